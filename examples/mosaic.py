@@ -3,7 +3,7 @@ import sys
 
 sys.path.append('.')  
 
-from node import group, expression, shader, properties
+from node import group, shader, properties, lod
 from node.properties import custom_properties, float_prop, vector_prop, color_prop, unit_prop
 from node.shader import Vector, Float
 
@@ -13,6 +13,7 @@ from math import pi
 from numbers import Number
 
 
+@group.memoize
 def mosaic_rotation(uv : Vector, edge_peturb:Vector=(0, 0, 0), scale:Float=1.0, rotation_inc:Float=0, rotation_var:Float=1):
     cell = (uv / scale + edge_peturb).floor()
     frac = uv - cell
@@ -22,12 +23,6 @@ def mosaic_rotation(uv : Vector, edge_peturb:Vector=(0, 0, 0), scale:Float=1.0,
     return shader.vector_rotate(vector=frac, center=scale / 2, angle=(angle + noise) * (pi / 180))
 
 
-def sum_weighted(samples, weights):
-    total = sum(weights)
-
-    weights = [x / total for x in weights]
-    return sum([sample * weight for sample, weight in zip(samples, weights)])
-
 def mosaic_sampling( uv, edge_peturb=0, scale=1, overlap=0.125, rotation_inc=0, rotation_var=1):
     vector_math = shader.vector_math
     def make_patch(uv : shader.Vector):       
@@ -65,7 +60,7 @@ def show_sampling(uvs, weights):
     samples = [(shader.tex_checker(uv).fac + 0.4) * shader.Vector(color)
         for uv, color in zip (uvs, colors)]
 
-    return sum_weighted(samples, weights)
+    return lod.weighted_sum(samples, weights)
 
 
 def sine_pattern(uv, frequency=8, amplitude=0.025):
@@ -76,6 +71,7 @@ def sine_pattern(uv, frequency=8, amplitude=0.025):
     return shader.Vector.combine(x, y, 0) * amplitude
 
 
+@group.memoize
 def mask_vector(v, x=None, y=None, z=None):
     return shader.Vector.combine(
         x if x is not None else v.x, 
@@ -84,6 +80,7 @@ def mask_vector(v, x=None, y=None, z=None):
     )
 
 
+@group.memoize
 def edge_noise(uv, props):
 
     noise_2d = shader.tex_noise.set(noise_dimensions='2D')
@@ -95,9 +92,28 @@ def edge_noise(uv, props):
 
 
 
+def mosaic_material(plane):
+    geom = shader.new_geometry()
+    props = shader.property_drivers(plane)
+
+    # edge_peturb = sine_pattern(geom.position, frequency=props.edge_scale/props.scale, amplitude=props.edge_magnitude)
+    edge_peturb = lod.optional(lambda: edge_noise(geom.position, props), lambda: shader.Vector((0, 0, 0)), min_level=2)
+
+    # uv = mosaic_rotation(geom.position, edge_peturb, scale=props.scale, 
+    #     rotation_inc=props.rotation_inc, rotation_var=props.rotation_var)
+    # color = shader.tex_voronoi(uv).color
+
+    # shader.output_material(shader.Color(color))
+
+    uvs, weights = mosaic_sampling(geom.position, edge_peturb, scale=props.scale, overlap=props.overlap, 
+        rotation_inc=props.rotation_inc, rotation_var=props.rotation_var)
+
+    color = show_sampling(uvs, weights)
+    shader.output_material(shader.Color(color))  
+
+
 def main():
-    mat = util.node_material("checker")
-    plane = util.adaptive_plane(name="terrain", size=10, material=mat)  
+    plane = util.adaptive_plane(name="terrain", size=10, material=None)  
 
     custom_properties(plane, 
         scale=float_prop(2, min=0),
@@ -111,24 +127,14 @@ def main():
     )
     
 
-    with expression.node_tree(mat.node_tree):
-        geom = shader.new_geometry()
-        props = shader.property_drivers(plane)
-
-        # edge_peturb = sine_pattern(geom.position, frequency=props.edge_scale/props.scale, amplitude=props.edge_magnitude)
-        edge_peturb = edge_noise(geom.position, props)
-
-        # uv = mosaic_rotation(geom.position, edge_peturb, scale=props.scale, 
-        #     rotation_inc=props.rotation_inc, rotation_var=props.rotation_var)
-        # color = shader.tex_voronoi(uv).color
-
-        # shader.output_material(shader.Color(color))
-
-        uvs, weights = mosaic_sampling(geom.position, edge_peturb, scale=props.scale, overlap=props.overlap, 
-            rotation_inc=props.rotation_inc, rotation_var=props.rotation_var)
+    # Full detail for renders, fewer samples and octaves in the viewport
+    lods = lod.build_lods(mosaic_material, "checker", levels=3, plane=plane)
+    for material in lods.materials:
+        material.cycles.displacement_method = 'BOTH'
 
-        color = show_sampling(uvs, weights)
-        shader.output_material(shader.Color(color))  
+    # The viewport variant while editing, wrap renders in lod.lod_use(lods, lod.render_use(scene))
+    plane.data.materials.append(lods.material('VIEWPORT'))
+    print(lods)
 
 
 if __name__ == '__main__':   
@@ -1,5 +1,7 @@
 import bpy
 
+from node import displace
+
 def make_plane(name, size, material=None):
     bpy.ops.mesh.primitive_plane_add(size=size)
     plane = bpy.context.active_object
@@ -32,6 +34,14 @@ def adaptive_plane(name, size, material):
     return plane
 
 
+def displaced_grid(name, size, f, subdivisions=(256, 256), material=None, scale=1.0):
+    """ Grid with displacement f (see node.displace) applied to the mesh once,
+    instead of adaptive subdivision and shader displacement at render time """
+    grid = make_grid(name, size, subdivisions, material)
+    displace.displace(grid, f, scale=scale)
+    return grid
+
+
 def node_material(name, displacement='BOTH'):
     material = bpy.data.materials.new(name=name)
     material.use_nodes = True
@@ -0,0 +1,330 @@
+import numpy as np
+
+from .graph import Graph, topological_order
+from .expression import RecordingContext
+from .evaluate import euler_to_matrix, matrix_to_euler, rotate_around_axis
+from .ranges import SimplifyReport
+
+
+# Nodes computing the same value at every shading point when their inputs do
+uniform_nodes = {'ShaderNodeValue', 'ShaderNodeRGB', 'ShaderNodeMath', 'ShaderNodeVectorMath', 'ShaderNodeClamp',
+    'ShaderNodeMapRange', 'ShaderNodeCombineXYZ', 'ShaderNodeSeparateXYZ', 'ShaderNodeCombineRGB',
+    'ShaderNodeSeparateRGB', 'ShaderNodeCombineColor', 'ShaderNodeSeparateColor', 'ShaderNodeMixRGB',
+    'ShaderNodeMix', 'ShaderNodeMapping', 'ShaderNodeVectorRotate', 'ShaderNodeInvert', 'ShaderNodeGamma',
+    'ShaderNodeBrightContrast', 'ShaderNodeHueSaturation', 'ShaderNodeRGBToBW', 'ShaderNodeValToRGB', 'NodeReroute'}
+
+
+def uniform_outputs(graph):
+    """ Output sockets whose value doesn't vary over the surface (constants, drivers and
+    functions of them) """
+    uniform = set()
+    for node in topological_order(graph.nodes):
+        if node.bl_idname in uniform_nodes and node.node_tree is None and node.external is None and\
+                all(link.from_socket in uniform for socket in node.inputs if socket.enabled for link in socket.links):
+            uniform.update(node.outputs)
+    return uniform
+
+
+def is_constant(p):
+    return isinstance(p, np.ndarray)
+
+
+def vector(value):
+    return np.array(np.broadcast_to(np.asarray(value, dtype=np.float64), (3,)))
+
+
+def reciprocal(v):
+    return np.where(v != 0, 1 / np.where(v != 0, v, 1), 0)
+
+
+def is_rotation(matrix):
+    return np.allclose(matrix.T @ matrix, np.eye(3), atol=1e-6) and np.linalg.det(matrix) > 0
+
+
+def decompose(matrix):
+    """ (rotation, scale) with matrix = rotation @ diag(scale), None for matrices with shear """
+    scale = np.linalg.norm(matrix, axis=0)
+    zero = scale < 1e-9
+    rotation = np.where(zero, 0, matrix / np.where(zero, 1, scale))
+    if not np.allclose(rotation.T @ rotation, np.diag(1.0 * ~zero), atol=1e-6):
+        return None
+
+    # Complete the columns scaled to zero to an orthonormal basis
+    for j in np.flatnonzero(zero):
+        for v in [np.cross(rotation[:, (j + 1) % 3], rotation[:, (j + 2) % 3])] + list(np.eye(3)):
+            v = v - rotation @ (rotation.T @ v)
+            if np.linalg.norm(v) > 1e-3:
+                rotation[:, j] = v / np.linalg.norm(v)
+                break
+
+    if np.linalg.det(rotation) < 0:
+        j = np.flatnonzero(zero)[0] if zero.any() else 0
+        rotation[:, j], scale[j] = -rotation[:, j], -scale[j]
+    return rotation, np.where(zero, 0, scale)
+
+
+def axis_rotation(axis, angle):
+    return rotate_around_axis(np.eye(3), axis / np.linalg.norm(axis), angle).T
+
+
+class Transform:
+    """ location + rotation @ (scale * v), the form of a POINT Mapping node. Parts are None,
+    constant arrays or uniform sockets, a constant rotation is a matrix and a socket
+    rotation gives XYZ euler angles """
+
+    def __init__(self):
+        self.scale = self.rotation = self.location = None
+
+    def append(self, operation, p):
+        """ Compose with an operation applied after the transform, returns False (leaving
+        the transform unchanged) where the result doesn't fit a single Mapping node """
+        constant = is_constant(p)
+        location_constant = self.location is None or is_constant(self.location)
+
+        if operation == 'translate':
+            if self.location is None:
+                self.location = p
+            elif constant and location_constant:
+                self.location = self.location + p
+            else:
+                return False
+
+        elif operation == 'scale':
+            commutes = self.rotation is None or (constant and np.allclose(p, p[0]))
+            if not (commutes and (constant or self.location is None) and location_constant):
+                return False
+            if self.scale is not None and not (constant and is_constant(self.scale)):
+                return False
+
+            self.scale = p if self.scale is None else self.scale * p
+            if self.location is not None:
+                self.location = self.location * p
+
+        elif operation == 'linear':
+            if not location_constant or not (self.rotation is None or is_constant(self.rotation)):
+                return False
+
+            matrix = p if self.rotation is None else p @ self.rotation
+            if self.scale is None or not is_constant(self.scale):
+                if not is_rotation(matrix):
+                    return False
+                rotation, scale = matrix, self.scale
+            else:
+                decomposed = decompose(matrix * self.scale)
+                if decomposed is None:
+                    return False
+                rotation, scale = decomposed
+
+            self.rotation, self.scale = rotation, scale
+            if self.location is not None:
+                self.location = p @ self.location
+
+        elif operation == 'rotate':
+            if self.rotation is not None or self.location is not None:
+                return False
+            self.rotation = p
+
+        return True
+
+    def simplify(self):
+        """ Drop constant parts which don't change their input, returns the number of nodes needed """
+        if is_constant(self.location) and np.allclose(self.location, 0):
+            self.location = None
+        if is_constant(self.rotation) and np.allclose(self.rotation, np.eye(3)):
+            self.rotation = None
+        if is_constant(self.scale) and np.allclose(self.scale, 1):
+            self.scale = None
+        return int(any(part is not None for part in [self.location, self.rotation, self.scale]))
+
+    def emit(self, graph, new_node, socket):
+        """ Create the node for the transform of socket, returns its output """
+        def connect(input, p):
+            if is_constant(p):
+                input.default_value = tuple(float(x) for x in p)
+            else:
+                graph.new_link(p, input)
+
+        if self.rotation is None and (self.scale is None or self.location is None):
+            operation, p = ('ADD', self.location) if self.scale is None else ('MULTIPLY', self.scale)
+            node = new_node('ShaderNodeVectorMath', dict(operation=operation))
+            connect(node.inputs[1], p)
+        else:
+            node = new_node('ShaderNodeMapping', dict(vector_type='POINT'))
+            rotation = matrix_to_euler(self.rotation) if is_constant(self.rotation) else self.rotation
+            for input, p in zip(node.inputs[1:4], [self.location, rotation, self.scale]):
+                if p is not None:
+                    connect(input, p)
+
+        graph.new_link(socket, node.inputs[0])
+        return node.outputs[0]
+
+
+def vector_math_operations(node, i, param):
+    operation = node.properties.get('operation', 'ADD')
+    inputs = node.inputs
+
+    if operation == 'ADD' and i < 2:
+        return [('translate', param(inputs[1 - i]))]
+    elif operation == 'SUBTRACT' and i == 0:
+        p = param(inputs[1])
+        return [('translate', -p)] if is_constant(p) else None
+    elif operation == 'SUBTRACT' and i == 1:
+        return [('scale', vector(-1)), ('translate', param(inputs[0]))]
+    elif operation == 'MULTIPLY' and i < 2:
+        return [('scale', param(inputs[1 - i]))]
+    elif operation == 'DIVIDE' and i == 0:
+        p = param(inputs[1])
+        return [('scale', reciprocal(p))] if is_constant(p) else None
+    elif operation == 'SCALE' and i == 0:
+        return [('scale', param(inputs[3]))]
+    elif operation == 'MULTIPLY_ADD' and i < 2:
+        return [('scale', param(inputs[1 - i])), ('translate', param(inputs[2]))]
+    return None
+
+
+def mapping_operations(node, i, param):
+    vector_type = node.properties.get('vector_type', 'POINT')
+    location, rotation, scale = [param(socket) for socket in node.inputs[1:4]]
+    if i != 0 or vector_type == 'NORMAL':
+        return None
+
+    if vector_type == 'TEXTURE':
+        if not all(is_constant(p) for p in [location, rotation, scale]):
+            return None
+        return [('translate', -location), ('linear', euler_to_matrix(rotation).T), ('scale', reciprocal(scale))]
+
+    rotate = ('linear', euler_to_matrix(rotation)) if is_constant(rotation) else ('rotate', rotation)
+    operations = [('scale', scale), rotate]
+    return operations + [('translate', location)] if vector_type == 'POINT' else operations
+
+
+def vector_rotate_operations(node, i, param):
+    p = node.properties
+    rotation_type = p.get('rotation_type', 'AXIS_ANGLE')
+    center, axis, angle, rotation = [param(socket) for socket in node.inputs[1:5]]
+    if i != 0 or not is_constant(center):
+        return None
+
+    if rotation_type == 'EULER_XYZ' and not is_constant(rotation):
+        return [('rotate', rotation)] if not p.get('invert', False) and np.allclose(center, 0) else None
+
+    if rotation_type == 'EULER_XYZ':
+        matrix = euler_to_matrix(rotation)
+        matrix = matrix.T if p.get('invert', False) else matrix
+    else:
+        axes = dict(X_AXIS=(1, 0, 0), Y_AXIS=(0, 1, 0), Z_AXIS=(0, 0, 1))
+        axis = vector(axes[rotation_type]) if rotation_type in axes else axis
+        if not (is_constant(axis) and is_constant(angle)):
+            return None
+        if np.linalg.norm(axis) == 0:
+            return []
+        angle = float(angle[0])
+        matrix = axis_rotation(axis, -angle if p.get('invert', False) else angle)
+
+    return [('translate', -center), ('linear', matrix), ('translate', center)]
+
+
+# Affine nodes by bl_idname, f(node, index of the transformed input, param) gives
+# the operations applied to that input, or None where the node isn't affine in it
+affine_nodes = {
+    'ShaderNodeVectorMath': vector_math_operations,
+    'ShaderNodeMapping': mapping_operations,
+    'ShaderNodeVectorRotate': vector_rotate_operations,
+}
+
+
+def affine_step(node, uniform):
+    """ (operations, transformed input) of a node applying an affine transform with
+    constant or uniform parameters to one varying vector input, otherwise None """
+    f = affine_nodes.get(node.bl_idname)
+    if f is None or node.mute or node.node_tree is not None or node.outputs[0].type != 'VECTOR':
+        return None
+
+    varying = [socket for socket in node.inputs if socket.enabled and socket.is_linked
+        and socket.links[0].from_socket not in uniform]
+    if len(varying) != 1 or varying[0].type != 'VECTOR':
+        return None
+
+    class Varying(Exception):
+        pass
+
+    def param(socket):
+        if socket.is_linked:
+            return socket.links[0].from_socket
+        elif socket.driver is not None:
+            raise Varying()
+        return vector(socket.default_value) if socket.type in ['VALUE', 'VECTOR'] else None
+
+    try:
+        operations = f(node, list(node.inputs).index(varying[0]), param)
+    except Varying:
+        return None
+
+    if operations is None or any(p is None for _, p in operations):
+        return None
+    return operations, varying[0]
+
+
+def pack(operations):
+    """ Transforms (each one node) applying the operations in order, greedily composed """
+    transforms = [Transform()]
+    for operation, p in operations:
+        if not transforms[-1].append(operation, p):
+            transforms.append(Transform())
+            assert transforms[-1].append(operation, p)
+    return transforms
+
+
+def compose_transforms(source):
+    """ Collapse chains of affine vector nodes (add, subtract, multiply, scale, vector rotate
+    and mapping) with constant or uniform parameters into Mapping nodes, where that needs fewer
+    nodes. Chains pass through nodes used only by the next step. Rewrites a recorded Graph
+    (or RecordingContext) """
+    if isinstance(source, RecordingContext):
+        graph, new_node = source.node_tree, source._new_node
+        remove = lambda node: source.remove(source.import_node(node))
+    elif isinstance(source, Graph):
+        graph, new_node, remove = source, source.new_node, source.remove
+    else:
+        raise TypeError("compose_transforms rewrites recorded graphs, expected Graph|RecordingContext, got {}"
+            .format(type(source).__name__))
+
+    uniform = uniform_outputs(graph)
+    steps = {node: affine_step(node, uniform) for node in graph.nodes}
+    steps = {node: step for node, step in steps.items() if step is not None}
+
+    def previous(node):
+        source = steps[node][1].links[0].from_socket
+        if source.node in steps and source is source.node.outputs[0] and len(source.links) == 1:
+            return source.node
+        return None
+
+    continued = {previous(node) for node in steps}
+    changes, removed = [], []
+    for end in topological_order(list(steps)):
+        if end not in steps or end in continued or not end.outputs[0].is_linked:
+            continue
+
+        chain = [end]
+        while previous(chain[0]) is not None:
+            chain.insert(0, previous(chain[0]))
+
+        transforms = pack([operation for node in chain for operation in steps[node][0]])
+        needed = sum(transform.simplify() for transform in transforms)
+        if needed >= len(chain):
+            continue
+
+        socket = steps[chain[0]][1].links[0].from_socket
+        for transform in transforms:
+            if transform.simplify() > 0:
+                socket = transform.emit(graph, new_node, socket)
+
+        for link in list(end.outputs[0].links):
+            graph.new_link(socket, link.to_socket)
+
+        changes.append((end.name, "{} transform nodes composed into {}".format(len(chain), needed)))
+        for node in reversed(chain):
+            remove(node)
+            removed.append(node.name)
+
+    return SimplifyReport(graph, changes, removed)
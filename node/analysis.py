@@ -0,0 +1,242 @@
+import bpy
+
+import heapq
+import colorsys
+from collections import Counter, defaultdict
+
+from .graph import Graph, capture, upstream, cone, topological_order
+from .expression import RecordingContext, graph_of, tracking_origins
+
+
+# Rough relative per-sample cost by node type, optionally refined by "TYPE.OPERATION"
+default_weights = {
+    'MATH': 1.0, 'MATH.POWER': 3.0, 'MATH.LOGARITHM': 3.0, 'MATH.SINE': 2.0, 'MATH.COSINE': 2.0,
+    'MATH.TANGENT': 2.0, 'MATH.ARCTAN2': 3.0, 'MATH.SQRT': 2.0, 'MATH.EXPONENT': 2.0,
+    'VECT_MATH': 2.0, 'VECT_MATH.NORMALIZE': 3.0, 'VECT_MATH.LENGTH': 2.5,
+    'CLAMP': 1.0, 'MAP_RANGE': 2.0,
+    'VALUE': 0.0, 'RGB': 0.0, 'REROUTE': 0.0, 'FRAME': 0.0,
+    'GROUP_INPUT': 0.0, 'GROUP_OUTPUT': 0.0, 'OUTPUT_MATERIAL': 0.0, 'OUTPUT_WORLD': 0.0,
+    'COMBXYZ': 0.5, 'SEPXYZ': 0.5, 'COMBRGB': 0.5, 'SEPRGB': 0.5, 'COMBHSV': 2.0, 'SEPHSV': 2.0,
+    'MIX_RGB': 2.0, 'VALTORGB': 3.0, 'CURVE_RGB': 4.0, 'CURVE_VEC': 4.0,
+    'VECTOR_ROTATE': 4.0, 'MAPPING': 3.0,
+    'TEX_COORD': 1.0, 'NEW_GEOMETRY': 1.0, 'UVMAP': 1.0, 'ATTRIBUTE': 2.0,
+    'TEX_WHITE_NOISE': 4.0, 'TEX_CHECKER': 3.0, 'TEX_GRADIENT': 2.0, 'TEX_BRICK': 8.0,
+    'TEX_MAGIC': 10.0, 'TEX_WAVE': 15.0, 'TEX_NOISE': 20.0, 'TEX_MUSGRAVE': 20.0,
+    'TEX_VORONOI': 60.0, 'TEX_IMAGE': 10.0, 'TEX_ENVIRONMENT': 10.0,
+    'BUMP': 4.0, 'NORMAL_MAP': 4.0, 'DISPLACEMENT': 2.0,
+    'BSDF_PRINCIPLED': 50.0, 'BSDF_DIFFUSE': 10.0, 'BSDF_GLOSSY': 15.0, 'EMISSION': 2.0,
+    'MIX_SHADER': 2.0, 'ADD_SHADER': 2.0,
+}
+
+default_weight = 2.0
+
+# Octave based textures cost roughly one base evaluation per octave
+octave_textures = {'TEX_NOISE', 'TEX_MUSGRAVE', 'TEX_WAVE'}
+
+# Cycles evaluates the height input of a bump node three times (center, dx, dy)
+bump_evaluations = 3
+
+
+def input_value(node, name, default=None):
+    for socket in node.inputs:
+        if socket.name == name and socket.enabled:
+            return None if socket.is_linked else socket.default_value
+    return default
+
+
+def node_weight(node, weights):
+    operation = node.properties.get('operation', node.properties.get('blend_type'))
+    if operation is not None and "{}.{}".format(node.type, operation) in weights:
+        return weights["{}.{}".format(node.type, operation)]
+    return weights.get(node.bl_idname, weights.get(node.type, default_weight))
+
+
+class CostReport:
+    """ Static per-sample cost estimate of a node graph """
+
+    def __init__(self, graph, weights):
+        self.graph = graph
+        self.weights = weights
+        self.groups = {}
+
+        self.live = live_nodes(graph)
+        self.self_cost = {node: self.node_cost(node) for node in self.live}
+        self.multiplicity = bump_multiplicity(graph, self.live)
+
+        self.cost = {node: self.self_cost[node] * self.multiplicity[node] for node in self.live}
+        self.total = sum(self.cost.values())
+        self.dead = [node for node in graph.nodes if node not in self.live]
+
+        self.depth, self.critical_cost, self.critical_path = critical_path(graph, self.live, self.cost)
+
+    def group_report(self, group):
+        if group.name not in self.groups:
+            self.groups[group.name] = None     # recursive groups are an error in Blender
+            self.groups[group.name] = CostReport(capture(group), self.weights)
+        return self.groups[group.name]
+
+    def node_cost(self, node):
+        if node.mute:
+            return 0.0
+
+        if node.node_tree is not None:
+            report = self.group_report(node.node_tree)
+            return 0.0 if report is None else report.total
+
+        cost = node_weight(node, self.weights)
+        if node.type in octave_textures:
+            detail = input_value(node, 'Detail', 0.0)
+            cost *= 1 + (2.0 if detail is None else detail)
+        return cost
+
+    @property
+    def histogram(self):
+        """ Node type counts, nodes inside groups counted once per group instance """
+        counts = Counter()
+        for node in self.live:
+            if node.node_tree is not None and self.group_report(node.node_tree) is not None:
+                counts.update(self.group_report(node.node_tree).histogram)
+            else:
+                counts[node.type] += 1
+        return counts
+
+    @property
+    def origins(self):
+        """ Cost attributed to the Python functions which created the nodes, known for
+        nodes built inside tracking_origins() (see profile) """
+        costs = defaultdict(float)
+        for node, cost in self.cost.items():
+            costs[node.origin or "<unknown>"] += cost
+        return dict(costs)
+
+    def hot_origins(self, n=10):
+        return sorted(self.origins.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def hot_subtrees(self, n=10):
+        """ Nodes with the most expensive upstream subgraph (shared nodes counted once) """
+        costs = subtree_costs(self.graph, self.live, self.cost, n)
+        return sorted(costs.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def to_dot(self):
+        return cost_dot(self)
+
+    def save_dot(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.to_dot())
+
+    def __str__(self):
+        lines = ["{}: total cost {:.1f}, {} nodes ({} dead), critical path {} nodes ({:.1f})".format(
+            self.graph.name, self.total, len(self.live), len(self.dead), self.depth, self.critical_cost)]
+
+        lines.append("hot functions:")
+        lines += ["  {:>8.1f}  {}".format(cost, origin) for origin, cost in self.hot_origins()]
+
+        lines.append("hot subtrees:")
+        lines += ["  {:>8.1f}  {} {}".format(cost, node.name, node.origin or "")
+            for node, cost in self.hot_subtrees()]
+
+        lines.append("nodes: " + ", ".join("{}:{}".format(k, v) for k, v in self.histogram.most_common()))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "CostReport({}, total={:.1f})".format(self.graph.name, self.total)
+
+
+def live_nodes(graph):
+    """ Nodes upstream of an output node (a node without outputs) """
+    roots = [node for node in graph.nodes if len(node.outputs) == 0]
+    if len(roots) == 0:
+        return list(graph.nodes)
+
+    live, stack = set(), roots
+    while len(stack):
+        node = stack.pop()
+        if node not in live:
+            live.add(node)
+            stack.extend(upstream(node.inputs))
+
+    return [node for node in graph.nodes if node in live]
+
+
+def bump_multiplicity(graph, live):
+    multiplicity = {node: 1 for node in live}
+    for node in live:
+        if node.type == 'BUMP' and not node.mute:
+            heights = [socket for socket in node.inputs if socket.name.startswith('Height')]
+            for height_node in cone(heights):
+                multiplicity[height_node] += bump_evaluations - 1
+    return multiplicity
+
+
+def critical_path(graph, live, cost):
+    """ Longest dependency chain, returns (node count, cost, path) """
+    best = {}
+    for node in topological_order(live):
+        inputs = [best[n] for n in upstream(node.inputs) if n in best]
+        depth, path_cost, path = max(inputs, key=lambda b: (b[1], b[0]), default=(0, 0.0, []))
+        best[node] = (depth + 1, path_cost + cost.get(node, 0.0), path + [node])
+
+    return max(best.values(), key=lambda b: (b[1], b[0]), default=(0, 0.0, []))
+
+
+def subtree_costs(graph, live, cost, n=10, limit=30):
+    """ Cost of the upstream cone of the n nodes where it's largest (shared nodes counted once).
+    Cones are walked best first by an upper bound on their cost (shared nodes counted per
+    path), stopping once no bound beats the n-th cost or after limit cones, O(limit * nodes) """
+    bound = {}
+    for node in topological_order(live):
+        bound[node] = cost.get(node, 0.0) + sum(bound[n] for n in set(upstream(node.inputs)) if n in bound)
+
+    totals, best = {}, []
+    for node in sorted(bound, key=bound.get, reverse=True)[:limit]:
+        if len(best) == n and bound[node] <= best[0]:
+            break
+        totals[node] = cost.get(node, 0.0) + sum(cost.get(m, 0.0) for m in cone(node.inputs))
+        heapq.heappush(best, totals[node])
+        if len(best) > n:
+            heapq.heappop(best)
+    return totals
+
+
+def heat_color(t):
+    r, g, b = colorsys.hsv_to_rgb((1 - t) * 0.33, 0.3 + 0.7 * t, 1.0)
+    return "#{:02x}{:02x}{:02x}".format(int(r * 255), int(g * 255), int(b * 255))
+
+
+def cost_dot(report):
+    graph = report.graph
+    index = {node: i for i, node in enumerate(graph.nodes)}
+    max_cost = max(report.cost.values(), default=0.0) or 1.0
+
+    def label(node):
+        parts = [node.name, "{:.1f}".format(report.cost.get(node, 0.0))]
+        if node.origin is not None:
+            parts.append(node.origin)
+        return "\\n".join(part.replace('"', '\\"') for part in parts)
+
+    lines = ['digraph "{}" {{'.format(graph.name.replace('"', '\\"')),
+        '  rankdir=LR;', '  node [shape=box, style=filled, fontname="Helvetica"];']
+
+    for node in graph.nodes:
+        color = heat_color(report.cost[node] / max_cost) if node in report.cost else "#dddddd"
+        lines.append('  n{} [label="{}", fillcolor="{}"];'.format(index[node], label(node), color))
+
+    for link in graph.links:
+        lines.append('  n{} -> n{};'.format(index[link.from_node], index[link.to_node]))
+
+    lines.append('}')
+    return "\n".join(lines) + "\n"
+
+
+def estimate(source, weights={}):
+    """ Estimate the per-sample cost of a NodeContext, NodeTree or Graph,
+    weights override entries of default_weights """
+    return CostReport(graph_of(source), dict(default_weights, **weights))
+
+
+def profile(f, name='profile', weights={}, **kwargs):
+    """ Estimate of the nodes f(**kwargs) builds, recorded into a Graph with
+    origins tracked so costs are attributed to functions (see CostReport.origins) """
+    with tracking_origins(), RecordingContext(Graph('SHADER', name)) as context:
+        f(**kwargs)
+    return estimate(context, weights)
@@ -0,0 +1,621 @@
+import math
+import functools
+from numbers import Number
+from cached_property import cached_property
+
+from .graph import GraphSocket, GraphNode, node_properties, graph_socket, add_driver, topological_order, cone, freeze,\
+    implicit_coordinates, implicit_input
+from .expression import node_context
+from .value import Value, Float
+from .util import assert_type
+from . import shader
+
+
+# Derivatives with respect to a vector p (usually the shading position) are recorded as nodes:
+# a scalar socket has a gradient Vector, a vector or color socket the three columns
+# [d/dx, d/dy, d/dz] of its Jacobian (Vectors), None stands for zero
+
+scalar_types = {'VALUE', 'INT', 'BOOLEAN'}
+vector_types = {'VECTOR', 'RGBA'}
+
+# Implicit conversions of vectors and colors to floats along links
+conversion_weights = dict(VECTOR=(1 / 3, 1 / 3, 1 / 3), RGBA=(0.2126, 0.7152, 0.0722))
+
+
+# Derivative rules by bl_idname, f(differentiator, node, inputs, derivatives) -> output derivatives,
+# rules raise NotImplementedError for cases they don't handle (which use finite differences)
+rules = {}
+
+def differentiates(*bl_idnames):
+    def register(f):
+        for bl_idname in bl_idnames:
+            rules[bl_idname] = f
+        return f
+    return register
+
+
+def unsupported(description):
+    raise NotImplementedError("no derivative for " + description)
+
+
+def unknown(description):
+    """ Raised outside of the rules, so it isn't replaced by finite differences """
+    raise NotImplementedError("derivative of {} with respect to the position is unknown,"
+        " differentiate with respect to a vector (wrt=) instead".format(description))
+
+
+# Outputs of input nodes which vary over a surface with no known derivative with respect to the position,
+# Object, Camera and Generated coordinates are transforms of the position (see Differentiator.coordinate)
+varying_inputs = {
+    'ShaderNodeTexCoord': {'Normal', 'UV', 'Window', 'Reflection'},
+    'ShaderNodeNewGeometry': {'Normal', 'Tangent', 'True Normal', 'Incoming', 'Parametric', 'Pointiness'},
+    'ShaderNodeUVMap': {'UV'},
+    'ShaderNodeAttribute': {'Color', 'Vector', 'Fac', 'Alpha'},
+    'ShaderNodeVertexColor': {'Color', 'Alpha'},
+    'ShaderNodeTangent': {'Tangent'},
+}
+
+
+def texture_scale(texture_space):
+    """ Derivative of generated coordinates with respect to object coordinates, given an object
+    (or its data) or the size of its texture space. As in Cycles, generated coordinates are
+    constant (0.5) along axes of zero size """
+    size = getattr(getattr(texture_space, 'data', texture_space), 'texspace_size', texture_space)
+    return tuple(0.5 / s if s != 0 else 0.0 for s in size)
+
+
+def add(*terms):
+    terms = [term for term in terms if term is not None]
+    return functools.reduce(lambda a, b: a + b, terms) if len(terms) else None
+
+def scale(d, c):
+    """ Derivative times a coefficient (number, tuple or Value) """
+    if d is None or (isinstance(c, Number) and c == 0):
+        return None
+    return d if isinstance(c, Number) and c == 1 else d * c
+
+def divide(d, c):
+    return d if d is None or (isinstance(c, Number) and c == 1) else d / c
+
+def neg(d):
+    return scale(d, -1)
+
+def sub(a, b):
+    return add(a, neg(b))
+
+
+def each(f, *derivatives):
+    """ f applied per axis to the columns of vector derivatives """
+    columns = [f(*[None if d is None else d[j] for d in derivatives]) for j in range(3)]
+    return None if all(column is None for column in columns) else columns
+
+def each_scale(d, c):
+    return each(lambda column: scale(column, c), d)
+
+def component(v, i):
+    return None if v is None else v.xyz[i]
+
+def combine(xs):
+    if all(x is None for x in xs):
+        return None
+    return shader.combine_xyz(*[0.0 if x is None else x for x in xs])
+
+def as_value(socket, socket_type):
+    return shader.Float(socket) if socket_type in scalar_types else shader.Vector(socket)
+
+def minus(a, b):
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return tuple(x - y for x, y in zip(a, b))
+    return a - b
+
+def broadcast(x):
+    """ Float as a Vector of three equal components (as linking a float to a vector socket does) """
+    return None if x is None else shader.Vector(x.socket)
+
+def axes(d, socket_type):
+    """ Derivatives of a socket along each axis, Floats for scalar sockets and Vectors otherwise """
+    if d is None:
+        return [None, None, None]
+    return [component(d, j) for j in range(3)] if socket_type in scalar_types else d
+
+def from_axes(xs, socket_type):
+    if socket_type in scalar_types:
+        return combine(xs)
+    return None if all(x is None for x in xs) else list(xs)
+
+
+def operation(name, f):
+    """ Math node operation on Values, or f on constants """
+    def apply(*args):
+        if all(isinstance(x, Number) for x in args):
+            return f(*args)
+        return getattr(shader.math, name)(*args)
+    return apply
+
+sin = operation('sine', math.sin)
+cos = operation('cosine', math.cos)
+sinh = operation('hyperbolic_sine', math.sinh)
+cosh = operation('hyperbolic_cosine', math.cosh)
+sign = operation('sign', lambda a: float(a > 0) - float(a < 0))
+floor = operation('floor', math.floor)
+truncate = operation('truncate', math.trunc)
+power = operation('power', lambda a, b: a ** b if a > 0 or float(b).is_integer() else 0.0)
+log = operation('logarithm', lambda a, b: math.log(a) / math.log(b) if a > 0 and b > 0 and b != 1 else 0.0)
+inv_sqrt = operation('inverse_square_root', lambda a: 1 / math.sqrt(a) if a > 0 else 0.0)
+quotient = operation('divide', lambda a, b: a / b if b != 0 else 0.0)
+less_than = operation('less_than', lambda a, b: float(a < b))
+greater_than = operation('greater_than', lambda a, b: float(a > b))
+
+def ln(a):
+    return log(a, math.e)
+
+def inside(x):
+    """ 1 where a clamped value is strictly inside 0..1, where its derivative passes """
+    return greater_than(x, 0.0) * less_than(x, 1.0)
+
+def select(mask, da, db):
+    return add(scale(da, mask), scale(db, 1 - mask))
+
+
+math_derivatives = dict(
+    ADD = lambda a, b, c, da, db, dc, out: add(da, db),
+    SUBTRACT = lambda a, b, c, da, db, dc, out: sub(da, db),
+    MULTIPLY = lambda a, b, c, da, db, dc, out: add(scale(da, b), scale(db, a)),
+    DIVIDE = lambda a, b, c, da, db, dc, out: divide(sub(da, scale(db, out)), b),
+    MULTIPLY_ADD = lambda a, b, c, da, db, dc, out: add(scale(da, b), scale(db, a), dc),
+    POWER = lambda a, b, c, da, db, dc, out: add(scale(da, b * power(a, b - 1)), scale(db, out * ln(a))),
+    LOGARITHM = lambda a, b, c, da, db, dc, out: divide(sub(divide(da, a), scale(divide(db, b), out)), ln(b)),
+    SQRT = lambda a, b, c, da, db, dc, out: divide(scale(da, 0.5), out),
+    INVERSE_SQRT = lambda a, b, c, da, db, dc, out: scale(da, out * out * out * -0.5),
+    ABSOLUTE = lambda a, b, c, da, db, dc, out: scale(da, sign(a)),
+    EXPONENT = lambda a, b, c, da, db, dc, out: scale(da, out),
+    MINIMUM = lambda a, b, c, da, db, dc, out: select(less_than(a, b), da, db),
+    MAXIMUM = lambda a, b, c, da, db, dc, out: select(greater_than(a, b), da, db),
+    LESS_THAN = lambda a, b, c, da, db, dc, out: None,
+    GREATER_THAN = lambda a, b, c, da, db, dc, out: None,
+    SIGN = lambda a, b, c, da, db, dc, out: None,
+    COMPARE = lambda a, b, c, da, db, dc, out: None,
+    ROUND = lambda a, b, c, da, db, dc, out: None,
+    FLOOR = lambda a, b, c, da, db, dc, out: None,
+    CEIL = lambda a, b, c, da, db, dc, out: None,
+    TRUNC = lambda a, b, c, da, db, dc, out: None,
+    SNAP = lambda a, b, c, da, db, dc, out: None,
+    FRACT = lambda a, b, c, da, db, dc, out: da,
+    MODULO = lambda a, b, c, da, db, dc, out: sub(da, scale(db, truncate(quotient(a, b)))),
+    FLOORED_MODULO = lambda a, b, c, da, db, dc, out: sub(da, scale(db, floor(quotient(a, b)))),
+    WRAP = lambda a, b, c, da, db, dc, out: sub(da, scale(sub(db, dc), floor(quotient(a - c, b - c)))),
+    SINE = lambda a, b, c, da, db, dc, out: scale(da, cos(a)),
+    COSINE = lambda a, b, c, da, db, dc, out: scale(da, -sin(a)),
+    TANGENT = lambda a, b, c, da, db, dc, out: divide(da, power(cos(a), 2)),
+    ARCSINE = lambda a, b, c, da, db, dc, out: scale(da, inv_sqrt(1 - a * a)),
+    ARCCOSINE = lambda a, b, c, da, db, dc, out: scale(da, -inv_sqrt(1 - a * a)),
+    ARCTANGENT = lambda a, b, c, da, db, dc, out: divide(da, 1 + a * a),
+    ARCTAN2 = lambda a, b, c, da, db, dc, out: divide(sub(scale(da, b), scale(db, a)), a * a + b * b),
+    SINH = lambda a, b, c, da, db, dc, out: scale(da, cosh(a)),
+    COSH = lambda a, b, c, da, db, dc, out: scale(da, sinh(a)),
+    TANH = lambda a, b, c, da, db, dc, out: scale(da, 1 - out * out),
+    RADIANS = lambda a, b, c, da, db, dc, out: scale(da, math.pi / 180),
+    DEGREES = lambda a, b, c, da, db, dc, out: scale(da, 180 / math.pi),
+)
+
+
+@differentiates('ShaderNodeMath')
+def math_derivative(d, node, inputs, derivatives):
+    operation = node.properties['operation']
+    if operation not in math_derivatives:
+        unsupported("math operation " + operation)
+
+    out = d.output(node.outputs[0])
+    result = math_derivatives[operation](*inputs[:3], *derivatives[:3], out)
+    return [scale(result, inside(out)) if node.properties.get('use_clamp', False) else result]
+
+
+def dot(column, v):
+    return None if column is None else column.dot(v)
+
+def cross(column, v):
+    return None if column is None else column.cross(v)
+
+def normalize_derivative(da, a, out):
+    size = shader.vector_math.length(a)
+    return each(lambda x: divide(sub(x, scale(out, dot(x, out))), size), da)
+
+
+# f(a, b, c, scale, da, db, dc, dscale, (vector, value)) -> (vector derivative, value derivative)
+vector_derivatives = dict(
+    ADD = lambda a, b, c, s, da, db, dc, ds, out: (each(add, da, db), None),
+    SUBTRACT = lambda a, b, c, s, da, db, dc, ds, out: (each(sub, da, db), None),
+    MULTIPLY = lambda a, b, c, s, da, db, dc, ds, out: (each(lambda x, y: add(scale(x, b), scale(y, a)), da, db), None),
+    DIVIDE = lambda a, b, c, s, da, db, dc, ds, out:
+        (each(lambda x, y: divide(sub(x, scale(y, out[0])), b), da, db), None),
+    MULTIPLY_ADD = lambda a, b, c, s, da, db, dc, ds, out:
+        (each(lambda x, y, z: add(scale(x, b), scale(y, a), z), da, db, dc), None),
+    SCALE = lambda a, b, c, s, da, db, dc, ds, out:
+        (each(lambda x, t: add(scale(x, s), scale(broadcast(t), a)), da, axes(ds, 'VALUE')), None),
+    CROSS_PRODUCT = lambda a, b, c, s, da, db, dc, ds, out:
+        (each(lambda x, y: add(cross(x, b), neg(cross(y, a))), da, db), None),
+    DOT_PRODUCT = lambda a, b, c, s, da, db, dc, ds, out:
+        (None, combine([add(dot(x, b), dot(y, a)) for x, y in zip(axes(da, 'VECTOR'), axes(db, 'VECTOR'))])),
+    LENGTH = lambda a, b, c, s, da, db, dc, ds, out:
+        (None, combine([divide(dot(x, a), out[1]) for x in axes(da, 'VECTOR')])),
+    DISTANCE = lambda a, b, c, s, da, db, dc, ds, out:
+        (None, combine([divide(dot(sub(x, y), minus(a, b)), out[1])
+            for x, y in zip(axes(da, 'VECTOR'), axes(db, 'VECTOR'))])),
+    NORMALIZE = lambda a, b, c, s, da, db, dc, ds, out: (normalize_derivative(da, a, out[0]), None),
+    ABSOLUTE = lambda a, b, c, s, da, db, dc, ds, out: (each_scale(da, a / shader.vector_math.absolute(a)), None),
+    FRACTION = lambda a, b, c, s, da, db, dc, ds, out: (da, None),
+    MODULO = lambda a, b, c, s, da, db, dc, ds, out:
+        (da, None) if db is None else unsupported("vector modulo by a varying vector"),
+    WRAP = lambda a, b, c, s, da, db, dc, ds, out:
+        (da, None) if db is None and dc is None else unsupported("vector wrap of varying bounds"),
+    FLOOR = lambda a, b, c, s, da, db, dc, ds, out: (None, None),
+    CEIL = lambda a, b, c, s, da, db, dc, ds, out: (None, None),
+    SNAP = lambda a, b, c, s, da, db, dc, ds, out: (None, None),
+    SINE = lambda a, b, c, s, da, db, dc, ds, out: (each_scale(da, shader.vector_math.cosine(a)), None),
+    COSINE = lambda a, b, c, s, da, db, dc, ds, out: (each_scale(da, -shader.vector_math.sine(a)), None),
+)
+
+
+@differentiates('ShaderNodeVectorMath')
+def vector_math_derivative(d, node, inputs, derivatives):
+    operation = node.properties['operation']
+    if operation not in vector_derivatives:
+        unsupported("vector math operation " + operation)
+
+    out = [d.output(socket) for socket in node.outputs]
+    return list(vector_derivatives[operation](*inputs[:4], *derivatives[:4], out))
+
+
+@differentiates('ShaderNodeCombineXYZ', 'ShaderNodeCombineRGB', 'ShaderNodeCombineColor')
+def combine_derivative(d, node, inputs, derivatives):
+    if node.properties.get('mode', 'RGB') != 'RGB':
+        unsupported("combine color in " + node.properties['mode'])
+    return [each(lambda *xs: combine(xs), *[axes(g, 'VALUE') for g in derivatives[:3]])]
+
+
+@differentiates('ShaderNodeSeparateXYZ', 'ShaderNodeSeparateRGB', 'ShaderNodeSeparateColor')
+def separate_derivative(d, node, inputs, derivatives):
+    if node.properties.get('mode', 'RGB') != 'RGB':
+        unsupported("separate color in " + node.properties['mode'])
+    if derivatives[0] is d.identity:
+        return list(d.identity)
+
+    da = axes(derivatives[0], 'VECTOR')
+    return [combine([component(column, i) for column in da]) for i in range(3)]
+
+
+def mix_derivative(fac, a, b, dfac, da, db, socket_type, clamp_factor):
+    if clamp_factor:
+        dfac = scale(dfac, inside(fac))
+
+    if socket_type in scalar_types:
+        return add(da, scale(sub(db, da), fac), scale(dfac, minus(b, a)))
+
+    dfac = axes(dfac, 'VALUE')
+    return each(lambda x, y, t: add(x, scale(sub(y, x), fac), scale(broadcast(t), minus(b, a))), da, db, dfac)
+
+
+@differentiates('ShaderNodeMixRGB')
+def mix_rgb_derivative(d, node, inputs, derivatives):
+    if node.properties.get('blend_type', 'MIX') != 'MIX' or node.properties.get('use_clamp', False):
+        unsupported("color mix " + node.properties.get('blend_type', 'MIX'))
+    return [mix_derivative(*inputs, *derivatives, 'RGBA', True)]
+
+
+@differentiates('ShaderNodeMix')
+def mix_node_derivative(d, node, inputs, derivatives):
+    p = node.properties
+    data_type = p.get('data_type', 'FLOAT')
+    if p.get('blend_type', 'MIX') != 'MIX' or p.get('clamp_result', False) or p.get('factor_mode', 'UNIFORM') != 'UNIFORM':
+        unsupported("mix with blend {} and factor {}".format(p.get('blend_type'), p.get('factor_mode')))
+
+    enabled = [(value, g) for socket, value, g in zip(node.inputs, inputs, derivatives) if socket.enabled][:3]
+    (fac, dfac), (a, da), (b, db) = enabled
+
+    outputs = [None, None, None]
+    outputs[['FLOAT', 'VECTOR', 'RGBA'].index(data_type)] =\
+        mix_derivative(fac, a, b, dfac, da, db, 'VALUE' if data_type == 'FLOAT' else data_type, p.get('clamp_factor', True))
+    return outputs
+
+
+@differentiates('ShaderNodeClamp')
+def clamp_derivative(d, node, inputs, derivatives):
+    (value, low, high), (dvalue, dlow, dhigh) = inputs, derivatives
+    if node.properties.get('clamp_type', 'MINMAX') != 'MINMAX' or dlow is not None or dhigh is not None:
+        unsupported("clamp with varying bounds")
+    return [scale(dvalue, greater_than(value, low) * less_than(value, high))]
+
+
+@differentiates('ShaderNodeMapRange')
+def map_range_derivative(d, node, inputs, derivatives):
+    p = node.properties
+    value, from_min, from_max, to_min, to_max = inputs[:5]
+    if p.get('data_type', 'FLOAT') != 'FLOAT' or p.get('interpolation_type', 'LINEAR') != 'LINEAR'\
+            or any(g is not None for g in derivatives[1:]):
+        unsupported("map range other than a linear map of the value")
+
+    result = scale(derivatives[0], quotient(to_max - to_min, from_max - from_min))
+    if p.get('clamp', True):
+        result = scale(result, inside(quotient(value - from_min, from_max - from_min)))
+    return [result]
+
+
+@differentiates('ShaderNodeMapping')
+def mapping_derivative(d, node, inputs, derivatives):
+    vector, location, rotation, size = inputs
+    vector_type = node.properties.get('vector_type', 'POINT')
+    if vector_type not in ('POINT', 'VECTOR') or any(g is not None for g in derivatives[1:]):
+        unsupported("mapping of type {} or with varying transforms".format(vector_type))
+
+    linear = shader.mapping.set(vector_type='VECTOR')
+    return [each(lambda x: None if x is None else linear(x, rotation=rotation, scale=size), derivatives[0])]
+
+
+@differentiates('ShaderNodeTexWhiteNoise', 'ShaderNodeTexChecker', 'ShaderNodeTexBrick')
+def piecewise_constant(d, node, inputs, derivatives):
+    """ Textures which are constant (almost) everywhere in space """
+    return [None for _ in node.outputs]
+
+
+class Differentiator:
+    """ Forward mode differentiation of the graph upstream of a socket. Derivative nodes are
+    created in the active node context and refer to the sockets of the expression itself,
+    so the value and its derivatives share subexpressions and are evaluated once """
+
+    def __init__(self, socket, wrt=None, epsilon=1e-3, texture_space=None):
+        self.socket = socket
+        self.graph, self.captured = graph_socket(socket)
+        self.node_tree = None if isinstance(socket, GraphSocket) else socket.id_data
+
+        if wrt is not None and wrt.type != 'VECTOR':
+            raise TypeError("expected a vector to differentiate with respect to, got " + wrt.type)
+        self.wrt = wrt
+        self.seed = ('ShaderNodeNewGeometry', (), 'Position') if wrt is None else self.seed_key(wrt.node, wrt)
+        self.epsilon = epsilon
+        self.texture_space = texture_space
+
+        self.context = node_context()
+        self.derivatives = {}
+        self.values = {}
+        self.implicit = {}
+        self.used = set()
+
+    @staticmethod
+    def seed_key(node, socket):
+        properties = node.properties if isinstance(node, GraphNode) else node_properties(node)
+        return node.bl_idname, tuple(sorted((k, freeze(v)) for k, v in properties.items())), socket.identifier
+
+    def is_seed(self, socket):
+        if len(socket.node.inputs) == 0:
+            return self.seed_key(socket.node, socket) == self.seed
+        return self.wrt is not None and self.original(socket) == self.wrt
+
+    def original(self, socket):
+        """ Socket of the node tree the expression was built in (graphs of bpy trees are captured) """
+        if self.node_tree is None:
+            return socket
+        node = self.node_tree.nodes[socket.node.name]
+        return (node.outputs if socket.is_output else node.inputs)[socket.index]
+
+    def wrap(self, socket, socket_type):
+        key = (socket, socket_type in scalar_types)
+        if key not in self.values:
+            self.values[key] = as_value(self.original(socket), socket_type)
+        return self.values[key]
+
+    def output(self, socket):
+        return self.wrap(socket, socket.type)
+
+    def value(self, socket):
+        """ Value of an input as a Float or Vector, or a constant (float or 3-tuple) if unlinked """
+        if socket in self.implicit:
+            return self.implicit[socket]
+        elif not socket.enabled or socket.type not in scalar_types | vector_types:
+            return None
+        elif socket.is_linked:
+            return self.wrap(socket.links[0].from_socket, socket.type)
+        elif socket.driver is not None and socket.type in scalar_types:
+            if socket not in self.values:
+                self.values[socket] = shader.value()
+                add_driver(self.values[socket].socket, socket.driver)
+            return self.values[socket]
+        elif socket.type in scalar_types:
+            return float(socket.default_value)
+        return tuple(socket.default_value[:3])
+
+    def convert(self, d, from_type, to_type):
+        """ Derivative through an implicit conversion along a link """
+        if d is None or to_type not in scalar_types | vector_types:
+            return None
+        elif (from_type in scalar_types) == (to_type in scalar_types):
+            return d
+        elif to_type in vector_types:
+            return [broadcast(x) for x in axes(d, from_type)]
+        return combine([column.dot(conversion_weights[from_type]) for column in d])
+
+    def input_derivative(self, socket):
+        if not socket.enabled or not socket.is_linked:
+            return None
+        from_socket = socket.links[0].from_socket
+        return self.convert(self.derivatives.get(from_socket), from_socket.type, socket.type)
+
+    @cached_property
+    def identity(self):
+        """ Derivative of the seed, the rows of the identity are also the gradients of its components """
+        return [shader.Vector(axis) for axis in [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]]
+
+    def coordinate(self, name, node=None):
+        """ Derivative of texture coordinates with respect to the position: Object and Camera
+        coordinates are linear transforms of it, Generated ones scale Object coordinates by
+        the texture space (of undeformed meshes), others are unknown """
+        if name == 'Position':
+            return self.identity
+        elif name in ('Object', 'Camera'):
+            if node is not None and node.properties.get('object') is not None:
+                unknown("the object coordinates of another object")
+            to_space = shader.vector_transform.set(vector_type='VECTOR', convert_from='WORLD', convert_to=name.upper())
+            return [to_space(axis) for axis in [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]]
+        elif name == 'Generated':
+            if self.texture_space is None:
+                unknown("generated coordinates without the texture space (texture_space=)")
+            return each_scale(self.coordinate('Object', node), texture_scale(self.texture_space))
+        unknown("{} coordinates".format(name))
+
+    def source_derivative(self, socket):
+        """ Derivative of an output of a node with constant inputs: the identity for the seed, the
+        derivatives of coordinates for varying inputs when differentiating with respect to the
+        position, None otherwise (group inputs are taken as constant) """
+        node = socket.node
+        if self.is_seed(socket):
+            return self.identity
+        elif self.wrt is not None or socket not in self.used:
+            return None
+        elif node.bl_idname == 'ShaderNodeTexCoord' and socket.name in ('Object', 'Camera', 'Generated'):
+            return self.coordinate(socket.name, node)
+        elif socket.name in varying_inputs.get(node.bl_idname, ()):
+            unknown("{} of {}".format(socket.name, node.name))
+        return None
+
+    def pass_through(self, node, derivatives):
+        """ Muted nodes and reroutes pass the first input of each output's type """
+        outputs = []
+        for output in node.outputs:
+            matching = [(socket, g) for socket, g in zip(node.inputs, derivatives) if socket.type == output.type]
+            outputs.append(matching[0][1] if len(matching) else None)
+        return outputs
+
+    def connect(self, socket, copy):
+        """ Connect an input of a copied node as the original input is """
+        if socket.is_linked:
+            from_socket = socket.links[0].from_socket
+            self.context._new_link(self.wrap(from_socket, from_socket.type), copy)
+        else:
+            copy.default_value = socket.default_value
+            if socket.driver is not None:
+                add_driver(copy, socket.driver)
+
+    def finite_difference(self, node, derivatives):
+        """ Forward differences along each axis for nodes without analytic derivatives (noise,
+        images, groups): a copy of the node per axis with its varying inputs offset by epsilon
+        times their derivatives along the axis """
+        tangents = [axes(g, socket.type) for socket, g in zip(node.inputs, derivatives)]
+        differences = [[None, None, None] for _ in node.outputs]
+
+        for j in range(3):
+            if all(t[j] is None for t in tangents):
+                continue
+
+            copy = self.context._new_node(node.bl_idname, node.properties)
+            for socket, copy_socket, t in zip(node.inputs, copy.inputs, tangents):
+                if t[j] is None:
+                    self.connect(socket, copy_socket)
+                else:
+                    self.context._new_link(self.value(socket) + t[j] * self.epsilon, copy_socket)
+
+            for output, copy_output, difference in zip(node.outputs, copy.outputs, differences):
+                if output.type in scalar_types | vector_types:
+                    difference[j] = (as_value(copy_output, output.type) - self.output(output)) / self.epsilon
+
+        return [from_axes(difference, output.type) for output, difference in zip(node.outputs, differences)]
+
+    def differentiate_node(self, node):
+        derivatives = [self.input_derivative(socket) for socket in node.inputs]
+
+        implicit = implicit_input(node) if self.wrt is None and rules.get(node.bl_idname) is not piecewise_constant else None
+        if implicit is not None:
+            name = implicit_coordinates[node.bl_idname]
+            derivatives[implicit.index] = self.coordinate(name)
+            self.implicit[implicit] = shader.new_geometry().position if name == 'Position'\
+                else getattr(shader.tex_coord(), name.lower())
+
+        if all(g is None for g in derivatives):
+            return [self.source_derivative(socket) for socket in node.outputs]
+
+        if node.mute or node.bl_idname == 'NodeReroute':
+            return self.pass_through(node, derivatives)
+
+        inputs = [self.value(socket) for socket in node.inputs]
+        try:
+            if node.bl_idname not in rules or node.node_tree is not None:
+                unsupported(node.bl_idname)
+            return rules[node.bl_idname](self, node, inputs, derivatives)
+        except NotImplementedError:
+            return self.finite_difference(node, derivatives)
+
+    def run(self):
+        order = topological_order([self.captured.node])
+        self.used = {self.captured} | {link.from_socket for node in order for socket in node.inputs for link in socket.links}
+        for node in order:
+            self.derivatives.update(zip(node.outputs, self.differentiate_node(node)))
+        return self.derivatives.get(self.captured)
+
+
+def prune(context, created, values):
+    """ Remove the nodes created while differentiating which the results don't use """
+    keep = {value.node for value in values}
+    keep.update(cone([socket for node in keep for socket in node.inputs]))
+
+    for node in created:
+        if node not in keep:
+            context.remove(context.import_node(node))
+
+
+def derivative(value, wrt=None, epsilon=1e-3, texture_space=None):
+    """ Derivative of a shader Value with respect to a vector Value (the shading position by
+    default) built from nodes in the active context: a gradient Vector for a Float, the
+    columns [d/dx, d/dy, d/dz] of the Jacobian for a Vector or Color, None if constant.
+
+    Math, vector math, combine/separate, mix, clamp, map range and mapping nodes are
+    differentiated analytically, other nodes (noise and other textures, groups) with
+    forward differences of step epsilon.
+
+    With respect to the position, Object and Camera coordinates (and Generated ones, given the
+    object whose texture space they use as texture_space) are differentiated as transforms of it,
+    including those textures read from an unlinked Vector input. Other inputs varying over the
+    surface (UV, normals, attributes) raise NotImplementedError. With respect to wrt, every
+    other input is taken as constant """
+    assert_type(value, Value)
+    wrt = wrt.socket if isinstance(wrt, Value) else wrt
+
+    context = node_context()
+    start = len(context.created_nodes)
+
+    d = Differentiator(value.socket, wrt, epsilon, texture_space)
+    result = d.convert(d.run(), value.socket.type, 'VALUE' if isinstance(value, Float) else 'VECTOR')
+
+    prune(context, context.created_nodes[start:],
+        [] if result is None else [result] if isinstance(result, Value) else [v for v in result if v is not None])
+    return result
+
+
+def gradient(value, wrt=None, epsilon=1e-3, texture_space=None):
+    """ Gradient of a Float as a Vector, see derivative """
+    if not isinstance(value, Float):
+        raise TypeError("expected a Float, use jacobian for vectors and colors")
+
+    g = derivative(value, wrt, epsilon, texture_space)
+    return shader.Vector((0.0, 0.0, 0.0)) if g is None else g
+
+
+def jacobian(value, wrt=None, epsilon=1e-3, texture_space=None):
+    """ Columns [d/dx, d/dy, d/dz] of the Jacobian of a Vector or Color, see derivative """
+    if isinstance(value, Float):
+        raise TypeError("expected a Vector or Color, use gradient for floats")
+
+    columns = derivative(value, wrt, epsilon, texture_space) or [None, None, None]
+    return [shader.Vector((0.0, 0.0, 0.0)) if column is None else column for column in columns]
+
+
+def bump(height, strength=1.0, distance=1.0, normal=None, invert=False, epsilon=1e-3, texture_space=None):
+    """ Bump mapped normal of a height Float, in place of a Bump node: the normal is tilted
+    by the surface gradient of the height (its gradient with the normal component removed)
+    which is built alongside the height, instead of evaluating the height several times """
+    normal = shader.new_geometry().normal if normal is None else normal
+    g = gradient(height, epsilon=epsilon, texture_space=texture_space)
+
+    surface = g - normal * normal.dot(g)
+    bumped = shader.vector_math.normalize(normal - surface * (-distance if invert else distance))
+
+    if isinstance(strength, Number) and strength == 1:
+        return bumped
+    return shader.vector_math.normalize(normal + (bumped - normal) * strength)
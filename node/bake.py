@@ -0,0 +1,153 @@
+import bpy
+import numpy as np
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .graph import graph_socket, detached_socket, content_hash, cone, upstream
+from .expression import node_context
+from .value import Value
+from .evaluate import Evaluator
+from .registry import tag_generated
+from . import evaluate_shader     # registers the shader node implementations
+
+
+bake_version = 1
+
+# Shader attribute a bake evaluates over
+bake_coordinates = dict(UV='UV', GENERATED='Generated')
+
+
+def default_cache_dir():
+    if bpy.data.filepath:
+        return bpy.path.abspath('//bake_cache')
+    return os.path.join(tempfile.gettempdir(), 'node_bake_cache')
+
+
+def check_bakeable(nodes):
+    for node in nodes:
+        if node.bl_idname == 'NodeGroupInput':
+            raise TypeError("can't bake a value depending on group inputs ({})".format(node.name))
+
+        driven = [socket.name for socket in node.inputs + node.outputs if socket.driver is not None]
+        if len(driven):
+            raise TypeError("can't bake a value depending on drivers ({} {})".format(node.name, ", ".join(driven)))
+
+
+def bake_grid(size, rows, z):
+    """ Pixel centre coordinates (u, v, z) of a range of rows, in Blender pixel order (bottom row first) """
+    width, height = size
+    co = np.empty((rows[1] - rows[0], width, 3), dtype=np.float32)
+    co[..., 0] = ((np.arange(width) + 0.5) / width)[None, :]
+    co[..., 1] = ((np.arange(*rows) + 0.5) / height)[:, None]
+    co[..., 2] = z
+    return co
+
+
+def as_pixels(value, socket_type):
+    if socket_type == 'RGBA':
+        return value
+    if socket_type == 'VALUE':
+        value = np.stack([value, value, value], axis=-1)
+    return np.concatenate([value, np.ones_like(value[..., :1])], axis=-1)
+
+
+def evaluate_pixels(graph, socket, size, coordinates='UV', z=0.5, chunk_rows=64, threads=None):
+    """ Evaluate a socket of a (detached) graph over a UV (or generated) grid to RGBA pixels """
+    width, height = size
+    name = bake_coordinates[coordinates]
+    pixels = np.empty((height, width, 4), dtype=np.float32)
+
+    def run(start):
+        rows = (start, min(start + chunk_rows, height))
+        grid = bake_grid(size, rows, z)
+        evaluator = Evaluator(graph, shape=grid.shape[:2], attributes={name: grid})
+        try:
+            value, = evaluator.evaluate([socket])
+        except KeyError as e:
+            raise TypeError("can't bake over {} coordinates: {}".format(coordinates, e.args[0])) from None
+        pixels[rows[0]:rows[1]] = as_pixels(evaluator.full(value, socket.type), socket.type)
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, height, chunk_rows)))
+    return pixels
+
+
+def save_image(pixels, filename, name, is_data, key=''):
+    height, width = pixels.shape[:2]
+    image = bpy.data.images.new(name, width, height, alpha=True, float_buffer=True, is_data=is_data)
+    tag_generated(image, __name__, key)
+    image.pixels.foreach_set(pixels.ravel())
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    image.filepath_raw = filename
+    image.file_format = 'OPEN_EXR'
+    image.save()
+    return image
+
+
+def load_image(filename, is_data):
+    image = bpy.data.images.load(filename, check_existing=True)
+    if is_data:
+        image.colorspace_settings.is_data = True
+    return image
+
+
+def unused_nodes(nodes):
+    """ Nodes of a set which no longer feed anything outside the set """
+    stack = [node for node in nodes if any(link.to_node not in nodes
+        for output in node.outputs for link in output.links)]
+    used = set()
+    while len(stack):
+        node = stack.pop()
+        if node not in used:
+            used.add(node)
+            stack.extend(n for n in upstream(node.inputs) if n in nodes)
+    return [node for node in nodes if node not in used]
+
+
+def bake(value, size=1024, coordinates='UV', z=0.5, cache_dir=None, interpolation='Linear', remove=True):
+    """ Replace a Value of the active node tree by an image texture lookup. The value may only
+    depend on UV (or generated, for flat geometry at height z) coordinates, it is evaluated
+    offline and cached as an EXR keyed by a hash of its subgraph and the resolution.
+
+    Returns the baked value, consumers of the original value are relinked and nodes only
+    used by it removed (unless remove=False) """
+    context = node_context()
+    original = value.socket if isinstance(value, Value) else value
+    width, height = (size, size) if isinstance(size, int) else size
+
+    if coordinates not in bake_coordinates:
+        raise TypeError("coordinates should be one of {}, got {}".format(list(bake_coordinates), coordinates))
+    if not original.is_output or original.type not in ['VALUE', 'VECTOR', 'RGBA']:
+        raise TypeError("can only bake float, vector or color node outputs, got {}".format(original.type))
+
+    _, socket = graph_socket(original)
+    check_bakeable(cone(socket.node.inputs) | {socket.node})
+
+    key = content_hash([socket], bake_version, width, height, coordinates, z)
+    filename = os.path.join(cache_dir or default_cache_dir(), key + '.exr')
+    is_data = original.type != 'RGBA'
+
+    if os.path.exists(filename):
+        image = tag_generated(load_image(filename, is_data), __name__, key)
+    else:
+        detached = detached_socket(socket)
+        pixels = evaluate_pixels(detached.node.id_data, detached, (width, height), coordinates, z)
+        image = save_image(pixels, filename, 'bake_' + key[:12], is_data, key)
+
+    nodes = context.nodes
+    vector = nodes.tex_coord().generated if coordinates == 'GENERATED' else (0, 0, 0)
+    color = nodes.tex_image.set(image=image, interpolation=interpolation, extension='EXTEND')(vector).color
+    baked = dict(VALUE=color.float, VECTOR=color.vector, RGBA=lambda: color)[original.type]()
+
+    subgraph = cone(original.node.inputs) | {original.node}
+    for link in list(original.links):
+        context._new_link(baked, link.to_socket)
+
+    if remove:
+        for node in unused_nodes(subgraph):
+            context.remove(context.import_node(node))
+
+    return baked
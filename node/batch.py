@@ -0,0 +1,266 @@
+import bpy
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import importlib
+import functools
+import traceback
+import subprocess
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+data_collections = ['node_groups', 'materials']
+
+package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+worker_script = "import sys; sys.path.insert(0, {!r}); from node import batch; batch.worker_main()"
+
+
+def builder_path(builder):
+    if isinstance(builder, str):
+        if ':' not in builder:
+            raise TypeError("builder should be 'module:function', got '{}'".format(builder))
+        return builder
+
+    if builder.__module__ == '__main__':
+        raise TypeError("builder {} is defined in __main__ and can't be imported by workers, pass 'module:function'"
+            .format(builder.__qualname__))
+    return "{}:{}".format(builder.__module__, builder.__qualname__)
+
+
+def import_builder(path):
+    module_name, name = path.split(':')
+    module = importlib.import_module(module_name)
+    return functools.reduce(getattr, name.split('.'), module)
+
+
+class Job:
+    """ One invocation of a builder function in a fresh headless Blender,
+    node groups and materials it creates are merged into 'library' """
+
+    def __init__(self, builder, library, params={}, name=None, paths=[]):
+        self.builder = builder_path(builder)
+        self.library = os.path.abspath(library)
+        self.params = dict(params)
+        self.paths = [os.path.abspath(path) for path in paths]
+
+        args = ", ".join("{}={}".format(k, v) for k, v in self.params.items())
+        self.name = name or "{}({})".format(self.builder, args)
+
+    def __repr__(self):
+        return "Job({})".format(self.name)
+
+
+class JobResult:
+    def __init__(self, job, ok, elapsed, output=None, build_time=None, datablocks=[], error=None):
+        self.job = job
+        self.ok = ok
+        self.elapsed = elapsed
+        self.output = output
+        self.build_time = build_time
+        self.datablocks = datablocks
+        self.error = error
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed"
+        return "JobResult({}, {}, {:.2f}s)".format(self.job.name, status, self.elapsed)
+
+
+class MergeResult:
+    def __init__(self, library, ok, elapsed, datablocks=[], error=None):
+        self.library = library
+        self.ok = ok
+        self.elapsed = elapsed
+        self.datablocks = datablocks
+        self.error = error
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed"
+        return "MergeResult({}, {}, {} datablocks)".format(self.library, status, len(self.datablocks))
+
+
+class BatchReport:
+    def __init__(self, results, merged, elapsed):
+        self.results = results
+        self.merged = merged
+        self.elapsed = elapsed
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def __str__(self):
+        lines = ["{:<48} {:>8} {:>9} {:>9}".format("job", "status", "total", "build")]
+        for r in self.results:
+            build_time = "" if r.build_time is None else "{:.2f}s".format(r.build_time)
+            lines.append("{:<48} {:>8} {:>8.2f}s {:>9}".format(r.job.name[:48],
+                "ok" if r.ok else "FAILED", r.elapsed, build_time))
+
+        for library, merge in self.merged.items():
+            status = "ok" if merge.ok else "FAILED: " + merge.error.splitlines()[-1]
+            lines.append("merged {} ({} datablocks) {}".format(library, len(merge.datablocks), status))
+
+        lines.append("{} jobs, {} failed, {:.2f}s".format(len(self.results), len(self.failed), self.elapsed))
+        return "\n".join(lines)
+
+
+def generated_datablocks():
+    return {(k, block.name) for k in data_collections
+        for block in getattr(bpy.data, k) if not block.name.startswith('.')}
+
+
+def run_job(builder, params, paths, output):
+    """ Worker side: run a builder and write what it created to output """
+    sys.path[:0] = paths
+    before = generated_datablocks()
+
+    start = time.perf_counter()
+    import_builder(builder)(**params)
+    build_time = time.perf_counter() - start
+
+    created = sorted(generated_datablocks() - before)
+    blocks = {getattr(bpy.data, k)[name] for k, name in created}
+
+    bpy.data.libraries.write(output, blocks, fake_user=True)
+    return dict(build_time=build_time, datablocks=created)
+
+
+def base_name(name):
+    """ Name without the numeric suffix Blender gives a duplicate, 'Group.001' -> 'Group' """
+    base, _, suffix = name.rpartition('.')
+    return base if base and suffix.isdigit() else name
+
+
+def merge_libraries(library, sources):
+    """ Worker side: merge datablocks of the source files into library, replacing blocks of the
+    same name (later sources replace earlier ones, which replace those of the existing library) """
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    paths = sources[::-1] + ([library] if os.path.exists(library) else [])
+    names = defaultdict(set)
+
+    for path in paths:
+        with bpy.data.libraries.load(path) as (data_from, data_to):
+            for k in data_collections:
+                new_names = [name for name in getattr(data_from, k) if name not in names[k]]
+                setattr(data_to, k, new_names)
+                names[k].update(new_names)
+
+    # Blocks replaced by name may still be loaded as dependencies of others (as 'Group.001')
+    for k in data_collections:
+        collection = getattr(bpy.data, k)
+        for block in [block for block in collection if block.name not in names[k]]:
+            if base_name(block.name) in names[k]:
+                block.user_remap(collection[base_name(block.name)])
+                collection.remove(block)
+
+    blocks = {getattr(bpy.data, k)[name] for k in data_collections for name in names[k]}
+    os.makedirs(os.path.dirname(os.path.abspath(library)), exist_ok=True)
+    bpy.data.libraries.write(library, blocks, fake_user=True)
+    return dict(datablocks=sorted((k, name) for k in data_collections for name in names[k]))
+
+
+# Worker side task functions by task name, taking the task dict and returning a result dict
+worker_tasks = dict(
+    job=lambda task: run_job(task['builder'], task['params'], task['paths'], task['output']),
+    merge=lambda task: merge_libraries(task['library'], task['sources']),
+)
+
+
+def worker_main():
+    task_file = sys.argv[sys.argv.index('--') + 1]
+    with open(task_file) as f:
+        task = json.load(f)
+
+    try:
+        result = worker_tasks[task['task']](task)
+        result.update(ok=True)
+    except Exception:
+        result = dict(ok=False, error=traceback.format_exc())
+
+    with open(task['result'], 'w') as f:
+        json.dump(result, f)
+
+
+def run_worker(executable, task, work_dir, name, timeout=None):
+    task_file = os.path.join(work_dir, name + '.task.json')
+    task['result'] = os.path.join(work_dir, name + '.result.json')
+
+    with open(task_file, 'w') as f:
+        json.dump(task, f)
+
+    command = [executable, '--background', '--factory-startup',
+        '--python-expr', worker_script.format(package_root), '--', task_file]
+
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return dict(ok=False, error="timed out after {}s".format(timeout))
+    except OSError as e:
+        return dict(ok=False, error="failed to start {}: {}".format(executable, e))
+
+    if not os.path.exists(task['result']):
+        output = (process.stdout + process.stderr).strip().splitlines()
+        return dict(ok=False, error="worker exited with code {}\n{}"
+            .format(process.returncode, "\n".join(output[-20:])))
+
+    with open(task['result']) as f:
+        return json.load(f)
+
+
+def default_executable():
+    return bpy.app.binary_path or shutil.which('blender') or 'blender'
+
+
+def run_batch(jobs, workers=None, executable=None, timeout=None, keep_files=False):
+    """ Run jobs across a pool of headless Blender processes (one process per job,
+    so a crashing job can't take others down) then merge results into their libraries """
+    executable = executable or default_executable()
+    workers = workers or os.cpu_count()
+    work_dir = tempfile.mkdtemp(prefix='node_batch_')
+
+    def run(i, job):
+        start = time.perf_counter()
+        output = os.path.join(work_dir, 'job_{:04d}.blend'.format(i))
+        task = dict(task='job', builder=job.builder, params=job.params, paths=job.paths, output=output)
+
+        result = run_worker(executable, task, work_dir, 'job_{:04d}'.format(i), timeout)
+        elapsed = time.perf_counter() - start
+
+        if result['ok']:
+            return JobResult(job, True, elapsed, output=output, build_time=result['build_time'],
+                datablocks=[tuple(block) for block in result['datablocks']])
+        return JobResult(job, False, elapsed, error=result['error'])
+
+    def merge(i, library, results):
+        start = time.perf_counter()
+        task = dict(task='merge', library=library, sources=[r.output for r in results])
+
+        result = run_worker(executable, task, work_dir, 'merge_{:04d}'.format(i), timeout)
+        return MergeResult(library, result['ok'], time.perf_counter() - start,
+            datablocks=[tuple(block) for block in result.get('datablocks', [])], error=result.get('error'))
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, range(len(jobs)), jobs))
+
+            by_library = defaultdict(list)
+            for result in results:
+                if result.ok:
+                    by_library[result.job.library].append(result)
+
+            libraries = list(by_library.items())
+            merged = pool.map(merge, range(len(libraries)), *zip(*libraries)) if libraries else []
+            merged = {library: result for (library, _), result in zip(libraries, merged)}
+
+    finally:
+        if not keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return BatchReport(results, merged, time.perf_counter() - start)
@@ -0,0 +1,456 @@
+import numpy as np
+
+
+# Vectorized ports of the noise functions of Blender (BLI_noise, blenlib/intern/noise.c) the
+# procedural textures are built on, arrays of points have a trailing axis of 3, arithmetic is float32
+
+# Tables of noise.c: a permutation of 0-255 (BLI_noise_hash_uchar_512 holds it twice), unit gradients
+# (hashvectf, also the original Perlin noise's g table) and feature points in unit cells (hashpntf)
+permutation = np.array([
+    162, 160, 25, 59, 248, 235, 170, 238, 243, 28, 103, 40, 29, 237, 0, 222,
+    149, 46, 220, 63, 58, 130, 53, 77, 108, 186, 54, 208, 246, 12, 121, 50,
+    209, 89, 244, 8, 139, 99, 137, 47, 184, 180, 151, 131, 242, 143, 24, 199,
+    81, 20, 101, 135, 72, 32, 66, 168, 128, 181, 64, 19, 178, 34, 126, 87,
+    188, 127, 107, 157, 134, 76, 200, 219, 124, 213, 37, 78, 90, 85, 116, 80,
+    205, 179, 122, 187, 195, 203, 182, 226, 228, 236, 253, 152, 11, 150, 211, 158,
+    92, 161, 100, 241, 129, 97, 225, 196, 36, 114, 73, 140, 144, 75, 132, 52,
+    56, 171, 120, 202, 31, 1, 215, 147, 17, 193, 88, 169, 49, 249, 68, 109,
+    191, 51, 156, 95, 9, 148, 163, 133, 6, 198, 154, 30, 123, 70, 21, 48,
+    39, 43, 27, 113, 60, 91, 214, 111, 98, 172, 79, 194, 192, 14, 177, 35,
+    167, 223, 71, 176, 119, 105, 5, 233, 230, 231, 118, 115, 15, 254, 110, 155,
+    86, 239, 18, 165, 55, 252, 174, 217, 3, 142, 221, 16, 185, 206, 201, 141,
+    218, 42, 189, 104, 23, 159, 190, 212, 10, 204, 210, 232, 67, 61, 112, 183,
+    2, 125, 153, 216, 13, 96, 138, 4, 44, 62, 146, 229, 175, 83, 7, 224,
+    41, 166, 197, 227, 245, 247, 74, 65, 38, 106, 22, 94, 82, 45, 33, 173,
+    240, 145, 255, 234, 84, 250, 102, 26, 69, 57, 207, 117, 164, 136, 251, 93], dtype=np.int32)
+
+gradients = np.array([
+    [0.33783, 0.715698, -0.611206], [-0.944031, -0.326599, -0.045624], [-0.101074, -0.416443, -0.903503], [0.799286, 0.49411, -0.341949],
+    [-0.854645, 0.518036, 0.033936], [0.42514, -0.437866, -0.792114], [-0.358948, 0.597046, 0.717377], [-0.985413, 0.144714, 0.089294],
+    [-0.601776, -0.33728, -0.723907], [-0.449921, 0.594513, 0.666382], [0.208313, -0.10791, 0.972076], [0.575317, 0.060425, 0.815643],
+    [0.293365, -0.875702, -0.383453], [0.293762, 0.465759, 0.834686], [-0.846008, -0.233398, -0.47934], [-0.115814, 0.143036, -0.98291],
+    [0.204681, -0.949036, -0.239532], [0.946716, -0.263947, 0.184326], [-0.235596, 0.573822, 0.784332], [0.203705, -0.372253, -0.905487],
+    [0.756989, -0.651031, 0.055298], [0.497803, 0.814697, -0.297363], [-0.16214, 0.063995, -0.98468], [-0.329254, 0.834381, 0.441925],
+    [0.703827, -0.527039, -0.476227], [0.956421, 0.266113, 0.119781], [0.480133, 0.482849, 0.7323], [-0.18631, 0.961212, -0.203125],
+    [-0.748474, -0.656921, -0.090393], [-0.085052, -0.165253, 0.982544], [-0.76947, 0.628174, -0.115234], [0.383148, 0.537659, 0.751068],
+    [0.616486, -0.668488, -0.415924], [-0.259979, -0.630005, 0.73175], [0.570953, -0.087952, 0.816223], [-0.458008, 0.023254, 0.888611],
+    [-0.196167, 0.976563, -0.088287], [-0.263885, -0.69812, -0.665527], [0.437134, -0.892273, -0.112793], [-0.621674, -0.230438, 0.748566],
+    [0.232422, 0.900574, -0.367249], [0.22229, -0.796143, 0.562744], [-0.665497, -0.73764, 0.11377], [0.670135, 0.704803, 0.232605],
+    [0.895599, 0.429749, -0.114655], [-0.11557, -0.474243, 0.872742], [0.621826, 0.604004, -0.498444], [-0.832214, 0.012756, 0.55426],
+    [-0.702484, 0.705994, -0.089661], [-0.692017, 0.649292, 0.315399], [-0.175995, -0.977997, 0.111877], [0.096954, -0.04953, 0.994019],
+    [0.635284, -0.606689, -0.477783], [-0.261261, -0.607422, -0.750153], [0.983276, 0.165436, 0.075958], [-0.29837, 0.404083, -0.864655],
+    [-0.638672, 0.507721, 0.578156], [0.388214, 0.412079, 0.824249], [0.556183, -0.208832, 0.804352], [0.778442, 0.562012, 0.27951],
+    [-0.616577, 0.781921, -0.091522], [0.196289, 0.051056, 0.979187], [-0.121216, 0.207153, -0.970734], [-0.173401, -0.384735, 0.906555],
+    [0.161499, -0.723236, -0.671387], [0.178497, -0.006226, -0.983887], [-0.126038, 0.15799, 0.97934], [0.830475, -0.024811, 0.556458],
+    [-0.510132, -0.76944, 0.384247], [0.81424, 0.200104, -0.544891], [-0.112549, -0.393311, -0.912445], [0.56189, 0.152222, -0.813049],
+    [0.198914, -0.254517, -0.946381], [-0.41217, 0.690979, -0.593811], [-0.407257, 0.324524, 0.853668], [-0.690186, 0.366119, -0.624115],
+    [-0.428345, 0.844147, -0.322296], [-0.21228, -0.297546, -0.930756], [-0.273071, 0.516113, 0.811798], [0.928314, 0.371643, 0.007233],
+    [0.785828, -0.479218, -0.390778], [-0.704895, 0.058929, 0.706818], [0.173248, 0.203583, 0.963562], [0.422211, -0.904297, -0.062469],
+    [-0.363312, -0.182465, 0.913605], [0.254028, -0.552307, -0.793945], [-0.28891, -0.765747, -0.574554], [0.058319, 0.291382, 0.954803],
+    [0.946136, -0.303925, 0.111267], [-0.078156, 0.443695, -0.892731], [0.182098, 0.89389, 0.409515], [-0.680298, -0.213318, 0.701141],
+    [0.062469, 0.848389, -0.525635], [-0.72879, -0.641846, 0.238342], [-0.88089, 0.427673, 0.202637], [-0.532501, -0.21405, 0.818878],
+    [0.948975, -0.305084, 0.07962], [0.925446, 0.374664, 0.055817], [0.820923, 0.565491, 0.079102], [0.25882, 0.099792, -0.960724],
+    [-0.294617, 0.910522, 0.289978], [0.137115, 0.320038, -0.937408], [-0.908386, 0.345276, -0.235718], [-0.936218, 0.138763, 0.322754],
+    [0.366577, 0.925934, -0.090637], [0.309296, -0.686829, -0.657684], [0.66983, 0.024445, 0.742065], [-0.917999, -0.059113, -0.392059],
+    [0.365509, 0.462158, -0.807922], [0.083374, 0.996399, -0.014801], [0.593842, 0.253143, -0.763672], [0.974976, -0.165466, 0.148285],
+    [0.918976, 0.137299, 0.369537], [0.294952, 0.694977, 0.655731], [0.943085, 0.152618, -0.295319], [0.58783, -0.598236, 0.544495],
+    [0.203796, 0.678223, 0.705994], [-0.478821, -0.661011, 0.577667], [0.719055, -0.1698, -0.673828], [-0.132172, -0.965332, 0.225006],
+    [-0.981873, -0.14502, 0.121979], [0.763458, 0.579742, 0.284546], [-0.893188, 0.079681, 0.442474], [-0.795776, -0.523804, 0.303802],
+    [0.734955, 0.67804, -0.007446], [0.15506, 0.986267, -0.056183], [0.258026, 0.571503, -0.778931], [-0.681549, -0.702087, -0.206116],
+    [-0.96286, -0.177185, 0.203613], [-0.470978, -0.515106, 0.716095], [-0.740326, 0.57135, 0.354095], [-0.56012, -0.824982, -0.074982],
+    [-0.507874, 0.753204, 0.417969], [-0.503113, 0.038147, 0.863342], [0.594025, 0.673553, -0.439758], [-0.119873, -0.005524, -0.992737],
+    [0.098267, -0.213776, 0.971893], [-0.615631, 0.643951, 0.454163], [0.896851, -0.441071, 0.032166], [-0.555023, 0.750763, -0.358093],
+    [0.398773, 0.304688, 0.864929], [-0.722961, 0.303589, 0.620544], [-0.63559, -0.621948, -0.457306], [-0.293243, 0.072327, 0.953278],
+    [-0.491638, 0.661041, -0.566772], [-0.304199, -0.572083, -0.761688], [0.908081, -0.398956, 0.127014], [-0.523621, -0.549683, -0.650848],
+    [-0.932922, -0.19986, 0.299408], [0.099426, 0.140869, 0.984985], [-0.020325, -0.999756, -0.002319], [0.952667, 0.280853, -0.11615],
+    [-0.971893, 0.082581, 0.220337], [0.65921, 0.705292, -0.260651], [0.733063, -0.175537, 0.657043], [-0.555206, 0.429504, -0.712189],
+    [0.400421, -0.89859, 0.179352], [0.750885, -0.19696, 0.630341], [0.785675, -0.569336, 0.241821], [-0.058899, -0.464111, 0.883789],
+    [0.129608, -0.94519, 0.299622], [-0.357819, 0.907654, 0.219238], [-0.842133, -0.439117, -0.312927], [-0.313477, 0.84433, 0.434479],
+    [-0.241211, 0.053253, 0.968994], [0.063873, 0.823273, 0.563965], [0.476288, 0.862152, -0.172516], [0.620941, -0.298126, 0.724915],
+    [0.25238, -0.749359, -0.612122], [-0.577545, 0.386566, 0.718994], [-0.406342, -0.737976, 0.538696], [0.04718, 0.556305, 0.82959],
+    [-0.802856, 0.587463, 0.101166], [-0.707733, -0.705963, 0.026428], [0.374908, 0.68457, 0.625092], [0.472137, 0.208405, -0.856506],
+    [-0.703064, -0.581085, -0.409821], [-0.417206, -0.736328, 0.532623], [-0.447876, -0.20285, -0.870728], [0.086945, -0.990417, 0.107086],
+    [0.183685, 0.018341, -0.982788], [0.560638, -0.428864, 0.708282], [0.296722, -0.952576, -0.0672], [0.135773, 0.990265, 0.030243],
+    [-0.068787, 0.654724, 0.752686], [0.762604, -0.551758, 0.337585], [-0.819611, -0.407684, 0.402466], [-0.727844, -0.55072, -0.408539],
+    [-0.855774, -0.480011, 0.19281], [0.693176, -0.079285, 0.716339], [0.226013, 0.650116, -0.725433], [0.246704, 0.953369, -0.173553],
+    [-0.970398, -0.239227, -0.03244], [0.136383, -0.394318, 0.908752], [0.813232, 0.558167, 0.164368], [0.40451, 0.549042, -0.731323],
+    [-0.380249, -0.566711, 0.730865], [0.022156, 0.932739, 0.359741], [0.00824, 0.996552, -0.082306], [0.956635, -0.065338, -0.283722],
+    [-0.743561, 0.008209, 0.668579], [-0.859589, -0.509674, 0.035767], [-0.852234, 0.363678, -0.375977], [-0.201965, -0.970795, -0.12915],
+    [0.313477, 0.947327, 0.06546], [-0.254028, -0.528259, 0.81015], [0.628052, 0.601105, 0.49411], [-0.494385, 0.868378, 0.037933],
+    [0.275635, -0.086426, 0.957336], [-0.197937, 0.468903, -0.860748], [0.895599, 0.399384, 0.195801], [0.560791, 0.825012, -0.069214],
+    [0.304199, -0.849487, 0.43103], [0.096375, 0.93576, 0.339111], [-0.051422, 0.408966, -0.911072], [0.330444, 0.942841, -0.042389],
+    [-0.452362, -0.786407, 0.420563], [0.134308, -0.933472, -0.332489], [0.80191, -0.566711, -0.188934], [-0.987946, -0.105988, 0.112518],
+    [-0.24408, 0.892242, -0.379791], [-0.920502, 0.229095, -0.316376], [0.7789, 0.325958, 0.535706], [-0.912872, 0.185211, -0.36377],
+    [-0.184784, 0.565369, -0.803833], [-0.018463, 0.119537, 0.992615], [-0.259247, -0.935608, 0.239532], [-0.82373, -0.449127, -0.345947],
+    [-0.433105, 0.659515, 0.614349], [-0.822754, 0.378845, -0.423676], [0.687195, -0.674835, -0.26889], [-0.246582, -0.800842, 0.545715],
+    [-0.729187, -0.207794, 0.651978], [0.653534, -0.610443, -0.447388], [0.492584, -0.023346, 0.869934], [0.609039, 0.009094, -0.79306],
+    [0.962494, -0.271088, -0.00885], [0.2659, -0.004913, 0.963959], [0.651245, 0.553619, -0.518951], [0.280548, -0.84314, 0.458618],
+    [-0.175293, -0.983215, 0.049805], [0.035339, -0.979919, 0.196045], [-0.982941, 0.164307, -0.082245], [0.233734, -0.97226, -0.005005],
+    [-0.747253, -0.611328, 0.260437], [0.645599, 0.592773, 0.481384], [0.117706, -0.949524, -0.29068], [-0.535004, -0.791901, -0.294312],
+    [-0.627167, -0.214447, 0.748718], [-0.047974, -0.813477, -0.57959], [-0.175537, 0.477264, -0.860992], [0.738556, -0.414246, -0.53183],
+    [0.562561, -0.704071, 0.433289], [-0.754944, 0.64801, -0.100586], [0.114716, 0.044525, -0.992371], [0.966003, 0.244873, -0.082764]], dtype=np.float32)
+
+feature_points = np.array([
+    [0.536902, 0.020915, 0.501445], [0.216316, 0.517036, 0.822466], [0.965315, 0.377313, 0.678764], [0.744545, 0.097731, 0.396357],
+    [0.247202, 0.520897, 0.613396], [0.542124, 0.146813, 0.255489], [0.810868, 0.638641, 0.980742], [0.292316, 0.357948, 0.114382],
+    [0.861377, 0.629634, 0.72253], [0.714103, 0.048549, 0.075668], [0.56492, 0.162026, 0.054466], [0.411738, 0.156897, 0.887657],
+    [0.599368, 0.074249, 0.170277], [0.225799, 0.393154, 0.301348], [0.057434, 0.293849, 0.442745], [0.150002, 0.398732, 0.184582],
+    [0.9152, 0.630984, 0.97404], [0.117228, 0.79552, 0.763238], [0.158982, 0.616211, 0.250825], [0.906539, 0.316874, 0.676205],
+    [0.23472, 0.667673, 0.792225], [0.273671, 0.119363, 0.199131], [0.856716, 0.828554, 0.900718], [0.70596, 0.635923, 0.989433],
+    [0.027261, 0.283507, 0.113426], [0.388115, 0.900176, 0.637741], [0.438802, 0.71549, 0.043692], [0.20264, 0.378325, 0.450325],
+    [0.471832, 0.147803, 0.906899], [0.524178, 0.784981, 0.051483], [0.893369, 0.596895, 0.275635], [0.391483, 0.844673, 0.103061],
+    [0.257322, 0.70839, 0.504091], [0.199517, 0.660339, 0.376071], [0.03888, 0.531293, 0.216116], [0.138672, 0.907737, 0.807994],
+    [0.659582, 0.915264, 0.449075], [0.627128, 0.480173, 0.380942], [0.018843, 0.211808, 0.569701], [0.082294, 0.689488, 0.57306],
+    [0.593859, 0.21608, 0.373159], [0.108117, 0.595539, 0.021768], [0.380297, 0.948125, 0.377833], [0.319699, 0.315249, 0.972805],
+    [0.79227, 0.445396, 0.845323], [0.372186, 0.096147, 0.689405], [0.423958, 0.055675, 0.11794], [0.328456, 0.605808, 0.631768],
+    [0.37217, 0.213723, 0.0327], [0.447257, 0.440661, 0.728488], [0.299853, 0.148599, 0.649212], [0.498381, 0.049921, 0.496112],
+    [0.607142, 0.562595, 0.990246], [0.739659, 0.108633, 0.978156], [0.209814, 0.258436, 0.876021], [0.30926, 0.600673, 0.713597],
+    [0.576967, 0.641402, 0.85393], [0.029173, 0.418111, 0.581593], [0.008394, 0.589904, 0.661574], [0.979326, 0.275724, 0.111109],
+    [0.440472, 0.120839, 0.521602], [0.648308, 0.284575, 0.204501], [0.153286, 0.822444, 0.300786], [0.303906, 0.364717, 0.209038],
+    [0.916831, 0.900245, 0.600685], [0.890002, 0.58166, 0.431154], [0.705569, 0.55125, 0.417075], [0.403749, 0.696652, 0.292652],
+    [0.911372, 0.690922, 0.323718], [0.036773, 0.258976, 0.274265], [0.225076, 0.628965, 0.351644], [0.065158, 0.08034, 0.467271],
+    [0.130643, 0.385914, 0.919315], [0.253821, 0.966163, 0.017439], [0.39261, 0.478792, 0.978185], [0.072691, 0.982009, 0.097987],
+    [0.731533, 0.401233, 0.10757], [0.349587, 0.479122, 0.700598], [0.481751, 0.788429, 0.706864], [0.120086, 0.562691, 0.981797],
+    [0.001223, 0.19212, 0.451543], [0.173092, 0.10896, 0.549594], [0.587892, 0.657534, 0.396365], [0.125153, 0.66642, 0.385823],
+    [0.890916, 0.436729, 0.128114], [0.369598, 0.759096, 0.044677], [0.904752, 0.088052, 0.621148], [0.005047, 0.452331, 0.162032],
+    [0.494238, 0.523349, 0.741829], [0.69845, 0.452316, 0.563487], [0.819776, 0.49216, 0.00421], [0.647158, 0.551475, 0.362995],
+    [0.177937, 0.814722, 0.727729], [0.867126, 0.997157, 0.108149], [0.085726, 0.796024, 0.665075], [0.362462, 0.323124, 0.043718],
+    [0.042357, 0.31503, 0.328954], [0.870845, 0.683186, 0.467922], [0.514894, 0.809971, 0.631979], [0.176571, 0.36632, 0.850621],
+    [0.505555, 0.749551, 0.75083], [0.401714, 0.481216, 0.438393], [0.508832, 0.867971, 0.654581], [0.058204, 0.566454, 0.084124],
+    [0.548539, 0.90269, 0.779571], [0.562058, 0.048082, 0.863109], [0.07929, 0.713559, 0.783496], [0.265266, 0.672089, 0.786939],
+    [0.143048, 0.086196, 0.876129], [0.408708, 0.229312, 0.629995], [0.206665, 0.207308, 0.710079], [0.341704, 0.264921, 0.028748],
+    [0.629222, 0.470173, 0.726228], [0.125243, 0.328249, 0.794187], [0.74134, 0.489895, 0.189396], [0.724654, 0.092841, 0.039809],
+    [0.860126, 0.247701, 0.655331], [0.964121, 0.672536, 0.044522], [0.690567, 0.837238, 0.63152], [0.953734, 0.352484, 0.289026],
+    [0.034152, 0.852575, 0.098454], [0.795529, 0.452181, 0.826159], [0.186993, 0.820725, 0.440328], [0.922137, 0.704592, 0.915437],
+    [0.738183, 0.733461, 0.193798], [0.929213, 0.16139, 0.318547], [0.888751, 0.430968, 0.740837], [0.193544, 0.872253, 0.563074],
+    [0.274598, 0.347805, 0.666176], [0.449831, 0.800991, 0.588727], [0.052296, 0.714761, 0.42062], [0.570325, 0.05755, 0.210888],
+    [0.407312, 0.662848, 0.924382], [0.895958, 0.775198, 0.688605], [0.025721, 0.301913, 0.791408], [0.500602, 0.831984, 0.828509],
+    [0.642093, 0.494174, 0.52588], [0.446365, 0.440063, 0.763114], [0.630358, 0.223943, 0.333806], [0.906033, 0.498306, 0.241278],
+    [0.42764, 0.772683, 0.198082], [0.225379, 0.503894, 0.436599], [0.016503, 0.803725, 0.189878], [0.291095, 0.499114, 0.151573],
+    [0.079031, 0.904618, 0.708535], [0.2739, 0.067419, 0.317124], [0.936499, 0.716511, 0.543845], [0.939909, 0.826574, 0.71509],
+    [0.154864, 0.75015, 0.845808], [0.648108, 0.556564, 0.644757], [0.140873, 0.799167, 0.632989], [0.444245, 0.471978, 0.43591],
+    [0.359793, 0.216241, 0.007633], [0.337236, 0.857863, 0.380247], [0.092517, 0.799973, 0.919], [0.296798, 0.096989, 0.854831],
+    [0.165369, 0.568475, 0.216855], [0.020457, 0.835511, 0.538039], [0.999742, 0.620226, 0.244053], [0.060399, 0.323007, 0.294874],
+    [0.988899, 0.384919, 0.735655], [0.773428, 0.549776, 0.292882], [0.660611, 0.593507, 0.621118], [0.175269, 0.682119, 0.794493],
+    [0.868197, 0.63215, 0.807823], [0.509656, 0.482035, 0.00178], [0.259126, 0.358002, 0.280263], [0.192985, 0.290367, 0.208111],
+    [0.917633, 0.114422, 0.925491], [0.98111, 0.25557, 0.974862], [0.016629, 0.552599, 0.575741], [0.612978, 0.615965, 0.803615],
+    [0.772334, 0.089745, 0.838812], [0.634542, 0.113709, 0.755832], [0.577589, 0.667489, 0.529834], [0.32566, 0.817597, 0.316557],
+    [0.335093, 0.737363, 0.260951], [0.737073, 0.04954, 0.735541], [0.988891, 0.299116, 0.147695], [0.417271, 0.940811, 0.52416],
+    [0.857968, 0.176403, 0.244835], [0.485759, 0.033353, 0.280319], [0.750688, 0.755809, 0.924208], [0.095956, 0.962504, 0.275584],
+    [0.173715, 0.942716, 0.706721], [0.078464, 0.576716, 0.804667], [0.559249, 0.900611, 0.646904], [0.432111, 0.927885, 0.383277],
+    [0.269973, 0.114244, 0.574867], [0.150703, 0.241855, 0.272871], [0.19995, 0.079719, 0.868566], [0.962833, 0.789122, 0.320025],
+    [0.905554, 0.234876, 0.991356], [0.061913, 0.732911, 0.78596], [0.874074, 0.069035, 0.658632], [0.309901, 0.023676, 0.791603],
+    [0.764661, 0.661278, 0.319583], [0.82965, 0.117091, 0.903124], [0.982098, 0.161631, 0.193576], [0.670428, 0.85739, 0.00376],
+    [0.572578, 0.222162, 0.114551], [0.420118, 0.530404, 0.470682], [0.525527, 0.764281, 0.040596], [0.443275, 0.501124, 0.816161],
+    [0.417467, 0.332172, 0.447565], [0.614591, 0.559246, 0.805295], [0.226342, 0.155065, 0.71463], [0.160925, 0.760001, 0.453456],
+    [0.093869, 0.406092, 0.264801], [0.72037, 0.743388, 0.373269], [0.403098, 0.911923, 0.897249], [0.147038, 0.753037, 0.516093],
+    [0.739257, 0.175018, 0.045768], [0.735857, 0.80133, 0.927708], [0.240977, 0.59187, 0.921831], [0.540733, 0.1491, 0.423152],
+    [0.806876, 0.397081, 0.0611], [0.81163, 0.044899, 0.460915], [0.961202, 0.822098, 0.971524], [0.867608, 0.773604, 0.226616],
+    [0.686286, 0.926972, 0.411613], [0.267873, 0.081937, 0.226124], [0.295664, 0.374594, 0.53324], [0.237876, 0.669629, 0.599083],
+    [0.513081, 0.878719, 0.201577], [0.721296, 0.495038, 0.07976], [0.965959, 0.23309, 0.052496], [0.714748, 0.887844, 0.308724],
+    [0.972885, 0.723337, 0.453089], [0.914474, 0.704063, 0.823198], [0.834769, 0.906561, 0.9196], [0.100601, 0.307564, 0.901977],
+    [0.468879, 0.265376, 0.885188], [0.683875, 0.868623, 0.081032], [0.466835, 0.199087, 0.663437], [0.812241, 0.311337, 0.821361],
+    [0.356628, 0.898054, 0.160781], [0.222539, 0.714889, 0.490287], [0.984915, 0.951755, 0.964097], [0.641795, 0.815472, 0.852732],
+    [0.862074, 0.051108, 0.440139], [0.323207, 0.517171, 0.562984], [0.115295, 0.743103, 0.977914], [0.337596, 0.440694, 0.535879],
+    [0.959427, 0.351427, 0.704361], [0.010826, 0.131162, 0.57708], [0.349572, 0.774892, 0.425796], [0.072697, 0.500001, 0.267322],
+    [0.909654, 0.206176, 0.223987], [0.937698, 0.323423, 0.117501], [0.490308, 0.474372, 0.689943], [0.168671, 0.719417, 0.188928],
+    [0.330464, 0.265273, 0.446271], [0.171933, 0.176133, 0.474616], [0.140182, 0.114246, 0.905043], [0.71387, 0.555261, 0.951333]], dtype=np.float32)
+
+
+def float32(x):
+    return np.asarray(x, dtype=np.float32)
+
+
+def lattice(i, j, k):
+    """ Hashed index of the integer lattice point (i, j, k) (HASHVEC, HASHPNT) """
+    return permutation[(permutation[(permutation[k & 255] + j) & 255] + i) & 255]
+
+
+def floor_int(x):
+    f = np.floor(x)
+    return f, f.astype(np.int32)
+
+
+def blender_original(p):
+    """ Blender's original noise in [0, 1] (orgBlenderNoise) """
+    p = float32(p)
+    (fx, ix), (fy, iy), (fz, iz) = [floor_int(p[..., i]) for i in range(3)]
+    o = [p[..., 0] - fx, p[..., 1] - fy, p[..., 2] - fz]
+    j = [c - np.float32(1) for c in o]
+
+    # Cubic weights of the near (1 - 3t² + 2t³) and far (1 - 3t² - 2t³ of t - 1) lattice points
+    near = [np.float32(1) - np.float32(3) * c * c + np.float32(2) * (c * c) * c for c in o]
+    far = [np.float32(1) - np.float32(3) * c * c - np.float32(2) * (c * c) * c for c in j]
+
+    n = np.full(p.shape[:-1], 0.5, dtype=np.float32)
+    for dx in (0, 1):
+        for dy in (0, 1):
+            b = permutation[(permutation[(ix + dx) & 255] + ((iy + dy) & 255)) & 255]
+            for dz in (0, 1):
+                h = gradients[permutation[(((iz + dz) & 255) + b) & 255]]
+                x, y, z = (j[0] if dx else o[0]), (j[1] if dy else o[1]), (j[2] if dz else o[2])
+                weight = (far[0] if dx else near[0]) * (far[1] if dy else near[1]) * (far[2] if dz else near[2])
+                n = n + weight * (h[..., 0] * x + h[..., 1] * y + h[..., 2] * z)
+    return np.clip(n, 0, 1)
+
+
+def perlin_original(p):
+    """ Perlin's original noise, signed (noise3_perlin) """
+    p = float32(p)
+    t = p + np.float32(10000)
+    b0 = t.astype(np.int32) & 255
+    b1 = (b0 + 1) & 255
+    r0 = t - np.floor(t)
+    r1 = r0 - np.float32(1)
+    s = r0 * r0 * (np.float32(3) - np.float32(2) * r0)
+
+    def value_at(i, j, k):
+        r = [r1[..., 0] if i else r0[..., 0], r1[..., 1] if j else r0[..., 1], r1[..., 2] if k else r0[..., 2]]
+        b = [b1[..., 0] if i else b0[..., 0], b1[..., 1] if j else b0[..., 1], b1[..., 2] if k else b0[..., 2]]
+        q = gradients[(permutation[(permutation[b[0]] + b[1]) & 255] + b[2]) & 255]
+        return r[0] * q[..., 0] + r[1] * q[..., 1] + r[2] * q[..., 2]
+
+    def lerp(t, a, b):
+        return a + t * (b - a)
+
+    sx, sy, sz = s[..., 0], s[..., 1], s[..., 2]
+    c, d = [lerp(sy, lerp(sx, value_at(0, 0, k), value_at(1, 0, k)), lerp(sx, value_at(0, 1, k), value_at(1, 1, k)))
+        for k in (0, 1)]
+    return np.float32(1.5) * lerp(sz, c, d)
+
+
+def improved_grad(h, x, y, z):
+    h = h & 15
+    u = np.where(h < 8, x, y)
+    v = np.where(h < 4, y, np.where((h == 12) | (h == 14), x, z))
+    return np.where(h & 1, -u, u) + np.where(h & 2, -v, v)
+
+
+def perlin_improved(p):
+    """ Perlin's improved noise, signed (newPerlin) """
+    p = float32(p)
+    f = np.floor(p)
+    i = f.astype(np.int32) & 255
+    r = p - f
+    u = r * r * r * (r * (r * np.float32(6) - np.float32(15)) + np.float32(10))
+
+    def lerp(t, a, b):
+        return a + t * (b - a)
+
+    X, Y, Z = i[..., 0], i[..., 1], i[..., 2]
+    x, y, z = r[..., 0], r[..., 1], r[..., 2]
+    one = np.float32(1)
+    A, B = permutation[X] + Y, permutation[(X + 1) & 255] + Y
+    AA, AB = permutation[A & 255] + Z, permutation[(A + 1) & 255] + Z
+    BA, BB = permutation[B & 255] + Z, permutation[(B + 1) & 255] + Z
+    g = lambda k, dx, dy, dz: improved_grad(permutation[k & 255], x - dx, y - dy, z - dz)
+
+    return lerp(u[..., 2],
+        lerp(u[..., 1], lerp(u[..., 0], g(AA, 0, 0, 0), g(BA, one, 0, 0)), lerp(u[..., 0], g(AB, 0, one, 0), g(BB, one, one, 0))),
+        lerp(u[..., 1], lerp(u[..., 0], g(AA + 1, 0, 0, one), g(BA + 1, one, 0, one)),
+            lerp(u[..., 0], g(AB + 1, 0, one, one), g(BB + 1, one, one, one))))
+
+
+def voronoi_distance(d, metric='DISTANCE', exponent=2.5):
+    """ Distance of offsets d (..., 3) by a Texture distance_metric """
+    x, y, z = np.abs(d[..., 0]), np.abs(d[..., 1]), np.abs(d[..., 2])
+    if metric == 'DISTANCE':
+        return np.sqrt(x * x + y * y + z * z)
+    elif metric == 'DISTANCE_SQUARED':
+        return x * x + y * y + z * z
+    elif metric == 'MANHATTAN':
+        return x + y + z
+    elif metric == 'CHEBYCHEV':
+        return np.maximum(np.maximum(x, y), z)
+    elif metric == 'MINKOVSKY_HALF':
+        d = np.sqrt(x) + np.sqrt(y) + np.sqrt(z)
+        return d * d
+    elif metric == 'MINKOVSKY_FOUR':
+        x, y, z = x * x, y * y, z * z
+        return np.sqrt(np.sqrt(x * x + y * y + z * z))
+    elif metric == 'MINKOVSKY':
+        e = np.float32(exponent)
+        return (x ** e + y ** e + z ** e) ** (np.float32(1) / e)
+    raise KeyError("unknown distance metric {}".format(metric))
+
+
+# Neighbouring cells searched for feature points, in Blender's order (x outermost)
+cell_offsets = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=np.int32)
+
+
+def voronoi(p, metric='DISTANCE', exponent=2.5):
+    """ Distances (..., 4) and positions (..., 4, 3) of the four closest feature points
+    (BLI_noise_voronoi), ties keep the first cell in search order """
+    p = float32(p)
+    cells = np.floor(p).astype(np.int32)[..., None, :] + cell_offsets
+    points = feature_points[lattice(cells[..., 0], cells[..., 1], cells[..., 2])] + cells.astype(np.float32)
+    distances = voronoi_distance(p[..., None, :] - points, metric, exponent).astype(np.float32)
+
+    order = np.argsort(distances, axis=-1, kind='stable')[..., :4]
+    return np.take_along_axis(distances, order, -1), np.take_along_axis(points, order[..., None], -2)
+
+
+def cell_noise(p):
+    """ Noise constant in each unit cell in [0, 1] (BLI_cellNoiseU) """
+    p = (float32(p) + np.float32(0.000001)) * np.float32(1.00001)
+    i = np.floor(p).astype(np.int32).astype(np.uint32)
+    with np.errstate(over='ignore'):
+        n = i[..., 0] + i[..., 1] * np.uint32(1301) + i[..., 2] * np.uint32(314159)
+        n ^= n << np.uint32(13)
+        n = n * (n * n * np.uint32(15731) + np.uint32(789221)) + np.uint32(1376312589)
+    return n.astype(np.float32) / np.float32(4294967296.0)
+
+
+def cell_vector(p):
+    """ Vector in [0, 1] constant in each unit cell, its feature point (BLI_noise_cell_v3) """
+    i = np.floor((float32(p) + np.float32(0.000001)) * np.float32(1.00001)).astype(np.int32)
+    return feature_points[lattice(i[..., 0], i[..., 1], i[..., 2])]
+
+
+def voronoi_feature(k):
+    return lambda p: voronoi(p)[0][..., k]
+
+
+def voronoi_f2_f1(p):
+    distances = voronoi(p)[0]
+    return distances[..., 1] - distances[..., 0]
+
+
+def voronoi_crackle(p):
+    return np.minimum(np.float32(10) * voronoi_f2_f1(p), 1)
+
+
+def unsigned(f):
+    return lambda p: np.float32(0.5) + np.float32(0.5) * f(p)
+
+
+def signed(f):
+    return lambda p: np.float32(2) * f(p) - np.float32(1)
+
+
+# Noise bases (Texture noise_basis) in about [0, 1], as used by the generic noise and turbulence
+unsigned_bases = dict(
+    BLENDER_ORIGINAL=blender_original, ORIGINAL_PERLIN=unsigned(perlin_original),
+    IMPROVED_PERLIN=unsigned(perlin_improved), VORONOI_F1=voronoi_feature(0), VORONOI_F2=voronoi_feature(1),
+    VORONOI_F3=voronoi_feature(2), VORONOI_F4=voronoi_feature(3), VORONOI_F2_F1=voronoi_f2_f1,
+    VORONOI_CRACKLE=voronoi_crackle, CELL_NOISE=cell_noise,
+)
+
+# Signed noise bases in about [-1, 1], as used by the musgrave functions
+signed_bases = dict(unsigned_bases, ORIGINAL_PERLIN=perlin_original, IMPROVED_PERLIN=perlin_improved,
+    **{k: signed(f) for k, f in unsigned_bases.items() if k not in ('ORIGINAL_PERLIN', 'IMPROVED_PERLIN')})
+
+
+def basis(bases, name):
+    if name not in bases:
+        raise KeyError("unknown noise basis {}".format(name))
+    return bases[name]
+
+
+def scaled(p, size, name):
+    """ Point of the generic functions, Blender's original noise is shifted by one """
+    p = float32(p) + np.float32(1 if name == 'BLENDER_ORIGINAL' else 0)
+    size = float32(size)[..., None]
+    with np.errstate(divide='ignore'):
+        return np.where(size != 0, p * (np.float32(1) / size), p)
+
+
+def generic_noise(p, size, hard=False, name='BLENDER_ORIGINAL'):
+    """ Noise in [0, 1] of p / size, hard noise folds signed noise to its absolute value (BLI_noise_generic_noise) """
+    n = basis(unsigned_bases, name)(scaled(p, size, name))
+    return np.abs(np.float32(2) * n - np.float32(1)) if hard else n
+
+
+def generic_turbulence(p, size, depth, hard=False, name='BLENDER_ORIGINAL'):
+    """ depth + 1 octaves of generic noise normalized to [0, 1] (BLI_noise_generic_turbulence) """
+    f, p = basis(unsigned_bases, name), scaled(p, size, name)
+    total, amplitude, frequency = 0, np.float32(1), np.float32(1)
+    for _ in range(depth + 1):
+        t = f(p * frequency)
+        if hard:
+            t = np.abs(np.float32(2) * t - np.float32(1))
+        total = total + t * amplitude
+        amplitude, frequency = amplitude * np.float32(0.5), frequency * np.float32(2)
+    return total * np.float32((1 << depth) / ((1 << (depth + 1)) - 1))
+
+
+def musgrave(p, musgrave_type, h, lacunarity, octaves, offset=1.0, gain=1.0, name='BLENDER_ORIGINAL'):
+    """ Musgrave fractals of signed noise (BLI_noise_mg_fbm, _multi_fractal, _hetero_terrain,
+    _hybrid_multi_fractal and _ridged_multi_fractal), parameters may vary per point """
+    f, p = basis(signed_bases, name), float32(p)
+    h, lacunarity, octaves, offset, gain, _ = np.broadcast_arrays(
+        *[float32(v) for v in (h, lacunarity, octaves, offset, gain)], p[..., 0])
+    count, remainder = np.floor(octaves).astype(int), octaves - np.floor(octaves)
+    pw_hl = lacunarity ** -h
+
+    # Fbm and multifractal start from octave 0, the others take a first (unweighted) octave
+    first = 0 if musgrave_type in ('FBM', 'MULTIFRACTAL') else 1
+    pwr = np.ones_like(h) if first == 0 else pw_hl
+    if musgrave_type == 'FBM':
+        value = np.zeros_like(h)
+    elif musgrave_type == 'MULTIFRACTAL':
+        value = np.ones_like(h)
+    elif musgrave_type == 'HETERO_TERRAIN':
+        value = offset + f(p)
+    elif musgrave_type == 'HYBRID_MULTIFRACTAL':
+        value = f(p) + offset
+        weight = gain * value
+    elif musgrave_type == 'RIDGED_MULTIFRACTAL':
+        signal = offset - np.abs(f(p))
+        value = signal = signal * signal
+    else:
+        raise KeyError("unknown musgrave type {}".format(musgrave_type))
+    if first == 1 and musgrave_type != 'RIDGED_MULTIFRACTAL':
+        p = p * lacunarity[..., None]
+
+    active = np.ones(h.shape, dtype=bool)
+    for i in range(first, int(count.max(initial=0))):
+        active = active & (i < count)
+        if musgrave_type == 'HYBRID_MULTIFRACTAL':
+            active = active & (weight > np.float32(0.001))
+        elif musgrave_type == 'RIDGED_MULTIFRACTAL':
+            p = np.where(active[..., None], p * lacunarity[..., None], p)
+
+        n = f(p)
+        if musgrave_type == 'FBM':
+            octave = value + n * pwr
+        elif musgrave_type == 'MULTIFRACTAL':
+            octave = value * (pwr * n + np.float32(1))
+        elif musgrave_type == 'HETERO_TERRAIN':
+            octave = value + (n + offset) * pwr * value
+        elif musgrave_type == 'HYBRID_MULTIFRACTAL':
+            w, octave_signal = np.minimum(weight, 1), (n + offset) * pwr
+            octave = value + w * octave_signal
+            weight = np.where(active, w * (gain * octave_signal), weight)
+        else:
+            octave_signal = offset - np.abs(n)
+            octave_signal = octave_signal * octave_signal * np.clip(signal * gain, 0, 1)
+            octave = value + octave_signal * pwr
+            signal = np.where(active, octave_signal, signal)
+
+        value = np.where(active, octave, value)
+        pwr = np.where(active, pwr * pw_hl, pwr)
+        if musgrave_type != 'RIDGED_MULTIFRACTAL':
+            p = np.where(active[..., None], p * lacunarity[..., None], p)
+
+    if musgrave_type == 'RIDGED_MULTIFRACTAL' or not np.any(remainder != 0):
+        return value
+
+    n = f(p)
+    if musgrave_type == 'FBM':
+        octave = value + remainder * n * pwr
+    elif musgrave_type == 'MULTIFRACTAL':
+        octave = value * (remainder * n * pwr + np.float32(1))
+    elif musgrave_type == 'HETERO_TERRAIN':
+        octave = value + remainder * ((n + offset) * pwr * value)
+    else:
+        octave = value + remainder * ((n + offset) * pwr)
+    return np.where(remainder != 0, octave, value)
+
+
+def variable_lacunarity(p, distortion, distortion_name='BLENDER_ORIGINAL', name='BLENDER_ORIGINAL'):
+    """ Noise of name at p moved by noise of distortion_name (BLI_noise_mg_variable_lacunarity) """
+    f, g, p = basis(signed_bases, distortion_name), basis(signed_bases, name), float32(p)
+    distortion, shift = float32(distortion), np.float32(13.5)
+    offset = np.stack([f(p + shift) * distortion, f(p) * distortion, f(p - shift) * distortion], axis=-1)
+    return g(p + offset)
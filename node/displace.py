@@ -0,0 +1,93 @@
+import bpy
+import numpy as np
+
+from .graph import Graph
+from .expression import RecordingContext
+from .value import Value
+from .util import namespace, assert_type
+from .evaluate import safe_divide, safe_normalize
+from . import shader, evaluate_shader
+
+
+def foreach_array(collection, attribute, size, dtype=np.float32):
+    """ Attribute of every element of a bpy collection as an (n, size) array, without copying through Python """
+    array = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    return array.reshape(-1, size) if size > 1 else array
+
+
+def vertex_uvs(mesh, uv_layer=None):
+    """ Per vertex UVs, averaged over the face corners of each vertex (seams are blended) """
+    layer = mesh.uv_layers[uv_layer] if uv_layer is not None else mesh.uv_layers.active
+    if layer is None:
+        return None
+
+    uv = foreach_array(layer.data, 'uv', 2)
+    vertex_index = foreach_array(mesh.loops, 'vertex_index', 1, dtype=np.int32)
+
+    n = len(mesh.vertices)
+    counts = np.maximum(np.bincount(vertex_index, minlength=n), 1)
+    u = np.bincount(vertex_index, uv[:, 0], minlength=n) / counts
+    v = np.bincount(vertex_index, uv[:, 1], minlength=n) / counts
+    return np.stack([u, v, np.zeros_like(u)], axis=-1).astype(np.float32)
+
+
+def mesh_attributes(mesh, matrix=None, uv_layer=None):
+    """ Shader attributes (Position, Normal, Generated, UV) of the vertices of a mesh,
+    positions and normals are transformed by matrix (e.g. to world space) if given """
+    co = foreach_array(mesh.vertices, 'co', 3)
+    normal = foreach_array(mesh.vertices, 'normal', 3)
+
+    low, high = co.min(axis=0), co.max(axis=0)
+    attributes = dict(Position=co, Normal=normal, Generated=safe_divide(co - low, high - low).astype(np.float32))
+
+    if matrix is not None:
+        linear = matrix[:3, :3]
+        attributes['Position'] = co @ linear.T + matrix[:3, 3]
+        attributes['Normal'] = safe_normalize(normal @ np.linalg.inv(linear)).astype(np.float32)
+
+    uv = vertex_uvs(mesh, uv_layer)
+    if uv is not None:
+        attributes['UV'] = uv
+    return attributes
+
+
+def displacement_value(f):
+    """ Record f(geometry) into a standalone shader graph, geometry has the position,
+    normal, uv and generated coordinate Values """
+    with RecordingContext(Graph('SHADER', 'displacement')):
+        geometry, coords = shader.new_geometry(), shader.tex_coord()
+        value = f(namespace('geometry', position=geometry.position, normal=geometry.normal,
+            uv=coords.uv, generated=coords.generated))
+
+    assert_type(value, Value)
+    return value
+
+
+def displace(obj, f, scale=1.0, space='WORLD', uv_layer=None, chunk_size=65536, threads=None):
+    """ Displace the vertices of a mesh object on the CPU, replacing shader displacement.
+
+    f: function of a geometry namespace (see displacement_value) written with node.shader,
+      or a shader Value. A float displaces along the normal, a vector is an offset
+    space: 'WORLD' evaluates at world space positions and normals (as shaders do), 'OBJECT'
+      in object space
+    Returns the evaluated displacement """
+    assert_type(obj, bpy.types.Object)
+    mesh = obj.data
+    matrix = np.array(obj.matrix_world, dtype=np.float32) if space == 'WORLD' else None
+
+    attributes = mesh_attributes(mesh, matrix, uv_layer)
+    value = f if isinstance(f, Value) else displacement_value(f)
+    displacement = evaluate_shader.evaluate(value, attributes, chunk_size=chunk_size, threads=threads)
+
+    co = foreach_array(mesh.vertices, 'co', 3)
+    if displacement.ndim == 1:
+        offset = foreach_array(mesh.vertices, 'normal', 3) * (displacement * scale)[:, None]
+    else:
+        offset = displacement[:, :3] * scale
+        if matrix is not None:
+            offset = offset @ np.linalg.inv(matrix[:3, :3]).T
+
+    mesh.vertices.foreach_set('co', (co + offset).astype(np.float32).ravel())
+    mesh.update()
+    return displacement
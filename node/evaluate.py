@@ -0,0 +1,425 @@
+import bpy
+import numpy as np
+
+from collections import Counter
+
+from .graph import Graph, capture, topological_order
+
+
+# Node implementations by tree type then bl_idname, f(evaluator, node, inputs) -> outputs
+implementations = dict(SHADER={}, COMPOSITING={}, TEXTURE={})
+
+scalar_types = {'VALUE', 'INT', 'BOOLEAN'}
+
+# Number of channels (last axis) of values of each socket type
+channels = dict(VALUE=None, INT=None, BOOLEAN=None, VECTOR=3, RGBA=4)
+
+
+def implements(tree_type, *bl_idnames, margin=None):
+    """ Register a NumPy implementation of nodes, 'margin(evaluator, node)' gives the number
+    of pixels of context a (non per-pixel) node needs around a tile """
+    def register(f):
+        f.margin = margin
+        for bl_idname in bl_idnames:
+            implementations[tree_type][bl_idname] = f
+        return f
+    return register
+
+
+def luminance(rgba):
+    return rgba[..., 0] * 0.2126 + rgba[..., 1] * 0.7152 + rgba[..., 2] * 0.0722
+
+
+def convert(value, from_type, to_type):
+    """ Implicit conversion along a link, following Blender's rules """
+    if value is None or from_type == to_type or isinstance(value, str):
+        return value
+
+    if from_type in scalar_types:
+        if to_type == 'VECTOR':
+            return np.stack([value, value, value], axis=-1)
+        elif to_type == 'RGBA':
+            return np.stack([value, value, value, np.ones_like(value)], axis=-1)
+
+    elif from_type == 'RGBA':
+        if to_type in scalar_types:
+            return luminance(value)
+        elif to_type == 'VECTOR':
+            return value[..., :3]
+
+    elif from_type == 'VECTOR':
+        if to_type in scalar_types:
+            return value.mean(axis=-1)
+        elif to_type == 'RGBA':
+            return np.concatenate([value, np.ones_like(value[..., :1])], axis=-1)
+
+    return value
+
+
+def rgb(color):
+    return color[..., :3]
+
+def alpha(color):
+    return color[..., 3]
+
+def rgba(rgb, alpha):
+    rgb = np.asarray(rgb)
+    alpha = np.broadcast_to(alpha, rgb.shape[:-1])
+    return np.concatenate([rgb, alpha[..., None]], axis=-1)
+
+
+def safe_divide(a, b):
+    with np.errstate(all='ignore'):
+        return np.where(b != 0, a / np.where(b != 0, b, 1), 0)
+
+
+def smooth_min(a, b, c):
+    with np.errstate(all='ignore'):
+        h = np.maximum(c - np.abs(a - b), 0) / np.where(c != 0, c, 1)
+        return np.where(c != 0, np.minimum(a, b) - h * h * h * c * (1 / 6), np.minimum(a, b))
+
+
+def safe_power(a, b):
+    with np.errstate(all='ignore'):
+        valid = (a >= 0) | (np.floor(b) == b)
+        return np.where(valid, np.power(np.where(valid, a, 1), b), 0)
+
+
+def safe_log(a, b):
+    with np.errstate(all='ignore'):
+        valid = (a > 0) & (b > 0)
+        return np.where(valid, safe_divide(np.log(np.where(valid, a, 1)), np.log(np.where(valid, b, 2))), 0)
+
+
+def wrap(value, max, min):
+    size = max - min
+    return np.where(size != 0, value - size * np.floor(safe_divide(value - min, size)), min)
+
+
+def fract(x):
+    return x - np.floor(x)
+
+
+def ping_pong(a, b):
+    return np.where(b != 0, np.abs(fract(safe_divide(a - b, b * 2)) * b * 2 - b), 0)
+
+
+def sqrt(a):
+    with np.errstate(all='ignore'):
+        return np.where(a > 0, np.sqrt(np.maximum(a, 0)), 0)
+
+
+# Math node operations with Blender's "safe" semantics, f(a, b, c)
+math_operations = dict(
+    ADD = lambda a, b, c: a + b,
+    SUBTRACT = lambda a, b, c: a - b,
+    MULTIPLY = lambda a, b, c: a * b,
+    DIVIDE = lambda a, b, c: safe_divide(a, b),
+    MULTIPLY_ADD = lambda a, b, c: a * b + c,
+    POWER = lambda a, b, c: safe_power(a, b),
+    LOGARITHM = lambda a, b, c: safe_log(a, b),
+    SQRT = lambda a, b, c: sqrt(a),
+    INVERSE_SQRT = lambda a, b, c: safe_divide(1.0, sqrt(a)),
+    ABSOLUTE = lambda a, b, c: np.abs(a),
+    EXPONENT = lambda a, b, c: np.exp(a),
+    MINIMUM = lambda a, b, c: np.minimum(a, b),
+    MAXIMUM = lambda a, b, c: np.maximum(a, b),
+    LESS_THAN = lambda a, b, c: (a < b).astype(np.result_type(a, b)),
+    GREATER_THAN = lambda a, b, c: (a > b).astype(np.result_type(a, b)),
+    SIGN = lambda a, b, c: np.sign(a),
+    COMPARE = lambda a, b, c: (np.abs(a - b) <= np.maximum(c, 1e-5)).astype(np.result_type(a, b)),
+    SMOOTH_MIN = lambda a, b, c: smooth_min(a, b, c),
+    SMOOTH_MAX = lambda a, b, c: -smooth_min(-a, -b, c),
+    ROUND = lambda a, b, c: np.floor(a + 0.5),
+    FLOOR = lambda a, b, c: np.floor(a),
+    CEIL = lambda a, b, c: np.ceil(a),
+    TRUNC = lambda a, b, c: np.trunc(a),
+    FRACT = lambda a, b, c: fract(a),
+    MODULO = lambda a, b, c: np.where(b != 0, np.fmod(a, np.where(b != 0, b, 1)), 0),
+    FLOORED_MODULO = lambda a, b, c: np.where(b != 0, a - np.floor(safe_divide(a, b)) * b, 0),
+    WRAP = lambda a, b, c: wrap(a, b, c),
+    SNAP = lambda a, b, c: np.floor(safe_divide(a, b)) * b,
+    PINGPONG = lambda a, b, c: ping_pong(a, b),
+    SINE = lambda a, b, c: np.sin(a),
+    COSINE = lambda a, b, c: np.cos(a),
+    TANGENT = lambda a, b, c: np.tan(a),
+    ARCSINE = lambda a, b, c: np.arcsin(np.clip(a, -1, 1)),
+    ARCCOSINE = lambda a, b, c: np.arccos(np.clip(a, -1, 1)),
+    ARCTANGENT = lambda a, b, c: np.arctan(a),
+    ARCTAN2 = lambda a, b, c: np.arctan2(a, b),
+    SINH = lambda a, b, c: np.sinh(a),
+    COSH = lambda a, b, c: np.cosh(a),
+    TANH = lambda a, b, c: np.tanh(a),
+    RADIANS = lambda a, b, c: np.radians(a),
+    DEGREES = lambda a, b, c: np.degrees(a),
+)
+
+
+def math_operation(node, a, b, c):
+    operation = node.properties['operation']
+    if operation not in math_operations:
+        raise NotImplementedError("math operation {} is not implemented".format(operation))
+
+    with np.errstate(all='ignore'):
+        result = math_operations[operation](a, b, c)
+
+    if node.properties.get('use_clamp', False):
+        result = np.clip(result, 0, 1)
+    return result
+
+
+def dot(a, b):
+    return np.sum(a * b, axis=-1)
+
+
+def length(a):
+    return np.sqrt(dot(a, a))
+
+
+def safe_normalize(a):
+    size = length(a)[..., None]
+    return np.where(size != 0, a / np.where(size != 0, size, 1), 0)
+
+
+def rotate_around_axis(p, axis, angle):
+    """ Rotate vectors p around a (normalized) axis by angle radians """
+    angle = np.asarray(angle)[..., None]
+    cos, sin = np.cos(angle), np.sin(angle)
+    return p * cos + np.cross(axis, p) * sin + axis * dot(axis, p)[..., None] * (1 - cos)
+
+
+def euler_to_matrix(euler):
+    """ XYZ euler rotations to 3x3 matrices (trailing axes) """
+    euler = np.asarray(euler)
+    cx, cy, cz = np.cos(euler[..., 0]), np.cos(euler[..., 1]), np.cos(euler[..., 2])
+    sx, sy, sz = np.sin(euler[..., 0]), np.sin(euler[..., 1]), np.sin(euler[..., 2])
+
+    rows = [[cy * cz, sy * sx * cz - cx * sz, sy * cx * cz + sx * sz],
+            [cy * sz, sy * sx * sz + cx * cz, sy * cx * sz - sx * cz],
+            [-sy, cy * sx, cy * cx]]
+    return np.stack([np.stack(np.broadcast_arrays(*row), axis=-1) for row in rows], axis=-2)
+
+
+def matrix_to_euler(matrix):
+    """ XYZ euler angles of rotation matrices, the inverse of euler_to_matrix """
+    m = np.asarray(matrix)
+    cy = np.hypot(m[..., 0, 0], m[..., 1, 0])
+    gimbal = cy < 1e-6
+
+    x = np.where(gimbal, np.arctan2(-m[..., 1, 2], m[..., 1, 1]), np.arctan2(m[..., 2, 1], m[..., 2, 2]))
+    z = np.where(gimbal, 0, np.arctan2(m[..., 1, 0], m[..., 0, 0]))
+    return np.stack([x, np.arctan2(-m[..., 2, 0], cy), z], axis=-1)
+
+
+def transform(matrix, v):
+    return np.einsum('...ij,...j->...i', matrix, v)
+
+
+def rgb_to_hsv(color):
+    r, g, b = color[..., 0], color[..., 1], color[..., 2]
+    cmax = np.maximum(np.maximum(r, g), b)
+    delta = cmax - np.minimum(np.minimum(r, g), b)
+
+    s = safe_divide(delta, cmax)
+    with np.errstate(all='ignore'):
+        h = np.where(r == cmax, safe_divide(g - b, delta),
+            np.where(g == cmax, 2 + safe_divide(b - r, delta), 4 + safe_divide(r - g, delta)))
+
+    h = np.where(s == 0, 0, h / 6)
+    return np.stack([np.where(h < 0, h + 1, h), s, cmax], axis=-1)
+
+
+def hsv_to_rgb(hsv):
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    h = fract(h) * 6
+    i = np.floor(h)
+    f = h - i
+
+    p, q, t = v * (1 - s), v * (1 - s * f), v * (1 - s * (1 - f))
+    i = i.astype(int) % 6
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    return np.stack([r, g, b], axis=-1)
+
+
+def linear_to_srgb(c):
+    return np.where(c < 0.0031308, np.maximum(c, 0) * 12.92, 1.055 * np.power(np.maximum(c, 0.0031308), 1 / 2.4) - 0.055)
+
+def srgb_to_linear(c):
+    return np.where(c < 0.04045, np.maximum(c, 0) / 12.92, np.power((np.maximum(c, 0.04045) + 0.055) / 1.055, 2.4))
+
+
+def blend_hsv(c1, c2, f, channels):
+    c1, c2, f = np.broadcast_arrays(c1, c2, f)
+    hsv1, hsv2 = rgb_to_hsv(c1), rgb_to_hsv(c2)
+    mixed = hsv1.copy()
+    for i in channels:
+        mixed[..., i] = hsv1[..., i] * (1 - f[..., 0]) + hsv2[..., i] * f[..., 0]
+    return hsv_to_rgb(mixed)
+
+
+# Blend modes of the MixRGB nodes on rgb arrays, f has a trailing axis of 1
+blend_modes = dict(
+    MIX = lambda c1, c2, f: c1 * (1 - f) + c2 * f,
+    ADD = lambda c1, c2, f: c1 + c2 * f,
+    SUBTRACT = lambda c1, c2, f: c1 - c2 * f,
+    MULTIPLY = lambda c1, c2, f: c1 * (1 - f + c2 * f),
+    SCREEN = lambda c1, c2, f: 1 - (1 - f + f * (1 - c2)) * (1 - c1),
+    DIVIDE = lambda c1, c2, f: np.where(c2 != 0, c1 * (1 - f) + f * safe_divide(c1, c2), c1),
+    DIFFERENCE = lambda c1, c2, f: c1 * (1 - f) + f * np.abs(c1 - c2),
+    DARKEN = lambda c1, c2, f: c1 * (1 - f) + f * np.minimum(c1, c2),
+    LIGHTEN = lambda c1, c2, f: c1 * (1 - f) + f * np.maximum(c1, c2),
+    OVERLAY = lambda c1, c2, f: np.where(c1 < 0.5, c1 * (1 - f + 2 * f * c2),
+        1 - (1 - f + 2 * f * (1 - c2)) * (1 - c1)),
+    SOFT_LIGHT = lambda c1, c2, f: c1 * (1 - f) + f * ((1 - c1) * c2 * c1 + c1 * (1 - (1 - c2) * (1 - c1))),
+    LINEAR_LIGHT = lambda c1, c2, f: np.where(c2 > 0.5, c1 + f * (2 * (c2 - 0.5)), c1 + f * (2 * c2 - 1)),
+    HUE = lambda c1, c2, f: blend_hsv(c1, c2, f, [0]),
+    SATURATION = lambda c1, c2, f: blend_hsv(c1, c2, f, [1]),
+    VALUE = lambda c1, c2, f: blend_hsv(c1, c2, f, [2]),
+    COLOR = lambda c1, c2, f: blend_hsv(c1, c2, f, [0, 1]),
+)
+
+
+def mix_rgb(node, fac, color1, color2):
+    """ MixRGB on RGBA arrays, the alpha of color1 is kept """
+    blend_type = node.properties.get('blend_type', 'MIX')
+    if blend_type not in blend_modes:
+        raise NotImplementedError("blend type {} is not implemented".format(blend_type))
+
+    if node.properties.get('use_alpha', False):
+        fac = fac * alpha(color2)
+
+    with np.errstate(all='ignore'):
+        result = blend_modes[blend_type](rgb(color1), rgb(color2), np.asarray(fac)[..., None])
+
+    if node.properties.get('use_clamp', False):
+        result = np.clip(result, 0, 1)
+    return rgba(result, alpha(color1))
+
+
+class Evaluator:
+    """ Evaluates the nodes of a Graph on NumPy arrays, scalars have shape 'shape' (or
+    broadcast to it) vectors and colors an extra trailing axis of 3 or 4 """
+
+    def __init__(self, graph, inputs={}, shape=(), dtype=np.float32, group_inputs=None, groups=None,
+            overrides={}, **context):
+        """ overrides: {socket: value} replacing the values of output sockets and unlinked inputs,
+          e.g. driven parameters evaluated for a batch of settings """
+        self.graph = graph
+        self.table = implementations[graph.type]
+
+        self.inputs = inputs
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.context = context
+
+        self.group_inputs = group_inputs
+        self.groups = {} if groups is None else groups
+        self.overrides = overrides
+        self.values = {}
+
+    def constant(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return np.asarray(value, dtype=self.dtype)
+
+    def full(self, value, socket_type):
+        """ Value broadcast to the full evaluation shape """
+        value = np.asarray(value, dtype=self.dtype)
+        size = channels.get(socket_type)
+        return np.broadcast_to(value, self.shape + (() if size is None else (size,)))
+
+    def input(self, socket):
+        if socket.is_linked:
+            link = socket.links[0]
+            return convert(self.values[link.from_socket], link.from_socket.type, socket.type)
+        return self.constant(self.overrides.get(socket, socket.default_value))
+
+    def group_graph(self, group):
+        if isinstance(group, Graph):
+            return group
+        if group.name_full not in self.groups:
+            self.groups[group.name_full] = capture(group)
+        return self.groups[group.name_full]
+
+    def evaluate_group(self, node, inputs):
+        graph = self.group_graph(node.node_tree)
+        outputs = [n for n in graph.nodes if n.bl_idname == 'NodeGroupOutput']
+        if len(outputs) == 0:
+            return []
+
+        output = next((n for n in outputs if n.properties.get('is_active_output', True)), outputs[0])
+        inner = Evaluator(graph, self.inputs, self.shape, self.dtype,
+            group_inputs=inputs, groups=self.groups, overrides=self.overrides, **self.context)
+        return inner.evaluate(output.inputs[:len(node.outputs)])
+
+    def passthrough(self, node, inputs):
+        """ Muted nodes pass the first input of a matching type through """
+        outputs = []
+        for output in node.outputs:
+            matching = [(socket, value) for socket, value in zip(node.inputs, inputs)
+                if socket.type == output.type and value is not None]
+            outputs.append(matching[0][1] if len(matching) else None)
+        return outputs
+
+    def evaluate_node(self, node):
+        inputs = [self.input(socket) if socket.enabled else None for socket in node.inputs]
+
+        if node.mute:
+            outputs = self.passthrough(node, inputs)
+        elif node.bl_idname == 'NodeReroute':
+            outputs = inputs
+        elif node.bl_idname == 'NodeGroupInput':
+            outputs = self.group_inputs or []
+        elif node.bl_idname == 'NodeGroupOutput':
+            outputs = []
+        elif node.node_tree is not None:
+            outputs = self.evaluate_group(node, inputs)
+        else:
+            f = self.table.get(node.bl_idname)
+            if f is None:
+                raise NotImplementedError("no {} implementation for {} ({})"
+                    .format(self.graph.type.lower(), node.bl_idname, node.name))
+            outputs = f(self, node, inputs)
+
+        for socket, value in zip(node.outputs, outputs):
+            self.values[socket] = self.constant(self.overrides[socket]) if socket in self.overrides else value
+
+    def evaluate(self, sockets):
+        """ Values of the given (input or output) sockets, intermediate values
+        are released as soon as all their consumers have been evaluated """
+        keep = {socket for socket in sockets if socket.is_output}
+        keep.update(link.from_socket for socket in sockets if not socket.is_output for link in socket.links)
+
+        order = topological_order([socket.node for socket in sockets])
+        consumers = Counter(link.from_socket for node in order for socket in node.inputs for link in socket.links)
+
+        for node in order:
+            self.evaluate_node(node)
+
+            for socket in node.inputs:
+                for link in socket.links:
+                    consumers[link.from_socket] -= 1
+                    if consumers[link.from_socket] == 0 and link.from_socket not in keep:
+                        self.values.pop(link.from_socket, None)
+
+        return [self.values.get(socket) if socket.is_output else self.input(socket) for socket in sockets]
+
+    def margin(self, sockets):
+        """ Pixels of context needed around a tile to evaluate the sockets exactly """
+        margins = {}
+        for node in topological_order([socket.node for socket in sockets]):
+            upstream = [margins[link.from_node] for socket in node.inputs for link in socket.links]
+            f = self.table.get(node.bl_idname)
+
+            if node.node_tree is not None:
+                graph = self.group_graph(node.node_tree)
+                outputs = [n for n in graph.nodes if n.bl_idname == 'NodeGroupOutput']
+                own = Evaluator(graph, groups=self.groups, **self.context)\
+                    .margin([socket for n in outputs for socket in n.inputs])
+            else:
+                own = f.margin(self, node) if f is not None and f.margin is not None else 0
+            margins[node] = own + max(upstream, default=0)
+
+        return max((margins[socket.node] for socket in sockets), default=0)
@@ -0,0 +1,305 @@
+import numpy as np
+import cv2
+
+import os
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from .graph import detach
+from .expression import graph_of
+from .evaluate import Evaluator, implements, math_operation, mix_rgb, safe_divide,\
+    rgb, alpha, rgba, luminance, rgb_to_hsv, hsv_to_rgb, linear_to_srgb, srgb_to_linear
+
+
+compositor = partial(implements, 'COMPOSITING')
+
+
+def as_rgba(image):
+    """ Float32 RGBA image from a grey, RGB or RGBA array (uint8/uint16 are normalized) """
+    image = np.asarray(image)
+    if image.dtype == np.uint8:
+        image = image.astype(np.float32) / 255
+    elif image.dtype == np.uint16:
+        image = image.astype(np.float32) / 65535
+    image = image.astype(np.float32, copy=False)
+
+    if image.ndim == 2:
+        image = image[..., None]
+    if image.shape[2] == 1:
+        image = np.repeat(image, 3, axis=2)
+    if image.shape[2] == 3:
+        image = np.concatenate([image, np.ones_like(image[..., :1])], axis=2)
+    return image
+
+
+@compositor('CompositorNodeImage', 'CompositorNodeRLayers', 'CompositorNodeMovieClip')
+def image_input(e, node, inputs):
+    key = node.name if node.name in e.inputs else node.properties.get('image', node.properties.get('clip'))
+    if key not in e.inputs:
+        raise KeyError("no input image given for node '{}'".format(node.name))
+
+    passes = e.inputs[key]
+    image = passes['Image']
+    return [image if output.name == 'Image' else alpha(image) if output.name == 'Alpha'
+        else passes.get(output.name) for output in node.outputs]
+
+
+@compositor('CompositorNodeValue', 'CompositorNodeRGB')
+def constant(e, node, inputs):
+    return [e.constant(node.outputs[0].default_value)]
+
+
+@compositor('CompositorNodeComposite', 'CompositorNodeViewer', 'CompositorNodeOutputFile')
+def output(e, node, inputs):
+    return []
+
+
+@compositor('CompositorNodeMath')
+def math(e, node, inputs):
+    a, b, c = (inputs + [None] * 3)[:3]
+    return [math_operation(node, a, b, c)]
+
+
+@compositor('CompositorNodeMixRGB')
+def mix(e, node, inputs):
+    fac, color1, color2 = inputs
+    return [mix_rgb(node, fac, color1, color2)]
+
+
+@compositor('CompositorNodeAlphaOver')
+def alpha_over(e, node, inputs):
+    fac, background, foreground = inputs
+    fac = np.asarray(fac)[..., None]
+
+    if node.properties.get('use_premultiply', False):
+        mul = 1 - fac * alpha(foreground)[..., None]
+        return [mul * background + fac * foreground]
+
+    premul = fac * alpha(foreground)[..., None]
+    mul = 1 - premul
+    color = mul * rgb(background) + premul * rgb(foreground)
+    return [rgba(color, mul[..., 0] * alpha(background) + fac[..., 0] * alpha(foreground))]
+
+
+@compositor('CompositorNodeInvert')
+def invert(e, node, inputs):
+    fac, color = inputs
+    fac = np.asarray(fac)[..., None]
+
+    inverted = np.array(color, copy=True)
+    if node.properties.get('invert_rgb', True):
+        inverted[..., :3] = 1 - inverted[..., :3]
+    if node.properties.get('invert_alpha', False):
+        inverted[..., 3] = 1 - inverted[..., 3]
+    return [color * (1 - fac) + inverted * fac]
+
+
+@compositor('CompositorNodeBrightContrast')
+def bright_contrast(e, node, inputs):
+    image, bright, contrast = inputs
+    bright, delta = np.asarray(bright) / 100, np.asarray(contrast) / 200
+
+    a = np.where(delta > 0, safe_divide(1, np.maximum(1 - delta * 2, 1e-6)), np.maximum(1 + delta * 2, 0))
+    b = np.where(delta > 0, a * (bright - delta), a * bright - delta)
+    return [rgba(rgb(image) * a[..., None] + b[..., None], alpha(image))]
+
+
+@compositor('CompositorNodeGamma')
+def gamma(e, node, inputs):
+    image, gamma = inputs
+    color = rgb(image)
+    with np.errstate(all='ignore'):
+        color = np.where(color > 0, np.power(np.maximum(color, 0), np.asarray(gamma)[..., None]), color)
+    return [rgba(color, alpha(image))]
+
+
+@compositor('CompositorNodeHueSat')
+def hue_saturation(e, node, inputs):
+    image, hue, saturation, value, fac = inputs
+    hsv = rgb_to_hsv(rgb(image))
+    h = hsv[..., 0] + hue - 0.5
+    s = hsv[..., 1] * saturation
+    v = hsv[..., 2] * value
+
+    color = hsv_to_rgb(np.stack([h - np.floor(h), s, v], axis=-1))
+    fac = np.asarray(fac)[..., None]
+    return [rgba(rgb(image) * (1 - fac) + color * fac, alpha(image))]
+
+
+@compositor('CompositorNodeColorBalance')
+def color_balance(e, node, inputs):
+    fac, image = inputs
+    p = node.properties
+    color = rgb(image)
+
+    with np.errstate(all='ignore'):
+        if p.get('correction_method', 'LIFT_GAMMA_GAIN') == 'LIFT_GAMMA_GAIN':
+            lift = 2 - np.asarray(p.get('lift', (1, 1, 1)))
+            gamma = np.asarray(p.get('gamma', (1, 1, 1)))
+            gamma_inv = np.where(gamma != 0, safe_divide(1, gamma), 1e6)
+
+            x = ((linear_to_srgb(color) - 1) * lift + 1) * np.asarray(p.get('gain', (1, 1, 1)))
+            balanced = np.power(srgb_to_linear(np.maximum(x, 0)), gamma_inv)
+        else:
+            offset = np.asarray(p.get('offset', (0, 0, 0))) + p.get('offset_basis', 0)
+            x = color * np.asarray(p.get('slope', (1, 1, 1))) + offset
+            balanced = np.power(np.maximum(x, 0), np.asarray(p.get('power', (1, 1, 1))))
+
+    fac = np.asarray(fac)[..., None]
+    return [rgba(color * (1 - fac) + balanced * fac, alpha(image))]
+
+
+@compositor('CompositorNodeSepRGBA')
+def separate_rgba(e, node, inputs):
+    image, = inputs
+    return [image[..., i] for i in range(4)]
+
+
+@compositor('CompositorNodeCombRGBA')
+def combine_rgba(e, node, inputs):
+    return [np.stack(np.broadcast_arrays(*inputs), axis=-1)]
+
+
+@compositor('CompositorNodeSetAlpha')
+def set_alpha(e, node, inputs):
+    image, a = inputs
+    if node.properties.get('mode', 'APPLY') == 'APPLY':
+        return [rgba(rgb(image) * np.asarray(a)[..., None], alpha(image) * a)]
+    return [rgba(rgb(image), a)]
+
+
+@compositor('CompositorNodeRGBToBW')
+def rgb_to_bw(e, node, inputs):
+    image, = inputs
+    return [luminance(image)]
+
+
+@compositor('CompositorNodeMapValue')
+def map_value(e, node, inputs):
+    value, = inputs
+    p = node.properties
+    value = (value + p.get('offset', (0,))[0]) * p.get('size', (1,))[0]
+
+    if p.get('use_min', False):
+        value = np.maximum(value, p['min'][0])
+    if p.get('use_max', False):
+        value = np.minimum(value, p['max'][0])
+    return [value]
+
+
+@compositor('CompositorNodeMapRange')
+def map_range(e, node, inputs):
+    value, from_min, from_max, to_min, to_max = inputs
+    result = to_min + safe_divide(value - from_min, from_max - from_min) * (to_max - to_min)
+
+    if node.properties.get('use_clamp', False):
+        result = np.clip(result, np.minimum(to_min, to_max), np.maximum(to_min, to_max))
+    return [result]
+
+
+def blur_size(e, node):
+    p = node.properties
+    if p.get('use_relative', False):
+        width, height = e.context['full_size']
+        return p.get('factor_x', 0) / 100 * width, p.get('factor_y', 0) / 100 * height
+    return p.get('size_x', 0), p.get('size_y', 0)
+
+
+def blur_margin(e, node):
+    return int(np.ceil(max(blur_size(e, node))))
+
+
+@compositor('CompositorNodeBlur', margin=blur_margin)
+def blur(e, node, inputs):
+    image, size = inputs
+    scale = float(np.mean(size))
+    sx, sy = [s * scale for s in blur_size(e, node)]
+
+    image = np.ascontiguousarray(np.broadcast_to(image, e.shape + (4,)), dtype=np.float32)
+    if max(sx, sy) < 0.5:
+        return [image]
+
+    kernel = (2 * int(np.ceil(sx)) + 1, 2 * int(np.ceil(sy)) + 1)
+    if node.properties.get('filter_type', 'GAUSS') == 'FLAT':
+        return [cv2.blur(image, kernel, borderType=cv2.BORDER_REPLICATE)]
+
+    return [cv2.GaussianBlur(image, kernel, sigmaX=max(sx, 1e-3) / 3, sigmaY=max(sy, 1e-3) / 3,
+        borderType=cv2.BORDER_REPLICATE)]
+
+
+def crop(image, x0, y0, x1, y1):
+    """ Region of an image, pixels outside the image repeat the nearest edge """
+    height, width = image.shape[:2]
+    cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+
+    region = image[cy0:cy1, cx0:cx1]
+    padding = [(cy0 - y0, y1 - cy1), (cx0 - x0, x1 - cx1)] + [(0, 0)] * (image.ndim - 2)
+    if any(before or after for before, after in padding):
+        region = np.pad(region, padding, mode='edge')
+    return region
+
+
+def output_sockets(graph, outputs):
+    if outputs is None:
+        nodes = [node for node in graph.nodes
+            if node.bl_idname in ['CompositorNodeComposite', 'CompositorNodeViewer']]
+    else:
+        by_name = {node.name: node for node in graph.nodes}
+        nodes = [by_name[name] for name in outputs]
+
+    return {node.name: node.inputs[0] if len(node.outputs) == 0 else node.outputs[0] for node in nodes}
+
+
+def tiles(roi, tile_size):
+    x0, y0, x1, y1 = roi
+    return [(x, y, min(x + tile_size, x1), min(y + tile_size, y1))
+        for y in range(y0, y1, tile_size) for x in range(x0, x1, tile_size)]
+
+
+def execute(source, images={}, outputs=None, size=None, roi=None, tile_size=512, threads=None):
+    """ Run a compositor graph (NodeTree, Graph or NodeContext) on NumPy images.
+
+    images: arrays for Image/Render Layers nodes keyed by node or image name, either an
+      image or a dict of passes {'Image':..., 'Depth':...}
+    outputs: node names to return (defaults to the Composite and Viewer nodes)
+    roi: (x0, y0, x1, y1) region to compute, tiles are processed on a thread pool
+    returns {node name: float32 array} of the roi size """
+    graph = detach(graph_of(source))
+    images = {k: {name: as_rgba(v) if name == 'Image' else np.asarray(v, dtype=np.float32)
+        for name, v in (passes if isinstance(passes, dict) else dict(Image=passes)).items()}
+        for k, passes in images.items()}
+
+    if size is None:
+        if len(images) == 0:
+            raise TypeError("execute: size is required when there are no input images")
+        height, width = next(iter(images.values()))['Image'].shape[:2]
+    else:
+        width, height = size
+
+    x0, y0, x1, y1 = roi or (0, 0, width, height)
+    sockets = output_sockets(graph, outputs)
+    margin = Evaluator(graph, full_size=(width, height)).margin(list(sockets.values()))
+
+    results = {}
+    for name, socket in sockets.items():
+        shape = (y1 - y0, x1 - x0) + ((4,) if socket.type == 'RGBA' else (3,) if socket.type == 'VECTOR' else ())
+        results[name] = np.zeros(shape, dtype=np.float32)
+
+    def run(tile):
+        tx0, ty0, tx1, ty1 = tile
+        region = (tx0 - margin, ty0 - margin, tx1 + margin, ty1 + margin)
+        inputs = {k: {name: crop(v, *region) for name, v in passes.items()} for k, passes in images.items()}
+
+        evaluator = Evaluator(graph, inputs, shape=(region[3] - region[1], region[2] - region[0]),
+            full_size=(width, height), offset=region[:2])
+        values = evaluator.evaluate(list(sockets.values()))
+
+        for (name, socket), value in zip(sockets.items(), values):
+            value = evaluator.full(value, socket.type)
+            results[name][ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0] = \
+                value[margin:margin + ty1 - ty0, margin:margin + tx1 - tx0]
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, tiles((x0, y0, x1, y1), tile_size)))
+
+    return results
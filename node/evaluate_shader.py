@@ -0,0 +1,426 @@
+import numpy as np
+
+import os
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from .graph import detached_socket
+from .value import Value
+from .evaluate_compositor import as_rgba
+from . import noise
+from .evaluate import Evaluator, implements, channels, math_operation, mix_rgb, luminance, safe_divide, wrap, fract,\
+    rgb, alpha, rgba, rgb_to_hsv, hsv_to_rgb, dot, length, safe_normalize, rotate_around_axis,\
+    euler_to_matrix, transform
+
+
+shader = partial(implements, 'SHADER')
+
+# Outputs of the input nodes which read per-sample attributes, keyed by output name
+attribute_nodes = {
+    'ShaderNodeTexCoord': {'Generated', 'Normal', 'UV', 'Object', 'Camera', 'Window', 'Reflection'},
+    'ShaderNodeNewGeometry': {'Position', 'Normal', 'Tangent', 'True Normal', 'Incoming', 'Parametric',
+        'Backfacing', 'Pointiness', 'Random Per Island'},
+    'ShaderNodeUVMap': {'UV'},
+}
+
+
+def attribute(e, name):
+    attributes = e.context.get('attributes', {})
+    if name not in attributes:
+        raise KeyError("shader attribute '{}' is not available, given: {}".format(name, list(attributes)))
+    return attributes[name]
+
+
+def texture_vector(e, node, vector, default='Generated'):
+    """ Texture nodes with an unlinked vector input use generated (or UV) coordinates """
+    return vector if node.inputs[0].is_linked else attribute(e, default)
+
+
+@shader(*attribute_nodes)
+def attributes(e, node, inputs):
+    return [attribute(e, output.name) if output.is_linked else None for output in node.outputs]
+
+
+@shader('ShaderNodeValue', 'ShaderNodeRGB')
+def constant(e, node, inputs):
+    return [e.constant(node.outputs[0].default_value)]
+
+
+@shader('ShaderNodeOutputMaterial', 'ShaderNodeOutputWorld', 'ShaderNodeOutputLight', 'ShaderNodeOutputAOV')
+def output(e, node, inputs):
+    return []
+
+
+@shader('ShaderNodeMath')
+def math(e, node, inputs):
+    a, b, c = (inputs + [None] * 3)[:3]
+    return [math_operation(node, a, b, c)]
+
+
+def project(a, b):
+    return b * safe_divide(dot(a, b), dot(b, b))[..., None]
+
+
+def reflect(a, b):
+    n = safe_normalize(b)
+    return a - 2 * dot(n, a)[..., None] * n
+
+
+def refract(a, b, ior):
+    n = safe_normalize(b)
+    d = dot(n, a)[..., None]
+    ior = np.asarray(ior)[..., None]
+    k = 1 - ior * ior * (1 - d * d)
+    return np.where(k < 0, 0, ior * a - (ior * d + np.sqrt(np.maximum(k, 0))) * n)
+
+
+# Vector math operations f(a, b, c, scale) -> (vector, value)
+vector_operations = dict(
+    ADD = lambda a, b, c, s: (a + b, None),
+    SUBTRACT = lambda a, b, c, s: (a - b, None),
+    MULTIPLY = lambda a, b, c, s: (a * b, None),
+    DIVIDE = lambda a, b, c, s: (safe_divide(a, b), None),
+    MULTIPLY_ADD = lambda a, b, c, s: (a * b + c, None),
+    CROSS_PRODUCT = lambda a, b, c, s: (np.cross(a, b), None),
+    PROJECT = lambda a, b, c, s: (project(a, b), None),
+    REFLECT = lambda a, b, c, s: (reflect(a, b), None),
+    REFRACT = lambda a, b, c, s: (refract(a, b, s), None),
+    FACEFORWARD = lambda a, b, c, s: (np.where((dot(c, b) < 0)[..., None], a, -a), None),
+    DOT_PRODUCT = lambda a, b, c, s: (None, dot(a, b)),
+    DISTANCE = lambda a, b, c, s: (None, length(a - b)),
+    LENGTH = lambda a, b, c, s: (None, length(a)),
+    SCALE = lambda a, b, c, s: (a * np.asarray(s)[..., None], None),
+    NORMALIZE = lambda a, b, c, s: (safe_normalize(a), None),
+    SNAP = lambda a, b, c, s: (np.floor(safe_divide(a, b)) * b, None),
+    FLOOR = lambda a, b, c, s: (np.floor(a), None),
+    CEIL = lambda a, b, c, s: (np.ceil(a), None),
+    MODULO = lambda a, b, c, s: (np.where(b != 0, np.fmod(a, np.where(b != 0, b, 1)), 0), None),
+    WRAP = lambda a, b, c, s: (wrap(a, b, c), None),
+    FRACTION = lambda a, b, c, s: (fract(a), None),
+    ABSOLUTE = lambda a, b, c, s: (np.abs(a), None),
+    MINIMUM = lambda a, b, c, s: (np.minimum(a, b), None),
+    MAXIMUM = lambda a, b, c, s: (np.maximum(a, b), None),
+    SINE = lambda a, b, c, s: (np.sin(a), None),
+    COSINE = lambda a, b, c, s: (np.cos(a), None),
+    TANGENT = lambda a, b, c, s: (np.tan(a), None),
+)
+
+
+@shader('ShaderNodeVectorMath')
+def vector_math(e, node, inputs):
+    a, b, c, scale = (inputs + [None] * 4)[:4]
+    operation = node.properties['operation']
+    if operation not in vector_operations:
+        raise NotImplementedError("vector math operation {} is not implemented".format(operation))
+
+    with np.errstate(all='ignore'):
+        return list(vector_operations[operation](a, b, c, scale))
+
+
+@shader('ShaderNodeCombineXYZ', 'ShaderNodeCombineRGB')
+def combine(e, node, inputs):
+    values = np.broadcast_arrays(*inputs)
+    if node.bl_idname == 'ShaderNodeCombineRGB':
+        values.append(np.ones_like(values[0]))
+    return [np.stack(values, axis=-1)]
+
+
+@shader('ShaderNodeSeparateXYZ', 'ShaderNodeSeparateRGB')
+def separate(e, node, inputs):
+    value, = inputs
+    return [value[..., i] for i in range(3)]
+
+
+@shader('ShaderNodeCombineHSV')
+def combine_hsv(e, node, inputs):
+    return [rgba(hsv_to_rgb(np.stack(np.broadcast_arrays(*inputs), axis=-1)), 1.0)]
+
+
+@shader('ShaderNodeSeparateHSV')
+def separate_hsv(e, node, inputs):
+    color, = inputs
+    hsv = rgb_to_hsv(rgb(color))
+    return [hsv[..., i] for i in range(3)]
+
+
+@shader('ShaderNodeCombineColor')
+def combine_color(e, node, inputs):
+    values = np.stack(np.broadcast_arrays(*inputs), axis=-1)
+    mode = node.properties.get('mode', 'RGB')
+    if mode == 'HSV':
+        values = hsv_to_rgb(values)
+    elif mode != 'RGB':
+        raise NotImplementedError("combine color mode {} is not implemented".format(mode))
+    return [rgba(values, 1.0)]
+
+
+@shader('ShaderNodeSeparateColor')
+def separate_color(e, node, inputs):
+    color, = inputs
+    mode = node.properties.get('mode', 'RGB')
+    if mode not in ['RGB', 'HSV']:
+        raise NotImplementedError("separate color mode {} is not implemented".format(mode))
+
+    values = rgb_to_hsv(rgb(color)) if mode == 'HSV' else rgb(color)
+    return [values[..., i] for i in range(3)]
+
+
+@shader('ShaderNodeMixRGB')
+def mix_node(e, node, inputs):
+    fac, color1, color2 = inputs
+    return [mix_rgb(node, np.clip(fac, 0, 1), color1, color2)]
+
+
+@shader('ShaderNodeMix')
+def mix(e, node, inputs):
+    p = node.properties
+    fac, a, b = [value for socket, value in zip(node.inputs, inputs) if socket.enabled][:3]
+    data_type = p.get('data_type', 'FLOAT')
+
+    if p.get('clamp_factor', True):
+        fac = np.clip(fac, 0, 1)
+    if data_type == 'RGBA':
+        return [None, None, mix_rgb(node, fac, a, b)]
+
+    if data_type == 'VECTOR' and p.get('factor_mode', 'UNIFORM') == 'UNIFORM':
+        fac = np.asarray(fac)[..., None]
+    result = a * (1 - fac) + b * fac
+    return [result, None, None] if data_type == 'FLOAT' else [None, result, None]
+
+
+@shader('ShaderNodeInvert')
+def invert(e, node, inputs):
+    fac, color = inputs
+    return [rgba(rgb(color) * (1 - fac[..., None]) + (1 - rgb(color)) * fac[..., None], alpha(color))]
+
+
+@shader('ShaderNodeRGBToBW')
+def rgb_to_bw(e, node, inputs):
+    color, = inputs
+    return [luminance(color)]
+
+
+@shader('ShaderNodeClamp')
+def clamp(e, node, inputs):
+    value, low, high = inputs
+    if node.properties.get('clamp_type', 'MINMAX') == 'RANGE':
+        low, high = np.minimum(low, high), np.maximum(low, high)
+    return [np.minimum(np.maximum(value, low), high)]
+
+
+def smoothstep(edge0, edge1, x):
+    t = np.clip(safe_divide(x - edge0, edge1 - edge0), 0, 1)
+    return t * t * (3 - 2 * t)
+
+
+def smootherstep(edge0, edge1, x):
+    t = np.clip(safe_divide(x - edge0, edge1 - edge0), 0, 1)
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+@shader('ShaderNodeMapRange')
+def map_range(e, node, inputs):
+    p = node.properties
+    if p.get('data_type', 'FLOAT') != 'FLOAT':
+        raise NotImplementedError("map range data type {} is not implemented".format(p['data_type']))
+
+    value, from_min, from_max, to_min, to_max, steps = inputs[:6]
+    interpolation = p.get('interpolation_type', 'LINEAR')
+
+    factor = safe_divide(value - from_min, from_max - from_min)
+    if interpolation == 'STEPPED':
+        factor = np.where(steps > 0, np.floor(factor * (steps + 1)) / np.where(steps > 0, steps, 1), 0)
+    elif interpolation in ['SMOOTHSTEP', 'SMOOTHERSTEP']:
+        step = smoothstep if interpolation == 'SMOOTHSTEP' else smootherstep
+        factor = np.where(from_min > from_max, 1 - step(from_max, from_min, value), step(from_min, from_max, value))
+
+    result = to_min + factor * (to_max - to_min)
+    if p.get('clamp', True) and interpolation in ['LINEAR', 'STEPPED']:
+        result = np.clip(result, np.minimum(to_min, to_max), np.maximum(to_min, to_max))
+    return [result, None][:len(node.outputs)]
+
+
+@shader('ShaderNodeVectorRotate')
+def vector_rotate(e, node, inputs):
+    vector, center, axis, angle, rotation = (inputs + [None] * 5)[:5]
+    p = node.properties
+    rotation_type = p.get('rotation_type', 'AXIS_ANGLE')
+    sign = -1 if p.get('invert', False) else 1
+
+    if rotation_type == 'EULER_XYZ':
+        matrix = euler_to_matrix(rotation)
+        if sign < 0:
+            matrix = np.swapaxes(matrix, -1, -2)
+        return [transform(matrix, vector - center) + center]
+
+    axes = dict(X_AXIS=(1, 0, 0), Y_AXIS=(0, 1, 0), Z_AXIS=(0, 0, 1))
+    axis = np.asarray(axes[rotation_type] if rotation_type in axes else axis, dtype=e.dtype)
+    rotated = rotate_around_axis(vector - center, safe_normalize(axis), sign * angle) + center
+    return [np.where(length(axis)[..., None] > 0, rotated, vector)]
+
+
+@shader('ShaderNodeMapping')
+def mapping(e, node, inputs):
+    vector, location, rotation, scale = inputs
+    vector_type = node.properties.get('vector_type', 'POINT')
+    matrix = euler_to_matrix(rotation)
+
+    if vector_type == 'POINT':
+        return [transform(matrix, vector * scale) + location]
+    elif vector_type == 'TEXTURE':
+        return [safe_divide(transform(np.swapaxes(matrix, -1, -2), vector - location), scale)]
+    elif vector_type == 'VECTOR':
+        return [transform(matrix, vector * scale)]
+    return [safe_normalize(transform(matrix, safe_divide(vector, scale)))]
+
+
+@shader('ShaderNodeTexChecker')
+def checker(e, node, inputs):
+    vector, color1, color2, scale = inputs
+    fac = noise.checker(texture_vector(e, node, vector) * np.asarray(scale)[..., None]).astype(e.dtype)
+    return [np.where(fac[..., None] > 0, color1, color2), fac]
+
+
+def gradient(gradient_type, x, y, z):
+    if gradient_type == 'LINEAR':
+        return x
+    elif gradient_type == 'QUADRATIC':
+        return np.maximum(x, 0) ** 2
+    elif gradient_type == 'EASING':
+        r = np.clip(x, 0, 1)
+        return 3 * r * r - 2 * r * r * r
+    elif gradient_type == 'DIAGONAL':
+        return (x + y) * 0.5
+    elif gradient_type == 'RADIAL':
+        return np.arctan2(y, x) / (2 * np.pi) + 0.5
+
+    r = np.maximum(0.999999 - np.sqrt(x * x + y * y + z * z), 0)
+    return r * r if gradient_type == 'QUADRATIC_SPHERE' else r
+
+
+@shader('ShaderNodeTexGradient')
+def tex_gradient(e, node, inputs):
+    vector, = inputs
+    co = texture_vector(e, node, vector)
+    fac = np.clip(gradient(node.properties.get('gradient_type', 'LINEAR'), co[..., 0], co[..., 1], co[..., 2]), 0, 1)
+    return [rgba(np.stack([fac, fac, fac], axis=-1), 1.0), fac]
+
+
+def noise_coordinates(e, vector, w, dimensions):
+    """ Points (..., n) of the 1D to 4D noise textures from their vector and w inputs """
+    if dimensions == '1D':
+        return e.full(w, 'VALUE')[..., None]
+    elif dimensions == '2D':
+        return vector[..., :2]
+    elif dimensions == '4D':
+        return np.concatenate([e.full(vector, 'VECTOR'), e.full(w, 'VALUE')[..., None]], axis=-1)
+    return vector
+
+
+@shader('ShaderNodeTexNoise')
+def tex_noise(e, node, inputs):
+    vector, w, scale, detail, roughness, distortion = inputs
+    dimensions = node.properties.get('noise_dimensions', '3D')
+    vector = texture_vector(e, node, vector) if dimensions != '1D' else None
+
+    p = noise_coordinates(e, vector, w, dimensions) * np.asarray(scale, dtype=e.dtype)[..., None]
+    fac, color = noise.noise_texture(p, detail, roughness, distortion)
+    return [fac, rgba(color, 1.0)]
+
+
+@shader('ShaderNodeTexWhiteNoise')
+def tex_white_noise(e, node, inputs):
+    vector, w = inputs
+    dimensions = node.properties.get('noise_dimensions', '3D')
+    vector = texture_vector(e, node, vector, 'Position') if dimensions != '1D' else None
+    value, color = noise.white_noise(noise_coordinates(e, vector, w, dimensions))
+    return [value, rgba(color, 1.0)]
+
+
+@shader('ShaderNodeTexVoronoi')
+def tex_voronoi(e, node, inputs):
+    vector, w, scale, smoothness, exponent, randomness = inputs
+    dimensions = node.properties.get('voronoi_dimensions', '3D')
+    vector = texture_vector(e, node, vector) if dimensions != '1D' else None
+    scale = np.asarray(scale, dtype=e.dtype)
+
+    p = noise_coordinates(e, vector, w, dimensions) * scale[..., None]
+    result = noise.voronoi(p, node.properties.get('feature', 'F1'), node.properties.get('distance', 'EUCLIDEAN'),
+        exponent, np.clip(randomness, 0, 1), np.clip(np.asarray(smoothness) / 2, 0, 0.5))
+
+    position = safe_divide(result['position'], scale[..., None])
+    if dimensions == '2D':
+        position = np.concatenate([position, np.zeros_like(position[..., :1])], axis=-1)
+    vector = position[..., :3] if dimensions != '1D' else None
+    w = position[..., -1] if dimensions in ['1D', '4D'] else None
+
+    return [result['distance'], rgba(result['color'], 1.0), vector, w, result['radius']]
+
+
+def sample_image(pixels, u, v, interpolation='Linear', extension='REPEAT'):
+    """ Sample an image array (row 0 at the top) at uv coordinates """
+    height, width = pixels.shape[:2]
+
+    def wrap_index(i, size):
+        return i % size if extension == 'REPEAT' else np.clip(i, 0, size - 1)
+
+    if interpolation == 'Closest':
+        x, y = np.floor(u * width).astype(np.int64), np.floor(v * height).astype(np.int64)
+        result = pixels[height - 1 - wrap_index(y, height), wrap_index(x, width)]
+    else:
+        x, y = u * width - 0.5, v * height - 0.5
+        x0, y0 = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        tx, ty = (x - x0)[..., None], (y - y0)[..., None]
+
+        def fetch(i, j):
+            return pixels[height - 1 - wrap_index(j, height), wrap_index(i, width)]
+
+        result = (fetch(x0, y0) * (1 - tx) + fetch(x0 + 1, y0) * tx) * (1 - ty)\
+            + (fetch(x0, y0 + 1) * (1 - tx) + fetch(x0 + 1, y0 + 1) * tx) * ty
+
+    if extension == 'CLIP':
+        inside = (u >= 0) & (u <= 1) & (v >= 0) & (v <= 1)
+        result = np.where(inside[..., None], result, 0)
+    return result
+
+
+@shader('ShaderNodeTexImage')
+def tex_image(e, node, inputs):
+    vector, = inputs
+    key = node.name if node.name in e.inputs else node.properties.get('image')
+    if key not in e.inputs:
+        raise KeyError("no input image given for node '{}'".format(node.name))
+
+    co = texture_vector(e, node, vector, default='UV')
+    color = sample_image(e.inputs[key], co[..., 0], co[..., 1],
+        node.properties.get('interpolation', 'Linear'), node.properties.get('extension', 'REPEAT'))
+    return [color, alpha(color)]
+
+
+def evaluate(value, attributes, images={}, chunk_size=65536, threads=None):
+    """ Evaluate a shader Value (or socket) over arrays of per-sample attributes,
+    e.g. dict(UV=uv, Position=position) where vectors have a trailing axis of 3.
+    Samples are evaluated in chunks (along the first axis) on a thread pool """
+    socket = detached_socket(value.socket if isinstance(value, Value) else value)
+    graph = socket.node.id_data
+
+    shape = next(iter(attributes.values())).shape[:-1] if len(attributes) else ()
+    size = channels.get(socket.type)
+    result = np.empty(shape + (() if size is None else (size,)), dtype=np.float32)
+    images = {k: as_rgba(v) for k, v in images.items()}
+
+    def run(start):
+        chunk = {k: v[start:start + chunk_size] for k, v in attributes.items()}
+        evaluator = Evaluator(graph, images, shape=(min(chunk_size, shape[0] - start),) + shape[1:],
+            attributes=chunk)
+        value, = evaluator.evaluate([socket])
+        result[start:start + chunk_size] = evaluator.full(value, socket.type)
+
+    if len(shape) == 0:
+        evaluator = Evaluator(graph, images, attributes=attributes)
+        value, = evaluator.evaluate([socket])
+        return evaluator.full(value, socket.type)
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, shape[0], chunk_size)))
+    return result
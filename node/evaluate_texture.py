@@ -0,0 +1,437 @@
+import numpy as np
+
+import os
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from .graph import detach
+from .expression import graph_of
+from .evaluate_compositor import as_rgba
+from . import blender_noise
+from .evaluate import Evaluator, implements, math_operation, mix_rgb, luminance, safe_divide,\
+    rgb, alpha, rgba, rgb_to_hsv, hsv_to_rgb, rotate_around_axis, safe_normalize
+
+
+texture = partial(implements, 'TEXTURE')
+
+
+def evaluate_at(e, socket, coordinates):
+    """ Value of an input socket with its upstream nodes evaluated at other coordinates,
+    used by the nodes which transform texture space (translate, rotate, scale, at) """
+    if not socket.is_linked:
+        return e.constant(socket.default_value)
+
+    inner = Evaluator(e.graph, e.inputs, e.shape, e.dtype, group_inputs=e.group_inputs, groups=e.groups,
+        **dict(e.context, coordinates=coordinates))
+    inner.evaluate([socket.links[0].from_socket])
+    return inner.input(socket)
+
+
+def mix(fac, color1, color2):
+    fac = np.asarray(fac)[..., None]
+    return color1 * (1 - fac) + color2 * fac
+
+
+@texture('TextureNodeCoordinates')
+def coordinates(e, node, inputs):
+    return [e.context['coordinates']]
+
+
+@texture('TextureNodeOutput', 'TextureNodeViewer')
+def output(e, node, inputs):
+    return []
+
+
+@texture('TextureNodeMath')
+def math(e, node, inputs):
+    a, b, c = (inputs + [None] * 3)[:3]
+    return [math_operation(node, a, b, c)]
+
+
+@texture('TextureNodeMixRGB')
+def mix_node(e, node, inputs):
+    fac, color1, color2 = inputs
+    return [mix_rgb(node, fac, color1, color2)]
+
+
+@texture('TextureNodeRGBToBW')
+def rgb_to_bw(e, node, inputs):
+    color, = inputs
+    return [luminance(color)]
+
+
+@texture('TextureNodeCompose')
+def compose(e, node, inputs):
+    return [np.stack(np.broadcast_arrays(*inputs), axis=-1)]
+
+
+@texture('TextureNodeDecompose')
+def decompose(e, node, inputs):
+    color, = inputs
+    return [color[..., i] for i in range(4)]
+
+
+@texture('TextureNodeInvert')
+def invert(e, node, inputs):
+    color, = inputs
+    return [rgba(1 - rgb(color), alpha(color))]
+
+
+@texture('TextureNodeHueSaturation')
+def hue_saturation(e, node, inputs):
+    hue, saturation, value, fac, color = inputs
+    hsv = rgb_to_hsv(rgb(color))
+    h = hsv[..., 0] + hue - 0.5
+    s = np.clip(hsv[..., 1] * saturation, 0, 1)
+    v = hsv[..., 2] * value
+
+    hsv = np.stack(np.broadcast_arrays(h - np.floor(h), s, v), axis=-1)
+    return [rgba(mix(fac, rgb(color), hsv_to_rgb(hsv)), alpha(color))]
+
+
+@texture('TextureNodeDistance')
+def distance(e, node, inputs):
+    a, b = inputs
+    return [np.linalg.norm(a - b, axis=-1)]
+
+
+@texture('TextureNodeTranslate')
+def translate(e, node, inputs):
+    return [evaluate_at(e, node.inputs[0], e.context['coordinates'] + inputs[1])]
+
+
+@texture('TextureNodeScale')
+def scale(e, node, inputs):
+    return [evaluate_at(e, node.inputs[0], e.context['coordinates'] * inputs[1])]
+
+
+@texture('TextureNodeRotate')
+def rotate(e, node, inputs):
+    _, turns, axis = inputs
+    rotated = rotate_around_axis(e.context['coordinates'], safe_normalize(np.asarray(axis)), turns * 2 * np.pi)
+    return [evaluate_at(e, node.inputs[0], rotated)]
+
+
+@texture('TextureNodeAt')
+def at(e, node, inputs):
+    return [evaluate_at(e, node.inputs[0], np.broadcast_to(inputs[1], e.shape + (3,)))]
+
+
+@texture('TextureNodeChecker')
+def checker(e, node, inputs):
+    color1, color2, size = inputs
+    co = e.context['coordinates']
+    with np.errstate(all='ignore'):
+        cells = np.abs(np.floor(0.00001 + co / np.asarray(size)[..., None])).astype(np.int64) % 2
+
+    first = (cells[..., 0] == cells[..., 1]) == cells[..., 2]
+    return [np.where(first[..., None], color1, color2)]
+
+
+def int_noise(n):
+    """ Blender's fast integer noise, n is wrapped to 32 bits """
+    n = np.asarray(n, dtype=np.int32)
+    with np.errstate(over='ignore'):
+        n = (n >> 13) ^ n
+        nn = (n * (n * n * 60493 + 19990303) + 1376312589) & 0x7fffffff
+    return 0.5 * nn.astype(np.float32) / 1073741824.0
+
+
+@texture('TextureNodeBricks')
+def bricks(e, node, inputs):
+    bricks1, bricks2, mortar, thickness, bias, brick_width, row_height = inputs
+    p = node.properties
+    co = e.context['coordinates']
+    x, y = co[..., 0], co[..., 1]
+
+    with np.errstate(all='ignore'):
+        row = np.floor(y / row_height).astype(np.int32)
+        offset = 0.0
+        if p.get('offset_frequency', 2) and p.get('squash_frequency', 2):
+            brick_width = brick_width * np.where(np.fmod(row, p.get('squash_frequency', 2)) != 0, 1, p.get('squash', 1))
+            offset = np.where(np.fmod(row, p.get('offset_frequency', 2)) != 0, 0, brick_width * p.get('offset', 0.5))
+
+        brick = np.floor((x + offset) / brick_width).astype(np.int32)
+        ins_x = x + offset - brick_width * brick
+        ins_y = y - row_height * row
+
+    tint = np.clip(int_noise((row << 16) + (brick & 0xFFFF)) + bias, 0, 1)
+    is_mortar = (ins_x < thickness) | (ins_y < thickness) | \
+        (ins_x > brick_width - thickness) | (ins_y > row_height - thickness)
+    return [np.where(is_mortar[..., None], mortar, mix(tint, bricks1, bricks2))]
+
+
+def blend_intensity(progression, x, y, z):
+    if progression == 'LINEAR':
+        return (1 + x) / 2
+    elif progression == 'QUADRATIC':
+        return np.maximum((1 + x) / 2, 0) ** 2
+    elif progression == 'EASING':
+        t = np.clip((1 + x) / 2, 0, 1)
+        return 3 * t * t - 2 * t * t * t
+    elif progression == 'DIAGONAL':
+        return (2 + x + y) / 4
+    elif progression == 'RADIAL':
+        return np.arctan2(y, x) / (2 * np.pi) + 0.5
+
+    sphere = np.maximum(1 - np.sqrt(x * x + y * y + z * z), 0)
+    return sphere * sphere if progression == 'QUADRATIC_SPHERE' else sphere
+
+
+@texture('TextureNodeTexBlend')
+def blend(e, node, inputs):
+    color1, color2 = inputs
+    co = e.context['coordinates']
+    x, y, z = co[..., 0], co[..., 1], co[..., 2]
+    if node.properties.get('use_flip_axis', 'HORIZONTAL') == 'VERTICAL':
+        x, y = y, x
+
+    intensity = blend_intensity(node.properties.get('progression', 'LINEAR'), x, y, z)
+    return [mix(intensity, color1, color2)]
+
+
+# Procedural textures of Blender's texture nodes (texture_procedural.c) on the NumPy port of its noise
+# functions (see blender_noise). Their settings aren't node properties in Blender, graphs may give them
+# with the Texture's property names (else defaults)
+
+tex_defaults = dict(noise_basis='BLENDER_ORIGINAL', noise_type='SOFT_NOISE', noise_depth=2, noise_basis_2='SIN',
+    cloud_type='GRAYSCALE', marble_type='SOFT', wood_type='BANDNOISE', stucci_type='PLASTIC',
+    musgrave_type='MULTIFRACTAL', offset=1.0, gain=1.0, noise_distortion='BLENDER_ORIGINAL',
+    distance_metric='DISTANCE', minkovsky_exponent=2.5, color_mode='INTENSITY')
+
+
+def tex_property(node, name):
+    return node.properties.get(name, tex_defaults[name])
+
+
+def size_scaled(co, size):
+    size = np.asarray(size, dtype=np.float32)[..., None]
+    return safe_divide(co, size) + np.where(size == 0, co, 0)
+
+
+def intensity(tin, color1, color2):
+    """ Colors of intensity textures, node textures don't clamp the intensity (TEX_NO_CLAMP) """
+    return rgba(mix(tin, rgb(color1), rgb(color2)), alpha(color1))
+
+
+def colors(r, g, b):
+    """ Colors of RGB textures, unclamped as intensities """
+    return rgba(np.stack(np.broadcast_arrays(r, g, b), axis=-1), 1.0)
+
+
+def hard_noise(node):
+    return tex_property(node, 'noise_type') == 'HARD_NOISE'
+
+
+waveforms = dict(
+    SIN = lambda a: 0.5 + 0.5 * np.sin(a),
+    SAW = lambda a: np.mod(a, 2 * np.pi) / (2 * np.pi),
+    TRI = lambda a: 1 - 2 * np.abs(np.floor(a / (2 * np.pi) + 0.5) - a / (2 * np.pi)),
+)
+
+
+@texture('TextureNodeTexClouds')
+def clouds(e, node, inputs):
+    color1, color2, size = inputs
+    co, hard, basis, depth = e.context['coordinates'], hard_noise(node), tex_property(node, 'noise_basis'),\
+        tex_property(node, 'noise_depth')
+
+    tin = blender_noise.generic_turbulence(co, size, depth, hard, basis)
+    if tex_property(node, 'cloud_type') != 'COLOR':
+        return [intensity(tin, color1, color2)]
+
+    g = blender_noise.generic_turbulence(co[..., [1, 0, 2]], size, depth, hard, basis)
+    b = blender_noise.generic_turbulence(co[..., [1, 2, 0]], size, depth, hard, basis)
+    return [colors(tin, g, b)]
+
+
+@texture('TextureNodeTexWood')
+def wood(e, node, inputs):
+    color1, color2, size, turbulence_amount = inputs
+    co, wood_type = e.context['coordinates'], tex_property(node, 'wood_type')
+    waveform = waveforms[tex_property(node, 'noise_basis_2')]
+
+    rings = wood_type in ('RINGS', 'RINGNOISE')
+    t = np.sqrt(np.sum(co * co, axis=-1)) * 20 if rings else np.sum(co, axis=-1) * 10
+    if wood_type in ('BANDNOISE', 'RINGNOISE'):
+        t = t + turbulence_amount * blender_noise.generic_noise(co, size, hard_noise(node), tex_property(node, 'noise_basis'))
+    return [intensity(waveform(t), color1, color2)]
+
+
+@texture('TextureNodeTexMarble')
+def marble(e, node, inputs):
+    color1, color2, size, turbulence_amount = inputs
+    co = e.context['coordinates']
+
+    t = 5 * np.sum(co, axis=-1) + turbulence_amount * blender_noise.generic_turbulence(co, size, tex_property(node, 'noise_depth'),
+        hard_noise(node), tex_property(node, 'noise_basis'))
+    t = waveforms[tex_property(node, 'noise_basis_2')](t)
+
+    marble_type = tex_property(node, 'marble_type')
+    if marble_type == 'SHARP':
+        t = np.sqrt(t)
+    elif marble_type == 'SHARPER':
+        t = np.sqrt(np.sqrt(t))
+    return [intensity(t, color1, color2)]
+
+
+# Steps of the magic texture, (axis, f, signs of x, y, z) setting axis to f(x * sx + y * sy + z * sz)
+magic_steps = [(1, lambda a: -np.cos(a), (1, -1, 1)), (0, np.cos, (1, -1, -1)), (2, np.sin, (-1, -1, -1)),
+    (0, lambda a: -np.cos(a), (-1, 1, -1)), (1, lambda a: -np.sin(a), (-1, 1, 1)), (1, lambda a: -np.cos(a), (-1, 1, 1)),
+    (0, np.cos, (1, 1, 1)), (2, np.sin, (1, 1, -1)), (0, lambda a: -np.cos(a), (-1, -1, 1)), (1, lambda a: -np.sin(a), (1, -1, 1))]
+
+
+@texture('TextureNodeTexMagic')
+def magic(e, node, inputs):
+    color1, color2, turbulence_amount = inputs
+    co = e.context['coordinates']
+    turb = np.asarray(turbulence_amount, dtype=np.float32) / 5
+    depth = tex_property(node, 'noise_depth')
+
+    x, y, z = co[..., 0], co[..., 1], co[..., 2]
+    xyz = [np.sin((x + y + z) * 5), np.cos((-x + y - z) * 5), -np.cos((-x - y + z) * 5)]
+    if depth > 0:
+        xyz = [v * turb for v in xyz]
+        for axis, f, (sx, sy, sz) in magic_steps[:min(depth, 10)]:
+            xyz[axis] = f(xyz[0] * sx + xyz[1] * sy + xyz[2] * sz) * turb
+
+    scale = np.where(turb != 0, 2 * turb, 1)
+    r, g, b = [0.5 - v / scale for v in xyz]
+    return [colors(r, g, b)]
+
+
+@texture('TextureNodeTexStucci')
+def stucci(e, node, inputs):
+    color1, color2, size, turbulence_amount = inputs
+    co, hard, basis = e.context['coordinates'], hard_noise(node), tex_property(node, 'noise_basis')
+    stucci_type = tex_property(node, 'stucci_type')
+
+    offset = np.asarray(turbulence_amount, dtype=np.float32) / 200
+    if stucci_type != 'PLASTIC':
+        offset = offset * blender_noise.generic_noise(co, size, hard, basis) ** 2
+
+    tin = blender_noise.generic_noise(co + np.stack(np.broadcast_arrays(0, 0, offset), axis=-1), size, hard, basis)
+    if stucci_type == 'WALL_OUT':
+        tin = 1 - tin
+    return [intensity(np.maximum(tin, 0), color1, color2)]
+
+
+@texture('TextureNodeTexNoise')
+def random_noise(e, node, inputs):
+    """ Random values per evaluation as Blender's noise texture, from a NumPy generator (context 'seed') """
+    color1, color2 = inputs
+    bits = np.random.default_rng(e.context.get('seed')).integers(0, 1 << 31, e.shape)
+    depth = tex_property(node, 'noise_depth')
+
+    value = (bits >> 29) & 3
+    for i in range(depth):
+        value = value * ((bits >> (27 - 2 * i)) & 3)
+    return [intensity(value / np.float32(3.0 ** (depth + 1)), color1, color2)]
+
+
+@texture('TextureNodeTexMusgrave')
+def musgrave_texture(e, node, inputs):
+    color1, color2, h, lacunarity, octaves, intensity_scale, size = inputs
+    co = size_scaled(e.context['coordinates'], size)
+
+    tin = blender_noise.musgrave(co, tex_property(node, 'musgrave_type'), h, lacunarity, octaves,
+        tex_property(node, 'offset'), tex_property(node, 'gain'), tex_property(node, 'noise_basis'))
+    return [intensity(intensity_scale * tin, color1, color2)]
+
+
+@texture('TextureNodeTexDistNoise')
+def distorted_noise(e, node, inputs):
+    color1, color2, size, distortion = inputs
+    co = size_scaled(e.context['coordinates'], size)
+
+    tin = blender_noise.variable_lacunarity(co, distortion, tex_property(node, 'noise_distortion'),
+        tex_property(node, 'noise_basis'))
+    return [intensity(tin, color1, color2)]
+
+
+@texture('TextureNodeTexVoronoi')
+def voronoi(e, node, inputs):
+    color1, color2, w1, w2, w3, w4, intensity_scale, size = inputs
+    co = size_scaled(e.context['coordinates'], size)
+    weights = np.stack(np.broadcast_arrays(w1, w2, w3, w4), axis=-1).astype(np.float32)
+
+    scale = safe_divide(intensity_scale, np.sum(np.abs(weights), axis=-1))
+    distances, points = blender_noise.voronoi(co, tex_property(node, 'distance_metric'), tex_property(node, 'minkovsky_exponent'))
+    tin = scale * np.abs(np.sum(weights * distances, axis=-1))
+
+    color_mode = tex_property(node, 'color_mode')
+    if color_mode == 'INTENSITY':
+        return [intensity(tin, color1, color2)]
+
+    cells = sum(np.abs(weights[..., i, None]) * blender_noise.cell_vector(points[..., i, :]) for i in range(4))
+    if color_mode == 'POSITION':
+        return [colors(*np.moveaxis(cells * scale[..., None], -1, 0))]
+
+    outline = np.minimum((distances[..., 1] - distances[..., 0]) * 10, 1)
+    outline = outline * (tin if color_mode == 'POSITION_OUTLINE_INTENSITY' else scale)
+    return [colors(*np.moveaxis(cells * outline[..., None], -1, 0))]
+
+
+@texture('TextureNodeImage')
+def image(e, node, inputs):
+    key = node.name if node.name in e.inputs else node.properties.get('image')
+    if key not in e.inputs:
+        raise KeyError("no input image given for node '{}'".format(node.name))
+
+    pixels = e.inputs[key]
+    height, width = pixels.shape[:2]
+    co = e.context['coordinates']
+
+    # Texture space [-1, 1] covers the image once and repeats, rows are stored top down
+    px = np.floor((co[..., 0] + 1) * width / 2).astype(np.int64) % width
+    py = np.floor((co[..., 1] + 1) * height / 2).astype(np.int64) % height
+    return [pixels[height - 1 - py, px]]
+
+
+def output_socket(graph, output):
+    nodes = [node for node in graph.nodes if node.bl_idname == 'TextureNodeOutput']
+    if output is not None:
+        nodes = [node for node in nodes if output in [node.name, node.properties.get('filepath')]]
+    if len(nodes) == 0:
+        raise KeyError("texture has no output node{}".format("" if output is None else " '{}'".format(output)))
+    return nodes[0].inputs[0]
+
+
+def texture_coordinates(size, bounds, z, rows):
+    """ Texture space coordinates of a range of pixel rows, row 0 is the top of the image """
+    width, height = size
+    x0, y0, x1, y1 = bounds
+    x = x0 + (np.arange(width) + 0.5) * (x1 - x0) / width
+    y = y1 - (np.arange(*rows) + 0.5) * (y1 - y0) / height
+
+    co = np.empty((len(y), width, 3), dtype=np.float32)
+    co[..., 0], co[..., 1], co[..., 2] = x[None, :], y[:, None], z
+    return co
+
+
+def execute(source, size, output=None, images={}, bounds=(-1, -1, 1, 1), z=0.0, chunk_rows=64, threads=None):
+    """ Evaluate a texture tree (NodeTree, Graph or NodeContext) to a float32 RGBA image.
+
+    size: (width, height) in pixels
+    output: name of the output node (defaults to the first)
+    images: arrays for Image nodes keyed by node or image name
+    bounds: (x0, y0, x1, y1) area of texture space covered by the image
+    Rows are evaluated in chunks of chunk_rows on a thread pool, returns a (height, width, 4) array """
+    graph = detach(graph_of(source))
+    socket = output_socket(graph, output)
+    images = {k: as_rgba(v) for k, v in images.items()}
+
+    width, height = size
+    result = np.empty((height, width, 4), dtype=np.float32)
+
+    def run(start):
+        rows = (start, min(start + chunk_rows, height))
+        evaluator = Evaluator(graph, images, shape=(rows[1] - rows[0], width),
+            coordinates=texture_coordinates(size, bounds, z, rows))
+        color, = evaluator.evaluate([socket])
+        result[rows[0]:rows[1]] = evaluator.full(color, 'RGBA')
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, height, chunk_rows)))
+
+    return result
@@ -7,23 +7,30 @@ import inspect
 import re
 import types
 import sys
+import os
+import threading
+import contextvars
+from array import array
 
 from collections.abc import Sequence
 from collections import OrderedDict
 
-from cached_property import cached_property
+from cached_property import cached_property, threaded_cached_property
 
 from numbers import Number
 from typing import List, Callable, Tuple, Any, Union, Optional
 import itertools
-from functools import partial
+from functools import partial, update_wrapper
 
-from .util import typename, assert_type, namespace
+from .util import typename, assert_type, namespace, staticproperty
+from .graph import Graph, GraphNode, node_layout, node_classes, capture
 
 import importlib
+import importlib.util
 
 
-value_types = ['VALUE', 'INT', 'BOOLEAN', 'VECTOR', 'STRING', 'SHADER', 'RGBA']
+value_types = ['VALUE', 'INT', 'BOOLEAN', 'VECTOR', 'STRING', 'SHADER', 'RGBA',
+    'GEOMETRY', 'OBJECT', 'COLLECTION', 'MATERIAL', 'IMAGE', 'TEXTURE']
 
 def node_template(node_type, property='input_template'):
     inputs = {}
@@ -61,29 +68,79 @@ def node_properties(node_type, common = {}):
     return {p.name:p for p in properties}
 
 
-def node_subclasses(base_node, types=bpy.types):
-    d = {}
-    prefix = base_node.__name__
-    common_properties = node_properties(base_node)
-
-    def node_desc(node_type):
-        return namespace("node description",
-            name = type_name[len(prefix):],
-            type=node_type, 
-            inputs = node_template(node_type, 'input_template'), 
-            outputs = node_template(node_type, 'output_template'), 
-            properties=node_properties(node_type, common_properties),
-        )    
-
-    for type_name in dir(types):
-        t = getattr(types, type_name)
-        
-        has_sockets = hasattr(t, 'input_template') or hasattr(t, 'output_template')
-        if inspect.isclass(t) and issubclass(t, base_node) and has_sockets:
-              desc = node_desc(t)
-              d[desc.name] = desc
+class NodeDesc:
+    """ Description of a node class, socket templates and RNA properties are introspected on first use """
+
+    def __init__(self, name, type, index, base):
+        self.name = name
+        self.type = type
+        self._index = index
+        self._base = base
+
+    @threaded_cached_property
+    def inputs(self):
+        return node_template(self.type, 'input_template')
+
+    @threaded_cached_property
+    def outputs(self):
+        return node_template(self.type, 'output_template')
+
+    @threaded_cached_property
+    def properties(self):
+        return node_properties(self.type, self._index.common_properties(self._base))
 
-    return d
+    def __repr__(self):
+        return "NodeDesc({})".format(self.name)
+
+
+class TypeIndex:
+    """ Node classes of a types module (bpy.types) indexed by each of their base classes, from
+    a single scan, so supporting another tree type doesn't scan the types again """
+
+    def __init__(self, types=bpy.types):
+        self.classes = {}
+        self._descs = {}
+        self._common = {}
+        self._lock = threading.RLock()
+
+        for type_name in dir(types):
+            t = getattr(types, type_name)
+            if inspect.isclass(t) and (hasattr(t, 'input_template') or hasattr(t, 'output_template')):
+                for base in t.__mro__:
+                    self.classes.setdefault(base, []).append((type_name, t))
+
+    def common_properties(self, base_node):
+        with self._lock:
+            if base_node not in self._common:
+                self._common[base_node] = node_properties(base_node)
+            return self._common[base_node]
+
+    def subclasses(self, base_node):
+        """ {name: NodeDesc} of the node classes derived from base_node, named without its prefix """
+        with self._lock:
+            if base_node not in self._descs:
+                prefix = base_node.__name__
+                descs = [NodeDesc(type_name[len(prefix):], t, self, base_node)
+                    for type_name, t in self.classes.get(base_node, [])]
+                self._descs[base_node] = {desc.name: desc for desc in descs}
+            return self._descs[base_node]
+
+
+_type_index = None
+_type_index_lock = threading.Lock()
+
+def type_index():
+    """ Shared TypeIndex of bpy.types, scanned on first use """
+    global _type_index
+    with _type_index_lock:
+        if _type_index is None:
+            _type_index = TypeIndex(bpy.types)
+        return _type_index
+
+
+def node_subclasses(base_node, types=bpy.types):
+    index = type_index() if types is bpy.types else TypeIndex(types)
+    return index.subclasses(base_node)
 
 
 def make_submodule(module, name):
@@ -92,48 +149,78 @@ def make_submodule(module, name):
 
     return submodule
 
-def add_node_module(module, node_type):
-    tree_type = node_tree_descs[node_type]
-    
-    def make_enumerations(node_builder, key):
-        options = node_builder.properties[key].options
 
-        submodule = make_submodule(module, key)
-        for name, identifier in options:
-            builder = node_builder.set(**{key:identifier.upper()})
-            setattr(submodule, parameter_name(name), builder)
+def builder_entries(desc_name, desc):
+    """ (submodule, name, bound properties) of the builders of a node, an enumerated operation
+    or blend_type makes a submodule with a builder per option (e.g. math.add) """
+    for key in ['operation', 'blend_type']:
+        if key in desc.properties:
+            return [(parameter_name(desc_name), parameter_name(name), {key: identifier.upper()})
+                for name, identifier in desc.properties[key].options]
+    return [(None, parameter_name(desc_name), {})]
 
-        return submodule
-  
-    def make_builder(k, desc):
-        node_builder = NodeBuilder(desc)
-        for k in ['operation', 'blend_type']:
-           if k in desc.properties:
-                return make_enumerations(node_builder, k)
-        return node_builder
 
-    for k, desc in tree_type.node_descriptions.items():
-        setattr(module, parameter_name(k), make_builder(k, desc))
+def node_builders(node_type):
+    """ (submodule, name, builder) of every node of a tree type, by introspection """
+    for k, desc in node_tree_descs[node_type].node_descriptions.items():
+        for submodule, name, properties in builder_entries(k, desc):
+            yield submodule, name, NodeBuilder(desc, properties)
+
+
+def generated_module(node_type):
+    """ Builders generated ahead of time for the running Blender version (see node.generate),
+    or None if there are none """
+    name = 'node.generated.{}_{}_{}'.format(node_type.lower(), *bpy.app.version[:2])
+    if importlib.util.find_spec(name) is None:
+        return None
+
+    module = importlib.import_module(name)
+    return module if tuple(module.blender_version[:2]) == tuple(bpy.app.version[:2]) else None
+
+
+def add_node_module(module, node_type):
+    generated = generated_module(node_type)
+    builders = node_builders(node_type) if generated is None else\
+        ((submodule, name, FixedBuilder(node_type, *entry)) for submodule, name, *entry in generated.builders)
+
+    submodules = {}
+    for submodule, name, builder in builders:
+        if submodule is None:
+            setattr(module, name, builder)
+        else:
+            if submodule not in submodules:
+                submodules[submodule] = make_submodule(module, submodule)
+                setattr(module, submodule, submodules[submodule])
+            setattr(submodules[submodule], name, builder)
 
     return module
 
   
 
 class TreeDesc:
-    def __init__(self, type, module, tree_type):
+    """ shared: [(base node class, class names or None for all)] of nodes of other
+    tree types this one can also use, e.g. shader math nodes in geometry trees """
+
+    def __init__(self, type, module, tree_type, shared=()):
         self.type = type
         self.module = module
         self.tree_type = tree_type
+        self.shared = shared
 
-    @cached_property
+    @threaded_cached_property
     def node_descriptions(self):
-        return node_subclasses(self.type)
+        descs = dict(node_subclasses(self.type))
+        for base, names in self.shared:
+            for k, desc in node_subclasses(base).items():
+                if k not in descs and (names is None or desc.type.__name__ in names):
+                    descs[k] = desc
+        return descs
 
     @property
     def name(self):
         return parameter_name(typename(self.type))
 
-    @cached_property
+    @threaded_cached_property
     def nodes(self):
         return importlib.import_module(self.module)
         
@@ -144,25 +231,165 @@ node_tree_descs = dict(
     TEXTURE=TreeDesc(bpy.types.TextureNode, 'node.texture', 'TextureNodeTree'),
 )
 
+# Shader nodes which geometry node trees evaluate per element as well
+geometry_shader_nodes = {
+    'ShaderNodeMath', 'ShaderNodeVectorMath', 'ShaderNodeClamp', 'ShaderNodeMapRange', 'ShaderNodeValue',
+    'ShaderNodeCombineXYZ', 'ShaderNodeSeparateXYZ', 'ShaderNodeCombineRGB', 'ShaderNodeSeparateRGB',
+    'ShaderNodeMixRGB', 'ShaderNodeMix', 'ShaderNodeValToRGB', 'ShaderNodeRGBCurve', 'ShaderNodeVectorCurve',
+    'ShaderNodeFloatCurve', 'ShaderNodeVectorRotate', 'ShaderNodeTexNoise', 'ShaderNodeTexVoronoi',
+    'ShaderNodeTexWhiteNoise', 'ShaderNodeTexGradient', 'ShaderNodeTexMusgrave', 'ShaderNodeTexWave',
+    'ShaderNodeTexMagic', 'ShaderNodeTexChecker', 'ShaderNodeTexBrick',
+}
 
-class NodeContext:
-    current = None
+if hasattr(bpy.types, 'GeometryNode'):
+    node_tree_descs['GEOMETRY'] = TreeDesc(bpy.types.GeometryNode, 'node.geometry', 'GeometryNodeTree',
+        shared=[(base, None) for base in [getattr(bpy.types, 'FunctionNode', None)] if base is not None]
+            + [(bpy.types.ShaderNode, geometry_shader_nodes)])
+
+
+# Active context as a (context, parent) chain, local to each thread and asyncio task
+_active_context = contextvars.ContextVar('node_context', default=None)
+
+
+# Whether nodes record the function which created them, see tracking_origins
+_track_origins = contextvars.ContextVar('track_origins', default=False)
+
+
+class tracking_origins:
+    """ Record the function creating each node (see creation_origin) for the attribution
+    of cost reports, 'with tracking_origins(): ...'. Off by default, it walks the stack for
+    every node and stores source file names in the saved node trees """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
+    def __enter__(self):
+        self._token = _track_origins.set(self.enabled)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _track_origins.reset(self._token)
+
+
+def creation_origin():
+    """ Innermost function outside this package on the stack, "function (file:line)" """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != __package__ and not module.startswith(__package__ + '.'):
+            code = frame.f_code
+            return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+class CreatedNodes:
+    """ Nodes created by a streaming context, recorded as compact integer keys (the
+    index of a GraphNode or the pointer of a bpy node) and looked up in the tree on
+    access, so the record keeps no node or socket objects alive. bpy nodes are found
+    by one scan of the tree per access, newest first. Removal marks the entry, using a
+    map of key positions built on the first removal or membership test, and positional
+    access compacts the marked entries away """
+
+    removed = 2**64 - 1
 
     def __init__(self, node_tree):
-        assert isinstance(node_tree, bpy.types.NodeTree)
         self.node_tree = node_tree
-        self.created_nodes = []     
+        self.keys = array('Q')
+        self._removed = 0
+        self._positions = None
+
+    @staticmethod
+    def key(node):
+        return node.index if isinstance(node, GraphNode) else node.as_pointer()
+
+    def positions(self):
+        if self._positions is None:
+            self._positions = {k: i for i, k in enumerate(self.keys) if k != self.removed}
+        return self._positions
+
+    def compact(self):
+        if self._removed:
+            self.keys = array('Q', (k for k in self.keys if k != self.removed))
+            self._removed, self._positions = 0, None
+
+    def resolve(self, keys):
+        if isinstance(self.node_tree, Graph):
+            nodes = [self.node_tree.nodes.get(k) for k in keys]
+        else:
+            # recent nodes are the ones usually asked for, the scan stops once all are found
+            keys = list(keys)
+            wanted, found = set(keys), {}
+            for node in reversed(self.node_tree.nodes):
+                key = node.as_pointer()
+                if key in wanted:
+                    found[key] = node
+                    if len(found) == len(wanted):
+                        break
+            nodes = [found.get(k) for k in keys]
+        return [node for node in nodes if node is not None]
+
+    def append(self, node):
+        key = self.key(node)
+        if self._positions is not None:
+            self._positions[key] = len(self.keys)
+        self.keys.append(key)
+
+    def remove(self, node):
+        key = self.key(node)
+        if key not in self.positions():
+            raise ValueError("{} was not created in this context".format(node))
+        self.keys[self._positions.pop(key)] = self.removed
+        self._removed += 1
+
+    def __contains__(self, node):
+        return self.key(node) in self.positions()
+
+    def __getitem__(self, index):
+        self.compact()
+        if isinstance(index, slice):
+            return self.resolve(self.keys[index])
+        return self.resolve([self.keys[index]])[0]
+
+    def __iter__(self):
+        return iter(self.resolve(k for k in self.keys if k != self.removed))
+
+    def __len__(self):
+        return len(self.keys) - self._removed
+
+    def __repr__(self):
+        return "CreatedNodes({} nodes, {} bytes)".format(len(self), self.keys.itemsize * len(self.keys))
+
+
+class NodeContext:
+    tree_class = bpy.types.NodeTree
+    track_origins = False     # in all builds in this context, see tracking_origins
+
+    def __init__(self, node_tree, streaming=False):
+        """ streaming: record created nodes as compact keys (see CreatedNodes) for
+        builds too large to keep a Python object per node alive. This saves memory with
+        bpy node trees only, the Graph of a RecordingContext holds every GraphNode anyway """
+        assert isinstance(node_tree, self.tree_class)
+        self.node_tree = node_tree
+        self.streaming = streaming
+        self.created_nodes = CreatedNodes(node_tree) if streaming else []
         self.desc = node_tree_descs[node_tree.type]
 
-        self.previous = None
+        self._lock = threading.RLock()
 
     def __enter__(self):
-        self.previous = NodeContext.current
-        NodeContext.current = self
+        _active_context.set((self, _active_context.get()))
+        return self
 
     def __exit__(self, type, value, traceback):
-        NodeContext.current = self.previous
-        self.previous = None
+        active, parent = _active_context.get()
+        assert active is self, "node contexts exited out of order"
+        _active_context.set(parent)
+
+    @staticproperty
+    def current():
+        entry = _active_context.get()
+        return None if entry is None else entry[0]
 
     @staticmethod
     def active():
@@ -172,7 +399,7 @@ class NodeContext:
         return NodeContext.current
 
     def import_group(self, group):
-        assert isinstance(group, type(self.node_tree))
+        assert group.bl_idname == self.node_tree.bl_idname
         return self.nodes.group.set(node_tree=group)
 
     @property
@@ -187,30 +414,87 @@ class NodeContext:
         return self.value_types[type_name]
        
     def _new_node(self, node_type, bound_properties):
-        node = self.node_tree.nodes.new(node_type)           
+        with self._lock:
+            node = self.node_tree.nodes.new(node_type)           
 
-        for k, v in bound_properties.items():
-            assert hasattr(node, k), "node {} has no property {}".format(node.type, k)
-            setattr(node, k, v)
+            for k, v in bound_properties.items():
+                assert hasattr(node, k), "node {} has no property {}".format(node.type, k)
+                setattr(node, k, v)
 
-        self.created_nodes.append(node)
+            if self.track_origins or _track_origins.get():
+                node['origin'] = creation_origin()
+            self.created_nodes.append(node)
         return node
 
 
     def _new_link(self, value, input):
-        return self.node_tree.links.new(value.socket, input)
+        with self._lock:
+            return self.node_tree.links.new(value.socket, input)
 
     def import_node(self, node):
         return Node(self, node)
 
     def remove(self, node):
         assert isinstance(node, Node)
-        self.node_tree.nodes.remove(node._node)
+        with self._lock:
+            if node._node in self.created_nodes:
+                self.created_nodes.remove(node._node)
+            self.node_tree.nodes.remove(node._node)
 
     def activate(self, node):
         assert isinstance(node, Node)
         self.node_tree.nodes.active = node._node
 
+
+class RecordingContext(NodeContext):
+    """ Records nodes into a Graph instead of a bpy NodeTree, recording does not touch
+    bpy data so graphs can be built concurrently and materialized on the main thread """
+
+    tree_class = Graph
+
+    def _new_node(self, node_type, bound_properties):
+        node = self.node_tree.new_node(node_type, bound_properties)
+        if self.track_origins or _track_origins.get():
+            node.origin = creation_origin()
+
+        with self._lock:
+            self.created_nodes.append(node)
+        return node
+
+    def _new_link(self, value, input):
+        return self.node_tree.new_link(value.socket, input)
+
+    def import_node(self, node):
+        if isinstance(node, bpy.types.Node):
+            node = self.node_tree.external(node)
+        return Node(self, node)
+
+    def remove(self, node):
+        assert isinstance(node, Node)
+        with self._lock:
+            if node._node in self.created_nodes:
+                self.created_nodes.remove(node._node)
+        self.node_tree.remove(node._node)
+
+    def activate(self, node):
+        assert isinstance(node, Node)
+        self.node_tree.active = node._node
+
+
+def graph_of(source):
+    """ Graph of a NodeContext (the nodes it created), NodeTree or Graph """
+    if isinstance(source, RecordingContext):
+        return source.node_tree
+    elif isinstance(source, NodeContext):
+        return capture(source.node_tree, source.created_nodes)
+    elif isinstance(source, bpy.types.NodeTree):
+        return capture(source)
+    elif isinstance(source, Graph):
+        return source
+
+    raise TypeError("expected NodeContext|NodeTree|Graph, got " + type(source).__name__)
+
+
 def node_context():
     return NodeContext.active()
     
@@ -220,8 +504,25 @@ def import_group(group):
 def activate_node(node):
     return node_context().activate(node)
 
-def node_tree(tree):
-    return NodeContext(tree)
+def node_tree(tree, streaming=False):
+    if isinstance(tree, Graph):
+        return RecordingContext(tree, streaming)
+    return NodeContext(tree, streaming)
+
+def warm_layouts(tree_type='SHADER'):
+    """ Probe socket layouts of every builder in a node module (main thread only),
+    so that Graphs using them can be recorded from worker threads """
+    module = node_tree_descs[tree_type].nodes
+
+    def builders(m):
+        for k, v in vars(m).items():
+            if isinstance(v, NodeBuilder):
+                yield v
+            elif sys.modules.get(m.__name__ + "." + k) is v:
+                yield from builders(v)
+
+    for builder in builders(module):
+        node_layout(tree_type, builder.node_type, builder.bound_properties)
 
 def remove_node(node):
     return node_context().remove(node)
@@ -257,7 +558,7 @@ def socket_parameter(context, socket, name):
 
 class Node:
     def __init__(self, context, node):
-        assert isinstance(node, bpy.types.Node)
+        assert isinstance(node, node_classes)
         self._node = node
 
         value_types = context.value_types
@@ -293,7 +594,7 @@ class Node:
         return len(self._outputs)
 
 def wrap_node(context, node):
-    assert isinstance(node, bpy.types.Node)
+    assert isinstance(node, node_classes)
     wrapper = Node(context, node)
     if len(wrapper) == 1:
         return wrapper[0]
@@ -378,6 +679,46 @@ class NodeBuilder:
         except TypeError as e:
             error = e.args[0]
             raise TypeError(error) from None
+
+
+class FixedBuilder(NodeBuilder):
+    """ Builder calling a function generated ahead of time (see node.generate) with fixed
+    parameters and socket indices, the node description is only introspected for set() and help """
+
+    def __init__(self, node_type, name, bl_idname, bound_properties, function):
+        self.tree_type = node_type
+        self.name = name
+        self.bl_idname = bl_idname
+        self.bound_properties = bound_properties
+        self.function = function
+        update_wrapper(self, function)
+
+    @cached_property
+    def desc(self):
+        return node_tree_descs[self.tree_type].node_descriptions[self.name]
+
+    @property
+    def node_type(self):
+        return self.bl_idname
+
+    def __repr__(self):
+        return "FixedBuilder({})".format(self.name)
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+
+def generic_builder(node_type, name, bound_properties):
+    """ Introspected builder, used by generated modules for nodes they have no fast path for """
+    return NodeBuilder(node_tree_descs[node_type].node_descriptions[name], bound_properties)
+
+
+def connect_argument(context, socket_type, value, socket, index, name):
+    """ Connect an argument of a generated builder, see call_node """
+    try:
+        context.value_type(socket_type).connect(context, value, socket)
+    except TypeError as e:
+        raise TypeError("argument {} '{}': {}".format(index, name, e.args[0])) from None
         
 
 def numbered(name, names):
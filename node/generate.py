@@ -0,0 +1,119 @@
+import bpy
+
+import os
+import keyword
+
+from .expression import node_tree_descs, builder_entries, number_duplicates, parameter_name
+from .graph import node_layout
+
+
+header = '''# Builders of {module} for Blender {version}, generated by node.generate - do not edit
+from typing import TYPE_CHECKING
+from node.expression import node_context, connect_argument, generic_builder, wrap_node
+
+if TYPE_CHECKING:
+    from {module} import {value_types}
+
+
+blender_version = {version_tuple}
+
+'''
+
+
+def is_parameter(name):
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+
+def generic_function(node_type, function_name, desc_name, properties):
+    return '''
+
+def {}(*args, **kwargs):
+    return generic_builder({!r}, {!r}, {!r})(*args, **kwargs)
+'''.format(function_name, node_type, desc_name, properties)
+
+
+def fixed_function(node_type, function_name, desc_name, bl_idname, properties, value_types):
+    """ Source of a builder function with the parameters and socket indices of the node's layout
+    with the given properties, or None if the layout has sockets builders don't support """
+    try:
+        layout = node_layout(node_type, bl_idname, properties)
+    except (RuntimeError, TypeError, AttributeError):
+        return None
+
+    inputs = [(i, socket) for i, socket in enumerate(layout.inputs) if socket.enabled]
+    outputs = [(i, socket) for i, socket in enumerate(layout.outputs)
+        if socket.enabled and socket.type in value_types]
+
+    names = number_duplicates([parameter_name(socket.name) for _, socket in inputs])
+    if not all(socket.type in value_types for _, socket in inputs) or not all(is_parameter(name) for name in names):
+        return None
+
+    parameters = ["{}: '{}' = {!r}".format(name, value_types[socket.type].__name__,
+        value_types[socket.type].default_value(socket.default)) for name, (_, socket) in zip(names, inputs)]
+
+    lines = ["_context = node_context()",
+        "_node = _context._new_node({!r}, {!r})".format(bl_idname, properties),
+        "_inputs = _node.inputs"]
+    lines += ["connect_argument(_context, {!r}, {}, _inputs[{}], {}, {!r})".format(socket.type, name, i, k + 1, name)
+        for k, (name, (i, socket)) in enumerate(zip(names, inputs))]
+
+    if len(outputs) == 1:
+        i, socket = outputs[0]
+        returns = " -> '{}'".format(value_types[socket.type].__name__)
+        lines.append("return _context.value_types[{!r}](_node.outputs[{}])".format(socket.type, i))
+    else:
+        returns = ""
+        lines.append("return wrap_node(_context, _node)")
+
+    description = "{}({})".format(desc_name, ", ".join("{}={!r}".format(k, v) for k, v in properties.items()))
+    return '\n\ndef {}({}){}:\n    """ {} """\n{}\n'.format(function_name, ", ".join(parameters), returns,
+        description, "\n".join("    " + line for line in lines))
+
+
+def generate_module(node_type):
+    """ Source of a module of builder functions for a tree type ('SHADER', 'COMPOSITING' or
+    'TEXTURE') in the running Blender, from the same node descriptions add_node_module uses.
+    Layouts are probed from bpy so this runs on the main thread """
+    tree_desc = node_tree_descs[node_type]
+    value_types = tree_desc.nodes._value_types
+
+    functions, entries, fixed = [], [], 0
+    for desc_name, desc in sorted(tree_desc.node_descriptions.items()):
+        for submodule, name, properties in builder_entries(desc_name, desc):
+            function_name = name if submodule is None else "{}_{}".format(submodule, name)
+            bl_idname = desc.type.__name__
+
+            source = fixed_function(node_type, function_name, desc_name, bl_idname, properties, value_types)
+            fixed += source is not None
+            functions.append(source or generic_function(node_type, function_name, desc_name, properties))
+            entries.append("    ({!r}, {!r}, {!r}, {!r}, {!r}, {}),".format(
+                submodule, name, desc_name, bl_idname, properties, function_name))
+
+    version = tuple(bpy.app.version)
+    source = header.format(module=tree_desc.module, version=bpy.app.version_string, version_tuple=version,
+        value_types=", ".join(sorted({t.__name__ for t in value_types.values()})))
+    source += "".join(functions)
+    source += "\n\n# (submodule, name, node, bl_idname, properties, function), {} of {} with fixed parameters\n"\
+        .format(fixed, len(entries))
+    return source + "builders = [\n{}\n]\n".format("\n".join(entries))
+
+
+def module_filename(node_type, directory=None):
+    directory = directory or os.path.join(os.path.dirname(__file__), 'generated')
+    return os.path.join(directory, "{}_{}_{}.py".format(node_type.lower(), *bpy.app.version[:2]))
+
+
+def generate(node_types=('SHADER', 'COMPOSITING', 'TEXTURE'), directory=None):
+    """ Write builder modules for the running Blender version, by default into node/generated
+    where node.shader, node.compositor and node.texture load them on import instead of
+    introspecting bpy.types and binding arguments at call time. Returns the files written """
+    filenames = []
+    for node_type in node_types:
+        source = generate_module(node_type)
+        filename = module_filename(node_type, directory)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        with open(filename, 'w') as f:
+            f.write(source)
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1 @@
+# Builder modules generated ahead of time by node.generate, one per tree type and Blender version
@@ -0,0 +1,235 @@
+import bpy
+
+import sys
+from numbers import Number
+
+from node import expression, value, shader
+from .value import Value     # 'value' is shadowed by the value node's builder below
+from .graph import cone, implicit_input
+from .group import new_group, socket_types
+from .util import namespace, typename
+
+from cached_property import cached_property
+
+
+# Input nodes whose outputs vary per element of a geometry, values depending on them are fields
+field_inputs = {
+    'GeometryNodeInputPosition', 'GeometryNodeInputNormal', 'GeometryNodeInputIndex', 'GeometryNodeInputID',
+    'GeometryNodeInputNamedAttribute', 'GeometryNodeInputRadius', 'GeometryNodeInputTangent',
+    'GeometryNodeInputMaterialIndex', 'GeometryNodeInputShadeSmooth', 'GeometryNodeInputSplineCyclic',
+    'GeometryNodeInputSplineResolution', 'GeometryNodeInputCurveTilt', 'GeometryNodeInputMeshFaceArea',
+    'GeometryNodeInputMeshEdgeAngle', 'GeometryNodeInputMeshVertexNeighbors', 'GeometryNodeSplineParameter',
+    'GeometryNodeAttributeCapture', 'GeometryNodeCaptureAttribute',
+}
+
+
+def is_field(v):
+    """ Value computed from per element inputs (see field_inputs) or from textures reading the
+    position through an unlinked Vector input, inside groups are not looked into """
+    if not isinstance(v, Value):
+        return False
+    node = v.socket.node
+    return any(n.bl_idname in field_inputs or implicit_input(n) is not None for n in cone(node.inputs) | {node})
+
+
+def single_value(handler):
+    """ Connection handler refusing fields on inputs which only take a single value (drawn as circles) """
+    def connect(context, v, socket):
+        if getattr(socket, 'display_shape', None) == 'CIRCLE' and is_field(v):
+            raise TypeError("input '{}' takes a single value, got a field".format(socket.name))
+        return handler(context, v, socket)
+    return connect
+
+
+class Field:
+    """ Value of a geometry node tree, a field when it depends on per element inputs """
+
+    @property
+    def is_field(self):
+        return is_field(self)
+
+    def capture(self, geometry, domain='POINT'):
+        """ Field evaluated on the elements of a geometry, returns (geometry, captured value) """
+        data_type = dict(Float='FLOAT', Vector='FLOAT_VECTOR', Color='FLOAT_COLOR', Int='INT', Bool='BOOLEAN')[self.type]
+        geometry, captured = self.nodes.capture_attribute.set(data_type=data_type, domain=domain)(geometry, self)
+        return geometry, captured
+
+
+class Float(Field, shader.Float):
+    def color(self):
+        return Color(self.socket)
+
+    def vector(self):
+        return Vector(self.socket)
+
+
+class Vector(Field, shader.Vector):
+    def color(self):
+        return Color(self.socket)
+
+
+class Color(Field, shader.Color):
+    def vector(self):
+        return Vector(self.socket)
+
+    def float(self):
+        return Float(self.socket)
+
+
+class Int(Field, shader.Int):
+    def float(self):
+        return Float(self.socket)
+
+
+class Bool(Field, shader.Bool):
+    def float(self):
+        return Float(self.socket)
+
+
+class String(shader.String):
+    pass
+
+
+class Geometry(value.Value):
+    type = 'Geometry'
+    expected = "Geometry"
+
+    @staticmethod
+    def annotation():
+        return Geometry
+
+    @staticmethod
+    def default_value(v):
+        return None
+
+    @cached_property
+    def bound_box(self):
+        return self.nodes.bound_box(self)
+
+    def set_position(self, position=None, offset=(0, 0, 0)):
+        if position is None:
+            return self.nodes.set_position(self, offset=offset)
+        return self.nodes.set_position(self, position=position, offset=offset)
+
+
+class Datablock(value.Value):
+    """ Object, collection, material, image or texture socket """
+    type = 'Datablock'
+    expected = "bpy.types.ID|Datablock"
+
+    @staticmethod
+    def annotation():
+        return Datablock
+
+    @staticmethod
+    def default_value(v):
+        return v
+
+
+Float.connectors = [(value.Float, single_value(value.link)), (Number, value.set_default)]
+Vector.connectors = [((value.Vector, value.Float), single_value(value.link)), (Number, value.set_vector),
+    (tuple, single_value(value.combine_vector))]
+Color.connectors = [((value.Color, value.Float), single_value(value.link)), (Number, value.set_color),
+    (tuple, value.literal_color)]
+Int.connectors = [(value.Int, single_value(value.link)), (Number, value.set_int)]
+Bool.connectors = [(value.Bool, single_value(value.link)), (bool, value.set_default)]
+Geometry.connectors = [(Geometry, value.link), (type(None), value.ignore)]
+Datablock.connectors = [(Datablock, value.link), ((bpy.types.ID, type(None)), value.set_default)]
+
+
+_value_types = {
+    'VALUE':Float,
+    'INT':Int,
+    'BOOLEAN':Bool,
+    'VECTOR':Vector,
+    'STRING':String,
+    'RGBA':Color,
+    'GEOMETRY':Geometry,
+    'OBJECT':Datablock,
+    'COLLECTION':Datablock,
+    'MATERIAL':Datablock,
+    'IMAGE':Datablock,
+    'TEXTURE':Datablock,
+}
+
+
+module = sys.modules[__name__]
+if 'GEOMETRY' in expression.node_tree_descs:
+    expression.add_node_module(module, 'GEOMETRY')
+
+
+# Output of a shader Attribute node reading per vertex values of each type
+attribute_outputs = dict(Float='fac', Vector='vector', Color='color')
+
+
+def stage_inputs(geometry=None):
+    """ Position, normal, uv and generated coordinates of the active tree's stage: per shading
+    sample in shader trees, per element of geometry in geometry trees. Expressions written as
+    functions of these run unchanged in either (see per_vertex) """
+    nodes = expression.node_context().nodes
+    if expression.node_context().node_tree.type != 'GEOMETRY':
+        geom, coords = nodes.new_geometry(), nodes.tex_coord()
+        return namespace('stage inputs', position=geom.position, normal=geom.normal,
+            uv=coords.uv, generated=coords.generated)
+
+    uv = nodes.input_named_attribute.set(data_type='FLOAT_VECTOR')(name='UVMap')
+    position = nodes.input_position()
+    inputs = dict(position=position, normal=nodes.input_normal(),
+        uv=uv if isinstance(uv, Value) else uv.attribute)
+    if geometry is not None:
+        # Blender's texture space is centred on the bounds with flat axes' size clamped, they read 0.5
+        box = geometry.bound_box
+        center = (box.min + box.max) * 0.5
+        inputs['generated'] = (position - center) / (box.max - box.min).max(2e-5) + 0.5
+    return namespace('stage inputs', **inputs)
+
+
+def vertex_group(f, name, source=None):
+    """ Geometry node group passing its geometry through with f(stage_inputs) as a field output """
+    node_tree, node_inputs, node_outputs = new_group(name, 'GeometryNodeTree', source or f)
+    node_tree.inputs.new('NodeSocketGeometry', 'Geometry')
+    node_tree.outputs.new('NodeSocketGeometry', 'Geometry')
+
+    with expression.NodeContext(node_tree) as context:
+        geometry = context.import_node(node_inputs)[0]
+        result = f(stage_inputs(geometry))
+        if not isinstance(result, Value) or result.type not in attribute_outputs:
+            raise TypeError("per vertex values are Float, Vector or Color, got {}".format(
+                result.type if isinstance(result, Value) else typename(result)))
+
+        node_tree.outputs.new(socket_types[result.type], name)
+        context.value_type('GEOMETRY').connect(context, geometry, node_outputs.inputs[0])
+        context.value_type(result.socket.type).connect(context, result, node_outputs.inputs[1])
+
+    return node_tree, result.type
+
+
+def per_vertex(obj, f, name):
+    """ Evaluate f(stage_inputs) once per vertex of obj in a geometry nodes modifier, stored as
+    the attribute 'name' which shaders read interpolated (see vertex_attribute). Returns the type """
+    node_tree, value_type = vertex_group(f, name)
+
+    modifier = obj.modifiers.get(name) or obj.modifiers.new(name, 'NODES')
+    modifier.node_group = node_tree
+    modifier[node_tree.outputs[1].identifier + '_attribute_name'] = name
+    return value_type
+
+
+def vertex_attribute(name, value_type='Float'):
+    """ Shader Value reading an attribute stored per vertex (see per_vertex) """
+    attribute = expression.node_context().nodes.attribute.set(attribute_name=name)()
+    return getattr(attribute, attribute_outputs[value_type])
+
+
+def evaluate_at(f, stage='SAMPLE', obj=None, name=None):
+    """ Shader Value of f(stage_inputs) computed per shading sample ('SAMPLE'), or per vertex
+    of obj ('VERTEX') and interpolated, which moves position-only work out of the shader """
+    if stage == 'SAMPLE':
+        return f(stage_inputs())
+    elif stage == 'VERTEX':
+        if obj is None:
+            raise TypeError("evaluate_at: per vertex evaluation needs an object")
+        name = name or getattr(f, '__name__', 'per_vertex')
+        return vertex_attribute(name, per_vertex(obj, f, name))
+
+    raise TypeError("evaluate_at: stage should be 'SAMPLE' or 'VERTEX', got {}".format(stage))
@@ -0,0 +1,653 @@
+import bpy
+
+import re
+import hashlib
+import threading
+from collections import namedtuple
+
+from .registry import tag_generated
+
+
+tree_idnames = dict(
+    SHADER='ShaderNodeTree',
+    COMPOSITING='CompositorNodeTree',
+    TEXTURE='TextureNodeTree',
+    GEOMETRY='GeometryNodeTree'
+)
+
+SocketLayout = namedtuple('SocketLayout', ['name', 'identifier', 'type', 'enabled', 'default'])
+NodeLayout = namedtuple('NodeLayout', ['type', 'inputs', 'outputs'])
+
+
+def socket_default(socket):
+    value = getattr(socket, 'default_value', None)
+    if hasattr(value, '__len__') and not isinstance(value, str):
+        return tuple(value)
+    return value
+
+
+def socket_layout(socket):
+    return SocketLayout(socket.name, socket.identifier, socket.type,
+        socket.enabled, socket_default(socket))
+
+
+def freeze(v):
+    if isinstance(v, bpy.types.ID):
+        return v.name_full
+    elif isinstance(v, (list, tuple)):
+        return tuple(v)
+    return v
+
+
+def layout_key(tree_type, bl_idname, properties):
+    return (tree_type, bl_idname,
+        tuple(sorted((k, freeze(v)) for k, v in properties.items())))
+
+
+_layouts = {}
+_layout_lock = threading.Lock()
+
+
+def probe_tree(tree_type):
+    name = '.layout_probe_' + tree_type.lower()
+    if name in bpy.data.node_groups:
+        return bpy.data.node_groups[name]
+    return tag_generated(bpy.data.node_groups.new(name, tree_idnames[tree_type]), __name__ + '.probe_tree')
+
+
+def probe_layout(tree_type, bl_idname, properties):
+    tree = probe_tree(tree_type)
+    node = tree.nodes.new(bl_idname)
+    try:
+        # Properties bpy nodes don't have (the settings of procedural textures) can't change their sockets
+        for k, v in properties.items():
+            if hasattr(node, k):
+                setattr(node, k, v)
+
+        return NodeLayout(node.type,
+            inputs=[socket_layout(socket) for socket in node.inputs],
+            outputs=[socket_layout(socket) for socket in node.outputs])
+    finally:
+        tree.nodes.remove(node)
+
+
+def node_layout(tree_type, bl_idname, properties={}):
+    """ Socket layout of a node type with the given properties. Layouts are probed
+    from bpy on the main thread and cached, worker threads may only use cached layouts """
+    key = layout_key(tree_type, bl_idname, properties)
+    layout = _layouts.get(key)
+
+    if layout is None:
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("no socket layout for {}{}, use expression.warm_layouts('{}') on the main thread"
+                .format(bl_idname, dict(key[2]), tree_type))
+
+        layout = probe_layout(tree_type, bl_idname, properties)
+        with _layout_lock:
+            _layouts[key] = layout
+
+    return layout
+
+
+class GraphSocket:
+    __slots__ = ('node', 'index', 'is_output', 'name', 'identifier', 'type', 'enabled',
+        'links', 'driver', 'is_modified', '_default_value')
+
+    def __init__(self, node, index, layout, is_output):
+        self.node = node
+        self.index = index
+        self.is_output = is_output
+
+        self.name = layout.name
+        self.identifier = layout.identifier
+        self.type = layout.type
+        self.enabled = layout.enabled
+
+        self.links = ()     # a list once linked, most sockets never are
+        self.driver = None
+        self.is_modified = False
+        self._default_value = layout.default
+
+    @property
+    def default_value(self):
+        return self._default_value
+
+    @default_value.setter
+    def default_value(self, value):
+        self._default_value = value
+        self.is_modified = True
+
+    @property
+    def is_linked(self):
+        return len(self.links) > 0
+
+    def __repr__(self):
+        return "GraphSocket({}.{}:{})".format(self.node.name, self.identifier, self.type)
+
+
+class GraphLink:
+    __slots__ = ('from_socket', 'to_socket')
+
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+
+    @property
+    def from_node(self):
+        return self.from_socket.node
+
+    @property
+    def to_node(self):
+        return self.to_socket.node
+
+    def __repr__(self):
+        return "GraphLink({} -> {})".format(self.from_socket, self.to_socket)
+
+
+class GraphNode:
+    # Slots rather than a __dict__ per node and socket, graphs can have 100k+ nodes
+    __slots__ = ('id_data', 'index', 'bl_idname', 'type', 'name', 'properties', 'mute',
+        'external', 'origin', 'inputs', 'outputs')
+
+    def __init__(self, graph, index, bl_idname, properties, layout):
+        self.id_data = graph
+        self.index = index
+        self.bl_idname = bl_idname
+        self.type = layout.type
+        self.name = "{}.{:03d}".format(layout.type.lower(), index)
+
+        self.properties = dict(properties)
+        self.mute = False
+        self.external = None
+        self.origin = None
+
+        self.inputs = [GraphSocket(self, i, socket, False) for i, socket in enumerate(layout.inputs)]
+        self.outputs = [GraphSocket(self, i, socket, True) for i, socket in enumerate(layout.outputs)]
+
+    @property
+    def node_tree(self):
+        return self.properties.get('node_tree')
+
+    def __repr__(self):
+        return "GraphNode({}, {})".format(self.name, self.bl_idname)
+
+
+class Members:
+    """ Nodes or links of a Graph in insertion order, held in a dict so membership and removal
+    are O(1) on graphs of 100k+ nodes. Iteration and positional access go through a list
+    rebuilt after changes, iterating while adding or removing sees the members at the start """
+
+    def __init__(self):
+        self._items = {}
+        self._list = None
+
+    @staticmethod
+    def key(item):
+        return item
+
+    def append(self, item):
+        self._items[self.key(item)] = item
+        self._list = None
+
+    def remove(self, item):
+        if item not in self:
+            raise ValueError("{} is not in the graph".format(item))
+        del self._items[self.key(item)]
+        self._list = None
+
+    def get(self, key):
+        return self._items.get(key)
+
+    @property
+    def list(self):
+        if self._list is None:
+            self._list = list(self._items.values())
+        return self._list
+
+    def index(self, item):
+        return self.list.index(item)
+
+    def __contains__(self, item):
+        return self._items.get(self.key(item)) is item
+
+    def __getitem__(self, index):
+        return self.list[index]
+
+    def __iter__(self):
+        return iter(self.list)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return repr(self.list)
+
+
+class GraphNodes(Members):
+    """ Nodes keyed by GraphNode.index """
+
+    @staticmethod
+    def key(node):
+        return node.index
+
+
+class Graph:
+    """ Python-side record of a node tree. A Graph is filled by building expressions
+    inside 'with node_tree(graph)' (on any thread) and later materialized into a bpy
+    NodeTree on the main thread """
+
+    def __init__(self, type='SHADER', name='Graph'):
+        assert type in tree_idnames, "unsupported tree type {}".format(type)
+        self.type = type
+        self.bl_idname = tree_idnames[type]
+        self.name = name
+
+        self.nodes = GraphNodes()
+        self.links = Members()
+        self.active = None
+        self.interface = dict(inputs=[], outputs=[])
+
+        self._next_index = 0
+        self._external = {}
+        self._lock = threading.RLock()
+
+    def new_node(self, bl_idname, properties={}):
+        layout = node_layout(self.type, bl_idname, properties)
+        with self._lock:
+            node = GraphNode(self, self._next_index, bl_idname, properties, layout)
+            self._next_index += 1
+            self.nodes.append(node)
+        return node
+
+    def node_at(self, index):
+        """ Node with the given GraphNode.index or None """
+        return self.nodes.get(index)
+
+    def external(self, node):
+        """ Reference an existing bpy node of the tree the graph will be materialized into,
+        such as the input and output nodes of a group """
+        with self._lock:
+            key = node.as_pointer()
+            if key not in self._external:
+                layout = NodeLayout(node.type,
+                    inputs=[socket_layout(socket) for socket in node.inputs],
+                    outputs=[socket_layout(socket) for socket in node.outputs])
+
+                graph_node = GraphNode(self, self._next_index, node.bl_idname, {}, layout)
+                graph_node.external = node
+                graph_node.name = node.name
+
+                self._next_index += 1
+                self.nodes.append(graph_node)
+                self._external[key] = graph_node
+
+            return self._external[key]
+
+    def new_link(self, from_socket, to_socket):
+        assert from_socket.is_output and not to_socket.is_output, "links go from output to input"
+        with self._lock:
+            for link in list(to_socket.links):
+                self.remove_link(link)
+
+            link = GraphLink(from_socket, to_socket)
+            for socket in (from_socket, to_socket):
+                if socket.links:
+                    socket.links.append(link)
+                else:
+                    socket.links = [link]
+            self.links.append(link)
+        return link
+
+    def remove_link(self, link):
+        with self._lock:
+            link.from_socket.links.remove(link)
+            link.to_socket.links.remove(link)
+            self.links.remove(link)
+
+    def remove(self, node):
+        with self._lock:
+            for socket in node.inputs + node.outputs:
+                for link in list(socket.links):
+                    self.remove_link(link)
+            self.nodes.remove(node)
+            if node.external is not None:
+                del self._external[node.external.as_pointer()]
+
+            if self.active is node:
+                self.active = None
+
+    def materialize_steps(self, node_tree, created):
+        """ Generator creating one bpy node or link per step, filling 'created'
+        with a mapping from GraphNode to bpy node """
+        assert node_tree.bl_idname == self.bl_idname, \
+            "expected {}, got {}".format(self.bl_idname, node_tree.bl_idname)
+
+        for node in list(self.nodes):
+            if node.external is not None:
+                new_node = node.external
+            else:
+                new_node = node_tree.nodes.new(node.bl_idname)
+                for k, v in node.properties.items():
+                    setattr(new_node, k, v)
+
+            for socket, new_socket in zip(node.inputs + node.outputs, list(new_node.inputs) + list(new_node.outputs)):
+                if socket.is_modified:
+                    new_socket.default_value = socket.default_value
+                if socket.driver is not None:
+                    add_driver(new_socket, socket.driver)
+
+            new_node.mute = node.mute
+            if node.origin is not None:
+                new_node['origin'] = node.origin
+
+            created[node] = new_node
+            yield new_node
+
+        for link in list(self.links):
+            from_socket = created[link.from_node].outputs[link.from_socket.index]
+            to_socket = created[link.to_node].inputs[link.to_socket.index]
+            yield node_tree.links.new(from_socket, to_socket)
+
+        if self.active is not None:
+            node_tree.nodes.active = created[self.active]
+
+    def materialize(self, node_tree):
+        created = {}
+        for _ in self.materialize_steps(node_tree, created):
+            pass
+        return created
+
+    def copy(self):
+        graph = Graph(self.type, self.name)
+        graph.interface = {k: list(v) for k, v in self.interface.items()}
+
+        copies = {}
+        for node in self.nodes:
+            layout = NodeLayout(node.type,
+                inputs=[SocketLayout(s.name, s.identifier, s.type, s.enabled, s.default_value) for s in node.inputs],
+                outputs=[SocketLayout(s.name, s.identifier, s.type, s.enabled, s.default_value) for s in node.outputs])
+
+            copy = GraphNode(graph, node.index, node.bl_idname, node.properties, layout)
+            copy.name, copy.mute, copy.origin, copy.external = node.name, node.mute, node.origin, node.external
+
+            for socket, socket_copy in zip(node.inputs + node.outputs, copy.inputs + copy.outputs):
+                socket_copy.is_modified = socket.is_modified
+                socket_copy.driver = socket.driver
+
+            graph.nodes.append(copy)
+            copies[node] = copy
+            if node.external is not None:
+                graph._external[node.external.as_pointer()] = copy
+
+        for link in self.links:
+            graph.new_link(copies[link.from_node].outputs[link.from_socket.index],
+                copies[link.to_node].inputs[link.to_socket.index])
+
+        graph.active = copies.get(self.active)
+        graph._next_index = self._next_index
+        return graph
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __repr__(self):
+        return "Graph({}, {} nodes, {} links)".format(self.type, len(self.nodes), len(self.links))
+
+
+id_collections = dict(OBJECT='objects', MATERIAL='materials', SCENE='scenes', MESH='meshes',
+    WORLD='worlds', NODETREE='node_groups', CAMERA='cameras', LIGHT='lights', IMAGE='images')
+
+
+def id_type(block):
+    """ Driver target type of a datablock, 'LIGHT' for a PointLight """
+    name = getattr(block, 'id_type', None)
+    if name not in id_collections:
+        raise TypeError("unsupported datablock type " + type(block).__name__)
+    return name
+
+
+def property_driver(obj, prop_name, driver_type='AVERAGE'):
+    """ Driver description reading a custom property of obj """
+    target = dict(id_type=id_type(obj), id=obj.name, data_path='["{}"]'.format(prop_name))
+
+    return dict(type=driver_type, expression='',
+        variables=[dict(name='var', type='SINGLE_PROP', targets=[target])])
+
+
+def driver_desc(fcurve):
+    driver = fcurve.driver
+    variables = [dict(name=var.name, type=var.type,
+        targets=[dict(id_type=t.id_type, id=t.id.name if t.id else None, data_path=t.data_path)
+            for t in var.targets])
+        for var in driver.variables]
+
+    return dict(type=driver.type, expression=driver.expression, variables=variables)
+
+
+def add_driver(socket, desc):
+    """ Drive the default value of a socket, recorded sockets store the description """
+    if isinstance(socket, GraphSocket):
+        socket.driver = desc
+        return
+
+    driver = socket.driver_add("default_value").driver
+    driver.type = desc['type']
+    if desc['type'] == 'SCRIPTED':
+        driver.expression = desc['expression']
+
+    for var_desc in desc['variables']:
+        var = driver.variables.new()
+        var.name = var_desc['name']
+        var.type = var_desc['type']
+        for target, target_desc in zip(var.targets, var_desc['targets']):
+            if var.type == 'SINGLE_PROP':
+                target.id_type = target_desc['id_type']
+            if target_desc['id'] is not None:
+                target.id = getattr(bpy.data, id_collections[target_desc['id_type']])[target_desc['id']]
+            target.data_path = target_desc['data_path']
+
+
+node_base_properties = {p.identifier for p in bpy.types.Node.bl_rna.properties}
+
+def node_properties(node):
+    properties = {}
+    for p in node.bl_rna.properties:
+        if not p.is_readonly and p.identifier not in node_base_properties:
+            value = getattr(node, p.identifier)
+            properties[p.identifier] = tuple(value) if hasattr(value, '__len__')\
+                and not isinstance(value, (str, bpy.types.ID)) else value
+    return properties
+
+
+def interface_sockets(sockets):
+    return [(socket.name, socket.bl_socket_idname, socket_default(socket)) for socket in sockets]
+
+
+socket_path = re.compile(r'nodes\["(.+)"\]\.(inputs|outputs)\[(\d+)\]\.default_value')
+
+def capture(node_tree, nodes=None):
+    """ Snapshot a bpy NodeTree (or a subset of its nodes) as a Graph. Sockets
+    are marked modified where they differ from the defaults of a new node """
+    graph = Graph(node_tree.type, node_tree.name)
+    graph.interface = dict(inputs=interface_sockets(node_tree.inputs),
+        outputs=interface_sockets(node_tree.outputs))
+
+    captured = {}
+    for node in (node_tree.nodes if nodes is None else nodes):
+        properties = node_properties(node)
+        layout = NodeLayout(node.type,
+            inputs=[socket_layout(socket) for socket in node.inputs],
+            outputs=[socket_layout(socket) for socket in node.outputs])
+
+        graph_node = GraphNode(graph, graph._next_index, node.bl_idname, properties, layout)
+        graph_node.name = node.name
+        graph_node.mute = node.mute
+        graph_node.origin = node.get('origin')
+        graph._next_index += 1
+
+        try:
+            initial = node_layout(graph.type, node.bl_idname, properties)
+            initial = initial.inputs + initial.outputs
+        except (RuntimeError, TypeError, AttributeError):
+            initial = [None] * len(layout.inputs + layout.outputs)
+
+        for socket, socket_initial in zip(graph_node.inputs + graph_node.outputs, initial):
+            socket.is_modified = socket_initial is None or socket.default_value != socket_initial.default
+
+        graph.nodes.append(graph_node)
+        captured[node.name] = (node, graph_node)
+
+    def socket_index(sockets, socket):
+        return [s.as_pointer() for s in sockets].index(socket.as_pointer())
+
+    for link in node_tree.links:
+        if link.is_valid and link.from_node.name in captured and link.to_node.name in captured:
+            from_node, from_graph_node = captured[link.from_node.name]
+            to_node, to_graph_node = captured[link.to_node.name]
+
+            graph.new_link(from_graph_node.outputs[socket_index(from_node.outputs, link.from_socket)],
+                to_graph_node.inputs[socket_index(to_node.inputs, link.to_socket)])
+
+    animation = node_tree.animation_data
+    for fcurve in (animation.drivers if animation is not None else []):
+        match = socket_path.fullmatch(fcurve.data_path)
+        if match is not None and match.group(1) in captured:
+            _, graph_node = captured[match.group(1)]
+            sockets = getattr(graph_node, match.group(2))
+            sockets[int(match.group(3))].driver = driver_desc(fcurve)
+
+    if node_tree.nodes.active is not None and node_tree.nodes.active.name in captured:
+        graph.active = captured[node_tree.nodes.active.name][1]
+
+    return graph
+
+
+def graph_socket(socket):
+    """ Graph containing a (bpy or recorded) socket and the matching GraphSocket,
+    bpy node trees are captured """
+    if isinstance(socket, GraphSocket):
+        return socket.node.id_data, socket
+
+    graph = capture(socket.id_data)
+    node = next(n for n in graph.nodes if n.name == socket.node.name)
+    sockets = socket.node.outputs if socket.is_output else socket.node.inputs
+    index = [s.as_pointer() for s in sockets].index(socket.as_pointer())
+    return graph, (node.outputs if socket.is_output else node.inputs)[index]
+
+
+def detach(graph, captured=None):
+    """ Copy of a graph without references to bpy data: group nodes refer to captured
+    Graphs (recursively) and other datablocks to their names, so it can be pickled """
+    captured = {} if captured is None else captured
+    graph = graph.copy()
+
+    for node in graph.nodes:
+        group = node.node_tree
+        if isinstance(group, bpy.types.NodeTree):
+            if group.name_full not in captured:
+                captured[group.name_full] = detach(capture(group), captured)
+            node.properties['node_tree'] = captured[group.name_full]
+
+        node.external = None
+        node.properties = {k: v.name_full if isinstance(v, bpy.types.ID) else v
+            for k, v in node.properties.items()}
+
+    graph._external = {}
+    return graph
+
+
+def detached_socket(socket):
+    """ Socket of a detached copy of the graph containing it, see graph_socket and detach """
+    graph, socket = graph_socket(socket)
+    node = detach(graph).nodes[graph.nodes.index(socket.node)]
+    return (node.outputs if socket.is_output else node.inputs)[socket.index]
+
+
+def upstream(sockets):
+    for socket in sockets:
+        for link in socket.links:
+            yield link.from_node
+
+
+def cone(sockets):
+    """ All nodes upstream of the sockets """
+    nodes, stack = set(), list(upstream(sockets))
+    while len(stack):
+        node = stack.pop()
+        if node not in nodes:
+            nodes.add(node)
+            stack.extend(upstream(node.inputs))
+    return nodes
+
+
+# Coordinates texture nodes read in place of an unlinked Vector input, in geometry trees they read the position
+implicit_coordinates = dict(
+    ShaderNodeTexNoise='Generated', ShaderNodeTexVoronoi='Generated', ShaderNodeTexMusgrave='Generated',
+    ShaderNodeTexWave='Generated', ShaderNodeTexMagic='Generated', ShaderNodeTexGradient='Generated',
+    ShaderNodeTexChecker='Generated', ShaderNodeTexBrick='Generated', ShaderNodeTexWhiteNoise='Position',
+    ShaderNodeTexImage='UV', GeometryNodeImageTexture='Position',
+)
+
+
+def implicit_input(node):
+    """ Vector input of a texture node which reads implicit coordinates (see implicit_coordinates), or None """
+    if node.bl_idname not in implicit_coordinates:
+        return None
+    socket = next((socket for socket in node.inputs if socket.name == 'Vector'), None)
+    return None if socket is None or not socket.enabled or socket.is_linked else socket
+
+
+def topological_order(nodes):
+    """ Nodes and everything upstream of them, dependencies first """
+    order, visited = [], set()
+    for root in nodes:
+        stack = [(root, False)]
+        while len(stack):
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+            elif node not in visited:
+                visited.add(node)
+                stack.append((node, True))
+                stack.extend((n, False) for n in upstream(node.inputs) if n not in visited)
+    return order
+
+
+def content_hash(sockets, *extra):
+    """ Hash of the recorded nodes upstream of the sockets: types, properties, unlinked input
+    values, drivers and links (groups by content), independent of node names and order """
+    def value(v):
+        if isinstance(v, (Graph, bpy.types.NodeTree)):
+            return tree_hash(v)
+        return repr(freeze(v))
+
+    order = topological_order([socket.node for socket in sockets])
+    index = {node: i for i, node in enumerate(order)}
+
+    desc = [[node.bl_idname, node.mute, sorted((k, value(v)) for k, v in node.properties.items()),
+        [(index[s.links[0].from_node], s.links[0].from_socket.index) if s.is_linked else value(s.default_value)
+            for s in node.inputs],
+        [value(s.default_value) for s in node.outputs],
+        [s.driver for s in node.inputs + node.outputs]] for node in order]
+
+    desc.append([(index[s.node], s.is_output, s.index) for s in sockets])
+    return hashlib.sha1(repr(desc + list(extra)).encode()).hexdigest()
+
+
+def tree_hash(tree):
+    """ content_hash of a node tree or Graph, from the inputs of its output nodes """
+    graph = tree if isinstance(tree, Graph) else capture(tree)
+    return content_hash([s for n in graph.nodes if len(n.outputs) == 0 for s in n.inputs])
+
+
+node_classes = (bpy.types.Node, GraphNode)
+socket_classes = (bpy.types.NodeSocket, GraphSocket)
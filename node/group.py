@@ -3,10 +3,17 @@ from __future__ import annotations
 
 import bpy
 import inspect
+import weakref
+from functools import wraps
+from numbers import Number
 from typing import List, Callable, Tuple, Any, Union, Optional
 
 from .util import typename, assert_type
-from .expression import NodeContext, Node, import_group
+from .expression import NodeContext, RecordingContext, Node, import_group, node_context
+from .graph import Graph, topological_order, tree_hash
+from .incremental import BuildTask
+from .ranges import simplify
+from .registry import tag_generated, set_hash
 from .value import Value
 
 
@@ -17,10 +24,11 @@ socket_types = {
     'Vector':'NodeSocketVector', 
     'String':'NodeSocketString', 
     'Shader':'NodeSocketShader', 
-    'Color':'NodeSocketColor'
+    'Color':'NodeSocketColor',
+    'Geometry':'NodeSocketGeometry'
 }
 
-    
+
 
 def make_param(context, node_tree, param:inspect.Parameter):
     if param.annotation is inspect.Parameter.empty:
@@ -39,54 +47,222 @@ def make_param(context, node_tree, param:inspect.Parameter):
     return socket
 
 
+def named_outputs(outputs):
+    if isinstance(outputs, dict):
+        return list(outputs.items())
+    elif isinstance(outputs, tuple):
+        return [("output_{}".format(i + 1), value) for i, value in enumerate(outputs)]
+    elif isinstance(outputs, Value):
+        return [("output", outputs)]
+    else:
+        raise TypeError("group.build: invalid output type, expected (dict|Value|tuple), got " + typename(outputs))
+
 
-    
-def build(f:Callable, name:str='Group', node_type:str='ShaderNodeTree'):
-    node_tree = bpy.data.node_groups.new(name, node_type)
+def new_group(name:str, node_type:str, source=None):
+    node_tree = tag_generated(bpy.data.node_groups.new(name, node_type), source or __name__)
 
     node_inputs = node_tree.nodes.new('NodeGroupInput')
     node_outputs = node_tree.nodes.new('NodeGroupOutput')
+    return node_tree, node_inputs, node_outputs
 
-    context = NodeContext(node_tree)
 
+def build_group(context, f:Callable, node_tree, node_inputs, node_outputs):
     sig = inspect.signature(f)
-    for param in sig.parameters.values(): 
+    for param in sig.parameters.values():
         if param.annotation is None:
             raise TypeError("expected type annotation on input parameter: " + str(param.name))
 
     for param in sig.parameters.values():
         make_param(context, node_tree, param)
 
-    input_node = Node(context, node_inputs)
+    input_node = context.import_node(node_inputs)
 
     with(context):
-        outputs = f(*input_node)
+        outputs = named_outputs(f(*input_node))
 
-        def add_output(value, name=None):
+        for name, value in outputs:
             if type(value) not in context.value_types.values():
                 raise TypeError("output {}:, expected Value, got {}".format(name, typename(value)))
 
-            name = name or typename(value)
-            output = node_tree.outputs.new(socket_types[value.type], name)
-            value.connect(context, value, node_outputs.inputs[name])
-
-        if isinstance(outputs, dict):
-            for k, value in outputs.items():
-                add_output(value, k)
-        elif isinstance(outputs, tuple):
-            for i, value in enumerate(outputs):
-                add_output(value, "output_{}".format(i + 1))
-        elif isinstance(outputs, Value):
-            add_output(outputs, "output")
-        else:
-            raise TypeError("group.build: invalid output type, expected (dict|Value|tuple), got " + typename(outputs))
+            node_tree.outputs.new(socket_types[value.type], name or typename(value))
+
+        output_node = context.import_node(node_outputs)._node
+        for i, (_, value) in enumerate(outputs):
+            value.connect(context, value, output_node.inputs[i])
+
 
+def build(f:Callable, name:str='Group', node_type:str='ShaderNodeTree'):
+    node_tree, node_inputs, node_outputs = new_group(name, node_type, f)
+    build_group(NodeContext(node_tree), f, node_tree, node_inputs, node_outputs)
+    set_hash(node_tree, tree_hash(node_tree))
     return node_tree
- 
+
+
+def build_async(f:Callable, name:str='Group', node_type:str='ShaderNodeTree', **options):
+    """ Record the group then materialize its nodes in time slices,
+    returns the (started) BuildTask, the group is task.node_tree """
+    node_tree, node_inputs, node_outputs = new_group(name, node_type, f)
+    graph = Graph(node_tree.type, node_tree.name)
+
+    build_group(RecordingContext(graph), f, node_tree, node_inputs, node_outputs)
+    set_hash(node_tree, tree_hash(graph))
+    return BuildTask(graph, node_tree, **options).start()
+
+
+def argument_key(value):
+    """ Hashable key of an argument: sockets for values, contents for literals and
+    sequences of them, identity for anything else """
+    if isinstance(value, Value):
+        return (type(value), value.socket)
+    elif value is None or isinstance(value, (Number, str)):
+        return (type(value), value)
+    elif isinstance(value, (tuple, list)):
+        return (type(value), tuple(argument_key(v) for v in value))
+    else:
+        return (id(value),)
+
+
+# {context: {key: (arguments, result)}}, arguments keep objects keyed by identity alive
+_memo_cache = weakref.WeakKeyDictionary()
+
+def memoize(f:Callable):
+    """ Decorator memoizing a helper within the active node context: calling it again with
+    the same values (by socket) and literals (by value) returns the first result
+    without running the function or creating its nodes again """
+    sig = inspect.signature(f)
+
+    @wraps(f)
+    def memoized(*args, **kwargs):
+        context = node_context()
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+
+        key = (f, argument_key(bound.args), argument_key(sorted(bound.kwargs.items())))
+        with context._lock:
+            cache = _memo_cache.setdefault(context, {})
+            if key in cache:
+                return cache[key][1]
+
+        result = f(*args, **kwargs)
+        with context._lock:
+            return cache.setdefault(key, (bound, result))[1]
+
+    return memoized
+
+
+def signature_key(f:Callable, node_type:str):
+    """ Groups built from the same code, literal closure variables and annotated
+    signature are the same, so nested functions redefined on each call share a group """
+    closure = [cell.cell_contents for cell in f.__closure__ or ()]
+    if not all(value is None or isinstance(value, (Number, str)) for value in closure):
+        return (f, node_type)
+
+    params = tuple((p.name, p.kind, p.annotation, argument_key(p.default))
+        for p in inspect.signature(f).parameters.values())
+    return (f.__code__, tuple(closure), params, node_type)
+
+
+# {signature_key: node_tree}
+_group_cache = {}
+
+def cached_group(key):
+    group = _group_cache.get(key)
+    try:
+        if group is not None and bpy.data.node_groups.get(group.name) == group:
+            return group
+    except ReferenceError:
+        pass
+
+    _group_cache.pop(key, None)
+    return None
+
 
 def function(f:Callable, name:str='Group', node_type:str='ShaderNodeTree'):
-     group = build(f, name, node_type)
-     return import_group(group)
+    """ Build f as a node group and import it, the group is built once per
+    signature (see signature_key) and name, and reused while it exists """
+    key = (signature_key(f, node_type), name)
+    group = cached_group(key)
+    if group is None:
+        group = _group_cache[key] = build(f, name, node_type)
+
+    return import_group(group)
+
+
+def is_literal(value):
+    return isinstance(value, Number) or\
+        (isinstance(value, tuple) and all(isinstance(x, Number) for x in value))
+
+
+def build_specialized(f:Callable, constants:dict, unused=(), name:str='Group', node_type:str='ShaderNodeTree'):
+    """ Build f as a group with the constant arguments passed to f as literals instead of group
+    inputs and without the unused outputs. The group is recorded first, then constants are
+    folded (see ranges.simplify) and nodes which no longer reach an output are removed """
+    node_tree, node_inputs, node_outputs = new_group(name, node_type, f)
+    context = RecordingContext(Graph(node_tree.type, node_tree.name))
+
+    params = [param for param in inspect.signature(f).parameters.values() if param.name not in constants]
+    for param in params:
+        make_param(context, node_tree, param)
+
+    input_node = context.import_node(node_inputs)
+    arguments = dict(zip([param.name for param in params], input_node))
+
+    with context:
+        outputs = [(output, value) for output, value in named_outputs(f(**arguments, **constants))
+            if output not in unused]
+
+        for output, value in outputs:
+            if type(value) not in context.value_types.values():
+                raise TypeError("output {}:, expected Value, got {}".format(output, typename(value)))
+            node_tree.outputs.new(socket_types[value.type], output)
+
+        output_node = context.import_node(node_outputs)._node
+        for i, (_, value) in enumerate(outputs):
+            value.connect(context, value, output_node.inputs[i])
+
+    graph = context.node_tree
+    simplify(context)
+
+    reachable = set(topological_order([output_node]))
+    for node in list(graph.nodes):
+        if node not in reachable and node.external is None:
+            context.remove(context.import_node(node))
+
+    set_hash(node_tree, tree_hash(graph))
+    graph.materialize(node_tree)
+    return node_tree
+
+
+def specialize(f:Callable, constants:dict, unused=(), name:str='Group', node_type:str='ShaderNodeTree'):
+    """ Group of f specialized for constant arguments {name: literal} and unused output names,
+    groups are cached by f's signature (see signature_key), name, the constants and unused
+    outputs so call sites with the same arguments share one """
+    key = (signature_key(f, node_type), name, argument_key(sorted(constants.items())), tuple(sorted(unused)))
+    group = cached_group(key)
+    if group is None:
+        label = ", ".join("{}={}".format(k, v) for k, v in sorted(constants.items()))
+        group = _group_cache[key] = build_specialized(f, constants, unused,
+            "{}({})".format(name, label) if label else name, node_type)
+    return group
+
+
+def specialized_function(f:Callable, name:str='Group', node_type:str='ShaderNodeTree', unused=()):
+    """ Opt-in alternative to function: arguments given as literals (numbers or tuples of them,
+    including literal defaults) are built into a specialized group (see specialize), the others
+    connect to its inputs """
+    sig = inspect.signature(f)
+
+    @wraps(f)
+    def call(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        constants = {k: v for k, v in arguments.items() if is_literal(v)}
+
+        group = specialize(f, constants, unused, name, node_type)
+        return import_group(group)(**{k: v for k, v in arguments.items() if k not in constants})
+
+    return call
 
 
 def lazy(f:Callable, name, node_type:str='ShaderNodeTree'):
@@ -98,4 +274,3 @@ def lazy(f:Callable, name, node_type:str='ShaderNodeTree'):
 def lazy_function(f:Callable, name, node_type:str='ShaderNodeTree'):
     group = lazy(f, name, node_type)
     return import_group(group)
-
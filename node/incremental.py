@@ -0,0 +1,173 @@
+import bpy
+
+import time
+import tracemalloc
+
+from .graph import Graph
+from . import expression
+
+
+class BuildTask:
+    """ Materializes a recorded Graph into a NodeTree in bounded time slices
+    driven by bpy.app.timers, so the UI stays responsive during large builds """
+
+    def __init__(self, graph, node_tree, slice_time=0.02, interval=0.0, on_progress=None, on_done=None):
+        self.graph = graph
+        self.node_tree = node_tree
+
+        self.slice_time = slice_time
+        self.interval = interval
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+        self.total = len(graph.nodes) + len(graph.links)
+        self.completed = 0
+        self.elapsed = 0.0
+
+        self.created = {}
+        self.error = None
+        self.cancelled = False
+        self.finished = False
+
+        self._steps = graph.materialize_steps(node_tree, self.created)
+        self._timer = self._step
+
+    @property
+    def progress(self):
+        return 1.0 if self.total == 0 else self.completed / self.total
+
+    @property
+    def running(self):
+        return not (self.finished or self.cancelled)
+
+    def start(self):
+        bpy.app.timers.register(self._timer, first_interval=0.0)
+        return self
+
+    def cancel(self, remove_created=True):
+        """ Stop building, by default nodes created so far are removed again """
+        if not self.running:
+            return
+
+        self.cancelled = True
+        if bpy.app.timers.is_registered(self._timer):
+            bpy.app.timers.unregister(self._timer)
+
+        if remove_created:
+            for graph_node, node in self.created.items():
+                if graph_node.external is None:
+                    self.node_tree.nodes.remove(node)
+            self.created.clear()
+
+        self._finish()
+
+    def run(self):
+        """ Materialize the remainder synchronously """
+        for _ in self._steps:
+            self.completed += 1
+        self._finish()
+
+    def _step(self):
+        if not self.running:
+            return None
+
+        start = time.perf_counter()
+        deadline = start + self.slice_time
+        try:
+            for _ in self._steps:
+                self.completed += 1
+                if time.perf_counter() >= deadline:
+                    self.elapsed += time.perf_counter() - start
+                    if self.on_progress is not None:
+                        self.on_progress(self)
+                    return self.interval
+
+        except Exception as e:
+            self.error = e
+
+        self.elapsed += time.perf_counter() - start
+        self._finish()
+        return None
+
+    def _finish(self):
+        if self.cancelled is False:
+            self.finished = True
+        self._steps.close()
+
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def __repr__(self):
+        state = "cancelled" if self.cancelled else "failed" if self.error is not None\
+            else "finished" if self.finished else "running"
+        return "BuildTask({}, {}/{} {})".format(self.node_tree.name, self.completed, self.total, state)
+
+
+def record(f, tree_type='SHADER', name='Graph'):
+    graph = Graph(tree_type, name)
+    with expression.node_tree(graph):
+        f()
+    return graph
+
+
+def build_async(node_tree, f, **options):
+    """ Record the nodes created by f() then materialize them into node_tree
+    in the background, options are passed to BuildTask """
+    graph = record(f, node_tree.type, node_tree.name)
+    return BuildTask(graph, node_tree, **options).start()
+
+
+class MemoryReport:
+    """ Python heap used by a build as traced by tracemalloc, relative to its start (bytes) """
+
+    def __init__(self, current=0, peak=0, nodes=0, elapsed=0.0):
+        self.current = current
+        self.peak = peak
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def __str__(self):
+        per_node = self.peak / self.nodes if self.nodes else 0
+        return "{} nodes in {:.2f}s, peak {:.1f} MB ({:.0f} bytes/node), retained {:.1f} MB".format(
+            self.nodes, self.elapsed, self.peak / 2**20, per_node, self.current / 2**20)
+
+    def __repr__(self):
+        return "MemoryReport({} nodes, peak {} bytes)".format(self.nodes, self.peak)
+
+
+class track_memory:
+    """ Context manager tracing Python allocations, 'with track_memory() as report:'
+    fills report when the block exits. Tracing slows allocation down noticeably """
+
+    def __init__(self):
+        self.report = MemoryReport()
+
+    def __enter__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self.report
+
+    def __exit__(self, type, value, traceback):
+        current, peak = tracemalloc.get_traced_memory()
+        self.report.elapsed = time.perf_counter() - self.start
+        self.report.current, self.report.peak = current - self.base, peak - self.base
+
+        if self.started:
+            tracemalloc.stop()
+
+
+def build_streaming(node_tree, f, *args, **kwargs):
+    """ Call f(*args, **kwargs) in a streaming context on node_tree (a NodeTree or Graph),
+    where created nodes are recorded as compact keys so wrappers f no longer references
+    are freed as it goes (with a NodeTree, a Graph keeps its nodes). Returns the MemoryReport of the build """
+    with track_memory() as report:
+        with expression.node_tree(node_tree, streaming=True) as context:
+            f(*args, **kwargs)
+        report.nodes = len(context.created_nodes)
+    return report
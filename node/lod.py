@@ -0,0 +1,187 @@
+import bpy
+
+import contextvars
+
+from .graph import Graph
+from .expression import RecordingContext
+from .analysis import estimate, live_nodes, octave_textures
+from .ranges import simplify
+
+
+# Level of detail of the material being built, 0 is full detail
+_level = contextvars.ContextVar('lod_level', default=0)
+
+# Level used for each purpose, clamped to the levels built
+lod_uses = dict(RENDER=0, PREVIEW=1, VIEWPORT=2)
+
+
+def level():
+    return _level.get()
+
+
+class lod_level:
+    """ Build expressions at a level of detail, 'with lod_level(2): ...' """
+
+    def __init__(self, level):
+        self.level = level
+
+    def __enter__(self):
+        self._token = _level.set(self.level)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _level.reset(self._token)
+
+
+def samples(n, min_samples=1):
+    """ Number of samples to blend out of n at the current level, halved per level """
+    return max(min(n, min_samples), n >> level())
+
+
+def weighted_sum(values, weights):
+    """ Sum of values weighted by weights normalized to one, lower levels blend
+    only the first samples(n) values """
+    n = samples(len(values))
+    values, weights = values[:n], weights[:n]
+
+    total = sum(weights)
+    return sum([value * (weight / total) for value, weight in zip(values, weights)])
+
+
+def optional(value, fallback, min_level=1):
+    """ Optional subgraph: value up to min_level, fallback from it on. Either can be a function
+    called only when used, so bypassed subgraphs aren't built at all """
+    chosen = fallback if level() >= min_level else value
+    return chosen() if callable(chosen) else chosen
+
+
+def reduce_detail(graph, level, octaves=2.0):
+    """ Drop octaves from the Detail input of noise, Musgrave and wave textures of a recorded graph,
+    linked inputs get a max(detail - octaves, 0) node, returns the number of textures changed """
+    drop = octaves * level
+    changed = 0
+    for node in [node for node in graph.nodes if node.type in octave_textures and not node.mute]:
+        socket = next((socket for socket in node.inputs if socket.name == 'Detail' and socket.enabled), None)
+        if socket is None or drop <= 0:
+            continue
+
+        if socket.is_linked:
+            link = socket.links[0]
+            subtract = graph.new_node('ShaderNodeMath', dict(operation='SUBTRACT'))
+            maximum = graph.new_node('ShaderNodeMath', dict(operation='MAXIMUM'))
+            subtract.inputs[1].default_value = drop
+            maximum.inputs[1].default_value = 0.0
+
+            graph.remove_link(link)
+            graph.new_link(link.from_socket, subtract.inputs[0])
+            graph.new_link(subtract.outputs[0], maximum.inputs[0])
+            graph.new_link(maximum.outputs[0], socket)
+        elif socket.driver is None:
+            socket.default_value = max(0.0, socket.default_value - drop)
+        else:
+            continue
+        changed += 1
+    return changed
+
+
+def record_level(f, level, name, octaves=2.0, kwargs={}):
+    """ Record f(**kwargs) at a level of detail into a Graph, simplified
+    and without nodes which don't reach an output """
+    context = RecordingContext(Graph('SHADER', name))
+    with lod_level(level), context:
+        f(**kwargs)
+
+    graph = context.node_tree
+    if level > 0:
+        reduce_detail(graph, level, octaves)
+        simplify(context)
+
+    live = set(live_nodes(graph))
+    for node in list(graph.nodes):
+        if node not in live and node.external is None:
+            context.remove(context.import_node(node))
+    return graph
+
+
+class LodMaterials:
+    """ Variants of a material by level of detail, with their estimated per-sample cost """
+
+    def __init__(self, materials, costs):
+        self.materials = materials
+        self.costs = costs
+
+    def __len__(self):
+        return len(self.materials)
+
+    def material(self, use):
+        """ Material for a purpose of lod_uses ('RENDER', 'PREVIEW' or 'VIEWPORT') """
+        if use not in lod_uses:
+            raise KeyError("unknown level of detail use {}, expected one of {}".format(use, list(lod_uses)))
+        return self.materials[min(lod_uses[use], len(self) - 1)]
+
+    def assign(self, use, objects=None):
+        """ Put the variant for use in the material slots holding any of the variants,
+        on the given objects or all objects, returns the number of slots changed """
+        variants, material = set(self.materials), self.material(use)
+        changed = 0
+        for obj in (bpy.data.objects if objects is None else objects):
+            for slot in obj.material_slots:
+                if slot.material in variants and slot.material != material:
+                    slot.material = material
+                    changed += 1
+        return changed
+
+    def __str__(self):
+        uses = {i: [use for use in lod_uses if self.material(use) == material]
+            for i, material in enumerate(self.materials)}
+        lines = ["{} levels of detail:".format(len(self))]
+        lines += ["  lod {}  {:>8.1f}  {:>6.1%}  {} {}".format(i, cost, cost / (self.costs[0] or 1),
+            material.name, ", ".join(uses[i])) for i, (material, cost) in enumerate(zip(self.materials, self.costs))]
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "LodMaterials({})".format(", ".join(material.name for material in self.materials))
+
+
+def build_lods(f, name, levels=3, octaves=2.0, **kwargs):
+    """ Materials built by calling f(**kwargs) inside their node trees at each level of
+    detail. Lower levels drop octaves of textures' Detail (see reduce_detail), blend fewer samples
+    (see samples, weighted_sum) and bypass optional subgraphs (see optional) """
+    materials, costs = [], []
+    for i in range(levels):
+        material = bpy.data.materials.new(name if i == 0 else "{}_lod{}".format(name, i))
+        material.use_nodes = True
+        material.node_tree.nodes.clear()
+
+        graph = record_level(f, i, material.name, octaves, kwargs)
+        costs.append(estimate(graph).total)
+        graph.materialize(material.node_tree)
+        materials.append(material)
+
+    return LodMaterials(materials, costs)
+
+
+def render_use(scene):
+    """ Final renders use the full material, renders at reduced resolution the preview one """
+    return 'RENDER' if scene.render.resolution_percentage >= 100 else 'PREVIEW'
+
+
+class lod_use:
+    """ Use a variant of a LodMaterials for a block and put back the materials before, the
+    pipeline switches explicitly around the renders it starts, e.g.
+    'with lod_use(lods, render_use(scene)): bpy.ops.render.render(write_still=True)' """
+
+    def __init__(self, lods, use, objects=None):
+        self.lods, self.use, self.objects = lods, use, objects
+
+    def __enter__(self):
+        variants = set(self.lods.materials)
+        self._previous = [(obj, i, slot.material)
+            for obj in (bpy.data.objects if self.objects is None else self.objects)
+                for i, slot in enumerate(obj.material_slots) if slot.material in variants]
+        self.lods.assign(self.use, self.objects)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        for obj, i, material in self._previous:
+            obj.material_slots[i].material = material
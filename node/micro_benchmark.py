@@ -0,0 +1,69 @@
+import timeit
+
+from .graph import Graph
+from .expression import RecordingContext
+from . import shader, value
+
+
+class MicroReport:
+    """ Best time per operation of each case, in microseconds """
+
+    def __init__(self, timings, number):
+        self.timings = timings
+        self.number = number
+
+    def __getitem__(self, name):
+        return self.timings[name]
+
+    def __str__(self):
+        width = max(len(name) for name in self.timings)
+        lines = ["{} operations per run:".format(self.number)]
+        lines += ["  {:<{}}  {:>8.3f} us".format(name, width, t) for name, t in self.timings.items()]
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "MicroReport({})".format(", ".join("{}={:.3f}".format(k, t) for k, t in self.timings.items()))
+
+
+def dispatch_cases(context):
+    """ {name: function} of operator and connection paths, and of the table lookups
+    they use against the reflective lookups they replace """
+    a, b = shader.value(), shader.value()
+    v = shader.combine_xyz(a, b, 0)
+
+    socket = context._new_node('ShaderNodeMath', {}).inputs[0]
+    vector_socket = context._new_node('ShaderNodeVectorMath', {}).inputs[0]
+    Float, Vector = context.value_type('VALUE'), context.value_type('VECTOR')
+
+    key = ('add', Float, Float)
+    a + b   # resolve the table entry
+
+    return {
+        'lookup operator (table)': lambda: value.operator_table[key],
+        'lookup operator (reflection)': lambda: getattr(Float, 'add') if hasattr(Float, 'add') else None,
+        'connect Float': lambda: Float.connect(context, a, socket),
+        'connect literal': lambda: Float.connect(context, 0.5, socket),
+        'connect tuple': lambda: Vector.connect(context, (1.0, 2.0, 3.0), vector_socket),
+        'Float + Float': lambda: a + b,
+        'Float * literal': lambda: a * 2.0,
+        'Float + Vector': lambda: a + v,
+        'math.add': lambda: shader.math.add(a, b),
+    }
+
+
+def benchmark_dispatch(number=10000, repeat=5):
+    """ Time the per-operation Python overhead of operators, socket connections and node calls,
+    recording into a Graph so no bpy data is created (socket layouts are probed once) """
+    with RecordingContext(Graph('SHADER', 'cases')) as context:
+        names = list(dispatch_cases(context))
+
+    timings = {}
+    for name in names:
+        best = float('inf')
+        for _ in range(repeat):
+            with RecordingContext(Graph('SHADER', 'benchmark')) as context:
+                f = dispatch_cases(context)[name]
+                best = min(best, timeit.timeit(f, number=number))
+        timings[name] = best / number * 1e6
+
+    return MicroReport(timings, number)
@@ -0,0 +1,408 @@
+import numpy as np
+
+import os
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Vectorized ports of the Cycles (3.x) hash, Perlin noise and Voronoi functions, arrays of
+# points have a trailing axis of the noise dimension (1 to 4), arithmetic is float32/uint32
+
+def uint32(x):
+    return np.asarray(x, dtype=np.uint32)
+
+
+def rot(x, k):
+    return (x << np.uint32(k)) | (x >> np.uint32(32 - k))
+
+
+def final(a, b, c):
+    c ^= b; c -= rot(b, 14)
+    a ^= c; a -= rot(c, 11)
+    b ^= a; b -= rot(a, 25)
+    c ^= b; c -= rot(b, 16)
+    a ^= c; a -= rot(c, 4)
+    b ^= a; b -= rot(a, 14)
+    c ^= b; c -= rot(b, 24)
+    return a, b, c
+
+
+def mix(a, b, c):
+    a -= c; a ^= rot(c, 4); c += b
+    b -= a; b ^= rot(a, 6); a += c
+    c -= b; c ^= rot(b, 8); b += a
+    a -= c; a ^= rot(c, 16); c += b
+    b -= a; b ^= rot(a, 19); a += c
+    c -= b; c ^= rot(b, 4); b += a
+    return a, b, c
+
+
+def hash_uint(*keys):
+    """ Jenkins lookup3 hash of 1 to 4 uint32 keys (Cycles hash_uint, hash_uint2, ...) """
+    keys = np.broadcast_arrays(*[uint32(k) for k in keys])
+    a = np.full(keys[0].shape, 0xdeadbeef + (len(keys) << 2) + 13, dtype=np.uint32)
+    b, c = a.copy(), a.copy()
+
+    if len(keys) == 4:
+        a += keys[0]; b += keys[1]; c += keys[2]
+        a, b, c = mix(a, b, c)
+        a += keys[3]
+    else:
+        for register, key in zip([a, b, c], keys):
+            register += key
+
+    return final(a, b, c)[2]
+
+
+def float_bits(x):
+    return np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+
+
+def hash_float(k):
+    """ Hash of float keys (..., n) to a float in [0, 1] (Cycles hash_floatn_to_float) """
+    k = np.asarray(k, dtype=np.float32)
+    h = hash_uint(*[float_bits(k[..., i]) for i in range(k.shape[-1])])
+    return h.astype(np.float32) / np.float32(4294967296.0)
+
+
+def with_components(k, *components):
+    """ Reorder or extend the components of k, integers index k, floats are constants """
+    return np.stack([k[..., c] if isinstance(c, int) else np.full(k.shape[:-1], c, dtype=np.float32)
+        for c in components], axis=-1)
+
+
+def hash_float3(k):
+    """ Hash of float keys (..., n) to three floats (Cycles hash_floatn_to_float3) """
+    n = k.shape[-1]
+    if n == 1:
+        keys = [k, with_components(k, 0, 1.0), with_components(k, 0, 2.0)]
+    elif n == 2:
+        keys = [k, with_components(k, 0, 1, 1.0), with_components(k, 0, 1, 2.0)]
+    elif n == 3:
+        keys = [k, with_components(k, 0, 1, 2, 1.0), with_components(k, 0, 1, 2, 2.0)]
+    else:
+        keys = [k, with_components(k, 2, 0, 3, 1), with_components(k, 3, 2, 1, 0)]
+    return np.stack([hash_float(key) for key in keys], axis=-1)
+
+
+def hash_float_n(k):
+    """ Hash of float keys (..., n) to n floats (Cycles hash_floatn_to_floatn) """
+    n = k.shape[-1]
+    if n == 1:
+        return hash_float(k)[..., None]
+    elif n == 2:
+        keys = [k, with_components(k, 0, 1, 1.0)]
+    elif n == 3:
+        return hash_float3(k)
+    else:
+        keys = [k, with_components(k, 3, 0, 1, 2), with_components(k, 2, 3, 0, 1), with_components(k, 1, 2, 3, 0)]
+    return np.stack([hash_float(key) for key in keys], axis=-1)
+
+
+def random_offset(seed, n):
+    seeds = np.array([[seed, i] for i in range(n)] if n > 1 else [[seed]], dtype=np.float32)
+    return 100 + hash_float(seeds) * 100
+
+
+def fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def negate_if(value, condition):
+    return np.where(condition != 0, -value, value)
+
+
+def grad(h, f):
+    n = f.shape[-1]
+    x = f[..., 0]
+    if n == 1:
+        h = h & 15
+        return negate_if(1 + (h & 7).astype(np.float32), h & 8) * x
+
+    y = f[..., 1]
+    if n == 2:
+        h = h & 7
+        u, v = np.where(h < 4, x, y), 2 * np.where(h < 4, y, x)
+        return negate_if(u, h & 1) + negate_if(v, h & 2)
+
+    z = f[..., 2]
+    if n == 3:
+        h = h & 15
+        u = np.where(h < 8, x, y)
+        v = np.where(h < 4, y, np.where((h == 12) | (h == 14), x, z))
+        return negate_if(u, h & 1) + negate_if(v, h & 2)
+
+    w = f[..., 3]
+    h = h & 31
+    u, v, s = np.where(h < 24, x, y), np.where(h < 16, y, z), np.where(h < 8, z, w)
+    return negate_if(u, h & 1) + negate_if(v, h & 2) + negate_if(s, h & 4)
+
+
+noise_scales = {1: 0.2500, 2: 0.6616, 3: 0.9820, 4: 0.8344}
+
+
+def perlin(p):
+    """ Signed Perlin noise of points (..., n) """
+    n = p.shape[-1]
+    cell = np.floor(p)
+    f = (p - cell).astype(np.float32)
+    cell = cell.astype(np.int32).view(np.uint32)
+    u = fade(f)
+
+    # Corner values, bit d of the corner index is the offset along axis d
+    values = []
+    for corner in range(1 << n):
+        offset = [(corner >> d) & 1 for d in range(n)]
+        h = hash_uint(*[cell[..., d] + np.uint32(offset[d]) for d in range(n)])
+        values.append(grad(h, f - np.array(offset, dtype=np.float32)))
+
+    for d in range(n):
+        t = u[..., d]
+        if d == 3 or n == 1:
+            values = [a + t * (b - a) for a, b in zip(values[0::2], values[1::2])]
+        else:
+            values = [a * (1 - t) + b * t for a, b in zip(values[0::2], values[1::2])]
+    return values[0]
+
+
+def snoise(p):
+    """ Signed noise in about [-1, 1], repeating every 100000 to limit float precision issues """
+    p = np.asarray(p, dtype=np.float32)
+    p = np.fmod(p, np.float32(100000.0)) + np.float32(0.5) * (np.abs(p) >= 1000000.0)
+    value = perlin(p)
+    return np.where(np.isfinite(value), value, 0) * np.float32(noise_scales[p.shape[-1]])
+
+
+def noise(p):
+    return 0.5 * snoise(p) + 0.5
+
+
+def fractal_noise(p, detail, roughness):
+    """ Octaves of noise, detail (0 to 15) may vary per point, the fractional octave is blended in """
+    octaves = np.clip(np.asarray(detail, dtype=np.float32), 0, 15)
+    roughness = np.clip(np.asarray(roughness, dtype=np.float32), 0, 1)
+    count = np.floor(octaves).astype(int)
+
+    shape = np.broadcast_shapes(p.shape[:-1], octaves.shape, roughness.shape)
+    scale = np.ones(shape + (1,), dtype=np.float32)
+    amp = np.ones(shape, dtype=np.float32)
+    total, max_amp = np.zeros(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32)
+
+    for i in range(int(count.max()) + 1):
+        active = i <= count
+        t = noise(scale * p)
+        total += np.where(active, t * amp, 0)
+        max_amp += np.where(active, amp, 0)
+        amp = np.where(active, amp * roughness, amp)
+        scale = np.where(active[..., None], scale * 2, scale)
+
+    result = total / max_amp
+    remainder = octaves - np.floor(octaves)
+    if np.any(remainder != 0):
+        t = noise(scale * p)
+        blended = (total + t * amp) / (max_amp + amp)
+        result = np.where(remainder != 0, (1 - remainder) * result + remainder * blended, result)
+    return result
+
+
+def noise_texture(p, detail=2.0, roughness=0.5, distortion=0.0, color=True):
+    """ Noise Texture node on points (..., n) already multiplied by the scale, returns (fac, rgb) """
+    p = np.asarray(p, dtype=np.float32)
+    n = p.shape[-1]
+    distortion = np.asarray(distortion, dtype=np.float32)
+
+    if np.any(distortion != 0):
+        offsets = [random_offset(float(i), n) for i in range(n)]
+        p = p + np.stack([snoise(p + offset) for offset in offsets], axis=-1) * distortion[..., None]
+
+    fac = fractal_noise(p, detail, roughness)
+    if not color:
+        return fac, None
+
+    channels = [fractal_noise(p + random_offset(float(n + i), n), detail, roughness) for i in range(2)]
+    return fac, np.stack(np.broadcast_arrays(fac, *channels), axis=-1)
+
+
+def white_noise(p):
+    """ White Noise node on points (..., n), returns (value, rgb) """
+    p = np.asarray(p, dtype=np.float32)
+    return hash_float(p), hash_float3(p)
+
+
+def checker(p):
+    """ Checker pattern (0 or 1) of points (..., 3) already multiplied by the scale """
+    p = (np.asarray(p, dtype=np.float32) + np.float32(0.000001)) * np.float32(0.999999)
+    cells = np.abs(np.floor(p)).astype(np.int64) % 2
+    return ((cells[..., 0] == cells[..., 1]) == cells[..., 2]).astype(np.float32)
+
+
+def voronoi_distance(a, b, metric='EUCLIDEAN', exponent=1.0):
+    d = np.abs(a - b)
+    if metric == 'EUCLIDEAN':
+        return np.sqrt(np.sum(d * d, axis=-1))
+    elif metric == 'MANHATTAN':
+        return np.sum(d, axis=-1)
+    elif metric == 'CHEBYCHEV':
+        return np.max(d, axis=-1)
+    elif metric == 'MINKOWSKI':
+        exponent = np.asarray(exponent, dtype=np.float32)
+        with np.errstate(all='ignore'):
+            return np.power(np.sum(np.power(d, exponent[..., None]), axis=-1), 1 / exponent)
+    raise NotImplementedError("voronoi distance metric {} is not implemented".format(metric))
+
+
+def cell_offsets(n, radius=1):
+    """ Neighbour cell offsets in the order Cycles visits them (first axis innermost) """
+    for offset in itertools.product(range(-radius, radius + 1), repeat=n):
+        yield np.array(offset[::-1], dtype=np.float32)
+
+
+def smoothstep(edge0, edge1, x):
+    t = (x - edge0) / (edge1 - edge0)
+    return np.where(x < edge0, 0, np.where(x >= edge1, 1, (3 - 2 * t) * (t * t)))
+
+
+def voronoi(coord, feature='F1', metric='EUCLIDEAN', exponent=1.0, randomness=1.0, smoothness=0.5):
+    """ Voronoi Texture node on points (..., n) already multiplied by the scale. Randomness
+    and smoothness are the clamped values the node uses (smoothness = input / 2).
+    Returns dict(distance, color, position, radius), position in scaled space """
+    coord = np.asarray(coord, dtype=np.float32)
+    n = coord.shape[-1]
+    cell = np.floor(coord)
+    local = coord - cell
+    shape = coord.shape[:-1]
+    randomness = np.asarray(randomness, dtype=np.float32)[..., None]
+
+    def point(offset):
+        return offset + hash_float_n(cell + offset) * randomness
+
+    result = dict(distance=None, color=np.zeros(shape + (3,), np.float32),
+        position=np.zeros(shape + (n,), np.float32), radius=np.zeros(shape, np.float32))
+
+    if feature in ['F1', 'F2']:
+        best = [np.full(shape, 8.0, np.float32) for _ in range(2)]
+        offsets = [np.zeros(shape + (n,), np.float32) for _ in range(2)]
+        points = [np.zeros(shape + (n,), np.float32) for _ in range(2)]
+
+        for offset in cell_offsets(n):
+            position = point(offset)
+            d = voronoi_distance(position, local, metric, exponent)
+            closer, second = d < best[0], (d >= best[0]) & (d < best[1])
+
+            best[1] = np.where(closer, best[0], np.where(second, d, best[1]))
+            offsets[1] = np.where(closer[..., None], offsets[0], np.where(second[..., None], offset, offsets[1]))
+            points[1] = np.where(closer[..., None], points[0], np.where(second[..., None], position, points[1]))
+            best[0] = np.where(closer, d, best[0])
+            offsets[0] = np.where(closer[..., None], offset, offsets[0])
+            points[0] = np.where(closer[..., None], position, points[0])
+
+        i = 0 if feature == 'F1' else 1
+        result.update(distance=best[i], color=hash_float3(cell + offsets[i]), position=points[i] + cell)
+
+    elif feature == 'SMOOTH_F1':
+        smoothness = np.asarray(smoothness, dtype=np.float32)
+        distance = np.full(shape, 8.0, np.float32)
+        color = np.zeros(shape + (3,), np.float32)
+        position = np.zeros(shape + (n,), np.float32)
+
+        with np.errstate(all='ignore'):
+            for offset in cell_offsets(n, radius=2):
+                point_position = point(offset)
+                d = voronoi_distance(point_position, local, metric, exponent)
+                h = smoothstep(0.0, 1.0, 0.5 + 0.5 * (distance - d) / smoothness)
+                correction = smoothness * h * (1 - h)
+                distance = distance + h * (d - distance) - correction
+                correction = (correction / (1 + 3 * smoothness))[..., None]
+                color = color + h[..., None] * (hash_float3(cell + offset) - color) - correction
+                position = position + h[..., None] * (point_position - position) - correction
+
+        result.update(distance=distance, color=color, position=cell + position)
+
+    elif feature == 'DISTANCE_TO_EDGE':
+        closest = np.zeros(shape + (n,), np.float32)
+        best = np.full(shape, 8.0, np.float32)
+        for offset in cell_offsets(n):
+            to_point = point(offset) - local
+            d = np.sum(to_point * to_point, axis=-1)
+            closest = np.where((d < best)[..., None], to_point, closest)
+            best = np.minimum(d, best)
+
+        distance = np.full(shape, 8.0, np.float32)
+        for offset in cell_offsets(n):
+            to_point = point(offset) - local
+            perpendicular = to_point - closest
+            length_squared = np.sum(perpendicular * perpendicular, axis=-1)
+            with np.errstate(all='ignore'):
+                edge = np.sum((closest + to_point) / 2 * perpendicular, axis=-1) / np.sqrt(length_squared)
+            distance = np.where(length_squared > 0.0001, np.minimum(distance, edge), distance)
+        result.update(distance=distance)
+
+    elif feature == 'N_SPHERE_RADIUS':
+        closest = np.zeros(shape + (n,), np.float32)
+        closest_offset = np.zeros(shape + (n,), np.float32)
+        best = np.full(shape, 8.0, np.float32)
+        for offset in cell_offsets(n):
+            position = point(offset)
+            d = voronoi_distance(position, local)
+            closer = (d < best)[..., None]
+            closest, closest_offset = np.where(closer, position, closest), np.where(closer, offset, closest_offset)
+            best = np.minimum(d, best)
+
+        best = np.full(shape, 8.0, np.float32)
+        neighbour = np.zeros(shape + (n,), np.float32)
+        for offset in cell_offsets(n):
+            if not offset.any():
+                continue
+            offset = offset + closest_offset
+            position = offset + hash_float_n(cell + offset) * randomness
+            d = voronoi_distance(closest, position)
+            neighbour = np.where((d < best)[..., None], position, neighbour)
+            best = np.minimum(d, best)
+
+        result.update(distance=np.zeros(shape, np.float32), radius=voronoi_distance(neighbour, closest) / 2)
+
+    else:
+        raise NotImplementedError("voronoi feature {} is not implemented".format(feature))
+
+    return result
+
+
+def chunked(f, points, chunk_size=1 << 18, threads=None):
+    """ Apply f to chunks of points (along the first axis) on a thread pool, f returns one array """
+    results = [None] * ((len(points) + chunk_size - 1) // chunk_size)
+
+    def run(i):
+        results[i] = f(points[i * chunk_size:(i + 1) * chunk_size])
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, range(len(results))))
+    return np.concatenate(results)
+
+
+benchmarks = dict(
+    white_noise = lambda p: white_noise(p)[0],
+    noise = lambda p: noise_texture(p, detail=2.0, color=False)[0],
+    noise_detail_8 = lambda p: noise_texture(p, detail=8.0, color=False)[0],
+    noise_color = lambda p: noise_texture(p, detail=2.0)[1],
+    voronoi_f1 = lambda p: voronoi(p)['distance'],
+    voronoi_smooth_f1 = lambda p: voronoi(p, 'SMOOTH_F1')['distance'],
+    voronoi_edge = lambda p: voronoi(p, 'DISTANCE_TO_EDGE')['distance'],
+    checker = checker,
+)
+
+
+def benchmark(points=10_000_000, dimensions=3, names=None, chunk_size=1 << 18, threads=None, seed=0):
+    """ Throughput (points per second) of the texture functions on random points,
+    evaluated in chunks across threads. Prints a table and returns {name: points/s} """
+    p = np.random.default_rng(seed).uniform(-100, 100, (points, dimensions)).astype(np.float32)
+    throughput = {}
+
+    for name in names or benchmarks:
+        start = time.perf_counter()
+        chunked(benchmarks[name], p, chunk_size, threads)
+        elapsed = time.perf_counter() - start
+
+        throughput[name] = points / elapsed
+        print("{:<20} {:>8.2f}s {:>10.2f} Mpoints/s".format(name, elapsed, throughput[name] / 1e6))
+    return throughput
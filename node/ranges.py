@@ -0,0 +1,639 @@
+import numpy as np
+
+from collections import namedtuple
+
+from .graph import Graph, topological_order, upstream
+from .expression import RecordingContext
+from .evaluate import convert, channels, luminance
+
+
+# Conservative bounds of the values of a socket, lo and hi have a trailing axis of 3 or 4
+# for vectors and colors (per channel bounds)
+Range = namedtuple('Range', ['lo', 'hi'])
+
+
+def shape_of(socket_type):
+    size = channels.get(socket_type)
+    return () if size is None else (size,)
+
+
+def bounded(lo, hi, socket_type='VALUE'):
+    shape = shape_of(socket_type)
+    return Range(np.broadcast_to(np.asarray(lo, dtype=np.float64), shape).copy(),
+        np.broadcast_to(np.asarray(hi, dtype=np.float64), shape).copy())
+
+
+def unknown(socket_type='VALUE'):
+    return bounded(-np.inf, np.inf, socket_type)
+
+
+def constant(value):
+    value = np.asarray(value, dtype=np.float64)
+    return Range(value, value)
+
+
+def unit_color():
+    return bounded((0, 0, 0, 1), (1, 1, 1, 1), 'RGBA')
+
+
+def is_constant(r):
+    return bool(np.all(r.lo == r.hi) and np.all(np.isfinite(r.lo)))
+
+
+def within(r, lo, hi):
+    return bool(np.all(r.lo >= lo) and np.all(r.hi <= hi))
+
+
+def hull(a, b):
+    return Range(np.minimum(a.lo, b.lo), np.maximum(a.hi, b.hi))
+
+
+def clip(r, lo, hi):
+    return Range(np.clip(r.lo, lo, hi), np.clip(r.hi, lo, hi))
+
+
+def products(a, b):
+    """ Products of interval ends, 0 * inf is 0 (the limit for finite values) """
+    with np.errstate(all='ignore'):
+        ends = np.stack(np.broadcast_arrays(a.lo * b.lo, a.lo * b.hi, a.hi * b.lo, a.hi * b.hi))
+    return np.where(np.isnan(ends), 0, ends)
+
+
+def add(a, b):
+    return Range(a.lo + b.lo, a.hi + b.hi)
+
+
+def subtract(a, b):
+    return Range(a.lo - b.hi, a.hi - b.lo)
+
+
+def multiply(a, b):
+    ends = products(a, b)
+    return Range(ends.min(axis=0), ends.max(axis=0))
+
+
+def divide(a, b):
+    """ Blender divides by zero to zero, so a divisor range containing zero also gives zero """
+    with np.errstate(all='ignore'):
+        inverse = Range(1 / b.hi, 1 / b.lo)
+    r = multiply(a, inverse)
+    spans_zero = (b.lo <= 0) & (b.hi >= 0)
+    return Range(np.where(spans_zero, -np.inf, r.lo), np.where(spans_zero, np.inf, r.hi))
+
+
+def monotonic(f, r, increasing=True):
+    with np.errstate(all='ignore'):
+        lo, hi = f(r.lo), f(r.hi)
+    return Range(lo, hi) if increasing else Range(hi, lo)
+
+
+def absolute(r):
+    lo = np.where(r.lo >= 0, r.lo, np.where(r.hi <= 0, -r.hi, 0))
+    return Range(lo, np.maximum(np.abs(r.lo), np.abs(r.hi)))
+
+
+def fraction(r):
+    same_cell = np.isfinite(r.lo) & np.isfinite(r.hi) & (np.floor(r.lo) == np.floor(r.hi))
+    return Range(np.where(same_cell, r.lo - np.floor(r.lo), 0), np.where(same_cell, r.hi - np.floor(r.hi), 1))
+
+
+def power(a, b):
+    """ Corners bound a^b for a > 0, other bases give any value """
+    if np.all(a.lo > 0):
+        with np.errstate(all='ignore'):
+            ends = np.stack(np.broadcast_arrays(a.lo ** b.lo, a.lo ** b.hi, a.hi ** b.lo, a.hi ** b.hi))
+        return Range(ends.min(axis=0), ends.max(axis=0))
+    return unknown_like(a, b)
+
+
+def modulo(a, b):
+    """ Truncated modulo takes the sign of a and is smaller than |b| """
+    if np.all(a.lo >= 0) and np.all(a.hi < b.lo):
+        return a
+    size = np.maximum(np.abs(b.lo), np.abs(b.hi))
+    return Range(np.where(a.lo < 0, -size, 0), np.where(a.hi > 0, size, 0))
+
+
+def floored_modulo(a, b):
+    if np.all(a.lo >= 0) and np.all(a.hi < b.lo):
+        return a
+    return Range(np.minimum(b.lo, 0), np.maximum(b.hi, 0))
+
+
+def less_than(a, b):
+    return decided(a.hi < b.lo, a.lo >= b.hi)
+
+
+def greater_than(a, b):
+    return decided(a.lo > b.hi, a.hi <= b.lo)
+
+
+def compare(a, b, c):
+    difference = absolute(subtract(a, b))
+    epsilon = Range(np.maximum(c.lo, 1e-5), np.maximum(c.hi, 1e-5))
+    return decided(difference.hi <= epsilon.lo, difference.lo > epsilon.hi)
+
+
+def decided(true, false):
+    """ Range of a comparison, 1 where it always holds and 0 where it never does """
+    return Range(np.where(true, 1.0, 0.0), np.where(false, 0.0, 1.0))
+
+
+def smooth_min(a, b, c):
+    return Range(np.minimum(a.lo, b.lo) - np.maximum(c.hi, 0) / 6, np.minimum(a.hi, b.hi))
+
+
+def smooth_max(a, b, c):
+    return Range(np.maximum(a.lo, b.lo), np.maximum(a.hi, b.hi) + np.maximum(c.hi, 0) / 6)
+
+
+def unknown_like(*ranges):
+    shape = np.broadcast_shapes(*[r.lo.shape for r in ranges])
+    return Range(np.full(shape, -np.inf), np.full(shape, np.inf))
+
+
+def signed_unit(*ranges):
+    shape = np.broadcast_shapes(*[r.lo.shape for r in ranges])
+    return Range(np.full(shape, -1.0), np.full(shape, 1.0))
+
+
+def dot_range(a, b):
+    r = multiply(a, b)
+    return Range(r.lo.sum(axis=-1), r.hi.sum(axis=-1))
+
+
+def length_range(r):
+    size = absolute(r)
+    return Range(np.sqrt(np.sum(size.lo ** 2, axis=-1)), np.sqrt(np.sum(size.hi ** 2, axis=-1)))
+
+
+# Ranges of the math node operations, f(a, b, c) as in evaluate.math_operations
+math_ranges = dict(
+    ADD = lambda a, b, c: add(a, b),
+    SUBTRACT = lambda a, b, c: subtract(a, b),
+    MULTIPLY = lambda a, b, c: multiply(a, b),
+    DIVIDE = lambda a, b, c: divide(a, b),
+    MULTIPLY_ADD = lambda a, b, c: add(multiply(a, b), c),
+    POWER = lambda a, b, c: power(a, b),
+    SQRT = lambda a, b, c: monotonic(lambda x: np.sqrt(np.maximum(x, 0)), a),
+    ABSOLUTE = lambda a, b, c: absolute(a),
+    EXPONENT = lambda a, b, c: monotonic(np.exp, a),
+    MINIMUM = lambda a, b, c: Range(np.minimum(a.lo, b.lo), np.minimum(a.hi, b.hi)),
+    MAXIMUM = lambda a, b, c: Range(np.maximum(a.lo, b.lo), np.maximum(a.hi, b.hi)),
+    LESS_THAN = lambda a, b, c: less_than(a, b),
+    GREATER_THAN = lambda a, b, c: greater_than(a, b),
+    SIGN = lambda a, b, c: monotonic(np.sign, a),
+    COMPARE = lambda a, b, c: compare(a, b, c),
+    SMOOTH_MIN = lambda a, b, c: smooth_min(a, b, c),
+    SMOOTH_MAX = lambda a, b, c: smooth_max(a, b, c),
+    ROUND = lambda a, b, c: monotonic(lambda x: np.floor(x + 0.5), a),
+    FLOOR = lambda a, b, c: monotonic(np.floor, a),
+    CEIL = lambda a, b, c: monotonic(np.ceil, a),
+    TRUNC = lambda a, b, c: monotonic(np.trunc, a),
+    FRACT = lambda a, b, c: fraction(a),
+    MODULO = lambda a, b, c: modulo(a, b),
+    FLOORED_MODULO = lambda a, b, c: floored_modulo(a, b),
+    SINE = lambda a, b, c: signed_unit(a),
+    COSINE = lambda a, b, c: signed_unit(a),
+    ARCSINE = lambda a, b, c: monotonic(lambda x: np.arcsin(np.clip(x, -1, 1)), a),
+    ARCCOSINE = lambda a, b, c: monotonic(lambda x: np.arccos(np.clip(x, -1, 1)), a, increasing=False),
+    ARCTANGENT = lambda a, b, c: monotonic(np.arctan, a),
+    ARCTAN2 = lambda a, b, c: bounded(-np.pi, np.pi),
+    SINH = lambda a, b, c: monotonic(np.sinh, a),
+    TANH = lambda a, b, c: monotonic(np.tanh, a),
+    RADIANS = lambda a, b, c: monotonic(np.radians, a),
+    DEGREES = lambda a, b, c: monotonic(np.degrees, a),
+)
+
+
+# Ranges of the vector math operations, f(a, b, c, scale) -> (vector, value)
+vector_ranges = dict(
+    ADD = lambda a, b, c, s: (add(a, b), None),
+    SUBTRACT = lambda a, b, c, s: (subtract(a, b), None),
+    MULTIPLY = lambda a, b, c, s: (multiply(a, b), None),
+    DIVIDE = lambda a, b, c, s: (divide(a, b), None),
+    MULTIPLY_ADD = lambda a, b, c, s: (add(multiply(a, b), c), None),
+    DOT_PRODUCT = lambda a, b, c, s: (None, dot_range(a, b)),
+    DISTANCE = lambda a, b, c, s: (None, length_range(subtract(a, b))),
+    LENGTH = lambda a, b, c, s: (None, length_range(a)),
+    SCALE = lambda a, b, c, s: (multiply(a, Range(s.lo[..., None], s.hi[..., None])), None),
+    NORMALIZE = lambda a, b, c, s: (signed_unit(a), None),
+    FLOOR = lambda a, b, c, s: (monotonic(np.floor, a), None),
+    CEIL = lambda a, b, c, s: (monotonic(np.ceil, a), None),
+    MODULO = lambda a, b, c, s: (modulo(a, b), None),
+    FRACTION = lambda a, b, c, s: (fraction(a), None),
+    ABSOLUTE = lambda a, b, c, s: (absolute(a), None),
+    MINIMUM = lambda a, b, c, s: (Range(np.minimum(a.lo, b.lo), np.minimum(a.hi, b.hi)), None),
+    MAXIMUM = lambda a, b, c, s: (Range(np.maximum(a.lo, b.lo), np.maximum(a.hi, b.hi)), None),
+    SINE = lambda a, b, c, s: (signed_unit(a), None),
+    COSINE = lambda a, b, c, s: (signed_unit(a), None),
+)
+
+
+def unclamped_math_range(node, inputs):
+    a, b, c = (inputs + [None] * 3)[:3]
+    operation = node.properties.get('operation', 'ADD')
+    return math_ranges[operation](a, b, c) if operation in math_ranges else unknown()
+
+
+def math_range(node, inputs):
+    r = unclamped_math_range(node, inputs)
+    return [clip(r, 0, 1) if node.properties.get('use_clamp', False) else r]
+
+
+def vector_math_range(node, inputs):
+    a, b, c, scale = (inputs + [None] * 4)[:4]
+    operation = node.properties.get('operation', 'ADD')
+    if operation in vector_ranges:
+        return list(vector_ranges[operation](a, b, c, scale))
+    return [unknown('VECTOR'), unknown()]
+
+
+def clamp_range(node, inputs):
+    value, low, high = inputs
+    if node.properties.get('clamp_type', 'MINMAX') == 'RANGE':
+        return [Range(np.minimum(low.lo, high.lo), np.maximum(low.hi, high.hi))]
+    return [Range(np.minimum(np.maximum(value.lo, low.lo), high.lo), np.minimum(np.maximum(value.hi, low.hi), high.hi))]
+
+
+def linear_map_range(inputs):
+    value, from_min, from_max, to_min, to_max = inputs[:5]
+    factor = divide(subtract(value, from_min), subtract(from_max, from_min))
+    return add(to_min, multiply(factor, subtract(to_max, to_min)))
+
+
+def map_range_range(node, inputs):
+    p = node.properties
+    interpolation = p.get('interpolation_type', 'LINEAR')
+
+    if interpolation in ['SMOOTHSTEP', 'SMOOTHERSTEP'] or (p.get('clamp', True) and interpolation == 'LINEAR'):
+        return [hull(inputs[3], inputs[4]), None]
+    if interpolation == 'LINEAR':
+        return [linear_map_range(inputs), None]
+    return [unknown(), None]
+
+
+def mix_rgb_range(node, inputs):
+    fac, color1, color2 = inputs
+    r = hull(color1, color2) if node.properties.get('blend_type', 'MIX') == 'MIX' else unknown('RGBA')
+    return [clip(r, 0, 1) if node.properties.get('use_clamp', False) else r]
+
+
+def mix_range(node, inputs):
+    p = node.properties
+    fac, a, b = [r for socket, r in zip(node.inputs, inputs) if socket.enabled][:3]
+    data_type = p.get('data_type', 'FLOAT')
+
+    outputs = [None, None, None]
+    index = ['FLOAT', 'VECTOR', 'RGBA'].index(data_type)
+    if p.get('clamp_factor', True) or within(fac, 0, 1):
+        convex = data_type != 'RGBA' or p.get('blend_type', 'MIX') == 'MIX'
+        outputs[index] = hull(a, b) if convex else unknown(data_type)
+    else:
+        outputs[index] = unknown(data_type)
+
+    if data_type == 'RGBA' and p.get('clamp_result', False):
+        outputs[index] = clip(outputs[index], 0, 1)
+    return outputs
+
+
+def combine_range(node, inputs):
+    lo, hi = [r.lo for r in inputs], [r.hi for r in inputs]
+    if node.bl_idname == 'ShaderNodeCombineRGB':
+        lo, hi = lo + [np.float64(1)], hi + [np.float64(1)]
+    return [Range(np.stack(lo, axis=-1), np.stack(hi, axis=-1))]
+
+
+def separate_range(node, inputs):
+    r, = inputs
+    return [Range(r.lo[..., i], r.hi[..., i]) for i in range(3)]
+
+
+def constant_range(node, inputs):
+    output = node.outputs[0]
+    return [unknown(output.type) if output.driver is not None else constant(output.default_value)]
+
+
+# Output ranges of nodes by bl_idname, f(node, input ranges) -> output ranges
+node_ranges = {
+    'ShaderNodeMath': math_range,
+    'ShaderNodeVectorMath': vector_math_range,
+    'ShaderNodeClamp': clamp_range,
+    'ShaderNodeMapRange': map_range_range,
+    'ShaderNodeMixRGB': mix_rgb_range,
+    'ShaderNodeMix': mix_range,
+    'ShaderNodeCombineXYZ': combine_range,
+    'ShaderNodeCombineRGB': combine_range,
+    'ShaderNodeSeparateXYZ': separate_range,
+    'ShaderNodeSeparateRGB': separate_range,
+    'ShaderNodeValue': constant_range,
+    'ShaderNodeRGB': constant_range,
+    'ShaderNodeRGBToBW': lambda node, inputs: [monotonic(luminance, inputs[0])],
+    'ShaderNodeTexNoise': lambda node, inputs: [bounded(0, 1), unit_color()],
+    'ShaderNodeTexWhiteNoise': lambda node, inputs: [bounded(0, 1), unit_color()],
+    'ShaderNodeTexGradient': lambda node, inputs: [unit_color(), bounded(0, 1)],
+    'ShaderNodeTexWave': lambda node, inputs: [unit_color(), bounded(0, 1)],
+    'ShaderNodeTexChecker': lambda node, inputs: [hull(inputs[1], inputs[2]), bounded(0, 1)],
+    'ShaderNodeTexVoronoi': lambda node, inputs: [bounded(0, np.inf), unit_color(), unknown('VECTOR'),
+        unknown(), bounded(0, np.inf)],
+}
+
+
+class RangeAnalysis:
+    """ Ranges of the output sockets of a graph, propagated from constants, assumptions
+    about sockets (e.g. {uv_socket: (0, 1)}) and the known ranges of nodes """
+
+    def __init__(self, graph, assume={}):
+        self.graph = graph
+        self.ranges = {}
+        self.assume = {getattr(socket, 'socket', socket): value for socket, value in assume.items()}
+
+    def assumed(self, socket, r):
+        if socket not in self.assume:
+            return r
+        lo, hi = self.assume[socket]
+        assumed = bounded(lo, hi, socket.type)
+        return Range(np.maximum(r.lo, assumed.lo), np.minimum(r.hi, assumed.hi))
+
+    def input(self, socket):
+        if not socket.enabled or socket.type not in channels:
+            return None
+        if socket.is_linked:
+            link = socket.links[0]
+            r = self.ranges.get(link.from_socket, unknown(link.from_socket.type))
+            r = Range(convert(r.lo, link.from_socket.type, socket.type), convert(r.hi, link.from_socket.type, socket.type))
+        elif socket.driver is not None:
+            r = unknown(socket.type)
+        else:
+            r = constant(socket.default_value)
+        return self.assumed(socket, r)
+
+    def evaluate_node(self, node):
+        inputs = [self.input(socket) for socket in node.inputs]
+        f = node_ranges.get(node.bl_idname)
+
+        if node.mute or node.bl_idname == 'NodeReroute':
+            outputs = []
+            for output in node.outputs:
+                matching = [r for socket, r in zip(node.inputs, inputs) if socket.type == output.type and r is not None]
+                outputs.append(matching[0] if len(matching) else None)
+        elif f is not None and node.node_tree is None:
+            outputs = f(node, inputs)
+        else:
+            outputs = []
+
+        outputs = outputs + [None] * (len(node.outputs) - len(outputs))
+        for socket, r in zip(node.outputs, outputs):
+            if socket.type in channels:
+                self.ranges[socket] = self.assumed(socket, unknown(socket.type) if r is None else r)
+
+    def run(self):
+        for node in topological_order(self.graph.nodes):
+            self.evaluate_node(node)
+        return self.ranges
+
+
+def analyze(graph, assume={}):
+    """ Ranges of every output socket of a graph, {socket: Range(lo, hi)} """
+    return RangeAnalysis(graph, assume).run()
+
+
+def socket_value(value, socket_type):
+    value = np.asarray(value)
+    if socket_type == 'INT':
+        return int(value)
+    elif socket_type == 'BOOLEAN':
+        return bool(value)
+    return float(value) if value.ndim == 0 else tuple(float(x) for x in value)
+
+
+class Simplifier(RangeAnalysis):
+    """ Range analysis which rewrites nodes as it goes: decided nodes are bypassed or
+    replaced by constants on their consumers, which keeps the ranges valid downstream """
+
+    def __init__(self, graph, assume={}):
+        super().__init__(graph, assume)
+        self.changes = []
+        self.candidates = []
+
+    def changed(self, node, reason):
+        self.changes.append((node.name, reason))
+        self.candidates.append(node)
+        return True
+
+    def replace_constant(self, output, value, reason):
+        consumers = [link.to_socket for link in output.links]
+        if any(s.node.bl_idname == 'NodeGroupOutput' or s.node.external is not None or s.driver is not None
+                for s in consumers):
+            return False
+
+        for link in list(output.links):
+            self.graph.remove_link(link)
+            link.to_socket.default_value = socket_value(convert(value, output.type, link.to_socket.type),
+                link.to_socket.type)
+        return self.changed(output.node, reason)
+
+    def bypass(self, output, input, reason):
+        """ Connect the consumers of an output to what feeds an input of the same node """
+        if not input.is_linked:
+            if input.driver is not None:
+                return False
+            value = convert(np.asarray(input.default_value, dtype=np.float64), input.type, output.type)
+            return self.replace_constant(output, value, reason)
+
+        source = input.links[0].from_socket
+        if source.type != output.type:
+            return False
+
+        for link in list(output.links):
+            self.graph.new_link(source, link.to_socket)
+        return self.changed(output.node, reason)
+
+    def fold_constant(self, output, reason):
+        r = self.ranges[output]
+        return output.is_linked and is_constant(r) and self.replace_constant(output, r.lo, reason)
+
+    def run(self):
+        for node in topological_order(list(self.graph.nodes)):
+            self.evaluate_node(node)
+            if not node.mute and node.node_tree is None and node.bl_idname in rewrites:
+                rewrites[node.bl_idname](self, node)
+        return self.changes
+
+
+def decided_factor(fac):
+    """ 0 or 1 where a (clamped) mix factor always has that value, otherwise None """
+    if np.all(fac.hi <= 0):
+        return 0
+    elif np.all(fac.lo >= 1):
+        return 1
+    return None
+
+
+# Operations which pass an input through when another is constant:
+# {operation: [(passed input, constant input, constant value)]}
+identities = dict(
+    ADD=[(0, 1, 0), (1, 0, 0)],
+    SUBTRACT=[(0, 1, 0)],
+    MULTIPLY=[(0, 1, 1), (1, 0, 1)],
+    DIVIDE=[(0, 1, 1)],
+    POWER=[(0, 1, 1)],
+    SCALE=[(0, 3, 1)],
+)
+
+
+def bypass_identity(s, node, inputs, clamp=False):
+    operation = node.properties.get('operation')
+    for kept, other, value in identities.get(operation, []):
+        r = inputs[other]
+        if r is not None and is_constant(r) and np.all(r.lo == value) and (not clamp or within(inputs[kept], 0, 1)):
+            return s.bypass(node.outputs[0], node.inputs[kept], "{} by {}".format(operation.lower(), value))
+    return False
+
+
+def simplify_math(s, node):
+    p = node.properties
+    inputs = [s.input(socket) for socket in node.inputs]
+    if p.get('use_clamp', False) and within(unclamped_math_range(node, inputs), 0, 1):
+        p['use_clamp'] = False
+        s.changed(node, "clamp not needed")
+
+    if s.fold_constant(node.outputs[0], "constant {}".format(p.get('operation'))):
+        return
+
+    if bypass_identity(s, node, inputs, p.get('use_clamp', False)):
+        return
+
+    operation, (a, b) = p.get('operation'), inputs[:2]
+    if operation == 'MINIMUM':
+        chosen = 0 if np.all(a.hi <= b.lo) else 1 if np.all(b.hi <= a.lo) else None
+    elif operation == 'MAXIMUM':
+        chosen = 0 if np.all(a.lo >= b.hi) else 1 if np.all(b.lo >= a.hi) else None
+    else:
+        return
+
+    if chosen is not None and (not p.get('use_clamp', False) or within(inputs[chosen], 0, 1)):
+        s.bypass(node.outputs[0], node.inputs[chosen], "{} decided".format(p['operation'].lower()))
+
+
+def simplify_vector_math(s, node):
+    for output in node.outputs:
+        if output.enabled and s.fold_constant(output, "constant {}".format(node.properties.get('operation'))):
+            return
+
+    bypass_identity(s, node, [s.input(socket) for socket in node.inputs])
+
+
+def simplify_clamp(s, node):
+    value, low, high = [s.input(socket) for socket in node.inputs]
+    if node.properties.get('clamp_type', 'MINMAX') != 'MINMAX':
+        return
+
+    if np.all(value.lo >= low.hi) and np.all(value.hi <= high.lo):
+        s.bypass(node.outputs[0], node.inputs[0], "redundant clamp")
+        return
+
+    # A [0, 1] clamp of a math node used only here becomes the math node's use_clamp
+    source = node.inputs[0].links[0].from_socket if node.inputs[0].is_linked else None
+    unit = all(not socket.is_linked and socket.driver is None for socket in node.inputs[1:]) and\
+        is_constant(low) and is_constant(high) and float(low.lo) == 0 and float(high.lo) == 1
+
+    if unit and source is not None and source.node.bl_idname == 'ShaderNodeMath' and not source.node.mute\
+            and len(source.links) == 1 and source.type == 'VALUE':
+        source.node.properties['use_clamp'] = True
+        s.ranges[source] = s.ranges[node.outputs[0]]
+        s.bypass(node.outputs[0], node.inputs[0], "clamp merged into {}".format(source.node.name))
+
+
+def simplify_mix_rgb(s, node):
+    p = node.properties
+    fac, color1, color2 = [s.input(socket) for socket in node.inputs]
+    factor = decided_factor(clip(fac, 0, 1))
+    if factor is None or (factor == 1 and (p.get('blend_type', 'MIX') != 'MIX' or p.get('use_alpha', False))):
+        return
+    if factor == 0 and p.get('blend_type', 'MIX') in ['HUE', 'SATURATION', 'VALUE', 'COLOR']:
+        return
+
+    chosen = [color1, color2][factor]
+    if not p.get('use_clamp', False) or within(chosen, 0, 1):
+        s.bypass(node.outputs[0], node.inputs[1 + factor], "mix factor is {}".format(factor))
+
+
+def simplify_mix(s, node):
+    p = node.properties
+    data_type = p.get('data_type', 'FLOAT')
+    sockets = [socket for socket in node.inputs if socket.enabled][:3]
+    fac, a, b = [s.input(socket) for socket in sockets]
+
+    factor = decided_factor(clip(fac, 0, 1) if p.get('clamp_factor', True) else fac)
+    if factor is None or (data_type == 'RGBA' and p.get('blend_type', 'MIX') != 'MIX'):
+        return
+
+    chosen = [a, b][factor]
+    if data_type != 'RGBA' or not p.get('clamp_result', False) or within(chosen, 0, 1):
+        output = next(output for output in node.outputs if output.enabled)
+        s.bypass(output, sockets[1 + factor], "mix factor is {}".format(factor))
+
+
+def simplify_map_range(s, node):
+    p = node.properties
+    if p.get('clamp', True) and p.get('interpolation_type', 'LINEAR') == 'LINEAR':
+        inputs = [s.input(socket) for socket in node.inputs]
+        if within(linear_map_range(inputs), *hull(inputs[3], inputs[4])):
+            p['clamp'] = False
+            s.changed(node, "clamp not needed")
+
+
+# Rewrites by bl_idname, f(simplifier, node) called once the node's ranges are known
+rewrites = {
+    'ShaderNodeMath': simplify_math,
+    'ShaderNodeVectorMath': simplify_vector_math,
+    'ShaderNodeClamp': simplify_clamp,
+    'ShaderNodeMixRGB': simplify_mix_rgb,
+    'ShaderNodeMix': simplify_mix,
+    'ShaderNodeMapRange': simplify_map_range,
+}
+
+
+class SimplifyReport:
+    def __init__(self, graph, changes, removed):
+        self.graph = graph
+        self.changes = changes
+        self.removed = removed
+
+    def __str__(self):
+        lines = ["{}: {} rewrites, {} nodes removed".format(self.graph.name, len(self.changes), len(self.removed))]
+        lines += ["  {}: {}".format(name, reason) for name, reason in self.changes]
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "SimplifyReport({}, {} rewrites, {} removed)".format(self.graph.name, len(self.changes), len(self.removed))
+
+
+def simplify(source, assume={}):
+    """ Remove clamps which can't change their value, fold comparisons, min/max and mixes whose
+    outcome the ranges decide, bypass arithmetic with identity operands (x + 0, x * 1) and use
+    the math nodes' use_clamp only where it's needed. Nodes left without consumers are removed.
+    Rewrites a recorded Graph (or RecordingContext) """
+    if isinstance(source, RecordingContext):
+        graph, remove = source.node_tree, lambda node: source.remove(source.import_node(node))
+    elif isinstance(source, Graph):
+        graph, remove = source, source.remove
+    else:
+        raise TypeError("simplify rewrites recorded graphs, expected Graph|RecordingContext, got {}"
+            .format(type(source).__name__))
+
+    simplifier = Simplifier(graph, assume)
+    changes = simplifier.run()
+
+    removed, nodes, stack = [], set(graph.nodes), list(simplifier.candidates)
+    while len(stack):
+        node = stack.pop()
+        if node in nodes and node.external is None and len(node.outputs) > 0 and\
+                not any(output.is_linked for output in node.outputs):
+            stack.extend(upstream(node.inputs))
+            nodes.discard(node)
+            remove(node)
+            removed.append(node.name)
+
+    return SimplifyReport(graph, changes, removed)
@@ -0,0 +1,125 @@
+import bpy
+
+import time
+from collections import Counter
+
+
+# Custom property marking the datablocks created by this library: {source, hash, created}
+tag = 'node_generated'
+
+# Collections of bpy.data generated datablocks are created in
+generated_collections = ['node_groups', 'images']
+
+
+def source_name(source):
+    if callable(source):
+        return "{}.{}".format(getattr(source, '__module__', '?'), getattr(source, '__qualname__', repr(source)))
+    return str(source)
+
+
+def tag_generated(block, source, content_hash=''):
+    """ Mark a datablock as generated by source (a function or module name), with a hash of its content """
+    block[tag] = dict(source=source_name(source), hash=content_hash, created=time.time())
+    return block
+
+
+def set_hash(block, content_hash):
+    if is_generated(block):
+        block[tag]['hash'] = content_hash
+
+
+def is_generated(block):
+    return block.get(tag) is not None
+
+
+def generated_info(block):
+    """ {source, hash, created} of a generated datablock, None for others """
+    info = block.get(tag)
+    return None if info is None else info.to_dict()
+
+
+def generated(collections=generated_collections):
+    """ Generated datablocks of the given bpy.data collections """
+    for k in collections:
+        for block in getattr(bpy.data, k):
+            if is_generated(block):
+                yield block
+
+
+def references(block):
+    """ Datablocks used by the nodes of a node tree, with the number of uses """
+    counts = Counter()
+    for node in getattr(block, 'nodes', []):
+        for k in ['node_tree', 'image']:
+            value = getattr(node, k, None)
+            if isinstance(value, bpy.types.ID):
+                counts[value] += 1
+    return counts
+
+
+def block_size(block):
+    """ (nodes, links, bytes of pixel data) of a node tree or image """
+    if isinstance(block, bpy.types.Image):
+        width, height = block.size
+        return 0, 0, width * height * block.channels * (4 if block.is_float else 1)
+    return len(block.nodes), len(block.links), 0
+
+
+class SweepReport:
+    def __init__(self, removed, kept, dry_run=False):
+        self.removed = removed
+        self.kept = kept
+        self.dry_run = dry_run
+
+    @property
+    def nodes(self):
+        return sum(nodes for _, _, _, (nodes, _, _) in self.removed)
+
+    @property
+    def links(self):
+        return sum(links for _, _, _, (_, links, _) in self.removed)
+
+    @property
+    def image_bytes(self):
+        return sum(size for _, _, _, (_, _, size) in self.removed)
+
+    def __str__(self):
+        by_collection = Counter(k for k, _, _, _ in self.removed)
+        by_source = Counter(source for _, _, source, _ in self.removed)
+
+        lines = ["{} {} generated datablocks ({}), {} kept in use".format(
+            "would remove" if self.dry_run else "removed", len(self.removed),
+            ", ".join("{} {}".format(n, k) for k, n in sorted(by_collection.items())) or "none", self.kept)]
+        lines.append("freed {} nodes, {} links, {:.2f} MB of images".format(
+            self.nodes, self.links, self.image_bytes / 2**20))
+        lines += ["  {:>6} from {}".format(n, source) for source, n in by_source.most_common(10)]
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "SweepReport({} removed, {} kept)".format(len(self.removed), self.kept)
+
+
+def sweep(collections=generated_collections, dry_run=False):
+    """ Remove generated datablocks which nothing uses, including groups only used by other
+    removed groups. Datablocks with a fake user, and anything not generated, are kept """
+    blocks = list(generated(collections))
+    uses = {block: references(block) for block in blocks}
+
+    removable, changed = set(), True
+    while changed:
+        changed = False
+        for block in blocks:
+            if block not in removable and block.users - sum(uses[r][block] for r in removable) <= 0:
+                removable.add(block)
+                changed = True
+
+    removed = []
+    for k in collections:
+        collection = getattr(bpy.data, k)
+        for block in [block for block in blocks if block in removable and block.name in collection
+                and collection[block.name] == block]:
+            removed.append((k, block.name, generated_info(block)['source'], block_size(block)))
+            if not dry_run:
+                collection.remove(block)
+
+    return SweepReport(removed, len(blocks) - len(removed), dry_run)
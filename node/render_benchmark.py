@@ -0,0 +1,244 @@
+import bpy
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+
+from . import batch
+
+
+metrics = ['build_time', 'render_time', 'compile_time', 'peak_memory']
+
+# Differences below these are treated as noise when comparing against a baseline (seconds, MB)
+noise_floor = dict(build_time=0.05, render_time=0.05, compile_time=0.02, peak_memory=1.0)
+
+peak_pattern = re.compile(r'Peak:?\s*([\d.]+)([MG])')
+
+
+class RenderStats:
+    """ render_stats handler timing the phases Cycles reports (Updating Shaders, Sample 1/16, ...)
+    and tracking the peak memory in the stats """
+
+    def __init__(self):
+        self.phases = {}
+        self.peak_memory = 0.0
+        self.current = None
+
+    def __call__(self, stats):
+        now = time.perf_counter()
+        if self.current is not None:
+            phase, start = self.current
+            self.phases[phase] = self.phases.get(phase, 0.0) + now - start
+
+        for value, unit in peak_pattern.findall(stats):
+            self.peak_memory = max(self.peak_memory, float(value) * (1024 if unit == 'G' else 1))
+
+        phase = stats.split('|')[-1].strip()
+        self.current = (re.sub(r'\s*\d+\s*/\s*\d+.*$', '', phase), now)
+
+    @property
+    def compile_time(self):
+        return sum(t for phase, t in self.phases.items() if 'shader' in phase.lower())
+
+
+def reset_scene():
+    """ Factory startup scene without its meshes (the camera and light are kept) """
+    for obj in list(bpy.data.objects):
+        if obj.type == 'MESH':
+            bpy.data.objects.remove(obj)
+
+
+def setup_scene(scene, materials, samples, resolution, threads):
+    used = {slot.material for obj in scene.objects if obj.type == 'MESH' for slot in obj.material_slots}
+    if not used.intersection(materials):
+        if len(materials) == 0:
+            raise TypeError("builder created no materials to render")
+
+        bpy.ops.mesh.primitive_uv_sphere_add(radius=2)
+        bpy.ops.object.shade_smooth()
+        bpy.context.active_object.data.materials.append(materials[0])
+
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = samples
+    scene.cycles.use_adaptive_sampling = False
+    scene.cycles.use_denoising = False
+    scene.cycles.seed = 0
+
+    scene.render.resolution_x, scene.render.resolution_y = resolution
+    scene.render.resolution_percentage = 100
+    if threads:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+
+
+def run_render(task):
+    """ Worker side: build the materials then render the scene, timing each repeat """
+    sys.path[:0] = task['paths']
+    reset_scene()
+    before = set(bpy.data.materials)
+
+    start = time.perf_counter()
+    batch.import_builder(task['builder'])(**task['params'])
+    build_time = time.perf_counter() - start
+
+    scene = bpy.context.scene
+    materials = [material for material in bpy.data.materials if material not in before]
+    setup_scene(scene, materials, task['samples'], task['resolution'], task['threads'])
+
+    runs = []
+    for _ in range(task['repeats']):
+        stats = RenderStats()
+        bpy.app.handlers.render_stats.append(stats)
+        try:
+            start = time.perf_counter()
+            bpy.ops.render.render()
+            render_time = time.perf_counter() - start
+        finally:
+            bpy.app.handlers.render_stats.remove(stats)
+
+        runs.append(dict(build_time=build_time, render_time=render_time, compile_time=stats.compile_time,
+            peak_memory=stats.peak_memory, phases=stats.phases))
+
+    return dict(runs=runs)
+
+
+batch.worker_tasks['render'] = run_render
+
+
+class RenderResult:
+    """ Median metrics of the repeated renders of one setting """
+
+    def __init__(self, name, ok, metrics={}, phases={}, error=None):
+        self.name = name
+        self.ok = ok
+        self.metrics = dict(metrics)
+        self.phases = dict(phases)
+        self.error = error
+
+    @staticmethod
+    def from_runs(name, runs):
+        median = {k: statistics.median(run[k] for run in runs) for k in metrics}
+        phases = {phase: statistics.median(run['phases'].get(phase, 0.0) for run in runs)
+            for phase in runs[-1]['phases']}
+        return RenderResult(name, True, median, phases)
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed"
+        return "RenderResult({}, {}, {})".format(self.name, status, self.metrics)
+
+
+class Regression:
+    def __init__(self, name, metric, baseline, value):
+        self.name = name
+        self.metric = metric
+        self.baseline = baseline
+        self.value = value
+
+    def __str__(self):
+        return "{} {}: {:.3f} -> {:.3f} ({:+.1f}%)".format(self.name, self.metric, self.baseline, self.value,
+            100 * (self.value / self.baseline - 1) if self.baseline else float('inf'))
+
+
+class RenderReport:
+    def __init__(self, results, baseline={}, tolerance=0.1):
+        self.results = results
+        self.baseline = baseline
+        self.tolerance = tolerance
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def regressions(self):
+        """ Metrics worse than the baseline of the same setting by more than tolerance (relative)
+        and the noise floor (absolute) """
+        regressions = []
+        for result in self.results:
+            for metric, value in result.metrics.items():
+                base = self.baseline.get(result.name, {}).get(metric)
+                if base is not None and value > base * (1 + self.tolerance) + noise_floor[metric]:
+                    regressions.append(Regression(result.name, metric, base, value))
+        return regressions
+
+    def save(self, filename):
+        """ Write the metrics of the settings that rendered as a baseline file, keeping other entries """
+        baseline = load_baseline(filename)
+        baseline.update({result.name: result.metrics for result in self.results if result.ok})
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    def __str__(self):
+        lines = ["{:<32} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+            "setting", "build", "render", "compile", "peak MB", "relative")]
+
+        reference = next((result for result in self.results if result.ok), None)
+        for r in self.results:
+            if not r.ok:
+                lines.append("{:<32} FAILED: {}".format(r.name[:32], r.error.strip().splitlines()[-1]))
+                continue
+
+            m = r.metrics
+            relative = m['render_time'] / reference.metrics['render_time'] if reference.metrics['render_time'] else 1.0
+            lines.append("{:<32} {:>8.2f}s {:>8.2f}s {:>8.3f}s {:>10.1f} {:>7.2f}x".format(r.name[:32],
+                m['build_time'], m['render_time'], m['compile_time'], m['peak_memory'], relative))
+
+        regressions = self.regressions
+        lines.extend("REGRESSION " + str(regression) for regression in regressions)
+        lines.append("{} settings, {} failed, {} regressions".format(
+            len(self.results), len(self.failed), len(regressions)))
+        return "\n".join(lines)
+
+
+def load_baseline(filename):
+    if filename is None or not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def benchmark_render(builder, settings=None, samples=16, resolution=(128, 128), repeats=3, threads=None,
+        baseline=None, tolerance=0.1, update_baseline=False, paths=[], executable=None, timeout=None,
+        keep_files=False):
+    """ Render the materials created by a builder ('module:function' or an importable function)
+    in a fresh headless Blender per setting, with Cycles on the CPU at a fixed sample count.
+
+    settings: {name: params} keyword arguments passed to the builder for each setting compared,
+      e.g. optimization options (defaults to a single 'default' setting without arguments)
+    baseline: json file of metrics by setting name, regressions against it are reported and
+      written back with update_baseline=True
+    The builder's materials are rendered on the objects it creates, or on a sphere if it creates
+    none. Settings are rendered one after another so they don't compete for the CPU """
+    builder = batch.builder_path(builder)
+    settings = settings or {'default': {}}
+    executable = executable or batch.default_executable()
+    work_dir = tempfile.mkdtemp(prefix='node_render_')
+
+    results = []
+    try:
+        for i, (name, params) in enumerate(settings.items()):
+            task = dict(task='render', builder=builder, params=dict(params),
+                paths=[os.path.abspath(path) for path in paths], samples=samples,
+                resolution=list(resolution), repeats=repeats, threads=threads)
+
+            result = batch.run_worker(executable, task, work_dir, 'render_{:04d}'.format(i), timeout)
+            if result['ok']:
+                results.append(RenderResult.from_runs(name, result['runs']))
+            else:
+                results.append(RenderResult(name, False, error=result['error']))
+    finally:
+        if not keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = RenderReport(results, load_baseline(baseline), tolerance)
+    if update_baseline and baseline is not None:
+        report.save(baseline)
+    return report
@@ -0,0 +1,224 @@
+import numpy as np
+import cv2
+
+import os
+import re
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .graph import detach
+from .expression import graph_of
+from . import evaluate_compositor
+
+
+float_formats = {'.exr', '.hdr', '.npy'}
+
+
+def frame_path(pattern, frame):
+    """ Blender style frame pattern, a run of '#' is replaced by the zero padded frame number """
+    if '#' not in pattern:
+        root, ext = os.path.splitext(pattern)
+        pattern = root + '####' + ext
+    return re.sub('#+', lambda m: str(frame).zfill(len(m.group(0))), pattern)
+
+
+def read_image(path):
+    """ Image file as an array, .npy files are memory-mapped instead of read """
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED | cv2.IMREAD_ANYDEPTH)
+    if image is None:
+        raise FileNotFoundError("can't read image '{}'".format(path))
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+    return image
+
+
+def write_image(path, image):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        np.save(path, image)
+        return
+
+    if ext not in float_formats:
+        image = (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA if image.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+    if not cv2.imwrite(path, image):
+        raise IOError("can't write image '{}'".format(path))
+
+
+class Stage:
+    """ Time spent by one pipeline stage, 'busy' is summed across its workers """
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.frames = 0
+        self.busy = 0.0
+        self.bytes = 0
+
+    def add(self, elapsed, nbytes=0):
+        self.frames += 1
+        self.busy += elapsed
+        self.bytes += nbytes
+
+    @property
+    def fps(self):
+        """ Throughput this stage could sustain on its own """
+        return self.frames * self.workers / self.busy if self.busy > 0 else float('inf')
+
+    def __str__(self):
+        line = "{:<8} {:>6} frames {:>9.2f}s busy {:>9.1f} fps".format(self.name, self.frames, self.busy, self.fps)
+        if self.bytes and self.busy > 0:
+            line += " {:>9.1f} MB/s".format(self.bytes / self.busy / 2 ** 20)
+        return line
+
+
+class SequenceReport:
+    def __init__(self, stages, frames, elapsed):
+        self.stages = stages
+        self.frames = frames
+        self.elapsed = elapsed
+
+    @property
+    def fps(self):
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bottleneck(self):
+        return min(self.stages, key=lambda stage: stage.fps).name
+
+    def __str__(self):
+        lines = [str(stage) for stage in self.stages]
+        lines.append("{} frames in {:.2f}s, {:.1f} fps, bound by {}".format(
+            self.frames, self.elapsed, self.fps, self.bottleneck))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "SequenceReport({} frames, {:.1f} fps)".format(self.frames, self.fps)
+
+
+_worker_graph = None
+
+
+def init_worker(graph, options):
+    global _worker_graph
+    _worker_graph = (graph, options)
+
+
+def process_frame(inputs, outputs):
+    """ Worker side: evaluate one frame from .npy input buffers into .npy output buffers """
+    graph, options = _worker_graph
+    start = time.perf_counter()
+
+    images = {name: np.load(path, mmap_mode='r') for name, path in inputs.items()}
+    results = evaluate_compositor.execute(graph, images, outputs=list(outputs), threads=1, **options)
+
+    for name, path in outputs.items():
+        buffer = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=results[name].shape)
+        buffer[...] = results[name]
+        buffer.flush()
+        del buffer
+
+    return time.perf_counter() - start
+
+
+def process_sequence(source, inputs, outputs, frames, workers=None, prefetch=4, mp_context=None, **options):
+    """ Stream an image sequence through a compositor graph (NodeTree, Graph or NodeContext).
+
+    inputs: {image node name: frame pattern}, e.g. {'Image': '//render/####.exr'}
+    outputs: {output node name: frame pattern}, written in frame order
+    frames: iterable of frame numbers
+
+    A reader thread prefetches frames into memory-mapped .npy buffers (.npy sequences are
+    mapped directly), a process pool evaluates up to workers + prefetch frames in flight and
+    the calling thread writes results in order. Returns a SequenceReport with per-stage throughput """
+    graph = detach(graph_of(source))
+    frames = list(frames)
+    workers = workers or os.cpu_count()
+    mp_context = mp_context or multiprocessing.get_context('fork' if os.name == 'posix' else None)
+
+    read, compute, write = stages = [Stage('read'), Stage('compute', workers), Stage('write')]
+    buffers = tempfile.mkdtemp(prefix='node_sequence_')
+
+    slots = queue.Queue()
+    for slot in range(workers + prefetch):
+        slots.put(slot)
+
+    pending = queue.Queue()
+    stop = threading.Event()
+
+    def buffer_path(slot, kind, name):
+        return os.path.join(buffers, "{}_{}_{}.npy".format(slot, kind, re.sub(r'\W', '_', name)))
+
+    def reader(pool):
+        try:
+            for frame in frames:
+                slot = slots.get()
+                if stop.is_set():
+                    return
+
+                start, nbytes, paths = time.perf_counter(), 0, {}
+                for name, pattern in inputs.items():
+                    path = frame_path(pattern, frame)
+                    if path.endswith('.npy'):
+                        paths[name] = path
+                        nbytes += os.path.getsize(path)
+                        continue
+
+                    image = read_image(path)
+                    paths[name] = buffer_path(slot, 'in', name)
+                    np.save(paths[name], image)
+                    nbytes += image.nbytes
+                read.add(time.perf_counter() - start, nbytes)
+
+                out = {name: buffer_path(slot, 'out', name) for name in outputs}
+                pending.put((frame, slot, out, pool.submit(process_frame, paths, out)))
+        except Exception as e:
+            pending.put(e)
+        finally:
+            pending.put(None)
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=init_worker,
+                initargs=(graph, options)) as pool:
+            thread = threading.Thread(target=reader, args=(pool,), daemon=True)
+            thread.start()
+
+            try:
+                for item in iter(pending.get, None):
+                    if isinstance(item, Exception):
+                        raise item
+
+                    frame, slot, out, future = item
+                    compute.add(future.result())
+
+                    write_start, nbytes = time.perf_counter(), 0
+                    for name, pattern in outputs.items():
+                        path = frame_path(pattern, frame)
+                        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                        if path.endswith('.npy'):
+                            nbytes += os.path.getsize(out[name])
+                            os.replace(out[name], path)
+                        else:
+                            image = np.load(out[name], mmap_mode='r')
+                            nbytes += image.nbytes
+                            write_image(path, image)
+                    write.add(time.perf_counter() - write_start, nbytes)
+                    slots.put(slot)
+            finally:
+                stop.set()
+                slots.put(None)
+                thread.join()
+    finally:
+        shutil.rmtree(buffers, ignore_errors=True)
+
+    return SequenceReport(stages, write.frames, time.perf_counter() - start)
@@ -0,0 +1,223 @@
+import bpy
+
+import json
+
+from .graph import capture, add_driver, id_type, id_collections, tree_idnames
+from .expression import NodeContext, graph_of
+from .registry import tag_generated
+
+
+format_name = 'node_expressions.graph'
+format_version = 1
+
+
+def encode_value(value, groups):
+    if isinstance(value, bpy.types.NodeTree):
+        if value.name not in groups:
+            groups[value.name] = None    # placeholder, guards against recursion
+            groups[value.name] = encode_graph(capture(value), groups)
+        return dict(group=value.name)
+
+    elif isinstance(value, bpy.types.ID):
+        return dict(id=[id_type(value), value.name])
+
+    elif isinstance(value, tuple):
+        return list(value)
+
+    return value
+
+
+def decode_value(value, groups):
+    if isinstance(value, dict):
+        if 'group' in value:
+            return groups[value['group']]
+        collection, name = value['id']
+        return getattr(bpy.data, id_collections[collection])[name]
+
+    elif isinstance(value, list):
+        return tuple(value)
+
+    return value
+
+
+def encode_graph(graph, groups):
+    index = {node: i for i, node in enumerate(graph.nodes)}
+
+    def encode_node(node):
+        desc = dict(id=index[node], type=node.bl_idname)
+
+        properties = {k: encode_value(v, groups) for k, v in node.properties.items()}
+        if len(properties):
+            desc['properties'] = properties
+
+        for key, sockets in [('inputs', node.inputs), ('outputs', node.outputs)]:
+            defaults = {str(socket.index): encode_value(socket.default_value, groups)
+                for socket in sockets if socket.is_modified and not socket.is_linked}
+            drivers = {str(socket.index): socket.driver for socket in sockets if socket.driver is not None}
+
+            if len(defaults):
+                desc[key] = defaults
+            if len(drivers):
+                desc[key[:-1] + '_drivers'] = drivers
+
+        if node.mute:
+            desc['mute'] = True
+        if node is graph.active:
+            desc['active'] = True
+        return desc
+
+    links = [[index[link.from_node], link.from_socket.index, index[link.to_node], link.to_socket.index]
+        for link in graph.links]
+
+    interface = {k: [[name, socket_type, encode_value(default, groups)] for name, socket_type, default in sockets]
+        for k, sockets in graph.interface.items()}
+
+    return dict(type=graph.type, name=graph.name, interface=interface,
+        nodes=[encode_node(node) for node in graph.nodes], links=links)
+
+
+def to_dict(source):
+    """ Serializable description of a NodeContext (the nodes it created), NodeTree or Graph,
+    node groups referenced are included (once) under 'groups' """
+    groups = {}
+    graph = encode_graph(graph_of(source), groups)
+    return dict(format=format_name, version=format_version, blender=bpy.app.version_string,
+        groups=groups, graph=graph)
+
+
+def dumps(source):
+    """ JSON with one node, link or group per line so that changes diff cleanly """
+    data = to_dict(source)
+
+    def lines(graph, indent):
+        pad = " " * indent
+        header = {k: graph[k] for k in ['type', 'name', 'interface']}
+        body = [pad + '"{}": {},'.format(k, json.dumps(v, sort_keys=True)) for k, v in header.items()]
+
+        body.append(pad + '"nodes": [')
+        body.append(",\n".join(pad + "  " + json.dumps(node, sort_keys=True) for node in graph['nodes']))
+        body.append(pad + '],')
+        body.append(pad + '"links": [')
+        body.append(",\n".join(pad + "  " + json.dumps(link) for link in graph['links']))
+        body.append(pad + ']')
+        return "\n".join(line for line in body if line)
+
+    groups = ",\n".join('    {}: {{\n{}\n    }}'.format(json.dumps(name), lines(group, 6))
+        for name, group in data['groups'].items())
+
+    return "\n".join(line for line in [
+        '{',
+        '  "format": {}, "version": {}, "blender": {},'.format(
+            json.dumps(data['format']), data['version'], json.dumps(data['blender'])),
+        '  "groups": {',
+        groups,
+        '  },',
+        '  "graph": {',
+        lines(data['graph'], 4),
+        '  }',
+        '}'
+    ] if line) + "\n"
+
+
+def replay_graph(desc, node_tree, groups):
+    nodes = node_tree.nodes
+    created = []
+
+    for node_desc in desc['nodes']:
+        node = nodes.new(node_desc['type'])
+        for k, v in node_desc.get('properties', {}).items():
+            setattr(node, k, decode_value(v, groups))
+
+        for key in ['inputs', 'outputs']:
+            sockets = getattr(node, key)
+            for i, v in node_desc.get(key, {}).items():
+                sockets[int(i)].default_value = decode_value(v, groups)
+            for i, driver in node_desc.get(key[:-1] + '_drivers', {}).items():
+                add_driver(sockets[int(i)], driver)
+
+        if node_desc.get('mute', False):
+            node.mute = True
+        if node_desc.get('active', False):
+            nodes.active = node
+        created.append(node)
+
+    new_link = node_tree.links.new
+    for from_node, from_index, to_node, to_index in desc['links']:
+        new_link(created[from_node].outputs[from_index], created[to_node].inputs[to_index], verify_limits=False)
+
+    return created
+
+
+def replay_interface(desc, node_tree, groups):
+    for k in ['inputs', 'outputs']:
+        sockets = getattr(node_tree, k)
+        for name, socket_type, default in desc['interface'][k]:
+            socket = sockets.new(socket_type, name)
+            if default is not None and hasattr(socket, 'default_value'):
+                socket.default_value = decode_value(default, groups)
+
+
+def from_dict(data, node_tree=None):
+    """ Replay a serialized graph into node_tree (or a new node group), groups are
+    created first, in dependency order. Returns the node tree """
+    if data.get('format') != format_name:
+        raise TypeError("not a serialized node graph")
+    if data['version'] > format_version:
+        raise TypeError("unsupported graph version {}, expected <= {}".format(data['version'], format_version))
+
+    groups = {}
+    def replay_group(name):
+        if name not in groups:
+            desc = data['groups'][name]
+            for dependency in group_dependencies(desc):
+                replay_group(dependency)
+
+            group = tag_generated(bpy.data.node_groups.new(name, tree_idnames[desc['type']]), __name__)
+            replay_interface(desc, group, groups)
+            replay_graph(desc, group, groups)
+            groups[name] = group
+        return groups[name]
+
+    for name in data['groups']:
+        replay_group(name)
+
+    desc = data['graph']
+    if node_tree is None:
+        node_tree = tag_generated(bpy.data.node_groups.new(desc['name'], tree_idnames[desc['type']]), __name__)
+        replay_interface(desc, node_tree, groups)
+
+    replay_graph(desc, node_tree, groups)
+    return node_tree
+
+
+def group_dependencies(desc):
+    for node in desc['nodes']:
+        for v in node.get('properties', {}).values():
+            if isinstance(v, dict) and 'group' in v:
+                yield v['group']
+
+
+def loads(text, node_tree=None):
+    return from_dict(json.loads(text), node_tree)
+
+
+def save(source, filename):
+    with open(filename, 'w') as f:
+        f.write(dumps(source))
+
+
+def load(filename, node_tree=None):
+    with open(filename) as f:
+        return loads(f.read(), node_tree)
+
+
+def load_or_build(filename, node_tree, f):
+    """ Replay a cached graph into node_tree if the cache file exists, otherwise
+    build it with f() inside the node_tree context and save it for next time """
+    try:
+        return load(filename, node_tree)
+    except FileNotFoundError:
+        with NodeContext(node_tree) as context:
+            f()
+        save(context, filename)
+        return node_tree
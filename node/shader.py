@@ -2,7 +2,7 @@ import bpy
 import idprop
 
 import sys
-from node import expression, value
+from node import expression, value, graph
 import node
 
 from .util import staticproperty, classproperty, Namespace
@@ -39,21 +39,7 @@ class Vector(value.Vector):
     def vector_math(cls):
         return cls.nodes.vector_math        
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Vector) or isinstance(v, Float):
-            context._new_link(v, socket)
-        elif isinstance(v, Number):
-            socket.default_value = (v, v, v)
-        elif isinstance(v, tuple):
-            if len(v) != 3: raise TypeError("expected literals of length 3")
-            literals = [isinstance(x, Number) for x in v]
-            if all(literals):
-                socket.default_value = v            
-            else:
-                context._new_link(context.nodes.combine_xyz(*v), socket)
-        else:
-            raise TypeError("expected tuple[scalar, scalar, scalar]|Vector, got " + type(v).__name__)
+    expected = "tuple[scalar, scalar, scalar]|Vector"
 
     @classmethod
     def combine(cls, x, y, z):
@@ -133,9 +119,10 @@ class Vector(value.Vector):
 
     def dot(self, other): return vector_math.dot_product(self, other)
     def proj(self, other): return vector_math.project(self, other)
-    def cross(self, other): return vector_math.cross_product(self, other)    
+    def cross(self, other): return vector_math.cross_product(self, other)
 
 
+Vector.connectors = [((Vector, Float), value.link), (Number, value.set_vector), (tuple, value.combine_vector)]
 
 
 class Color(value.Color):
@@ -240,13 +227,7 @@ def float_driver(obj, prop_name):
     v = obj[prop_name]
 
     node_value = module.value()
-    fcurve = node_value.socket.driver_add("default_value")
-    driver = fcurve.driver
-
-    driver.type = 'AVERAGE'
-    var = driver.variables.new()
-    var.targets[0].id = obj
-    var.targets[0].data_path = '["{}"]'.format(prop_name)
+    graph.add_driver(node_value.socket, graph.property_driver(obj, prop_name))
 
     return node_value
     
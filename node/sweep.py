@@ -0,0 +1,196 @@
+import numpy as np
+
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from .graph import GraphSocket, capture, detach
+from .value import Value
+from .evaluate import Evaluator, channels, luminance
+from . import evaluate_shader     # registers the shader node implementations
+
+
+def reads_property(driver, name):
+    """ Driver whose value is the custom property 'name', as made by graph.property_driver """
+    variables = driver['variables']
+    if len(variables) != 1 or len(variables[0]['targets']) != 1:
+        return False
+    if driver['type'] == 'SCRIPTED' and driver['expression'].strip() != variables[0]['name']:
+        return False
+    return variables[0]['targets'][0]['data_path'] == '["{}"]'.format(name)
+
+
+def locate(graph, socket):
+    """ Index of the node and the socket in a graph (captured from the socket's tree if it's a bpy socket) """
+    socket = socket.socket if isinstance(socket, Value) else socket
+    if isinstance(socket, GraphSocket):
+        if socket.node.id_data is not graph:
+            raise TypeError("swept socket {} is not in the evaluated graph".format(socket))
+        node = socket.node
+    else:
+        node = next(n for n in graph.nodes if n.name == socket.node.name)
+        sockets = socket.node.outputs if socket.is_output else socket.node.inputs
+        socket = (node.outputs if socket.is_output else node.inputs)[
+            [s.as_pointer() for s in sockets].index(socket.as_pointer())]
+
+    return graph.nodes.index(node), socket.is_output, socket.index
+
+
+def parameter_sockets(graph, key):
+    """ Locations of the sockets a parameter sets: sockets driven by a custom property for
+    names (see shader.property_drivers), otherwise the given Value or socket """
+    if not isinstance(key, str):
+        return [locate(graph, key)]
+
+    found = [(i, socket.is_output, socket.index) for i, node in enumerate(graph.nodes)
+        for socket in node.inputs + node.outputs if socket.driver is not None and reads_property(socket.driver, key)]
+    if len(found) == 0:
+        raise KeyError("no sockets driven by property '{}'".format(key))
+    return found
+
+
+def parameter_name(key):
+    if isinstance(key, str):
+        return key
+    socket = key.socket if isinstance(key, Value) else key
+    return "{}.{}".format(socket.node.name, socket.name)
+
+
+class Sweep:
+    """ Values of an expression at the same samples for every combination of parameter values,
+    values has shape (combinations, samples) plus a trailing channel axis for vectors and colors """
+
+    def __init__(self, parameters, values, socket_type):
+        self.parameters = parameters
+        self.values = values
+        self.socket_type = socket_type
+
+    @property
+    def names(self):
+        return list(self.parameters)
+
+    def __len__(self):
+        return len(self.values)
+
+    def combination(self, i):
+        return {name: values[i].tolist() for name, values in self.parameters.items()}
+
+    def scalar(self):
+        """ Values as one number per sample (luminance of colors, mean of vectors) """
+        if self.socket_type == 'RGBA':
+            return luminance(self.values)
+        elif self.socket_type == 'VECTOR':
+            return self.values.mean(axis=-1)
+        return self.values
+
+    @property
+    def statistics(self):
+        """ {statistic: array of one value per combination} of the scalar values """
+        values = self.scalar()
+        return dict(mean=values.mean(axis=1), std=values.std(axis=1),
+            min=values.min(axis=1), max=values.max(axis=1))
+
+    def rank(self, statistic='std', n=10, reverse=True):
+        """ Indices of the n combinations with the highest (or lowest) statistic """
+        order = np.argsort(self.statistics[statistic])
+        return [int(i) for i in (order[::-1] if reverse else order)[:n]]
+
+    def thumbnails(self, resolution):
+        """ Values as images (combinations, height, width, channels), for samples
+        taken on a grid such as plane_samples(resolution) """
+        width, height = resolution
+        values = self.values.reshape(len(self), height, width, -1)
+        if values.shape[-1] == 1:
+            return np.repeat(values, 3, axis=-1)
+        return values
+
+    def contact_sheet(self, resolution, columns=None, padding=2):
+        """ Thumbnails tiled into one RGBA image, row by row in combination order """
+        thumbnails = self.thumbnails(resolution)[..., :3]
+        columns = columns or int(np.ceil(np.sqrt(len(self))))
+        rows = int(np.ceil(len(self) / columns))
+        width, height = resolution
+
+        sheet = np.zeros((rows * (height + padding) + padding, columns * (width + padding) + padding, 4), np.float32)
+        sheet[..., 3] = 1
+        for i, thumbnail in enumerate(thumbnails):
+            y, x = padding + (i // columns) * (height + padding), padding + (i % columns) * (width + padding)
+            sheet[y:y + height, x:x + width, :3] = thumbnail
+        return sheet
+
+    def __str__(self):
+        stats = self.statistics
+        lines = [" ".join("{:>12}".format(name[-12:]) for name in self.names + list(stats))]
+        for i in range(min(len(self), 20)):
+            row = [values[i] for values in self.parameters.values()] + [stat[i] for stat in stats.values()]
+            lines.append(" ".join("{:>12.4g}".format(float(np.mean(v))) for v in row))
+        if len(self) > 20:
+            lines.append("... {} combinations".format(len(self)))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "Sweep({}, {} combinations of {} samples)".format(self.names, len(self), self.values.shape[1])
+
+
+def plane_samples(resolution, size=1.0, center=(0, 0, 0)):
+    """ Attributes of samples on a grid over the XY plane (row by row from the bottom), for
+    thumbnails of a sweep: Position, Generated, Object and UV coordinates and Normal """
+    width, height = resolution
+    x, y = np.meshgrid((np.arange(width) + 0.5) / width, (np.arange(height) + 0.5) / height)
+    uv = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=-1)
+
+    position = (uv - (0.5, 0.5, 0)) * size + center
+    normal = np.broadcast_to(np.array([0, 0, 1.0]), uv.shape)
+    return dict(Position=position, Object=position, Generated=uv, UV=uv, Normal=normal, **{'True Normal': normal})
+
+
+def sweep(value, parameters, attributes, images={}, batch_size=None, threads=None):
+    """ Evaluate a shader Value for every combination of parameter values at once, with the
+    combinations on a leading array axis so one evaluation pass covers many of them.
+
+    parameters: {key: values}, keys are names of custom properties read by drivers (see
+      shader.property_drivers) or Values/sockets to set, e.g. {'scale': np.linspace(1, 4, 16)}
+    attributes: per-sample attributes as for evaluate_shader.evaluate, e.g. plane_samples((64, 64))
+    Combinations are evaluated in batches (of about a million values each by default) on a thread pool """
+    socket = value.socket if isinstance(value, Value) else value
+    graph = socket.node.id_data if isinstance(socket, GraphSocket) else capture(socket.id_data)
+
+    names = [parameter_name(key) for key in parameters]
+    output, located = locate(graph, socket), [parameter_sockets(graph, key) for key in parameters]
+    graph = detach(graph)
+
+    def socket_at(i, is_output, index):
+        node = graph.nodes[i]
+        return (node.outputs if is_output else node.inputs)[index]
+
+    # Every combination of the values of each parameter, the last parameter varying fastest
+    values = [np.asarray(values, dtype=np.float64) for values in parameters.values()]
+    indices = [np.array(i) for i in zip(*itertools.product(*[range(len(v)) for v in values]))]
+    grid = {name: v[i] for name, v, i in zip(names, values, indices)}
+
+    output = socket_at(*output)
+    targets = [(socket_at(*location), name) for name, locations in zip(names, located) for location in locations]
+
+    samples = len(next(iter(attributes.values())))
+    size = channels.get(output.type)
+    combinations = len(indices[0]) if len(indices) else 1
+    result = np.empty((combinations, samples) + (() if size is None else (size,)), dtype=np.float32)
+
+    batch_size = batch_size or max(1, 2**20 // samples)
+    attributes = {k: np.asarray(v)[None] for k, v in attributes.items()}
+
+    def run(start):
+        stop = min(start + batch_size, combinations)
+        overrides = {}
+        for socket, name in targets:
+            batch = grid[name][start:stop]
+            overrides[socket] = batch.reshape((len(batch), 1) + batch.shape[1:])
+
+        evaluator = Evaluator(graph, images, shape=(stop - start, samples), attributes=attributes,
+            overrides=overrides)
+        evaluated, = evaluator.evaluate([output])
+        result[start:stop] = evaluator.full(evaluated, output.type)
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, combinations, batch_size)))
+    return Sweep(grid, result, output.type)
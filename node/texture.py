@@ -31,23 +31,10 @@ class Vector(value.Vector):
     def color(self):
         return Color(self.socket)
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Vector) or isinstance(v, Float):
-            context._new_link(v, socket)
-        elif isinstance(v, Number):
-            socket.default_value = (v, v, v)
-        elif isinstance(v, tuple):
-            if len(v) != 3: raise TypeError("expected literals of length 3")
-            literals = [isinstance(x, Number) for x in v]
-            if all(literals):
-                socket.default_value = v            
-            else:
-                context._new_link(context.nodes.combine_xyz(*v), socket)
-        else:
-            raise TypeError("expected tuple[scalar, scalar, scalar]|Vector, got " + type(v).__name__)
+    expected = "tuple[scalar, scalar, scalar]|Vector"
 
 
+Vector.connectors = [((Vector, Float), value.link), (Number, value.set_vector), (tuple, value.combine_vector)]
 
 
 class Color(value.Color):
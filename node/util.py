@@ -15,7 +15,8 @@ def typename(x):
 
 
 def assert_type(x, expected):
-    assert isinstance(x, expected), "expected {}, got {}".format(expected.__name__, typename(x))
+    names = "|".join(t.__name__ for t in expected) if isinstance(expected, tuple) else expected.__name__
+    assert isinstance(x, expected), "expected {}, got {}".format(names, typename(x))
 
 
 def attribute_error(name, k, keys):
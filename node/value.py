@@ -5,11 +5,55 @@ from cached_property import cached_property
 from typing import List, Callable, Tuple, Any, Union, Optional
 
 from .expression import node_context
+from .graph import socket_classes
 from .util import typename, assert_type, staticproperty, classproperty, Namespace
 
 import math
 
 
+# Connection handlers by (value class, argument type), resolved from the class's connectors on first use
+connect_table = {}
+
+# Operator functions by (name, left type, right type), resolved on first use (see Float.operator)
+operator_table = {}
+
+
+def link(context, v, socket):
+    return context._new_link(v, socket)
+
+def set_default(context, v, socket):
+    socket.default_value = v
+
+def set_int(context, v, socket):
+    socket.default_value = int(v)
+
+def set_vector(context, v, socket):
+    socket.default_value = (v, v, v)
+
+def set_color(context, v, socket):
+    socket.default_value = (v, v, v, 1)
+
+def ignore(context, v, socket):
+    return None
+
+def literal_vector(context, v, socket):
+    if len(v) != 3 or not all(isinstance(x, Number) for x in v):
+        raise TypeError("expected literals of length 3")
+    socket.default_value = v
+
+def combine_vector(context, v, socket):
+    """ Tuple of literals as the default value, otherwise linked through a combine node """
+    if len(v) != 3: raise TypeError("expected literals of length 3")
+    if all(isinstance(x, Number) for x in v):
+        socket.default_value = v
+    else:
+        context._new_link(context.nodes.combine_xyz(*v), socket)
+
+def literal_color(context, v, socket):
+    if len(v) != 4 or not all(isinstance(x, Number) for x in v):
+        raise TypeError("expected literals of length 4")
+    socket.default_value = v
+
 
 class Value:
     def __init__(self, socket):
@@ -18,7 +62,7 @@ class Value:
         self.socket = socket.socket if isinstance(socket, Value)\
             else socket
 
-        assert_type(self.socket, bpy.types.NodeSocket)
+        assert_type(self.socket, socket_classes)
     
 
     @property
@@ -39,6 +83,30 @@ class Value:
     @property
     def type(self):
         raise NotImplementedError
+
+    # (types, handler(context, v, socket)) tried in order for an argument's type, see connect
+    connectors = []
+    expected = "Value"
+
+    @classmethod
+    def connect(cls, context, v, socket):
+        """ Link a value or set a literal on a socket, by a handler looked up in connect_table """
+        key = (cls, type(v))
+        handler = connect_table.get(key)
+        if handler is None:
+            handler = connect_table[key] = cls.connector(type(v))
+        return handler(context, v, socket)
+
+    @classmethod
+    def connector(cls, t):
+        for types, handler in cls.connectors:
+            if issubclass(t, types):
+                return handler
+        return cls.reject
+
+    @classmethod
+    def reject(cls, context, v, socket):
+        raise TypeError("expected {}, got {}".format(cls.expected, type(v).__name__))
        
     def __repr__(self):
         return self.type
@@ -67,24 +135,16 @@ class Float(Value):
         value.socket.default_value = x
         return value
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Float):
-            return context._new_link(v, socket)
-        elif isinstance(v, Number):
-            socket.default_value = v
-            return None
-        else:
-            raise TypeError("expected scalar (float|Float), got " + type(v).__name__)
-    
+    expected = "scalar (float|Float)"
+
     # Allow Vector/Color to handle operators as higher precedence
     def operator(self, name, x):
-        if hasattr(type(x), name):
-            f = getattr(type(x), name)
-            return f(self, x)
-        else:
-            f = getattr(self, name)
-            return f(x)
+        key = (name, type(self), type(x))
+        f = operator_table.get(key)
+        if f is None:
+            f = operator_table[key] = getattr(type(x), name) if hasattr(type(x), name)\
+                else getattr(type(self), name)
+        return f(self, x)
 
 
 
@@ -181,15 +241,7 @@ class Vector(Value):
         assert len(v) == 3
         return tuple(v)
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Float) or  isinstance(v, Vector):
-            return context._new_link(v, socket)
-        elif isinstance(v, tuple):
-            if len(v) != 3 or all([isinstance(x, Number) for x in v]): 
-                raise TypeError("expected literals of length 3")
-            socket.default_value = v            
-        raise TypeError("expected float|tuple[float, float, float]|Vector, got " + type(v).__name__)     
+    expected = "float|tuple[float, float, float]|Vector"
 
 class Int(Value):
     def __init__(self, socket):
@@ -205,15 +257,7 @@ class Int(Value):
     def default_value(v):
         return int(v)         
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Int):
-            return context._new_link(v, socket)
-        elif isinstance(v, Number):
-            socket.default_value = int(v)
-            return None
-        else:
-            raise TypeError("expected int|Int, got " + type(v).__name__)     
+    expected = "int|Int"
 
 
 class Bool(Value):
@@ -230,16 +274,7 @@ class Bool(Value):
     def default_value(v):
         return bool(v)  
 
-
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Bool):
-            return context._new_link(v, socket)
-        elif isinstance(v, bool):
-            socket.default_value = v
-            return None
-        else:
-            raise TypeError("expected bool|Bool, got " + type(v).__name__)     
+    expected = "bool|Bool"
 
 
 
@@ -255,15 +290,7 @@ class String(Value):
     def default_value(v):
         return str(v)  
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, String):
-            return context._new_link(v, socket)
-        elif isinstance(v, str):
-            socket.default_value = v
-            return None
-        else:
-            raise TypeError("expected str|String, got " + type(v).__name__)     
+    expected = "str|String"
 
 
 class Shader(Value):
@@ -280,12 +307,7 @@ class Shader(Value):
     def default_value(v):
         return None 
 
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Shader):
-            return context._new_link(v, socket)
-        elif v is not None:
-            raise TypeError("expected Shader, got " + type(v).__name__) 
+    expected = "Shader"
 
 class Color(Value):
     def __init__(self,  socket):
@@ -303,21 +325,7 @@ class Color(Value):
         assert len(v) == 4
         return tuple(v)          
 
-
-    @staticmethod
-    def connect(context, v, socket):
-        if isinstance(v, Color) or isinstance(v, Float):
-            context._new_link(v, socket)
-
-        elif isinstance(v, Number):
-            socket.default_value = (v, v, v, 1)
-        elif isinstance(v, tuple):
-            if len(v) != 4 or not all([isinstance(x, Number) for x in v]): 
-                raise TypeError("expected literals of length 4")
-                
-            socket.default_value = v            
-        else:
-            raise TypeError("expected tuple[scalar x4]|Color, got " + type(v).__name__)
+    expected = "tuple[scalar x4]|Color"
 
     @classproperty
     def mix(cls):
@@ -336,8 +344,11 @@ class Color(Value):
     def __rsub__(self, x): return Color.sub(x, self)
     def __rmul__(self, x): return Color.mul(x, self)
 
-    
-    
-
-
 
+Float.connectors = [(Float, link), (Number, set_default)]
+Vector.connectors = [((Float, Vector), link), (tuple, literal_vector)]
+Int.connectors = [(Int, link), (Number, set_int)]
+Bool.connectors = [(Bool, link), (bool, set_default)]
+String.connectors = [(String, link), (str, set_default)]
+Shader.connectors = [(Shader, link), (type(None), ignore)]
+Color.connectors = [((Color, Float), link), (Number, set_color), (tuple, literal_color)]
@@ -7,7 +7,7 @@ setup(
     author_email="saulzar@gmail.com",
     description="API for using expressions to create node graphs in blender",
     url="https://github.com/saulzar/node_expressions",
-    packages=find_namespace_packages(),
+    packages=find_namespace_packages(exclude=["tests", "tests.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -16,5 +16,5 @@ setup(
     install_requires = [
         "fuzzywuzzy"
     ],
-    python_requires='>=3.7',
+    python_requires='>=3.9',
 )
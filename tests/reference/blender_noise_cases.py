@@ -0,0 +1,36 @@
+""" Settings the reference values of tests/test_blender_noise.py are exported with (see export_blender_noise.py),
+{name: dict(function, basis, args)}. Functions are those of mathutils.noise, except turbulence which Blender only
+evaluates in textures (read from the intensity of a clouds texture). Bases use the Texture's names """
+
+bases = ['BLENDER_ORIGINAL', 'ORIGINAL_PERLIN', 'IMPROVED_PERLIN', 'VORONOI_F1', 'VORONOI_F2', 'VORONOI_F3', 'VORONOI_F4',
+    'VORONOI_F2_F1', 'VORONOI_CRACKLE', 'CELL_NOISE']
+
+metrics = ['DISTANCE', 'DISTANCE_SQUARED', 'MANHATTAN', 'CHEBYCHEV', 'MINKOVSKY_HALF', 'MINKOVSKY_FOUR', 'MINKOVSKY']
+
+# Musgrave types with their mathutils.noise functions and arguments after the point
+musgrave_types = dict(
+    FBM=('fractal', (0.8, 2.1, 3.5)),
+    MULTIFRACTAL=('multi_fractal', (0.8, 2.1, 3.5)),
+    HETERO_TERRAIN=('hetero_terrain', (0.8, 2.1, 3.5, 0.7)),
+    HYBRID_MULTIFRACTAL=('hybrid_multi_fractal', (0.8, 2.1, 3.5, 0.7, 1.3)),
+    RIDGED_MULTIFRACTAL=('ridged_multi_fractal', (0.8, 2.1, 3.5, 0.7, 1.3)),
+)
+
+cases = dict(
+    cell=dict(function='cell', basis=None, args=()),
+    cell_vector=dict(function='cell_vector', basis=None, args=()),
+)
+
+for basis in bases:
+    cases['noise_' + basis.lower()] = dict(function='noise', basis=basis, args=())
+    cases['turbulence_' + basis.lower()] = dict(function='turbulence', basis=basis, args=(0.6, 3, False))
+    cases['turbulence_hard_' + basis.lower()] = dict(function='turbulence', basis=basis, args=(0.6, 3, True))
+    cases['variable_lacunarity_' + basis.lower()] = dict(function='variable_lacunarity', basis=basis,
+        args=(0.8, 'IMPROVED_PERLIN'))
+
+for metric in metrics:
+    cases['voronoi_' + metric.lower()] = dict(function='voronoi', basis=None, args=(metric, 1.7))
+
+for musgrave_type, (function, args) in musgrave_types.items():
+    for basis in ['BLENDER_ORIGINAL', 'IMPROVED_PERLIN', 'VORONOI_CRACKLE']:
+        cases[function + '_' + basis.lower()] = dict(function=function, basis=basis, args=args)
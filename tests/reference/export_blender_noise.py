@@ -0,0 +1,77 @@
+""" Export reference values of Blender's noise functions (BLI_noise) for tests/test_blender_noise.py,
+from mathutils.noise and the intensity of clouds textures:
+
+    blender -b --factory-startup --python tests/reference/export_blender_noise.py
+"""
+import bpy
+import numpy as np
+from mathutils import noise
+
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent))
+from blender_noise_cases import cases
+
+# mathutils.noise names of the Texture's noise bases
+basis_names = dict(BLENDER_ORIGINAL='BLENDER', ORIGINAL_PERLIN='PERLIN_ORIGINAL', IMPROVED_PERLIN='PERLIN_NEW',
+    VORONOI_F1='VORONOI_F1', VORONOI_F2='VORONOI_F2', VORONOI_F3='VORONOI_F3', VORONOI_F4='VORONOI_F4',
+    VORONOI_F2_F1='VORONOI_F2F1', VORONOI_CRACKLE='VORONOI_CRACKLE', CELL_NOISE='CELLNOISE')
+
+
+def reference_points(n=128, seed=0):
+    """ Random points, a quarter of them on lattice points and cell centers """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-6, 6, (n, 3)).astype(np.float32)
+    points[:n // 4] = np.round(points[:n // 4] * 2) / 2
+    return points
+
+
+def turbulence(points, basis, size, depth, hard):
+    texture = bpy.data.textures.new('noise_reference', 'CLOUDS')
+    texture.noise_basis, texture.noise_scale, texture.noise_depth = basis, size, depth
+    texture.noise_type = 'HARD_NOISE' if hard else 'SOFT_NOISE'
+    values = [texture.evaluate(p)[3] for p in points]
+    bpy.data.textures.remove(texture)
+    return values
+
+
+def evaluate(case, points):
+    """ {attribute: values} of a case """
+    function, basis, args = case['function'], case['basis'], case['args']
+    points = [tuple(map(float, p)) for p in points]
+
+    if function == 'turbulence':
+        return dict(value=turbulence(points, basis, *args))
+    elif function == 'voronoi':
+        results = [noise.voronoi(p, distance_metric=args[0], exponent=args[1]) for p in points]
+        return dict(distances=[r[0] for r in results], points=[[tuple(v) for v in r[1]] for r in results])
+    elif function == 'cell':
+        return dict(value=[noise.cell(p) for p in points])
+    elif function == 'cell_vector':
+        return dict(value=[tuple(noise.cell_vector(p)) for p in points])
+    elif function == 'noise':
+        return dict(value=[noise.noise(p, noise_basis=basis_names[basis]) for p in points])
+    elif function == 'variable_lacunarity':
+        distortion, distortion_basis = args
+        return dict(value=[noise.variable_lacunarity(p, distortion, noise_type1=basis_names[distortion_basis],
+            noise_type2=basis_names[basis]) for p in points])
+
+    f = getattr(noise, function)
+    return dict(value=[f(p, *args, noise_basis=basis_names[basis]) for p in points])
+
+
+def export(path=pathlib.Path(__file__).parent / 'blender_noise.npz'):
+    points = reference_points()
+    arrays = dict(points=points)
+
+    for name, case in cases.items():
+        for attribute, values in evaluate(case, points).items():
+            arrays["{}/{}".format(name, attribute)] = np.array(values, dtype=np.float32)
+
+    np.savez_compressed(path, version=np.array(bpy.app.version), **arrays)
+    print("wrote {} cases to {}".format(len(cases), path))
+
+
+if __name__ == '__main__':
+    export()
@@ -0,0 +1,105 @@
+""" Export reference values of the white noise, noise, Voronoi and checker textures from Blender
+for tests/test_noise.py, evaluated by geometry nodes (which share the Cycles implementations) on
+the vertices of a point cloud mesh. Run with Blender 3.x (the noise port predates 4.0):
+
+    blender -b --factory-startup --python tests/reference/export_noise.py
+"""
+import bpy
+import numpy as np
+
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent))
+from noise_cases import cases
+
+
+def reference_points(n=4096, seed=0):
+    """ Random points and W values, with points close to either side of cell boundaries """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-8, 8, (n, 3)).astype(np.float32)
+    boundary = np.round(points[:n // 4]) + rng.choice([-1e-3, 1e-3], (n // 4, 3))
+    points[:n // 4] = boundary.astype(np.float32)
+    return points, rng.uniform(-8, 8, n).astype(np.float32)
+
+
+def point_object(points, w):
+    mesh = bpy.data.meshes.new('noise_reference')
+    mesh.vertices.add(len(points))
+    mesh.vertices.foreach_set('co', points.ravel())
+    mesh.attributes.new('w', 'FLOAT', 'POINT').data.foreach_set('value', w)
+
+    obj = bpy.data.objects.new('noise_reference', mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def enabled(sockets, name=None):
+    return next(socket for socket in sockets if socket.enabled and (name is None or socket.name == name))
+
+
+def reference_tree(name, case):
+    """ Geometry node group storing the outputs of the texture as point attributes """
+    tree = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    tree.inputs.new('NodeSocketGeometry', 'Geometry')
+    tree.outputs.new('NodeSocketGeometry', 'Geometry')
+    nodes, links = tree.nodes, tree.links
+
+    texture = nodes.new(case['node'])
+    for k, v in case['properties'].items():
+        setattr(texture, k, v)
+    for k, v in case['inputs'].items():
+        enabled(texture.inputs, k).default_value = v
+
+    if any(socket.enabled for socket in texture.inputs if socket.name == 'Vector'):
+        links.new(nodes.new('GeometryNodeInputPosition').outputs[0], enabled(texture.inputs, 'Vector'))
+    if any(socket.enabled for socket in texture.inputs if socket.name == 'W'):
+        w = nodes.new('GeometryNodeInputNamedAttribute')
+        w.data_type = 'FLOAT'
+        w.inputs['Name'].default_value = 'w'
+        links.new(enabled(w.outputs), enabled(texture.inputs, 'W'))
+
+    geometry = nodes.new('NodeGroupInput').outputs[0]
+    for attribute, (output, data_type) in case['outputs'].items():
+        store = nodes.new('GeometryNodeStoreNamedAttribute')
+        store.data_type, store.domain = data_type, 'POINT'
+        store.inputs['Name'].default_value = attribute
+        links.new(geometry, store.inputs['Geometry'])
+        links.new(enabled(texture.outputs, output), enabled(store.inputs, 'Value'))
+        geometry = store.outputs[0]
+
+    links.new(geometry, nodes.new('NodeGroupOutput').inputs[0])
+    return tree
+
+
+def read_attribute(mesh, name, data_type):
+    attribute = mesh.attributes[name]
+    channels, key = dict(FLOAT=(1, 'value'), FLOAT_VECTOR=(3, 'vector'), FLOAT_COLOR=(4, 'color'))[data_type]
+    values = np.zeros(len(attribute.data) * channels, dtype=np.float32)
+    attribute.data.foreach_get(key, values)
+    return values if channels == 1 else values.reshape(-1, channels)[:, :3]
+
+
+def export(path=pathlib.Path(__file__).parent / 'noise.npz'):
+    points, w = reference_points()
+    obj = point_object(points, w)
+    arrays = dict(points=points, w=w)
+
+    for name, case in cases.items():
+        modifier = obj.modifiers.new(name, 'NODES')
+        modifier.node_group = reference_tree(name, case)
+
+        evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+        mesh = evaluated.to_mesh()
+        for attribute, (_, data_type) in case['outputs'].items():
+            arrays["{}/{}".format(name, attribute)] = read_attribute(mesh, attribute, data_type)
+        evaluated.to_mesh_clear()
+
+        obj.modifiers.remove(modifier)
+
+    np.savez_compressed(path, version=np.array(bpy.app.version), **arrays)
+    print("wrote {} cases to {}".format(len(cases), path))
+
+
+if __name__ == '__main__':
+    export()
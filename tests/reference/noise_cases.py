@@ -0,0 +1,50 @@
+""" Texture node settings the reference values of tests/test_noise.py are exported with (see export_noise.py),
+{name: dict(node, properties, inputs, outputs={attribute: (output socket, attribute data type)})}. Points are
+used with a scale of 1, 1D and 4D textures read W from the 'w' attribute """
+
+values = dict(value=('Value', 'FLOAT'), color=('Color', 'FLOAT_COLOR'))
+noise_outputs = dict(fac=('Fac', 'FLOAT'), color=('Color', 'FLOAT_COLOR'))
+voronoi_outputs = dict(distance=('Distance', 'FLOAT'), color=('Color', 'FLOAT_COLOR'), position=('Position', 'FLOAT_VECTOR'))
+
+
+def white_noise(dimensions):
+    return dict(node='ShaderNodeTexWhiteNoise', properties=dict(noise_dimensions=dimensions), inputs={}, outputs=values)
+
+
+def noise(dimensions, **inputs):
+    return dict(node='ShaderNodeTexNoise', properties=dict(noise_dimensions=dimensions),
+        inputs=dict(dict(Scale=1.0, Detail=2.0, Roughness=0.5, Distortion=0.0), **inputs), outputs=noise_outputs)
+
+
+def voronoi(dimensions, feature='F1', distance='EUCLIDEAN', outputs=voronoi_outputs, **inputs):
+    return dict(node='ShaderNodeTexVoronoi', properties=dict(voronoi_dimensions=dimensions, feature=feature, distance=distance),
+        inputs=dict(dict(Scale=1.0, Exponent=0.5, Randomness=1.0, Smoothness=1.0), **inputs), outputs=outputs)
+
+
+cases = dict(
+    white_noise_1d = white_noise('1D'),
+    white_noise_2d = white_noise('2D'),
+    white_noise_3d = white_noise('3D'),
+    white_noise_4d = white_noise('4D'),
+
+    noise_1d = noise('1D'),
+    noise_2d = noise('2D'),
+    noise_3d = noise('3D'),
+    noise_4d = noise('4D'),
+    noise_detail_0 = noise('3D', Detail=0.0),
+    noise_detail_fraction = noise('3D', Detail=2.5, Roughness=0.7),
+    noise_distortion = noise('3D', Distortion=0.7),
+
+    voronoi_f1 = voronoi('3D'),
+    voronoi_f2 = voronoi('3D', 'F2'),
+    voronoi_smooth_f1 = voronoi('3D', 'SMOOTH_F1', Smoothness=0.6),
+    voronoi_randomness = voronoi('3D', Randomness=0.4),
+    voronoi_manhattan = voronoi('3D', distance='MANHATTAN'),
+    voronoi_chebychev = voronoi('3D', distance='CHEBYCHEV'),
+    voronoi_minkowski = voronoi('3D', distance='MINKOWSKI', Exponent=0.7),
+    voronoi_2d = voronoi('2D'),
+    voronoi_edge = voronoi('3D', 'DISTANCE_TO_EDGE', outputs=dict(distance=('Distance', 'FLOAT'))),
+    voronoi_radius = voronoi('3D', 'N_SPHERE_RADIUS', outputs=dict(radius=('Radius', 'FLOAT'))),
+
+    checker = dict(node='ShaderNodeTexChecker', properties={}, inputs=dict(Scale=1.0), outputs=dict(fac=('Fac', 'FLOAT'))),
+)
@@ -0,0 +1,92 @@
+""" Run inside Blender, e.g. blender -b --python-expr "import pytest; pytest.main(['tests'])" """
+from math import pi
+
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+
+from node import shader, affine, evaluate_shader
+from node.evaluate import euler_to_matrix, matrix_to_euler
+from node.graph import Graph
+from node.expression import RecordingContext
+
+
+rng = np.random.default_rng(0)
+
+
+def random_rotation():
+    return euler_to_matrix(rng.uniform(-pi, pi, 3))
+
+
+@pytest.mark.parametrize('scale', [(1, 2, 3), (0.5, -2, 1), (2, 0, 1), (0, 0, 3)])
+def test_decompose(scale):
+    for _ in range(20):
+        matrix = random_rotation() * np.asarray(scale, dtype=np.float64)
+        rotation, decomposed = affine.decompose(matrix)
+
+        assert affine.is_rotation(rotation)
+        assert np.allclose(rotation * decomposed, matrix, atol=1e-9)
+
+
+def test_decompose_shear():
+    assert affine.decompose(np.array([[1, 0.5, 0], [0, 1, 0], [0, 0, 1]])) is None
+
+
+@pytest.mark.parametrize('euler', [(0.3, 1.2, -0.4), (-2.5, 0.1, 3.0), (0.3, pi / 2, 0.2), (1.0, -pi / 2, -0.7)])
+def test_euler_round_trip(euler):
+    """ Angles may differ (at gimbal lock only their sum or difference is known), the rotation may not """
+    matrix = euler_to_matrix(euler)
+    assert np.allclose(euler_to_matrix(matrix_to_euler(matrix)), matrix, atol=1e-9)
+
+
+def test_euler_round_trip_random():
+    matrices = euler_to_matrix(rng.uniform(-pi, pi, (1000, 3)))
+    assert np.allclose(euler_to_matrix(matrix_to_euler(matrices)), matrices, atol=1e-9)
+
+
+def uniform():
+    return shader.Float(0.7) * 2     # a value node times a constant, the same at every sample
+
+
+chains = dict(
+    translate=lambda p: (p + (1, 2, 3)) - (0.5, 0.5, 0.5) + 1.0,
+    scale=lambda p: (p * 2) * (1, 3, 0.5) / (2, 2, 2),
+    rotate=lambda p: shader.vector_rotate(vector=p, center=(0.5, 0.5, 0), angle=0.7),
+    rotate_twice=lambda p: shader.vector_rotate(vector=shader.vector_rotate(vector=p * 0.5 + 1.0, center=(1, 0, 0),
+        angle=0.3), axis=(1, 1, 0), angle=-1.1) - (0.5, 0, 0),
+    flatten=lambda p: shader.vector_rotate(vector=p, angle=0.7) * (1, 0.5, 0),
+    uniform=lambda p: (p * uniform() + (1, 0, 0)) + uniform(),
+    uniform_scale=lambda p: ((p + (1, 0, 0)) * uniform()) + (2, 3, 4),
+    uniform_euler=lambda p: shader.vector_rotate.set(rotation_type='EULER_XYZ')(vector=p * 2,
+        rotation=shader.Vector.combine(uniform(), 0, 1)) + (1, 1, 1),
+    texture_mapping=lambda p: shader.mapping.set(vector_type='TEXTURE')(p, location=(1, 2, 3),
+        rotation=(0.1, 0.2, 0.3), scale=(2, 2, 0)) * 3 + 1.0,
+    inverted_euler=lambda p: shader.vector_rotate.set(rotation_type='EULER_XYZ', invert=True)(vector=p,
+        rotation=(0.3, 1.2, -0.4), center=(1, 0, 0)) * 0.5,
+    gimbal=lambda p: shader.mapping(p, rotation=(0.3, pi / 2, 0.2)) + 1.0,
+    z_axis=lambda p: shader.vector_rotate.set(rotation_type='Z_AXIS', invert=True)(vector=p - 0.5, angle=0.4) + 0.5,
+    reversed=lambda p: (1.0 - p) * 2 - 1.0,
+    varying=lambda p: (p + p.x) * 2 + 1.0,
+)
+
+# Chains already as short as the rewrite would make them
+unchanged = {'rotate', 'flatten'}
+
+
+@pytest.mark.parametrize('name', list(chains))
+def test_compose_transforms_equivalent(name):
+    position = rng.uniform(-2, 2, (500, 3))
+    attributes = dict(Position=position, Normal=np.tile([0.0, 0.0, 1.0], (500, 1)))
+
+    with RecordingContext(Graph('SHADER', name)) as context:
+        v = chains[name](shader.new_geometry().position)
+        result = shader.vector_math.dot_product(v, (0.3, -1.7, 0.9)) + v.x * 0.5 - v.z.sin()
+
+        nodes = len(context.node_tree.nodes)
+        before = np.asarray(evaluate_shader.evaluate(result, attributes), dtype=np.float64)
+        affine.compose_transforms(context)
+        after = np.asarray(evaluate_shader.evaluate(result, attributes), dtype=np.float64)
+
+    assert len(context.node_tree.nodes) == nodes if name in unchanged else len(context.node_tree.nodes) < nodes
+    assert np.max(np.abs(after - before)) < 1e-4
@@ -0,0 +1,151 @@
+""" Tests of the NumPy ports of Blender's noise functions in node/blender_noise.py, which the procedural textures
+of texture nodes use: properties (run anywhere), and values compared with ones exported from Blender
+(tests/reference/export_blender_noise.py) """
+import numpy as np
+import pytest
+
+import sys
+import pathlib
+import importlib.util
+
+root = pathlib.Path(__file__).parent
+sys.path.insert(0, str(root / 'reference'))
+from blender_noise_cases import cases, bases, musgrave_types
+
+
+def load_blender_noise():
+    """ node/blender_noise.py only needs NumPy, it's loaded by path as importing the node package imports bpy """
+    spec = importlib.util.spec_from_file_location('blender_noise', root.parent / 'node' / 'blender_noise.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+bn = load_blender_noise()
+
+
+def random_points(n=2000, low=-8, high=8, seed=0):
+    return np.random.default_rng(seed).uniform(low, high, (n, 3)).astype(np.float32)
+
+
+def test_tables():
+    assert sorted(bn.permutation) == list(range(256))
+    assert np.allclose(np.linalg.norm(bn.gradients, axis=-1), 1, atol=1e-3)
+    assert np.all((bn.feature_points > -1) & (bn.feature_points < 1))
+
+
+@pytest.mark.parametrize('f', [bn.perlin_original, bn.perlin_improved])
+def test_perlin_zero_on_lattice(f):
+    assert np.all(f(np.round(random_points())) == 0)
+
+
+@pytest.mark.parametrize('name', ['BLENDER_ORIGINAL', 'ORIGINAL_PERLIN', 'IMPROVED_PERLIN', 'VORONOI_F1', 'VORONOI_F2_F1'])
+def test_noise_continuous_across_cells(name):
+    p = random_points()
+    p[:, 0] = np.round(p[:, 0])
+    a = bn.generic_noise(p - (1e-4, 0, 0), 1.0, name=name)
+    b = bn.generic_noise(p + (1e-4, 0, 0), 1.0, name=name)
+    assert np.max(np.abs(a - b)) < 5e-3
+
+
+@pytest.mark.parametrize('name', ['BLENDER_ORIGINAL', 'ORIGINAL_PERLIN', 'IMPROVED_PERLIN', 'CELL_NOISE'])
+def test_noise_range(name):
+    values = bn.generic_noise(random_points(), 0.7, name=name)
+    assert values.min() >= 0 and values.max() <= 1
+
+
+def test_cell_noise_constant_in_cells():
+    p = np.floor(random_points()) + 0.5
+    offset = np.random.default_rng(1).uniform(-0.49, 0.49, p.shape).astype(np.float32)
+    assert np.all(bn.cell_noise(p) == bn.cell_noise(p + offset))
+
+
+@pytest.mark.parametrize('metric', ['DISTANCE', 'MANHATTAN', 'CHEBYCHEV', 'MINKOVSKY'])
+def test_voronoi_sorted(metric):
+    distances, points = bn.voronoi(random_points(), metric, 1.7)
+    assert distances.shape[-1] == 4 and points.shape[-2:] == (4, 3)
+    assert np.all(np.diff(distances, axis=-1) >= 0)
+
+
+def test_voronoi_points_are_feature_points():
+    """ The nearest point of a point which is a feature point is that point """
+    distances, points = bn.voronoi(random_points(200))
+    nearest = points[:, 0]
+    distances, points = bn.voronoi(nearest)
+    assert np.allclose(distances[:, 0], 0, atol=1e-5) and np.allclose(points[:, 0], nearest, atol=1e-5)
+
+
+@pytest.mark.parametrize('name', bases)
+def test_turbulence_depth_zero_is_noise(name):
+    p = random_points()
+    for hard in (False, True):
+        assert np.allclose(bn.generic_turbulence(p, 0.5, 0, hard, name), bn.generic_noise(p, 0.5, hard, name), atol=1e-6)
+
+
+def test_hard_noise():
+    p = random_points()
+    assert np.allclose(bn.generic_noise(p, 0.5, True, 'IMPROVED_PERLIN'),
+        np.abs(2 * bn.generic_noise(p, 0.5, False, 'IMPROVED_PERLIN') - 1), atol=1e-6)
+
+
+def test_size_zero_is_unscaled():
+    p = random_points()
+    assert np.all(bn.generic_noise(p, 0.0, name='VORONOI_F1') == bn.generic_noise(p, 1.0, name='VORONOI_F1'))
+
+
+def test_musgrave_octaves_per_point():
+    p = random_points(100)
+    octaves = np.repeat([[1.0], [2.5], [4.0]], 100, axis=1)
+    result = bn.musgrave(p[None], 'FBM', 0.8, 2.1, octaves)
+    for i, n in enumerate([1.0, 2.5, 4.0]):
+        assert np.allclose(result[i], bn.musgrave(p, 'FBM', 0.8, 2.1, n), atol=1e-6)
+
+
+def test_unknown_names():
+    p = random_points(10)
+    with pytest.raises(KeyError):
+        bn.generic_noise(p, 1.0, name='SIMPLEX')
+    with pytest.raises(KeyError):
+        bn.musgrave(p, 'TERRAIN', 0.8, 2.1, 3.0)
+    with pytest.raises(KeyError):
+        bn.voronoi(p, 'HAMMING')
+
+
+# Values exported from Blender (see tests/reference/export_blender_noise.py) the ports are compared with
+
+reference_file = root / 'reference' / 'blender_noise.npz'
+musgrave_functions = {function: musgrave_type for musgrave_type, (function, _) in musgrave_types.items()}
+
+
+@pytest.fixture(scope='module')
+def reference():
+    if not reference_file.exists():
+        pytest.skip("no reference values, export them with Blender: "
+            "blender -b --factory-startup --python tests/reference/export_blender_noise.py")
+    return np.load(reference_file)
+
+
+def evaluate(case, p):
+    """ {attribute: values} of the port as the function of the case """
+    function, basis, args = case['function'], case['basis'], case['args']
+    if function == 'turbulence':
+        return dict(value=bn.generic_turbulence(p, *args, name=basis))
+    elif function == 'voronoi':
+        return dict(zip(['distances', 'points'], bn.voronoi(p, *args)))
+    elif function == 'cell':
+        return dict(value=2 * bn.cell_noise(p) - 1)
+    elif function == 'cell_vector':
+        return dict(value=bn.cell_vector(p))
+    elif function == 'noise':
+        return dict(value=2 * bn.generic_noise(p, 1.0, name=basis) - 1)
+    elif function == 'variable_lacunarity':
+        distortion, distortion_basis = args
+        return dict(value=bn.variable_lacunarity(p, distortion, distortion_basis, basis))
+    return dict(value=bn.musgrave(p, musgrave_functions[function], *args, name=basis))
+
+
+@pytest.mark.parametrize('name', list(cases))
+def test_reference(reference, name):
+    for attribute, result in evaluate(cases[name], reference['points']).items():
+        expected = reference["{}/{}".format(name, attribute)]
+        assert np.allclose(result, expected, rtol=1e-5, atol=1e-5),\
+            "{} {}: max error {}".format(name, attribute, np.max(np.abs(result - expected)))
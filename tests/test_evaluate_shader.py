@@ -0,0 +1,24 @@
+""" Run inside Blender, e.g. blender -b --python-expr "import pytest; pytest.main(['tests'])" """
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+
+from node import shader, evaluate_shader, noise
+from node.graph import Graph
+from node.expression import RecordingContext
+
+
+position = np.random.default_rng(0).uniform(-2, 2, (500, 3))
+
+
+@pytest.mark.parametrize('dimensions, axes', [('2D', 2), ('3D', 3)])
+def test_white_noise_reads_position(dimensions, axes):
+    """ An unlinked Vector reads the position (graph.implicit_coordinates) rather than a constant """
+    with RecordingContext(Graph('SHADER', 'white_noise')) as context:
+        value = shader.tex_white_noise.set(noise_dimensions=dimensions)().value
+        result = evaluate_shader.evaluate(value, dict(Position=position))
+
+    expected, _ = noise.white_noise(position[:, :axes].astype(np.float32))
+    assert np.std(result) > 0.1
+    assert np.allclose(result, expected)
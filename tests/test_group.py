@@ -0,0 +1,57 @@
+""" Run inside Blender, e.g. blender -b --python-expr "import pytest; pytest.main(['tests'])" """
+import pytest
+
+bpy = pytest.importorskip('bpy')
+
+from node import group
+from node.shader import Float, Vector
+
+
+def scale_offset(a: Float, b: Vector):
+    return dict(scaled=a * 2.0, offset=b + (1.0, 0.0, 0.0))
+
+
+def linked_outputs(node_tree):
+    output_node = next(node for node in node_tree.nodes if node.bl_idname == 'NodeGroupOutput')
+    return {socket.name: socket.links[0].from_node.bl_idname for socket in output_node.inputs if socket.is_linked}
+
+
+def test_build_async_connects_outputs():
+    task = group.build_async(scale_offset, name='test_build_async')
+    task.run()
+
+    node_tree = task.node_tree
+    assert task.finished and task.error is None
+    assert [socket.name for socket in node_tree.outputs] == ['scaled', 'offset']
+    assert linked_outputs(node_tree) == dict(scaled='ShaderNodeMath', offset='ShaderNodeVectorMath')
+
+    bpy.data.node_groups.remove(node_tree)
+
+
+def test_build_async_matches_build():
+    built = group.build(scale_offset, name='test_build')
+    task = group.build_async(scale_offset, name='test_build_async')
+    task.run()
+
+    assert linked_outputs(task.node_tree) == linked_outputs(built)
+    assert len(task.node_tree.nodes) == len(built.nodes)
+
+    for node_tree in (built, task.node_tree):
+        bpy.data.node_groups.remove(node_tree)
+
+
+def test_function_cached_per_name():
+    from node.graph import Graph
+    from node.expression import RecordingContext
+
+    with RecordingContext(Graph('SHADER', 'test_function')) as context:
+        group.function(scale_offset, name='test_function_a')(1.0, (0.0, 0.0, 0.0))
+        group.function(scale_offset, name='test_function_b')(1.0, (0.0, 0.0, 0.0))
+        group.function(scale_offset, name='test_function_a')(2.0, (0.0, 0.0, 0.0))
+
+    groups = [node.properties['node_tree'] for node in context.node_tree.nodes if node.bl_idname == 'ShaderNodeGroup']
+    assert [g.name for g in groups] == ['test_function_a', 'test_function_b', 'test_function_a']
+    assert groups[0] == groups[2]
+
+    for node_tree in set(groups):
+        bpy.data.node_groups.remove(node_tree)
@@ -0,0 +1,246 @@
+""" Tests of the NumPy texture ports in node/noise.py: properties which hold for the Cycles functions
+(run anywhere), and values compared with ones exported from Blender (tests/reference/export_noise.py) """
+import numpy as np
+import pytest
+
+import sys
+import pathlib
+import importlib.util
+
+root = pathlib.Path(__file__).parent
+sys.path.insert(0, str(root / 'reference'))
+from noise_cases import cases
+
+
+def load_noise():
+    """ node/noise.py only needs NumPy, it's loaded by path as importing the node package imports bpy """
+    spec = importlib.util.spec_from_file_location('noise', root.parent / 'node' / 'noise.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+noise = load_noise()
+
+
+def random_points(n=2000, dimensions=3, low=-8, high=8, seed=0):
+    return np.random.default_rng(seed).uniform(low, high, (n, dimensions)).astype(np.float32)
+
+
+def boundary_pairs(n=1000, dimensions=3, axis=0, epsilon=1e-4, seed=1):
+    """ Points either side of cell boundaries along an axis """
+    p = random_points(n, dimensions, seed=seed)
+    p[:, axis] = np.round(p[:, axis])
+    offset = np.zeros(dimensions, dtype=np.float32)
+    offset[axis] = epsilon
+    return p - offset, p + offset
+
+
+def hashword(keys, initval):
+    """ Bob Jenkins' lookup3 hashword on Python integers, written from the general loop
+    (hash_uint has the 1 to 4 key cases unrolled as Cycles has) """
+    mask = 0xffffffff
+    rot = lambda x, k: ((x << k) | (x >> (32 - k))) & mask
+
+    def mix(a, b, c):
+        for x, y, z, k in [(0, 2, 1, 4), (1, 0, 2, 6), (2, 1, 0, 8), (0, 2, 1, 16), (1, 0, 2, 19), (2, 1, 0, 4)]:
+            r = [a, b, c]
+            r[x] = ((r[x] - r[y]) & mask) ^ rot(r[y], k)
+            r[y] = (r[y] + r[z]) & mask
+            a, b, c = r
+        return a, b, c
+
+    def final(a, b, c):
+        r = [a, b, c]
+        for x, y, k in [(2, 1, 14), (0, 2, 11), (1, 0, 25), (2, 1, 16), (0, 2, 4), (1, 0, 14), (2, 1, 24)]:
+            r[x] = ((r[x] ^ r[y]) - rot(r[y], k)) & mask
+        return r
+
+    a = b = c = (0xdeadbeef + (len(keys) << 2) + initval) & mask
+    keys = list(keys)
+    while len(keys) > 3:
+        a, b, c = (a + keys[0]) & mask, (b + keys[1]) & mask, (c + keys[2]) & mask
+        a, b, c = mix(a, b, c)
+        keys = keys[3:]
+
+    if len(keys) == 0:
+        return c
+    a, b, c = [(r + k) & mask for r, k in zip([a, b, c], keys + [0] * (3 - len(keys)))]
+    return final(a, b, c)[2]
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4])
+def test_hash_uint_is_lookup3(n):
+    keys = np.random.default_rng(n).integers(0, 2**32, (64, n), dtype=np.uint64).astype(np.uint32)
+    hashes = noise.hash_uint(*keys.T)
+
+    assert hashes.dtype == np.uint32
+    assert [int(h) for h in hashes] == [hashword([int(k) for k in key], 13) for key in keys]
+
+
+def test_hash_float_range():
+    values = noise.hash_float(random_points(100000))
+    assert values.dtype == np.float32
+    assert values.min() >= 0 and values.max() <= 1
+
+    counts, _ = np.histogram(values, bins=10, range=(0, 1))
+    assert np.all(np.abs(counts / len(values) - 0.1) < 0.01)
+
+
+@pytest.mark.parametrize('dimensions', [1, 2, 3, 4])
+def test_hash_float_n_components_differ(dimensions):
+    p = random_points(1000, dimensions)
+    h = noise.hash_float_n(p)
+    assert h.shape == (1000, dimensions)
+    assert np.array_equal(noise.hash_float_n(p), h)
+    if dimensions > 1:
+        assert np.all(np.abs(np.corrcoef(h.T)[np.triu_indices(dimensions, 1)]) < 0.1)
+
+
+@pytest.mark.parametrize('dimensions', [1, 2, 3, 4])
+def test_perlin_zero_on_lattice(dimensions):
+    lattice = np.round(random_points(500, dimensions))
+    assert np.all(noise.perlin(lattice) == 0)
+
+
+@pytest.mark.parametrize('dimensions', [1, 2, 3, 4])
+def test_perlin_continuous_across_cells(dimensions):
+    for axis in range(dimensions):
+        a, b = boundary_pairs(dimensions=dimensions, axis=axis)
+        assert np.max(np.abs(noise.perlin(a) - noise.perlin(b))) < 1e-2
+
+
+@pytest.mark.parametrize('dimensions', [1, 2, 3, 4])
+def test_noise_range(dimensions):
+    fac, color = noise.noise_texture(random_points(20000, dimensions), detail=4.0)
+    assert fac.min() >= 0 and fac.max() <= 1
+    assert color.shape == (20000, 3)
+    assert abs(float(fac.mean()) - 0.5) < 0.02
+
+
+@pytest.mark.parametrize('distortion', [0.0, 0.7])
+def test_noise_texture_continuous_across_cells(distortion):
+    for axis in range(3):
+        a, b = boundary_pairs(axis=axis)
+        (fa, ca), (fb, cb) = noise.noise_texture(a, 4.0, 0.6, distortion), noise.noise_texture(b, 4.0, 0.6, distortion)
+        assert np.max(np.abs(fa - fb)) < 1e-2
+        assert np.max(np.abs(ca - cb)) < 1e-2
+
+
+def test_noise_fractional_detail_blends_octaves():
+    p = random_points()
+    low, high = noise.noise_texture(p, 2.0, color=False)[0], noise.noise_texture(p, 3.0, color=False)[0]
+    blended = noise.noise_texture(p, 2.25, color=False)[0]
+    assert np.allclose(blended, 0.75 * low + 0.25 * high, atol=1e-6)
+
+
+def test_noise_detail_zero_is_single_octave():
+    p = random_points()
+    assert np.allclose(noise.noise_texture(p, 0.0, color=False)[0], noise.noise(p), atol=1e-6)
+
+
+metrics = dict(
+    EUCLIDEAN=lambda d: np.sqrt(np.sum(d * d, axis=-1)),
+    MANHATTAN=lambda d: np.sum(np.abs(d), axis=-1),
+    CHEBYCHEV=lambda d: np.max(np.abs(d), axis=-1),
+)
+
+
+@pytest.mark.parametrize('metric', list(metrics))
+def test_voronoi_without_randomness_is_lattice(metric):
+    p = random_points(dimensions=3)
+    result = noise.voronoi(p, 'F1', metric, randomness=0.0)
+    nearest = np.round(p)
+
+    assert np.allclose(result['distance'], metrics[metric](p - nearest), atol=1e-5)
+    if metric == 'EUCLIDEAN':
+        assert np.allclose(result['position'], nearest, atol=1e-5)
+        assert np.allclose(noise.voronoi(p, 'N_SPHERE_RADIUS', randomness=0.0)['radius'], 0.5, atol=1e-5)
+
+
+@pytest.mark.parametrize('dimensions', [1, 2, 3, 4])
+def test_voronoi_f1_position(dimensions):
+    p = random_points(dimensions=dimensions)
+    f1, f2 = noise.voronoi(p, 'F1'), noise.voronoi(p, 'F2')
+
+    assert np.allclose(np.linalg.norm(f1['position'] - p, axis=-1), f1['distance'], atol=1e-4)
+    assert np.all(f1['distance'] <= f2['distance'])
+    assert np.allclose(f1['color'], noise.hash_float3(np.floor(f1['position'])), atol=1e-6)
+
+
+# Cycles (3.x) searches edges among the neighbours of the cell the point is in only, which misses a few
+@pytest.mark.parametrize('feature, discontinuous', [('F1', 0), ('F2', 0), ('SMOOTH_F1', 0), ('DISTANCE_TO_EDGE', 0.01)])
+def test_voronoi_distance_continuous_across_cells(feature, discontinuous):
+    for axis in range(3):
+        a, b = boundary_pairs(axis=axis)
+        da, db = noise.voronoi(a, feature)['distance'], noise.voronoi(b, feature)['distance']
+        assert np.mean(np.abs(da - db) > 1e-2) <= discontinuous
+
+
+def test_voronoi_smooth_f1_below_f1():
+    p = random_points()
+    f1, smooth = noise.voronoi(p, 'F1')['distance'], noise.voronoi(p, 'SMOOTH_F1', smoothness=0.5)['distance']
+    assert np.all(smooth <= f1 + 1e-5)
+    assert np.allclose(noise.voronoi(p, 'SMOOTH_F1', smoothness=0.0)['distance'], f1, atol=1e-5)
+
+
+def test_voronoi_distance_to_edge_is_positive():
+    distance = noise.voronoi(random_points(), 'DISTANCE_TO_EDGE')['distance']
+    assert distance.min() >= 0 and distance.max() < 1
+
+
+def test_checker():
+    assert noise.checker([[0.5, 0.5, 0.5], [1.5, 0.5, 0.5], [1.5, 1.5, 0.5], [1.5, 1.5, 1.5]]).tolist() == [0, 1, 0, 1]
+
+    p = random_points() * np.float32(0.9)
+    for axis in np.eye(3, dtype=np.float32):
+        shifted = p + axis * np.sign(p)    # |floor| changes by one across the origin as well
+        assert np.all(noise.checker(shifted) == 1 - noise.checker(p))
+
+
+# Values exported from Blender (see tests/reference/export_noise.py) the ports are compared with
+
+reference_file = root / 'reference' / 'noise.npz'
+tolerances = dict(ShaderNodeTexWhiteNoise=1e-6, ShaderNodeTexChecker=0.0)
+
+
+@pytest.fixture(scope='module')
+def reference():
+    if not reference_file.exists():
+        pytest.skip("no reference values, export them with Blender: "
+            "blender -b --factory-startup --python tests/reference/export_noise.py")
+    return np.load(reference_file)
+
+
+def coordinates(reference, dimensions):
+    points, w = reference['points'], reference['w']
+    return dict(zip(['1D', '2D', '3D', '4D'], [w[:, None], points[:, :2], points, np.concatenate([points, w[:, None]], -1)]))[dimensions]
+
+
+def evaluate(case, p):
+    """ {attribute: values} of the port with the settings of a texture node """
+    inputs = case['inputs']
+    if case['node'] == 'ShaderNodeTexWhiteNoise':
+        return dict(zip(['value', 'color'], noise.white_noise(p)))
+    elif case['node'] == 'ShaderNodeTexNoise':
+        return dict(zip(['fac', 'color'], noise.noise_texture(p, inputs['Detail'], inputs['Roughness'], inputs['Distortion'])))
+    elif case['node'] == 'ShaderNodeTexChecker':
+        return dict(fac=noise.checker(p))
+
+    properties = case['properties']
+    result = noise.voronoi(p, properties['feature'], properties['distance'], inputs['Exponent'],
+        np.clip(inputs['Randomness'], 0, 1), np.clip(inputs['Smoothness'], 0, 1) / 2)
+    position = result['position']
+    result['position'] = np.concatenate([position, np.zeros((len(p), 3 - p.shape[-1]), np.float32)], -1)[:, :3]
+    return result
+
+
+@pytest.mark.parametrize('name', list(cases))
+def test_reference(reference, name):
+    case = cases[name]
+    dimensions = case['properties'].get('noise_dimensions', case['properties'].get('voronoi_dimensions', '3D'))
+    result = evaluate(case, coordinates(reference, dimensions))
+
+    for attribute in case['outputs']:
+        expected = reference["{}/{}".format(name, attribute)]
+        assert np.allclose(result[attribute], expected, atol=tolerances.get(case['node'], 1e-4)),\
+            "{} {}: max error {}".format(name, attribute, np.max(np.abs(result[attribute] - expected)))
@@ -0,0 +1,70 @@
+""" Run inside Blender, e.g. blender -b --python-expr "import pytest; pytest.main(['tests'])" """
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+
+from node.graph import Graph
+from node.evaluate import Evaluator
+from node import evaluate_texture
+
+
+points = np.random.default_rng(0).uniform(-2, 2, (200, 3)).astype(np.float32)
+
+# Node inputs of procedural textures with the Texture properties they set
+texture_inputs = {'Size': 'noise_scale', 'Turbulence': 'turbulence', 'H': 'dimension_max', 'Lacunarity': 'lacunarity',
+    'Octaves': 'octaves', 'iScale': 'noise_intensity', 'Distortion': 'distortion',
+    'W1': 'weight_1', 'W2': 'weight_2', 'W3': 'weight_3', 'W4': 'weight_4'}
+
+cases = [
+    ('CLOUDS', dict(noise_basis='IMPROVED_PERLIN', noise_type='HARD_NOISE', noise_depth=3, noise_scale=0.4)),
+    ('CLOUDS', dict(noise_basis='VORONOI_F2_F1', cloud_type='COLOR')),
+    ('WOOD', dict(noise_basis='ORIGINAL_PERLIN', noise_basis_2='TRI', wood_type='RINGNOISE', turbulence=7.0)),
+    ('WOOD', dict(noise_basis_2='SAW', wood_type='BANDS')),
+    ('MARBLE', dict(noise_basis='VORONOI_CRACKLE', marble_type='SHARPER', noise_depth=3, turbulence=4.0)),
+    ('STUCCI', dict(noise_basis='VORONOI_F4', stucci_type='WALL_OUT', noise_type='HARD_NOISE', turbulence=20.0)),
+    ('MAGIC', dict(noise_depth=7, turbulence=2.5)),
+    ('MUSGRAVE', dict(musgrave_type='HETERO_TERRAIN', noise_basis='CELL_NOISE', octaves=3.5, offset=0.8)),
+    ('MUSGRAVE', dict(musgrave_type='RIDGED_MULTIFRACTAL', dimension_max=0.7, lacunarity=2.3, gain=1.3, noise_scale=0.6)),
+    ('DISTORTED_NOISE', dict(noise_basis='VORONOI_F1', noise_distortion='IMPROVED_PERLIN', distortion=2.0)),
+    ('VORONOI', dict(distance_metric='MINKOVSKY', minkovsky_exponent=1.7, weight_2=-0.4, noise_intensity=1.2)),
+    ('VORONOI', dict(distance_metric='CHEBYCHEV', color_mode='POSITION_OUTLINE_INTENSITY', weight_1=0.8, weight_3=0.3)),
+]
+
+idnames = dict(CLOUDS='TextureNodeTexClouds', WOOD='TextureNodeTexWood', MARBLE='TextureNodeTexMarble',
+    STUCCI='TextureNodeTexStucci', MAGIC='TextureNodeTexMagic', MUSGRAVE='TextureNodeTexMusgrave',
+    DISTORTED_NOISE='TextureNodeTexDistNoise', VORONOI='TextureNodeTexVoronoi')
+
+
+def evaluate_node(texture, properties):
+    """ RGBA of the texture node with the settings of a Texture, between black and white """
+    graph = Graph('TEXTURE')
+    node = graph.new_node(idnames[texture.type], {k: v for k, v in properties.items() if k in evaluate_texture.tex_defaults})
+    output = graph.new_node('TextureNodeOutput')
+    graph.new_link(node.outputs[0], output.inputs[0])
+
+    for socket in node.inputs:
+        if socket.name in texture_inputs:
+            socket.default_value = getattr(texture, texture_inputs[socket.name])
+    node.inputs[0].default_value, node.inputs[1].default_value = (0, 0, 0, 1), (1, 1, 1, 1)
+
+    evaluator = Evaluator(graph, {}, shape=(len(points),), coordinates=points)
+    color, = evaluator.evaluate([output.inputs[0]])
+    return evaluator.full(color, 'RGBA')
+
+
+@pytest.mark.parametrize('texture_type, properties', cases)
+def test_procedural_texture(texture_type, properties):
+    """ Compared with the Texture of the same settings, evaluate gives (r, g, b, intensity) """
+    texture = bpy.data.textures.new('texture_test', texture_type)
+    try:
+        for k, v in properties.items():
+            setattr(texture, k, v)
+        expected = np.array([tuple(texture.evaluate(tuple(map(float, p)))) for p in points], dtype=np.float32)
+        result = evaluate_node(texture, properties)
+    finally:
+        bpy.data.textures.remove(texture)
+
+    rgb = texture_type == 'MAGIC' or properties.get('cloud_type') == 'COLOR' or 'color_mode' in properties
+    result, expected = (result[:, :3], expected[:, :3]) if rgb else (result[:, 0], expected[:, 3])
+    assert np.allclose(result, expected, rtol=1e-4, atol=1e-4), "max error {}".format(np.max(np.abs(result - expected)))